@@ -5,11 +5,45 @@ MVP - Prototipo Funcional
 
 import streamlit as st
 import pandas as pd
-from datetime import date, datetime, timedelta
+from datetime import date, timedelta
 from decimal import Decimal
 import json
 import os
-from io import BytesIO
+import uuid
+from io import BytesIO, StringIO
+
+from core.contabilizador import LibroAsientos, a_centimos
+from core.saldos import CacheSaldos
+from core.sumas_saldos import NIVEL_AUXILIAR, NIVELES, BalanceSumasSaldos
+from core.columnar import ApuntesColumnares
+from core.diario import IndiceDiario, filas_diario
+from core.exportacion import (
+    FORMATOS as FORMATOS_EXPORTACION, exportar, tabla_balance, tabla_diario, tabla_mayor, tabla_recibos,
+)
+from core.importacion import ErrorDiario, analizar_diario
+from core.plan_cuentas import CUENTAS_TERCERO, compilar_plan
+from core.referencias import IndiceReferencias
+from core.cierre import preparar_cierres
+from core.perfilador import Perfilador
+from core.vistas import CacheVistas
+from core.ocr.cache import CacheExtracciones
+from core.ocr.extractor import extractor_por_defecto
+from core.ocr.pipeline import ColaRevision, ProcesadorDocumentos, propuesta_asiento
+from modelos_aeat.modelo_303 import Modelo303
+from modelos_aeat.base import euros
+from modelos_aeat.modelo_347 import CLAVES_347, Modelo347
+from modelos_aeat.presentacion import modelos_disponibles, presentar_lote
+from modelos_aeat.retenciones import MotorRetenciones
+from database.almacen import AlmacenContable, ErrorPersistencia, PersistenciaContable
+from pagos.sepa_direct_debit import (
+    ConfiguracionAcreedorSEPA, DatosMandato, GeneradorSEPADirectDebit, ReciboSEPA,
+    calcular_creditor_id,
+)
+from pagos.sepa_credit_transfer import ConfiguracionOrdenanteSEPA, GeneradorSEPACreditTransfer
+from comunidades.cuotas import emitir_cuotas
+from pagos.conciliacion import Conciliacion, ConciliadorRecibos, IndiceRecibos, PENDIENTE
+from pagos.extractos import ClasificadorMovimientos, ErrorExtracto, importar_extracto
+from pagos.proveedores import asientos_de_pagos, pagos_pendientes, transferencias_de_pagos
 
 # Configuración de página
 st.set_page_config(
@@ -20,47 +54,116 @@ st.set_page_config(
 )
 
 # =====================================================
-# DATOS DE EJEMPLO (En producción usaríamos PostgreSQL)
+# DATOS DE EJEMPLO (semilla de una base de datos vacía)
 # =====================================================
 
-if 'entidades' not in st.session_state:
-    st.session_state.entidades = [
-        {
-            'id': 1,
-            'nif': 'B12345678',
-            'razon_social': 'POINT TRADING S.L.',
-            'tipo': 'sociedad_limitada',
-            'regimen_iva': 'general',
-            'plan_contable': 'pymes'
-        },
-        {
-            'id': 2,
-            'nif': '12345678A',
-            'razon_social': 'GARCÍA LÓPEZ, JUAN (Autónomo)',
-            'tipo': 'autonomo_directa',
-            'regimen_iva': 'general',
-            'plan_contable': 'pymes'
-        },
-        {
-            'id': 3,
-            'nif': 'H03123456',
-            'razon_social': 'COMUNIDAD PROP. EDIFICIO LOS NARANJOS',
-            'tipo': 'comunidad_propietarios',
-            'regimen_iva': 'no_sujeto',
-            'plan_contable': 'comunidades'
-        }
-    ]
+ENTIDADES_INICIALES = [
+    {
+        'id': 1,
+        'nif': 'B12345678',
+        'razon_social': 'POINT TRADING S.L.',
+        'tipo': 'sociedad_limitada',
+        'regimen_iva': 'general',
+        'plan_contable': 'pymes'
+    },
+    {
+        'id': 2,
+        'nif': '12345678A',
+        'razon_social': 'GARCÍA LÓPEZ, JUAN (Autónomo)',
+        'tipo': 'autonomo_directa',
+        'regimen_iva': 'general',
+        'plan_contable': 'pymes'
+    },
+    {
+        'id': 3,
+        'nif': 'H03123456',
+        'razon_social': 'COMUNIDAD PROP. EDIFICIO LOS NARANJOS',
+        'tipo': 'comunidad_propietarios',
+        'regimen_iva': 'no_sujeto',
+        'plan_contable': 'comunidades'
+    }
+]
+
+TERCEROS_INICIALES = [
+    {'id': 1, 'nif': 'B98765432', 'nombre': 'SUMINISTROS INDUSTRIALES SL', 'tipo': 'proveedor', 'iban': 'ES7620770024003102575766'},
+    {'id': 2, 'nif': 'A11111111', 'nombre': 'CLIENTE EJEMPLO SA', 'tipo': 'cliente', 'iban': 'ES9121000418450200051332'},
+    {'id': 3, 'nif': '11111111A', 'nombre': 'PROPIETARIO 1A - García Martínez', 'tipo': 'propietario', 'iban': 'ES7921000813610123456789'},
+    {'id': 4, 'nif': '22222222B', 'nombre': 'PROPIETARIO 1B - López Fernández', 'tipo': 'propietario', 'iban': 'ES4720385778983000760236'},
+]
+
+# Coeficientes de participación (%) de los propietarios de cada comunidad
+PROPIETARIOS_INICIALES = [
+    {'entidad_id': 3, 'tercero_id': 3, 'coeficiente': 50.0},
+    {'entidad_id': 3, 'tercero_id': 4, 'coeficiente': 50.0},
+]
+
+# Presupuesto anual de cada comunidad (importes en céntimos)
+PRESUPUESTOS_INICIALES = [
+    {'id': 1, 'entidad_id': 3, 'ejercicio': date.today().year, 'concepto': 'Cuota ordinaria',
+     'tipo': 'ordinaria', 'importe': 301200, 'mes_inicio': 1, 'num_cuotas': 12},
+]
+
+CUENTA_BANCARIA_EJEMPLO = {
+    'nombre': 'Cuenta Principal',
+    'iban': 'ES91 2100 0418 4502 0005 1332',
+    'bic': 'CAIXESBBXXX',
+    'banco': 'CaixaBank',
+    'creditor_id': 'ES12000B12345678'
+}
+
+# Extracciones de documentos simultáneas (límite del servicio de IA)
+MAX_EXTRACCIONES_SIMULTANEAS = 4
+
+# Máximo de recibos por fichero de remesa (las mayores se reparten en un ZIP)
+MAX_TRANSACCIONES_FICHERO_SEPA = 5000
+
+# Secciones de la aplicación y su ruta en la URL
+SECCION_DOCUMENTOS = "📄 Subir Documentos"
+SECCION_DIARIO = "📒 Libro Diario"
+SECCION_MAYOR = "📊 Libro Mayor"
+SECCION_MODELOS = "🧾 Modelos Fiscales"
+SECCION_COBROS = "💰 Cobros/Pagos"
+SECCION_CONFIGURACION = "⚙️ Configuración"
+RUTAS_SECCION = {
+    SECCION_DOCUMENTOS: 'documentos',
+    SECCION_DIARIO: 'diario',
+    SECCION_MAYOR: 'mayor',
+    SECCION_MODELOS: 'modelos',
+    SECCION_COBROS: 'cobros',
+    SECCION_CONFIGURACION: 'configuracion',
+}
+SECCIONES = list(RUTAS_SECCION)
+SECCIONES_POR_RUTA = {ruta: seccion for seccion, ruta in RUTAS_SECCION.items()}
+
+# Vistas derivadas (DataFrames) que se conservan entre reruns por sesión
+MAX_VISTAS_CACHEADAS = 128
+
+# =====================================================
+# PERSISTENCIA (DATABASE_URL o SQLite local)
+# =====================================================
+
+@st.cache_resource
+def obtener_almacen():
+    """Conexión a la base de datos compartida por todas las sesiones"""
+    almacen = AlmacenContable(os.environ.get('DATABASE_URL'))
+    almacen.inicializar(ENTIDADES_INICIALES, TERCEROS_INICIALES,
+                        PROPIETARIOS_INICIALES, PRESUPUESTOS_INICIALES)
+    return almacen
 
-if 'asientos' not in st.session_state:
-    st.session_state.asientos = []
+@st.cache_resource
+def obtener_cache_extracciones():
+    """Caché de extracciones OCR + IA compartida por todas las sesiones"""
+    return CacheExtracciones()
+
+almacen = obtener_almacen()
+
+if 'entidades' not in st.session_state:
+    st.session_state.entidades = almacen.cargar_entidades()
 
 if 'terceros' not in st.session_state:
-    st.session_state.terceros = [
-        {'id': 1, 'nif': 'B98765432', 'nombre': 'SUMINISTROS INDUSTRIALES SL', 'tipo': 'proveedor', 'iban': 'ES7620770024003102575766'},
-        {'id': 2, 'nif': 'A11111111', 'nombre': 'CLIENTE EJEMPLO SA', 'tipo': 'cliente', 'iban': 'ES9121000418450200051332'},
-        {'id': 3, 'nif': '11111111A', 'nombre': 'PROPIETARIO 1A - García Martínez', 'tipo': 'propietario', 'iban': 'ES7921000813610123456789'},
-        {'id': 4, 'nif': '22222222B', 'nombre': 'PROPIETARIO 1B - López Fernández', 'tipo': 'propietario', 'iban': 'ES4720385778983000760236'},
-    ]
+    st.session_state.terceros = almacen.cargar_terceros()
+    # Quien cambie la lista de terceros la incrementa: planes y vistas se recalculan
+    st.session_state.version_terceros = 0
 
 if 'recibos' not in st.session_state:
     st.session_state.recibos = []
@@ -68,105 +171,122 @@ if 'recibos' not in st.session_state:
 if 'facturas' not in st.session_state:
     st.session_state.facturas = []
 
-# =====================================================
-# PLAN DE CUENTAS PGC
-# =====================================================
+if 'libro' not in st.session_state:
+    st.session_state.libro = LibroAsientos()
+    st.session_state.saldos = CacheSaldos()
+    st.session_state.libro.suscribir(st.session_state.saldos)
+    st.session_state.sumas_saldos = BalanceSumasSaldos()
+    st.session_state.libro.suscribir(st.session_state.sumas_saldos)
+    st.session_state.apuntes = ApuntesColumnares()
+    st.session_state.libro.suscribir(st.session_state.apuntes)
+    st.session_state.modelo_303 = Modelo303(st.session_state.apuntes)
+    st.session_state.libro.suscribir(st.session_state.modelo_303)
+    st.session_state.modelo_347 = Modelo347(st.session_state.apuntes)
+    st.session_state.libro.suscribir(st.session_state.modelo_347)
+    st.session_state.retenciones = MotorRetenciones(st.session_state.apuntes)
+    st.session_state.libro.suscribir(st.session_state.retenciones)
+    st.session_state.diario = IndiceDiario()
+    st.session_state.libro.suscribir(st.session_state.diario)
+    st.session_state.referencias = IndiceReferencias()
+    st.session_state.libro.suscribir(st.session_state.referencias)
+    st.session_state.persistencia = PersistenciaContable(
+        almacen, st.session_state.libro, st.session_state.recibos
+    )
+    st.session_state.libro.suscribir(st.session_state.persistencia)
+    st.session_state.indice_recibos = IndiceRecibos()
+    st.session_state.persistencia.suscribir_recibos(st.session_state.indice_recibos)
 
-PLAN_CUENTAS_PYMES = {
-    '100': {'descripcion': 'Capital social', 'tipo': 'patrimonio'},
-    '129': {'descripcion': 'Resultado del ejercicio', 'tipo': 'patrimonio'},
-    '400': {'descripcion': 'Proveedores', 'tipo': 'pasivo'},
-    '410': {'descripcion': 'Acreedores por prestación servicios', 'tipo': 'pasivo'},
-    '430': {'descripcion': 'Clientes', 'tipo': 'activo'},
-    '465': {'descripcion': 'Remuneraciones pendientes pago', 'tipo': 'pasivo'},
-    '472': {'descripcion': 'H.P. IVA soportado', 'tipo': 'activo'},
-    '475': {'descripcion': 'H.P. acreedora conceptos fiscales', 'tipo': 'pasivo'},
-    '4750': {'descripcion': 'H.P. acreedora por IVA', 'tipo': 'pasivo'},
-    '4751': {'descripcion': 'H.P. acreedora por retenciones', 'tipo': 'pasivo'},
-    '476': {'descripcion': 'Organismos Seg. Social acreedores', 'tipo': 'pasivo'},
-    '477': {'descripcion': 'H.P. IVA repercutido', 'tipo': 'pasivo'},
-    '570': {'descripcion': 'Caja, euros', 'tipo': 'activo'},
-    '572': {'descripcion': 'Bancos c/c', 'tipo': 'activo'},
-    '600': {'descripcion': 'Compras de mercaderías', 'tipo': 'gasto'},
-    '621': {'descripcion': 'Arrendamientos y cánones', 'tipo': 'gasto'},
-    '622': {'descripcion': 'Reparaciones y conservación', 'tipo': 'gasto'},
-    '623': {'descripcion': 'Servicios profesionales indep.', 'tipo': 'gasto'},
-    '624': {'descripcion': 'Transportes', 'tipo': 'gasto'},
-    '625': {'descripcion': 'Primas de seguros', 'tipo': 'gasto'},
-    '626': {'descripcion': 'Servicios bancarios', 'tipo': 'gasto'},
-    '627': {'descripcion': 'Publicidad y propaganda', 'tipo': 'gasto'},
-    '628': {'descripcion': 'Suministros', 'tipo': 'gasto'},
-    '629': {'descripcion': 'Otros servicios', 'tipo': 'gasto'},
-    '640': {'descripcion': 'Sueldos y salarios', 'tipo': 'gasto'},
-    '642': {'descripcion': 'Seguridad Social empresa', 'tipo': 'gasto'},
-    '700': {'descripcion': 'Ventas de mercaderías', 'tipo': 'ingreso'},
-    '705': {'descripcion': 'Prestaciones de servicios', 'tipo': 'ingreso'},
-    '759': {'descripcion': 'Ingresos por servicios diversos', 'tipo': 'ingreso'},
-    '769': {'descripcion': 'Otros ingresos financieros', 'tipo': 'ingreso'},
-}
+if 'vistas' not in st.session_state:
+    st.session_state.vistas = CacheVistas(max_entradas=MAX_VISTAS_CACHEADAS)
 
-PLAN_CUENTAS_COMUNIDADES = {
-    '100': {'descripcion': 'Fondo de reserva', 'tipo': 'patrimonio'},
-    '110': {'descripcion': 'Remanente', 'tipo': 'patrimonio'},
-    '129': {'descripcion': 'Resultado del ejercicio', 'tipo': 'patrimonio'},
-    '410': {'descripcion': 'Acreedores prestación servicios', 'tipo': 'pasivo'},
-    '430': {'descripcion': 'Propietarios cuenta corriente', 'tipo': 'activo'},
-    '4300': {'descripcion': 'Propietarios - Cuotas ordinarias', 'tipo': 'activo'},
-    '4301': {'descripcion': 'Propietarios - Derramas', 'tipo': 'activo'},
-    '4309': {'descripcion': 'Propietarios - Dudoso cobro', 'tipo': 'activo'},
-    '465': {'descripcion': 'Remuneraciones pendientes pago', 'tipo': 'pasivo'},
-    '4751': {'descripcion': 'H.P. acreedora retenciones', 'tipo': 'pasivo'},
-    '476': {'descripcion': 'Organismos Seg. Social acreedores', 'tipo': 'pasivo'},
-    '570': {'descripcion': 'Caja', 'tipo': 'activo'},
-    '572': {'descripcion': 'Bancos c/c', 'tipo': 'activo'},
-    '5721': {'descripcion': 'Banco cuenta ordinaria', 'tipo': 'activo'},
-    '5722': {'descripcion': 'Banco fondo reserva', 'tipo': 'activo'},
-    '621': {'descripcion': 'Arrendamientos y cánones', 'tipo': 'gasto'},
-    '622': {'descripcion': 'Reparaciones y conservación', 'tipo': 'gasto'},
-    '623': {'descripcion': 'Servicios profesionales', 'tipo': 'gasto'},
-    '6230': {'descripcion': 'Honorarios administrador', 'tipo': 'gasto'},
-    '625': {'descripcion': 'Primas de seguros', 'tipo': 'gasto'},
-    '626': {'descripcion': 'Servicios bancarios', 'tipo': 'gasto'},
-    '628': {'descripcion': 'Suministros', 'tipo': 'gasto'},
-    '6280': {'descripcion': 'Suministro eléctrico', 'tipo': 'gasto'},
-    '6281': {'descripcion': 'Suministro agua', 'tipo': 'gasto'},
-    '629': {'descripcion': 'Otros servicios', 'tipo': 'gasto'},
-    '6290': {'descripcion': 'Limpieza', 'tipo': 'gasto'},
-    '6291': {'descripcion': 'Jardinería', 'tipo': 'gasto'},
-    '6293': {'descripcion': 'Mantenimiento ascensor', 'tipo': 'gasto'},
-    '630': {'descripcion': 'Tributos', 'tipo': 'gasto'},
-    '640': {'descripcion': 'Sueldos y salarios', 'tipo': 'gasto'},
-    '642': {'descripcion': 'Seguridad Social empresa', 'tipo': 'gasto'},
-    '740': {'descripcion': 'Cuotas de propietarios', 'tipo': 'ingreso'},
-    '7400': {'descripcion': 'Cuotas ordinarias', 'tipo': 'ingreso'},
-    '7401': {'descripcion': 'Derramas', 'tipo': 'ingreso'},
-    '752': {'descripcion': 'Ingresos por arrendamientos', 'tipo': 'ingreso'},
-}
+if 'perfilador' not in st.session_state:
+    st.session_state.perfilador = Perfilador()
+
+if 'cola_revision' not in st.session_state:
+    st.session_state.cola_revision = ColaRevision(st.session_state.referencias)
+    st.session_state.procesador_documentos = ProcesadorDocumentos(
+        extractor_por_defecto(), max_concurrencia=MAX_EXTRACCIONES_SIMULTANEAS,
+        cache=obtener_cache_extracciones()
+    )
+
+libro = st.session_state.libro
+saldos = st.session_state.saldos
+sumas_saldos = st.session_state.sumas_saldos
+apuntes = st.session_state.apuntes
+modelo_303 = st.session_state.modelo_303
+modelo_347 = st.session_state.modelo_347
+retenciones = st.session_state.retenciones
+diario = st.session_state.diario
+persistencia = st.session_state.persistencia
+indice_recibos = st.session_state.indice_recibos
+cola_revision = st.session_state.cola_revision
+procesador_documentos = st.session_state.procesador_documentos
+vistas = st.session_state.vistas
+perfilador = st.session_state.perfilador
+
+# El panel de depuración (al final) decide si se mide este rerun
+perfilador.activo = st.session_state.get('perfilador_activo', False)
+perfilador.iniciar_rerun()
+
+ASIENTOS_POR_PAGINA = 100
 
 # =====================================================
 # FUNCIONES AUXILIARES
 # =====================================================
 
-def obtener_plan_cuentas(tipo_entidad):
-    """Devuelve el plan de cuentas según tipo de entidad"""
-    if tipo_entidad == 'comunidad_propietarios':
-        return PLAN_CUENTAS_COMUNIDADES
-    return PLAN_CUENTAS_PYMES
+def obtener_plan_cuentas(entidad):
+    """Plan de cuentas compilado de la entidad (solo el de la última versión de los terceros)"""
+    version = st.session_state.version_terceros
+    planes = st.session_state.setdefault('planes_cuentas', {})
+    if entidad['id'] not in planes or planes[entidad['id']][0] != version:
+        planes[entidad['id']] = (version, compilar_plan(entidad, st.session_state.terceros))
+    return planes[entidad['id']][1]
+
+def vista_libro(nombre, entidad, parametros, calcular):
+    """Vista derivada del libro de la entidad, recalculada solo si el libro o los terceros cambian"""
+    return vistas.obtener(nombre, entidad['id'],
+                          (libro.version(entidad['id']), st.session_state.version_terceros),
+                          parametros, calcular)
 
-def generar_numero_asiento(entidad_id):
-    """Genera número de asiento correlativo"""
-    asientos_entidad = [a for a in st.session_state.asientos if a['entidad_id'] == entidad_id]
-    return len(asientos_entidad) + 1
+def vista_recibos(nombre, entidad, parametros, calcular):
+    """Vista derivada de los recibos de la entidad, recalculada solo si cambian"""
+    return vistas.obtener(nombre, entidad['id'], persistencia.version_recibos(entidad['id']),
+                          parametros, calcular)
 
-def calcular_iva(base, tipo_iva):
-    """Calcula cuota de IVA"""
-    return round(base * tipo_iva / 100, 2)
+def botones_exportacion(tabla, clave):
+    """Descargas CSV / XLSX / Parquet de un libro; el fichero se escribe por trozos al pulsar"""
+    for columna, (formato, (extension, mime)) in zip(st.columns(len(FORMATOS_EXPORTACION)),
+                                                     FORMATOS_EXPORTACION.items()):
+        def generar(formato=formato):
+            fichero = BytesIO()
+            exportar(tabla, formato, fichero)
+            return fichero.getvalue()
+        columna.download_button(f"📥 {formato.upper()}", data=generar, mime=mime,
+                                file_name=f"{tabla.nombre}_{entidad_seleccionada['nif']}.{extension}",
+                                key=f"exportar_{clave}_{formato}", on_click='ignore')
+
+def confirmar_cambios(recibos=(), detener=True):
+    """Escribe los asientos pendientes (y los recibos, en la misma transacción);
+    si la base los rechaza, lo avisa (y corta el rerun)"""
+    try:
+        persistencia.confirmar(recibos)
+    except ErrorPersistencia as e:
+        st.error(f"❌ {e}")
+        if detener:
+            st.stop()
+
+def buscar_tercero_id(nif):
+    """Devuelve el id del tercero con ese NIF, o None si no está dado de alta"""
+    for tercero in st.session_state.terceros:
+        if tercero['nif'] == nif:
+            return tercero['id']
+    return None
 
 # =====================================================
 # SIDEBAR - SELECCIÓN DE ENTIDAD
 # =====================================================
 
-with st.sidebar:
+with st.sidebar, perfilador.seccion('Barra lateral'):
     st.image("https://img.icons8.com/color/96/accounting.png", width=80)
     st.title("ContaFácil")
     st.caption("Contabilidad PGC Español")
@@ -182,6 +302,12 @@ with st.sidebar:
     )
     
     if entidad_seleccionada:
+        # Carga perezosa: asientos y recibos de la entidad, la primera vez
+        persistencia.cargar_entidad(
+            entidad_seleccionada['id'],
+            {t['id']: t for t in st.session_state.terceros}
+        )
+        
         tipo_badges = {
             'sociedad_limitada': '🏛️ S.L.',
             'sociedad_anonima': '🏛️ S.A.',
@@ -204,10 +330,8 @@ with st.sidebar:
     st.divider()
     
     # Estadísticas rápidas
-    asientos_entidad = [a for a in st.session_state.asientos 
-                        if a['entidad_id'] == entidad_seleccionada['id']]
-    
-    st.metric("Asientos", len(asientos_entidad))
+    st.metric("Asientos", libro.num_asientos(entidad_seleccionada['id']))
+    st.metric("Cuentas con movimientos", saldos.num_cuentas(entidad_seleccionada['id']))
 
 # =====================================================
 # CONTENIDO PRINCIPAL
@@ -215,772 +339,1226 @@ with st.sidebar:
 
 st.title(f"📊 {entidad_seleccionada['razon_social']}")
 
-# Pestañas principales
-tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
-    "📄 Subir Documentos",
-    "📒 Libro Diario",
-    "📊 Libro Mayor",
-    "🧾 Modelos Fiscales",
-    "💰 Cobros/Pagos",
-    "⚙️ Configuración"
-])
+# Secciones principales: solo se ejecuta la activa (st.tabs ejecutaría las seis
+# en cada rerun). La sección vive en session_state y en la URL (?seccion=diario).
+if 'seccion_activa' not in st.session_state:
+    st.session_state.seccion_activa = SECCIONES_POR_RUTA.get(
+        st.query_params.get('seccion'), SECCION_DOCUMENTOS
+    )
+
+seccion_activa = st.radio(
+    "Sección:", SECCIONES, key='seccion_activa', horizontal=True, label_visibility="collapsed"
+)
+st.query_params['seccion'] = RUTAS_SECCION[seccion_activa]
+
+# Los apartados de una sección que no se ejecuta conservan su valor
+for clave_apartado in ('apartado_cobros', 'apartado_configuracion'):
+    if clave_apartado in st.session_state:
+        st.session_state[clave_apartado] = st.session_state[clave_apartado]
 
 # =====================================================
-# TAB 1: SUBIR DOCUMENTOS
+# SECCIÓN 1: SUBIR DOCUMENTOS
 # =====================================================
 
-with tab1:
-    st.header("📄 Contabilización Automática de Documentos")
+if seccion_activa == SECCION_DOCUMENTOS:
+    with perfilador.seccion('Subir documentos'):
+        st.header("📄 Contabilización Automática de Documentos")
     
-    col1, col2 = st.columns([2, 1])
+        col1, col2 = st.columns([2, 1])
     
-    with col1:
-        st.subheader("Subir documento")
+        with col1:
+            st.subheader("Subir documentos")
         
-        uploaded_file = st.file_uploader(
-            "Arrastra o selecciona un PDF (factura, nómina, etc.)",
-            type=['pdf', 'png', 'jpg', 'jpeg'],
-            help="El sistema extraerá los datos y propondrá el asiento contable"
-        )
+            ficheros = st.file_uploader(
+                "Arrastra o selecciona PDFs o imágenes (facturas, nóminas, etc.)",
+                type=['pdf', 'png', 'jpg', 'jpeg'],
+                accept_multiple_files=True,
+                help="El sistema extraerá los datos de cada documento y propondrá su asiento contable"
+            )
         
-        if uploaded_file:
-            st.success(f"✅ Archivo cargado: {uploaded_file.name}")
+            if ficheros and st.button(f"🤖 Procesar {len(ficheros)} documento(s) con IA", type="primary"):
+                barra = st.progress(0.0, text="Procesando documentos...")
             
-            # Simulación de OCR + IA (en producción usaríamos Claude API)
-            st.info("🔄 Procesando documento con IA...")
+                def mostrar_progreso(documento, terminados, total):
+                    barra.progress(terminados / total,
+                                   text=f"{terminados}/{total} · {documento.nombre}: {documento.estado}")
             
-            # Datos de ejemplo extraídos
-            with st.expander("📋 Datos extraídos del documento", expanded=True):
-                tipo_doc = st.selectbox(
-                    "Tipo de documento detectado:",
-                    ["Factura recibida", "Factura emitida", "Nómina", "Extracto bancario"]
-                )
-                
-                if tipo_doc == "Factura recibida":
-                    col_a, col_b = st.columns(2)
-                    with col_a:
-                        proveedor = st.text_input("Proveedor:", "SUMINISTROS INDUSTRIALES SL")
-                        nif_prov = st.text_input("NIF Proveedor:", "B98765432")
-                        fecha_fra = st.date_input("Fecha factura:", date.today())
-                    with col_b:
-                        num_factura = st.text_input("Nº Factura:", "2024/1234")
-                        base_imp = st.number_input("Base imponible:", value=1000.00, step=0.01)
-                        tipo_iva = st.selectbox("Tipo IVA:", [21, 10, 4, 0])
-                    
-                    cuota_iva = calcular_iva(base_imp, tipo_iva)
-                    total = base_imp + cuota_iva
-                    
-                    st.divider()
-                    st.write(f"**Cuota IVA:** {cuota_iva:.2f} €")
-                    st.write(f"**TOTAL FACTURA:** {total:.2f} €")
-                    
-                    # Propuesta de asiento
-                    st.divider()
-                    st.subheader("📝 Asiento propuesto")
-                    
-                    cuenta_gasto = st.selectbox(
-                        "Cuenta de gasto:",
-                        ['600 - Compras mercaderías', '621 - Arrendamientos', 
-                         '622 - Reparaciones', '623 - Servicios profesionales',
-                         '628 - Suministros', '629 - Otros servicios']
+                with perfilador.seccion('OCR + IA'):
+                    documentos = procesador_documentos.procesar(
+                        [(f.name, f.getvalue()) for f in ficheros], mostrar_progreso
                     )
-                    
-                    # Mostrar asiento
-                    df_asiento = pd.DataFrame([
-                        {'Cuenta': cuenta_gasto.split(' - ')[0], 
-                         'Descripción': cuenta_gasto.split(' - ')[1],
-                         'Debe': f"{base_imp:.2f} €", 'Haber': ''},
-                        {'Cuenta': '472', 
-                         'Descripción': 'H.P. IVA soportado',
-                         'Debe': f"{cuota_iva:.2f} €", 'Haber': ''},
-                        {'Cuenta': '400', 
-                         'Descripción': f'Proveedor: {proveedor}',
-                         'Debe': '', 'Haber': f"{total:.2f} €"},
-                    ])
-                    
-                    st.dataframe(df_asiento, use_container_width=True, hide_index=True)
-                    
-                    if st.button("✅ Contabilizar", type="primary"):
-                        # Guardar asiento
-                        nuevo_asiento = {
-                            'id': len(st.session_state.asientos) + 1,
-                            'entidad_id': entidad_seleccionada['id'],
-                            'numero': generar_numero_asiento(entidad_seleccionada['id']),
-                            'fecha': fecha_fra.isoformat(),
-                            'concepto': f"Fra. {num_factura} - {proveedor}",
-                            'apuntes': [
-                                {'cuenta': cuenta_gasto.split(' - ')[0], 'debe': base_imp, 'haber': 0},
-                                {'cuenta': '472', 'debe': cuota_iva, 'haber': 0},
-                                {'cuenta': '400', 'debe': 0, 'haber': total},
-                            ]
-                        }
-                        st.session_state.asientos.append(nuevo_asiento)
-                        st.success(f"✅ Asiento nº {nuevo_asiento['numero']} contabilizado correctamente")
-                        st.balloons()
-                
-                elif tipo_doc == "Factura emitida":
-                    col_a, col_b = st.columns(2)
-                    with col_a:
-                        cliente = st.text_input("Cliente:", "CLIENTE EJEMPLO SA")
-                        nif_cli = st.text_input("NIF Cliente:", "A11111111")
-                        fecha_fra = st.date_input("Fecha factura:", date.today())
-                    with col_b:
-                        num_factura = st.text_input("Nº Factura:", "2024/0001")
-                        base_imp = st.number_input("Base imponible:", value=2500.00, step=0.01)
-                        tipo_iva = st.selectbox("Tipo IVA:", [21, 10, 4, 0])
-                    
-                    cuota_iva = calcular_iva(base_imp, tipo_iva)
-                    total = base_imp + cuota_iva
-                    
-                    st.divider()
-                    st.subheader("📝 Asiento propuesto")
-                    
-                    df_asiento = pd.DataFrame([
-                        {'Cuenta': '430', 
-                         'Descripción': f'Cliente: {cliente}',
-                         'Debe': f"{total:.2f} €", 'Haber': ''},
-                        {'Cuenta': '700', 
-                         'Descripción': 'Ventas de mercaderías',
-                         'Debe': '', 'Haber': f"{base_imp:.2f} €"},
-                        {'Cuenta': '477', 
-                         'Descripción': 'H.P. IVA repercutido',
-                         'Debe': '', 'Haber': f"{cuota_iva:.2f} €"},
-                    ])
-                    
-                    st.dataframe(df_asiento, use_container_width=True, hide_index=True)
-                    
-                    if st.button("✅ Contabilizar", type="primary"):
-                        nuevo_asiento = {
-                            'id': len(st.session_state.asientos) + 1,
-                            'entidad_id': entidad_seleccionada['id'],
-                            'numero': generar_numero_asiento(entidad_seleccionada['id']),
-                            'fecha': fecha_fra.isoformat(),
-                            'concepto': f"Fra. emitida {num_factura} - {cliente}",
-                            'apuntes': [
-                                {'cuenta': '430', 'debe': total, 'haber': 0},
-                                {'cuenta': '700', 'debe': 0, 'haber': base_imp},
-                                {'cuenta': '477', 'debe': 0, 'haber': cuota_iva},
-                            ]
-                        }
-                        st.session_state.asientos.append(nuevo_asiento)
-                        st.success(f"✅ Asiento nº {nuevo_asiento['numero']} contabilizado correctamente")
-    
-    with col2:
-        st.subheader("📌 Asientos rápidos")
-        
-        if entidad_seleccionada['tipo'] == 'comunidad_propietarios':
-            st.write("**Comunidad de propietarios:**")
-            if st.button("🏠 Emitir cuotas mensuales"):
-                st.session_state.mostrar_cuotas = True
-            if st.button("💡 Registrar factura suministro"):
-                st.session_state.mostrar_suministro = True
-            if st.button("👷 Registrar nómina empleado"):
-                st.session_state.mostrar_nomina = True
-        else:
-            st.write("**Empresa/Autónomo:**")
-            if st.button("🛒 Compra mercaderías"):
-                pass
-            if st.button("💰 Venta mercaderías"):
-                pass
-            if st.button("👷 Nóminas mes"):
-                pass
+                for documento in documentos:
+                    if documento.estado == 'extraido':
+                        try:
+                            cola_revision.anadir(documento, propuesta_asiento(
+                                documento.datos, entidad_seleccionada['id'], buscar_tercero_id
+                            ))
+                        except ValueError as e:
+                            documento.estado, documento.error = 'error', str(e)
+            
+                st.dataframe(pd.DataFrame([{
+                    'Documento': d.nombre,
+                    'Estado': d.estado.title(),
+                    'Intentos': d.intentos,
+                    'Caché': '✓' if d.desde_cache else '',
+                    'Segundos': f"{d.segundos:.2f}",
+                    'Detalle': d.error or '',
+                } for d in documentos]), use_container_width=True, hide_index=True)
+        
+            # Cola de revisión: propuestas de la entidad pendientes de contabilizar
+            propuestas = {doc_id: p for doc_id, p in cola_revision.propuestas.items()
+                          if p['asiento']['entidad_id'] == entidad_seleccionada['id']}
+            if propuestas:
+                st.divider()
+                st.subheader(f"📝 Asientos propuestos pendientes de revisión ({len(propuestas)})")
+            
+                df_cola = pd.DataFrame([{
+                    'id': doc_id,
+                    'Aprobar': not p['duplicado'],
+                    'Documento': p['documento'],
+                    'Tipo': p['datos'].tipo,
+                    'Fecha': p['asiento']['fecha'],
+                    'Tercero': p['datos'].nombre,
+                    'Nº Factura': p['datos'].numero_factura,
+                    'Base': float(p['datos'].base),
+                    'IVA %': p['datos'].tipo_iva,
+                    'Total': float(p['datos'].total),
+                    'Posible duplicado': p['duplicado'] or '',
+                } for doc_id, p in propuestas.items()])
+            
+                revision = st.data_editor(
+                    df_cola,
+                    column_config={'id': None},
+                    disabled=[c for c in df_cola.columns if c != 'Aprobar'],
+                    use_container_width=True,
+                    hide_index=True,
+                    key='editor_cola_revision'
+                )
+                seleccionados = revision.loc[revision['Aprobar'], 'id'].tolist()
+            
+                col_aprobar, col_descartar = st.columns(2)
+                with col_aprobar:
+                    if st.button(f"✅ Contabilizar {len(seleccionados)} asiento(s)", type="primary",
+                                 disabled=not seleccionados):
+                        aprobados, omitidos = cola_revision.aprobar(seleccionados)
+                        contabilizados = libro.contabilizar_lote(aprobados)
+                        confirmar_cambios()
+                        if contabilizados:
+                            st.success(f"✅ {len(contabilizados)} asientos contabilizados "
+                                       f"(nº {contabilizados[0]['numero']} a {contabilizados[-1]['numero']})")
+                        if omitidos:
+                            st.warning("No se contabilizan por estar ya registradas: " + ", ".join(omitidos))
+                with col_descartar:
+                    if st.button("🗑️ Descartar seleccionados", disabled=not seleccionados):
+                        cola_revision.descartar(seleccionados)
+                        st.rerun()
+
+            # Extractos bancarios: se leen en streaming y se contabilizan por lotes
+            st.divider()
+            st.subheader("🏦 Extracto bancario")
+
+            fichero_extracto = st.file_uploader(
+                "Extracto en formato AEB Norma 43 o ISO 20022 CAMT.053",
+                type=['n43', 'c43', 'aeb', 'txt', 'xml'],
+                key='fichero_extracto',
+                help="Cada movimiento se propone como asiento contra la 572 según su contraparte y concepto"
+            )
+
+            if fichero_extracto:
+                cuentas_tercero = dict(CUENTAS_TERCERO)
+                if entidad_seleccionada['tipo'] == 'comunidad_propietarios':
+                    cuentas_tercero['propietario'] = '4300'
+                clasificador = ClasificadorMovimientos(st.session_state.terceros,
+                                                       cuentas_tercero=cuentas_tercero)
+                clave_extracto = (fichero_extracto.file_id, entidad_seleccionada['id'],
+                                  libro.version(entidad_seleccionada['id']))
+
+                try:
+                    if st.session_state.get('analisis_extracto', (None,))[0] != clave_extracto:
+                        with perfilador.seccion('Análisis de extracto'):
+                            analisis = importar_extracto(BytesIO(fichero_extracto.getvalue()),
+                                                         entidad_seleccionada['id'], clasificador,
+                                                         st.session_state.referencias, max_muestra=50)
+                        st.session_state.analisis_extracto = (clave_extracto, analisis)
+                    analisis = st.session_state.analisis_extracto[1]
+                except ErrorExtracto as e:
+                    st.error(f"❌ {e}")
+                    analisis = None
+
+                if analisis:
+                    resumen = analisis.resumen
+                    c1, c2, c3, c4 = st.columns(4)
+                    c1.metric("Movimientos", f"{resumen.movimientos:,}")
+                    c2.metric("Abonos", f"{euros(resumen.abonos):,.2f} €")
+                    c3.metric("Cargos", f"{euros(resumen.cargos):,.2f} €")
+                    c4.metric("Ya importados", f"{analisis.ya_importados:,}")
+                    st.caption(f"{resumen.formato} · {', '.join(resumen.cuentas)} · "
+                               f"analizado en {analisis.segundos:.2f} s")
+                    for aviso in resumen.avisos:
+                        st.warning(aviso)
+
+                    st.dataframe(pd.DataFrame([{
+                        'Contrapartida': cuenta,
+                        'Descripción': descripcion,
+                        'Movimientos': num,
+                        'Importe neto': float(euros(importe)),
+                    } for cuenta, (descripcion, num, importe) in sorted(analisis.por_cuenta.items())]),
+                        use_container_width=True, hide_index=True)
+
+                    with st.expander(f"Primeros {len(analisis.muestra)} asientos propuestos"):
+                        st.dataframe(perfilador.dataframe(pd.DataFrame([{
+                            'Fecha': a['fecha'],
+                            'Concepto': a['concepto'],
+                            'Contrapartida': a['apuntes'][1]['cuenta'],
+                            'Banco (572)': a['apuntes'][0]['debe'] - a['apuntes'][0]['haber'],
+                        } for a in analisis.muestra])), use_container_width=True, hide_index=True)
+
+                    if st.button(f"✅ Contabilizar {analisis.propuestos:,} movimiento(s)", type="primary",
+                                 disabled=not analisis.propuestos, key='contabilizar_extracto'):
+                        barra = st.progress(0.0, text="Contabilizando extracto...")
+
+                        def contabilizar_lote_extracto(lote):
+                            libro.contabilizar_lote(lote)
+                            confirmar_cambios()
+
+                        def mostrar_progreso_extracto(leidos):
+                            barra.progress(min(leidos / resumen.movimientos, 1.0),
+                                           text=f"{leidos:,}/{resumen.movimientos:,} movimientos")
+
+                        with perfilador.seccion('Importación de extracto'):
+                            importacion = importar_extracto(
+                                BytesIO(fichero_extracto.getvalue()), entidad_seleccionada['id'],
+                                clasificador, st.session_state.referencias,
+                                contabilizar=contabilizar_lote_extracto, max_muestra=0,
+                                al_progresar=mostrar_progreso_extracto,
+                            )
+                        st.success(f"✅ {importacion.contabilizados:,} asientos contabilizados "
+                                   f"en {importacion.segundos:.1f} s")
+
+            # Diarios de otros programas: validación por columnas y alta en un solo lote
+            st.divider()
+            st.subheader("📚 Importar diario histórico")
+
+            fichero_diario = st.file_uploader(
+                "Diario exportado de ContaPlus o A3 (CSV o Excel)",
+                type=['csv', 'txt', 'xlsx'],
+                key='fichero_diario',
+                help="Se valida el fichero completo (cuadre de cada asiento, cuentas del plan y fechas "
+                     "del ejercicio) y se contabilizan de una vez los asientos correctos"
+            )
+
+            if fichero_diario:
+                ejercicio_diario = st.number_input("Ejercicio del diario:", min_value=1990,
+                                                   max_value=date.today().year, value=ejercicio,
+                                                   step=1, key='ejercicio_diario')
+                clave_diario = (fichero_diario.file_id, entidad_seleccionada['id'], ejercicio_diario,
+                                libro.version(entidad_seleccionada['id']))
+
+                try:
+                    if st.session_state.get('analisis_diario', (None,))[0] != clave_diario:
+                        with perfilador.seccion('Análisis de diario histórico'):
+                            analisis_diario = analizar_diario(
+                                fichero_diario.getvalue(), fichero_diario.name, entidad_seleccionada['id'],
+                                obtener_plan_cuentas(entidad_seleccionada), ejercicio_diario,
+                                st.session_state.referencias
+                            )
+                        st.session_state.analisis_diario = (clave_diario, analisis_diario)
+                    analisis_diario = st.session_state.analisis_diario[1]
+                except ErrorDiario as e:
+                    st.error(f"❌ {e}")
+                    analisis_diario = None
+
+                if analisis_diario:
+                    c1, c2, c3, c4 = st.columns(4)
+                    c1.metric("Asientos válidos", f"{len(analisis_diario.asientos):,}")
+                    c2.metric("Asientos con errores", f"{analisis_diario.asientos_con_errores:,}")
+                    c3.metric("Ya importados", f"{analisis_diario.ya_importados:,}")
+                    c4.metric("Importe (debe)", f"{euros(analisis_diario.debe):,.2f} €")
+                    st.caption(f"Diseño {analisis_diario.diseno} · {analisis_diario.filas:,} líneas "
+                               f"({analisis_diario.apuntes_vacios:,} sin importe) · "
+                               f"analizado en {analisis_diario.segundos:.2f} s")
+
+                    errores_diario = analisis_diario.errores
+                    if not errores_diario.empty:
+                        st.warning(f"{len(errores_diario):,} línea(s) con errores: sus asientos no se importan")
+                        st.dataframe(perfilador.dataframe(errores_diario.head(1000)),
+                                     use_container_width=True, hide_index=True)
+                        st.download_button(
+                            "📥 Informe de errores (CSV)",
+                            data=lambda: errores_diario.to_csv(sep=';', index=False).encode('utf-8-sig'),
+                            file_name=f"errores_diario_{ejercicio_diario}.csv", mime='text/csv',
+                            key='informe_errores_diario', on_click='ignore'
+                        )
+
+                    if analisis_diario.asientos:
+                        primer_numero = libro.siguiente_numero(entidad_seleccionada['id'])
+                        st.caption(f"Se numerarán por fecha del nº {primer_numero:,} al "
+                                   f"{primer_numero + len(analisis_diario.asientos) - 1:,}")
+                        existentes = len(libro.asientos_ejercicio(entidad_seleccionada['id'], ejercicio_diario))
+                        if existentes:
+                            st.warning(f"El ejercicio {ejercicio_diario} ya tiene {existentes:,} asiento(s): "
+                                       "los importados se numeran a continuación del último asiento")
+
+                    if st.button(f"✅ Contabilizar {len(analisis_diario.asientos):,} asiento(s)",
+                                 type="primary", disabled=not analisis_diario.asientos,
+                                 key='contabilizar_diario'):
+                        with perfilador.seccion('Importación de diario histórico'):
+                            contabilizados = libro.contabilizar_lote(analisis_diario.asientos)
+                            confirmar_cambios()
+                        st.success(f"✅ {len(contabilizados):,} asientos contabilizados "
+                                   f"(nº {contabilizados[0]['numero']} a {contabilizados[-1]['numero']})")
+
+        with col2:
+            st.subheader("📌 Asientos rápidos")
+        
+            if entidad_seleccionada['tipo'] == 'comunidad_propietarios':
+                st.write("**Comunidad de propietarios:**")
+                if st.button("🏠 Emitir cuotas mensuales"):
+                    st.session_state.mostrar_cuotas = True
+                if st.button("💡 Registrar factura suministro"):
+                    st.session_state.mostrar_suministro = True
+                if st.button("👷 Registrar nómina empleado"):
+                    st.session_state.mostrar_nomina = True
+            else:
+                st.write("**Empresa/Autónomo:**")
+                if st.button("🛒 Compra mercaderías"):
+                    pass
+                if st.button("💰 Venta mercaderías"):
+                    pass
+                if st.button("👷 Nóminas mes"):
+                    pass
 
 # =====================================================
-# TAB 2: LIBRO DIARIO
+# SECCIÓN 2: LIBRO DIARIO
 # =====================================================
 
-with tab2:
-    st.header("📒 Libro Diario")
-    
-    asientos_entidad = [a for a in st.session_state.asientos 
-                        if a['entidad_id'] == entidad_seleccionada['id']]
+if seccion_activa == SECCION_DIARIO:
+    with perfilador.seccion('Libro Diario'):
+        st.header("📒 Libro Diario")
     
-    if not asientos_entidad:
-        st.info("No hay asientos registrados. Sube un documento o crea un asiento manual.")
-        
-        if st.button("➕ Crear asiento manual"):
-            st.session_state.crear_asiento_manual = True
-    else:
-        # Filtros
-        col1, col2, col3 = st.columns([1, 1, 2])
-        with col1:
-            fecha_desde = st.date_input("Desde:", date(ejercicio, 1, 1))
-        with col2:
-            fecha_hasta = st.date_input("Hasta:", date(ejercicio, 12, 31))
+        if not libro.num_asientos(entidad_seleccionada['id']):
+            st.info("No hay asientos registrados. Sube un documento o crea un asiento manual.")
         
-        st.divider()
+            if st.button("➕ Crear asiento manual"):
+                st.session_state.crear_asiento_manual = True
+        else:
+            # Filtros
+            col1, col2, col3 = st.columns([1, 1, 2])
+            with col1:
+                fecha_desde = st.date_input("Desde:", date(ejercicio, 1, 1))
+            with col2:
+                fecha_hasta = st.date_input("Hasta:", date(ejercicio, 12, 31))
         
-        # Mostrar asientos
-        for asiento in sorted(asientos_entidad, key=lambda x: x['numero']):
-            with st.expander(f"**Asiento {asiento['numero']}** | {asiento['fecha']} | {asiento['concepto']}", expanded=False):
-                
-                # Crear tabla de apuntes
-                datos_apuntes = []
-                total_debe = 0
-                total_haber = 0
-                
-                plan = obtener_plan_cuentas(entidad_seleccionada['tipo'])
-                
-                for apunte in asiento['apuntes']:
-                    cuenta_info = plan.get(apunte['cuenta'], {'descripcion': 'Cuenta no encontrada'})
-                    datos_apuntes.append({
-                        'Cuenta': apunte['cuenta'],
-                        'Descripción': cuenta_info['descripcion'],
-                        'Debe': f"{apunte['debe']:.2f}" if apunte['debe'] else '',
-                        'Haber': f"{apunte['haber']:.2f}" if apunte['haber'] else '',
-                    })
-                    total_debe += apunte['debe']
-                    total_haber += apunte['haber']
-                
-                df = pd.DataFrame(datos_apuntes)
-                st.dataframe(df, use_container_width=True, hide_index=True)
-                
-                col_tot1, col_tot2 = st.columns(2)
-                with col_tot1:
-                    st.write(f"**Total Debe:** {total_debe:.2f} €")
-                with col_tot2:
-                    st.write(f"**Total Haber:** {total_haber:.2f} €")
-                
-                if abs(total_debe - total_haber) < 0.01:
-                    st.success("✓ Asiento cuadrado")
+            # Rango por búsqueda binaria sobre el índice por fecha
+            num_asientos_rango = diario.num_asientos_rango(
+                entidad_seleccionada['id'], fecha_desde, fecha_hasta
+            )
+            num_paginas = max(1, -(-num_asientos_rango // ASIENTOS_POR_PAGINA))
+            with col3:
+                pagina = st.number_input(
+                    f"Página (de {num_paginas}):", min_value=1, max_value=num_paginas, value=1
+                )
+        
+            st.divider()
+        
+            if not num_asientos_rango:
+                st.info("No hay asientos en el rango de fechas seleccionado.")
+            else:
+                # Mostrar solo la página actual como una única tabla
+                asientos_pagina = diario.pagina(
+                    entidad_seleccionada['id'], fecha_desde, fecha_hasta,
+                    pagina=pagina - 1, tamano=ASIENTOS_POR_PAGINA
+                )
+                plan = obtener_plan_cuentas(entidad_seleccionada)
+                if perfilador.activo:
+                    perfilador.anotar_apuntes(sum(len(a['apuntes']) for a in asientos_pagina))
+            
+                df = vista_libro('diario', entidad_seleccionada, (fecha_desde, fecha_hasta, pagina),
+                                 lambda: pd.DataFrame(filas_diario(asientos_pagina, plan)))
+                st.dataframe(perfilador.dataframe(df), use_container_width=True, hide_index=True)
+            
+                primero = (pagina - 1) * ASIENTOS_POR_PAGINA
+                st.caption(f"Asientos {primero + 1}-{primero + len(asientos_pagina)} de {num_asientos_rango}")
+            
+                descuadrados = [a['numero'] for a in asientos_pagina if not diario.cuadrado(a['id'])]
+                if descuadrados:
+                    st.error(f"✗ Asientos descuadrados: {', '.join(map(str, descuadrados))}")
                 else:
-                    st.error("✗ Asiento descuadrado")
+                    st.success("✓ Todos los asientos de la página están cuadrados")
         
-        st.divider()
+            st.divider()
         
-        # Totales del diario
-        total_debe_diario = sum(
-            sum(a['debe'] for a in asiento['apuntes']) 
-            for asiento in asientos_entidad
-        )
-        total_haber_diario = sum(
-            sum(a['haber'] for a in asiento['apuntes']) 
-            for asiento in asientos_entidad
-        )
+            # Totales del rango (sumas acumuladas precalculadas, en céntimos)
+            total_debe_diario, total_haber_diario = (
+                c / 100 for c in diario.totales_rango(entidad_seleccionada['id'], fecha_desde, fecha_hasta)
+            )
         
-        st.subheader("Totales del Diario")
-        col1, col2 = st.columns(2)
-        with col1:
-            st.metric("Total Debe", f"{total_debe_diario:,.2f} €")
-        with col2:
-            st.metric("Total Haber", f"{total_haber_diario:,.2f} €")
+            st.subheader("Totales del Diario")
+            col1, col2 = st.columns(2)
+            with col1:
+                st.metric("Total Debe", f"{total_debe_diario:,.2f} €")
+            with col2:
+                st.metric("Total Haber", f"{total_haber_diario:,.2f} €")
+
+            with st.expander("📤 Exportar Libro Diario del rango"):
+                st.caption("Para libros muy grandes, CSV y Parquet son mucho más rápidos que XLSX")
+                botones_exportacion(tabla_diario(
+                    diario, entidad_seleccionada['id'], plan,
+                    {t['id']: t for t in st.session_state.terceros}, fecha_desde, fecha_hasta
+                ), 'diario')
 
 # =====================================================
-# TAB 3: LIBRO MAYOR
+# SECCIÓN 3: LIBRO MAYOR
 # =====================================================
 
-with tab3:
-    st.header("📊 Libro Mayor")
+if seccion_activa == SECCION_MAYOR:
+    with perfilador.seccion('Libro Mayor'):
+        st.header("📊 Libro Mayor")
     
-    plan = obtener_plan_cuentas(entidad_seleccionada['tipo'])
-    asientos_entidad = [a for a in st.session_state.asientos 
-                        if a['entidad_id'] == entidad_seleccionada['id']]
+        plan = obtener_plan_cuentas(entidad_seleccionada)
     
-    if not asientos_entidad:
-        st.info("No hay movimientos registrados.")
-    else:
-        # Agrupar por cuenta
-        movimientos_por_cuenta = {}
-        
-        for asiento in asientos_entidad:
-            for apunte in asiento['apuntes']:
-                cuenta = apunte['cuenta']
-                if cuenta not in movimientos_por_cuenta:
-                    movimientos_por_cuenta[cuenta] = {
-                        'movimientos': [],
-                        'total_debe': 0,
-                        'total_haber': 0
-                    }
-                
-                movimientos_por_cuenta[cuenta]['movimientos'].append({
-                    'fecha': asiento['fecha'],
-                    'concepto': asiento['concepto'],
-                    'debe': apunte['debe'],
-                    'haber': apunte['haber']
-                })
-                movimientos_por_cuenta[cuenta]['total_debe'] += apunte['debe']
-                movimientos_por_cuenta[cuenta]['total_haber'] += apunte['haber']
-        
-        # Selector de cuenta
-        cuentas_con_movimientos = sorted(movimientos_por_cuenta.keys())
-        
-        cuenta_seleccionada = st.selectbox(
-            "Seleccionar cuenta:",
-            cuentas_con_movimientos,
-            format_func=lambda c: f"{c} - {plan.get(c, {}).get('descripcion', 'Sin descripción')}"
-        )
+        # Cuentas y totales salen de la caché de saldos (sin recorrer el diario)
+        cuentas_con_movimientos = saldos.cuentas(entidad_seleccionada['id'])
+    
+        if not cuentas_con_movimientos:
+            st.info("No hay movimientos registrados.")
+        else:
+            # Selector de cuenta
+            cuenta_seleccionada = st.selectbox(
+                "Seleccionar cuenta:",
+                cuentas_con_movimientos,
+                format_func=lambda c: f"{c} - {plan.descripcion(c)}"
+            )
         
-        if cuenta_seleccionada:
-            datos = movimientos_por_cuenta[cuenta_seleccionada]
+            if cuenta_seleccionada:
+                total_debe_cuenta, total_haber_cuenta = saldos.totales_cuenta(
+                    entidad_seleccionada['id'], cuenta_seleccionada
+                )
             
-            st.subheader(f"Cuenta {cuenta_seleccionada} - {plan.get(cuenta_seleccionada, {}).get('descripcion', '')}")
+                def construir_mayor():
+                    movimientos = apuntes.movimientos_cuenta(entidad_seleccionada['id'], cuenta_seleccionada)
+                    perfilador.anotar_apuntes(len(movimientos))
+                    return pd.DataFrame({
+                        'Fecha': movimientos['fecha'].dt.strftime('%Y-%m-%d'),
+                        'Concepto': movimientos['asiento'].map(lambda i: libro.obtener(i)['concepto']),
+                        'Debe': movimientos['debe'].apply(lambda c: f"{c / 100:.2f}" if c else ''),
+                        'Haber': movimientos['haber'].apply(lambda c: f"{c / 100:.2f}" if c else ''),
+                    })
             
-            df_mayor = pd.DataFrame(datos['movimientos'])
-            df_mayor['Debe'] = df_mayor['debe'].apply(lambda x: f"{x:.2f}" if x else '')
-            df_mayor['Haber'] = df_mayor['haber'].apply(lambda x: f"{x:.2f}" if x else '')
+                st.subheader(f"Cuenta {cuenta_seleccionada} - {plan.descripcion(cuenta_seleccionada)}")
             
-            st.dataframe(
-                df_mayor[['fecha', 'concepto', 'Debe', 'Haber']].rename(
-                    columns={'fecha': 'Fecha', 'concepto': 'Concepto'}
-                ),
-                use_container_width=True,
-                hide_index=True
-            )
+                st.dataframe(
+                    perfilador.dataframe(
+                        vista_libro('mayor', entidad_seleccionada, cuenta_seleccionada, construir_mayor)
+                    ),
+                    use_container_width=True,
+                    hide_index=True
+                )
             
-            # Saldo
-            saldo = datos['total_debe'] - datos['total_haber']
+                # Saldo
+                saldo = saldos.saldo(entidad_seleccionada['id'], cuenta_seleccionada)
             
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.metric("Total Debe", f"{datos['total_debe']:,.2f} €")
-            with col2:
-                st.metric("Total Haber", f"{datos['total_haber']:,.2f} €")
-            with col3:
-                tipo_cuenta = plan.get(cuenta_seleccionada, {}).get('tipo', '')
-                if tipo_cuenta in ['activo', 'gasto']:
-                    saldo_texto = "Saldo Deudor" if saldo >= 0 else "Saldo Acreedor"
-                else:
-                    saldo_texto = "Saldo Acreedor" if saldo <= 0 else "Saldo Deudor"
-                st.metric(saldo_texto, f"{abs(saldo):,.2f} €")
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    st.metric("Total Debe", f"{total_debe_cuenta:,.2f} €")
+                with col2:
+                    st.metric("Total Haber", f"{total_haber_cuenta:,.2f} €")
+                with col3:
+                    tipo_cuenta = plan.tipo(cuenta_seleccionada)
+                    if tipo_cuenta in ['activo', 'gasto']:
+                        saldo_texto = "Saldo Deudor" if saldo >= 0 else "Saldo Acreedor"
+                    else:
+                        saldo_texto = "Saldo Acreedor" if saldo <= 0 else "Saldo Deudor"
+                    st.metric(saldo_texto, f"{abs(saldo):,.2f} €")
+
+            with st.expander("📤 Exportar Libro Mayor"):
+                mayor_completo = st.radio("Cuentas:", [f"Cuenta {cuenta_seleccionada}", "Todas las cuentas"],
+                                          horizontal=True, key='exportar_mayor_alcance') == "Todas las cuentas"
+                botones_exportacion(tabla_mayor(
+                    apuntes, libro, entidad_seleccionada['id'], plan,
+                    None if mayor_completo else [cuenta_seleccionada]
+                ), 'mayor')
+
+        st.divider()
+        st.subheader(f"⚖️ Balance de sumas y saldos {ejercicio}")
+    
+        # Acumulados por nivel PGC mantenidos al contabilizar (sin recorrer apuntes)
+        niveles_balance = {**NIVELES, NIVEL_AUXILIAR: 'Auxiliar'}
+        col_a, col_b = st.columns([2, 1])
+        with col_a:
+            nivel_maximo = st.select_slider(
+                "Nivel de detalle:", options=list(niveles_balance),
+                value=3, format_func=lambda n: niveles_balance[n]
+            )
+        with col_b:
+            nodos_desglose = [f.codigo for f in sumas_saldos.filas(
+                entidad_seleccionada['id'], ejercicio, nivel_maximo=NIVEL_AUXILIAR - 1
+            ) if f.tiene_desglose]
+            raiz_balance = st.selectbox(
+                "Desglosar:", [''] + nodos_desglose,
+                format_func=lambda c: "Balance completo" if not c else
+                    f"{c} - {plan.descripcion(c)}"
+            )
+    
+        df_balance = vista_libro(
+            'balance', entidad_seleccionada, (ejercicio, nivel_maximo, raiz_balance),
+            lambda: pd.DataFrame([{
+                'Cuenta': '\u2003' * (f.nivel - 1) + f.codigo,
+                'Descripción': plan.descripcion(f.codigo),
+                'Nivel': niveles_balance[f.nivel],
+                'Sumas Debe': f.debe / 100,
+                'Sumas Haber': f.haber / 100,
+                'Saldo Deudor': max(f.saldo, 0) / 100,
+                'Saldo Acreedor': max(-f.saldo, 0) / 100,
+            } for f in sumas_saldos.filas(entidad_seleccionada['id'], ejercicio,
+                                          nivel_maximo=nivel_maximo, raiz=raiz_balance)])
+        )
+        if df_balance.empty:
+            st.info(f"No hay movimientos en {ejercicio}.")
+        else:
+            st.dataframe(perfilador.dataframe(df_balance), use_container_width=True, hide_index=True)
+        
+            total_debe_balance, total_haber_balance = sumas_saldos.totales(entidad_seleccionada['id'], ejercicio)
+            col_a, col_b = st.columns(2)
+            with col_a:
+                st.metric("Sumas Debe", f"{total_debe_balance / 100:,.2f} €")
+            with col_b:
+                st.metric("Sumas Haber", f"{total_haber_balance / 100:,.2f} €")
+
+            with st.expander("📤 Exportar balance de sumas y saldos"):
+                botones_exportacion(tabla_balance(sumas_saldos, entidad_seleccionada['id'], ejercicio,
+                                                  plan, nivel_maximo), 'balance')
 
 # =====================================================
-# TAB 4: MODELOS FISCALES
+# SECCIÓN 4: MODELOS FISCALES
 # =====================================================
 
-with tab4:
-    st.header("🧾 Generación de Modelos Fiscales AEAT")
+if seccion_activa == SECCION_MODELOS:
+    with perfilador.seccion('Modelos fiscales'):
+        st.header("🧾 Generación de Modelos Fiscales AEAT")
     
-    col1, col2 = st.columns([1, 2])
+        col1, col2 = st.columns([1, 2])
     
-    with col1:
-        st.subheader("Configuración")
-        
-        periodo_tipo = st.radio("Periodicidad:", ["Trimestral", "Mensual", "Anual"])
-        
-        if periodo_tipo == "Trimestral":
-            periodo = st.selectbox("Trimestre:", ["1T", "2T", "3T", "4T"])
-        elif periodo_tipo == "Mensual":
-            periodo = st.selectbox("Mes:", 
-                [f"{i:02d}" for i in range(1, 13)],
-                format_func=lambda m: ["Enero", "Febrero", "Marzo", "Abril", 
-                    "Mayo", "Junio", "Julio", "Agosto", "Septiembre", 
-                    "Octubre", "Noviembre", "Diciembre"][int(m)-1]
-            )
-        else:
-            periodo = "0A"
-        
-        # Modelos disponibles según tipo entidad
-        if entidad_seleccionada['tipo'] in ['sociedad_limitada', 'sociedad_anonima']:
-            modelos_disp = {
-                'Trimestral': ['303 - IVA', '111 - Retenciones IRPF', '115 - Ret. Alquileres'],
-                'Anual': ['390 - Resumen IVA', '190 - Resumen Ret.', '200 - Impuesto Sociedades', '347 - Op. Terceros']
-            }
-        elif entidad_seleccionada['tipo'] in ['autonomo_directa', 'autonomo_modulos']:
-            modelos_disp = {
-                'Trimestral': ['303 - IVA', '130 - Pago frac. IRPF', '111 - Retenciones'],
-                'Anual': ['390 - Resumen IVA', '100 - IRPF', '347 - Op. Terceros']
-            }
-        else:  # Comunidad
-            modelos_disp = {
-                'Trimestral': ['111 - Retenciones IRPF', '115 - Ret. Alquileres'],
-                'Anual': ['190 - Resumen Ret.', '180 - Resumen Alq.', '184 - Atribución rentas', '347 - Op. Terceros']
-            }
-        
-        modelo_lista = modelos_disp.get(periodo_tipo, modelos_disp.get('Trimestral', []))
-        modelo_sel = st.selectbox("Modelo:", modelo_lista)
+        with col1:
+            st.subheader("Configuración")
+        
+            periodo_tipo = st.radio("Periodicidad:", ["Trimestral", "Mensual", "Anual"])
+        
+            if periodo_tipo == "Trimestral":
+                periodo = st.selectbox("Trimestre:", ["1T", "2T", "3T", "4T"])
+            elif periodo_tipo == "Mensual":
+                periodo = st.selectbox("Mes:", 
+                    [f"{i:02d}" for i in range(1, 13)],
+                    format_func=lambda m: ["Enero", "Febrero", "Marzo", "Abril", 
+                        "Mayo", "Junio", "Julio", "Agosto", "Septiembre", 
+                        "Octubre", "Noviembre", "Diciembre"][int(m)-1]
+                )
+            else:
+                periodo = "0A"
+        
+            # Modelos disponibles según tipo entidad
+            modelos_disp = modelos_disponibles(entidad_seleccionada['tipo'])
+        
+            modelo_lista = modelos_disp.get(periodo_tipo, modelos_disp.get('Trimestral', []))
+            modelo_sel = st.selectbox("Modelo:", modelo_lista)
     
-    with col2:
-        st.subheader(f"Modelo {modelo_sel.split(' - ')[0]}")
-        
-        if '303' in modelo_sel:
-            st.write("**IVA - Autoliquidación**")
-            
-            # Calcular desde asientos
-            asientos_entidad = [a for a in st.session_state.asientos 
-                                if a['entidad_id'] == entidad_seleccionada['id']]
-            
-            # IVA Repercutido (cuenta 477)
-            iva_rep = sum(
-                apunte['haber'] 
-                for asiento in asientos_entidad 
-                for apunte in asiento['apuntes'] 
-                if apunte['cuenta'] == '477'
-            )
+        with col2:
+            st.subheader(f"Modelo {modelo_sel.split(' - ')[0]}")
+        
+            if '303' in modelo_sel:
+                st.write("**IVA - Autoliquidación**")
             
-            # IVA Soportado (cuenta 472)
-            iva_sop = sum(
-                apunte['debe'] 
-                for asiento in asientos_entidad 
-                for apunte in asiento['apuntes'] 
-                if apunte['cuenta'] == '472'
-            )
+                # Una sola pasada sobre los apuntes del periodo (cacheada)
+                liquidacion = modelo_303.calcular(entidad_seleccionada['id'], ejercicio, periodo)
+                perfilador.anotar_apuntes(liquidacion.apuntes_analizados)
             
-            # Base imponible (ventas 700)
-            base_ventas = sum(
-                apunte['haber'] 
-                for asiento in asientos_entidad 
-                for apunte in asiento['apuntes'] 
-                if apunte['cuenta'] == '700'
-            )
+                st.write("**IVA DEVENGADO**")
+                for tipo_iva, casilla_base, casilla_cuota in [(4, '01', '03'), (10, '04', '06'), (21, '07', '09')]:
+                    col_a, col_b = st.columns(2)
+                    with col_a:
+                        st.text_input(f"[{casilla_base}] Base {tipo_iva}%:",
+                                      value=f"{liquidacion.importe(casilla_base):.2f}", disabled=True)
+                    with col_b:
+                        st.text_input(f"[{casilla_cuota}] Cuota {tipo_iva}%:",
+                                      value=f"{liquidacion.importe(casilla_cuota):.2f}", disabled=True)
             
-            # Base compras (600)
-            base_compras = sum(
-                apunte['debe'] 
-                for asiento in asientos_entidad 
-                for apunte in asiento['apuntes'] 
-                if apunte['cuenta'] == '600'
-            )
+                st.write("**IVA DEDUCIBLE**")
+                col_a, col_b = st.columns(2)
+                with col_a:
+                    st.text_input("[28] Base op. interiores:", value=f"{liquidacion.importe('28'):.2f}", disabled=True)
+                with col_b:
+                    st.text_input("[29] Cuota soportada:", value=f"{liquidacion.importe('29'):.2f}", disabled=True)
             
-            st.write("**IVA DEVENGADO**")
-            col_a, col_b = st.columns(2)
-            with col_a:
-                st.text_input("[01] Base 21%:", value=f"{base_ventas:.2f}", disabled=True)
-            with col_b:
-                st.text_input("[02] Cuota 21%:", value=f"{iva_rep:.2f}", disabled=True)
+                st.divider()
             
-            st.write("**IVA DEDUCIBLE**")
-            col_a, col_b = st.columns(2)
-            with col_a:
-                st.text_input("[28] Base op. interiores:", value=f"{base_compras:.2f}", disabled=True)
-            with col_b:
-                st.text_input("[29] Cuota soportada:", value=f"{iva_sop:.2f}", disabled=True)
+                total_devengado = liquidacion.importe('27')
+                total_deducir = liquidacion.importe('45')
+                diferencia = liquidacion.resultado
             
-            st.divider()
+                col_a, col_b, col_c = st.columns(3)
+                with col_a:
+                    st.metric("[27] Total cuota devengada", f"{total_devengado:.2f} €")
+                with col_b:
+                    st.metric("[45] Total a deducir", f"{total_deducir:.2f} €")
+                with col_c:
+                    color = "normal" if diferencia >= 0 else "inverse"
+                    st.metric("[71] Resultado", f"{diferencia:.2f} €", delta_color=color)
             
-            total_devengado = iva_rep
-            total_deducir = iva_sop
-            diferencia = total_devengado - total_deducir
+                st.divider()
             
-            col_a, col_b, col_c = st.columns(3)
-            with col_a:
-                st.metric("[27] Total cuota devengada", f"{total_devengado:.2f} €")
-            with col_b:
-                st.metric("[45] Total a deducir", f"{total_deducir:.2f} €")
-            with col_c:
-                color = "normal" if diferencia >= 0 else "inverse"
-                st.metric("[71] Resultado", f"{diferencia:.2f} €", delta_color=color)
+                col_btn1, col_btn2 = st.columns(2)
+                with col_btn1:
+                    if st.button("📥 Generar fichero AEAT", type="primary"):
+                        # Registro de longitud fija según el diseño del modelo
+                        with perfilador.seccion('Fichero 303'):
+                            fichero_303 = BytesIO()
+                            modelo_303.generar_fichero(liquidacion, entidad_seleccionada, fichero_303)
+                    
+                        st.download_button(
+                            "📥 Descargar modelo303.txt",
+                            fichero_303.getvalue(),
+                            file_name=f"modelo303_{ejercicio}_{periodo}.txt",
+                            mime="text/plain"
+                        )
             
-            st.divider()
+                with col_btn2:
+                    st.link_button("🌐 Ir a Sede AEAT", "https://sede.agenciatributaria.gob.es")
+        
+            elif modelo_sel.split(' - ')[0] in ('111', '115', '190', '180'):
+                numero_modelo = modelo_sel.split(' - ')[0]
+                st.write({
+                    '111': "**Retenciones e ingresos a cuenta - Trabajo y actividades económicas**",
+                    '115': "**Retenciones e ingresos a cuenta - Arrendamientos de inmuebles urbanos**",
+                    '190': "**Resumen anual de retenciones - Trabajo y actividades económicas**",
+                    '180': "**Resumen anual de retenciones - Arrendamientos de inmuebles urbanos**",
+                }[numero_modelo])
             
-            col_btn1, col_btn2 = st.columns(2)
-            with col_btn1:
-                if st.button("📥 Generar fichero AEAT", type="primary"):
-                    # Generar fichero formato BOE
-                    contenido_fichero = f"""<T3030{ejercicio}{periodo}{entidad_seleccionada['nif'].ljust(9)}{entidad_seleccionada['razon_social'][:40].ljust(40)}I {int(base_ventas*100):017d} {int(iva_rep*100):017d} {int(base_compras*100):017d} {int(iva_sop*100):017d} {int(diferencia*100):017d}</T303>"""
-                    
-                    st.download_button(
-                        "📥 Descargar modelo303.txt",
-                        contenido_fichero,
-                        file_name=f"modelo303_{ejercicio}_{periodo}.txt",
-                        mime="text/plain"
-                    )
+                # Bases y retenciones desde 4751 y 640/621/623 (los anuales suman los trimestres)
+                liquidacion = retenciones.calcular(
+                    numero_modelo, entidad_seleccionada['id'], ejercicio, periodo,
+                    {t['id']: t for t in st.session_state.terceros}
+                )
+                casillas = liquidacion.casillas
+            
+                if numero_modelo == '111':
+                    st.write("**Rendimientos del trabajo**")
+                    col_a, col_b, col_c = st.columns(3)
+                    with col_a:
+                        st.number_input("[01] Nº perceptores:", value=casillas['01'], disabled=True)
+                    with col_b:
+                        st.text_input("[02] Importe percepciones:", value=f"{liquidacion.importe('02'):.2f}", disabled=True)
+                    with col_c:
+                        st.text_input("[03] Importe retenciones:", value=f"{liquidacion.importe('03'):.2f}", disabled=True)
+                
+                    st.write("**Rendimientos de actividades económicas**")
+                    col_a, col_b, col_c = st.columns(3)
+                    with col_a:
+                        st.number_input("[07] Nº perceptores:", value=casillas['07'], disabled=True)
+                    with col_b:
+                        st.text_input("[08] Importe percepciones:", value=f"{liquidacion.importe('08'):.2f}", disabled=True)
+                    with col_c:
+                        st.text_input("[09] Importe retenciones:", value=f"{liquidacion.importe('09'):.2f}", disabled=True)
+                
+                    st.metric("[30] Resultado a ingresar", f"{liquidacion.resultado:.2f} €")
+            
+                elif numero_modelo == '115':
+                    col_a, col_b, col_c = st.columns(3)
+                    with col_a:
+                        st.number_input("[01] Nº perceptores:", value=casillas['01'], disabled=True)
+                    with col_b:
+                        st.text_input("[02] Base retenciones:", value=f"{liquidacion.importe('02'):.2f}", disabled=True)
+                    with col_c:
+                        st.text_input("[03] Retenciones:", value=f"{liquidacion.importe('03'):.2f}", disabled=True)
+                
+                    st.metric("[05] Resultado a ingresar", f"{liquidacion.resultado:.2f} €")
+            
+                else:
+                    col_a, col_b, col_c = st.columns(3)
+                    with col_a:
+                        st.metric("Nº perceptores", casillas['num_perceptores'])
+                    with col_b:
+                        st.metric("Total percepciones", f"{liquidacion.importe('total_percepciones'):,.2f} €")
+                    with col_c:
+                        st.metric("Total retenciones", f"{liquidacion.importe('total_retenciones'):,.2f} €")
+            
+                if liquidacion.perceptores:
+                    def construir_perceptores():
+                        df = pd.DataFrame([{
+                            'NIF': p.nif,
+                            'Perceptor': p.nombre,
+                            'Clave': p.clave,
+                            'Base': p.base / 100,
+                            'Retención': p.retencion / 100,
+                        } for p in liquidacion.perceptores])
+                        return df.drop(columns='Clave') if numero_modelo in ('115', '180') else df
+                
+                    df_perceptores = vista_libro('perceptores', entidad_seleccionada,
+                                                 (numero_modelo, ejercicio, periodo), construir_perceptores)
+                    st.dataframe(perfilador.dataframe(df_perceptores), use_container_width=True, hide_index=True)
             
-            with col_btn2:
-                st.link_button("🌐 Ir a Sede AEAT", "https://sede.agenciatributaria.gob.es")
+                if liquidacion.asientos_sin_tercero:
+                    st.warning(f"{liquidacion.asientos_sin_tercero} asiento(s) con retención sin tercero "
+                               "asignado no se incluyen en el modelo")
         
-        elif '111' in modelo_sel:
-            st.write("**Retenciones e ingresos a cuenta - Rendimientos del trabajo**")
+            elif '347' in modelo_sel:
+                st.write("**Declaración anual de operaciones con terceras personas**")
+                st.info("Incluye operaciones > 3.005,06 € anuales con cada tercero")
+            
+                # Las comunidades solo declaran adquisiciones (sus cuotas no son entregas)
+                es_comunidad = entidad_seleccionada['tipo'] == 'comunidad_propietarios'
+                declaracion = modelo_347.calcular(
+                    entidad_seleccionada['id'], ejercicio,
+                    {t['id']: t for t in st.session_state.terceros},
+                    claves=('A',) if es_comunidad else ('A', 'B')
+                )
             
-            # Datos de ejemplo
-            st.number_input("[01] Nº perceptores trabajo:", value=2, disabled=True)
-            st.number_input("[02] Importe percepciones:", value=3500.00, disabled=True)
-            st.number_input("[03] Importe retenciones:", value=525.00, disabled=True)
+                col_a, col_b, col_c = st.columns(3)
+                with col_a:
+                    st.metric("Terceros analizados", f"{declaracion.terceros_analizados:,}")
+                with col_b:
+                    st.metric("Declarados", f"{len(declaracion.declarados):,}")
+                with col_c:
+                    st.metric("Importe total", f"{euros(declaracion.importe_total):,.2f} €")
             
-            st.metric("[30] Resultado a ingresar", "525.00 €")
+                if declaracion.declarados:
+                    df_ops = vista_libro('347', entidad_seleccionada, ejercicio, lambda: pd.DataFrame([{
+                        'NIF': d.nif,
+                        'Nombre': d.nombre,
+                        'Clave': f"{d.clave} - {CLAVES_347[d.clave]}",
+                        'Importe': float(d.importe_euros()),
+                        '1T': d.trimestres[0] / 100,
+                        '2T': d.trimestres[1] / 100,
+                        '3T': d.trimestres[2] / 100,
+                        '4T': d.trimestres[3] / 100,
+                    } for d in declaracion.declarados]))
+                    st.dataframe(perfilador.dataframe(df_ops), use_container_width=True, hide_index=True)
+                
+                    # El fichero se escribe al pulsar, no en cada rerun de la sección
+                    def generar_347(declaracion=declaracion, entidad=entidad_seleccionada):
+                        fichero_347 = BytesIO()
+                        modelo_347.generar_fichero(declaracion, entidad, fichero_347)
+                        return fichero_347.getvalue()
+                    st.download_button(
+                        "📥 Generar fichero 347",
+                        generar_347,
+                        file_name=f"modelo347_{ejercicio}.txt",
+                        mime="text/plain",
+                        on_click='ignore'
+                    )
+                else:
+                    st.caption(f"Ningún tercero supera el umbral en {ejercicio}")
+
+        st.divider()
+    
+        with st.expander("🗂️ Presentación en lote (todas las entidades)"):
+            st.caption(f"Genera todos los modelos del periodo {periodo} de {ejercicio} para cada entidad "
+                       "según su tipo, en paralelo, con un informe de resultados y errores")
         
-        elif '347' in modelo_sel:
-            st.write("**Declaración anual de operaciones con terceras personas**")
-            st.info("Incluye operaciones > 3.005,06 € anuales con cada tercero")
+            if st.button("⚙️ Generar todos los modelos", type="primary"):
+                terceros_por_id = {t['id']: t for t in st.session_state.terceros}
+                for entidad in st.session_state.entidades:
+                    persistencia.cargar_entidad(entidad['id'], terceros_por_id)
             
-            # Simular operaciones
-            df_ops = pd.DataFrame([
-                {'NIF': 'B98765432', 'Nombre': 'SUMINISTROS INDUSTRIALES SL', 'Importe': 15230.50, 'Clave': 'A'},
-                {'NIF': 'A11111111', 'Nombre': 'CLIENTE EJEMPLO SA', 'Importe': 8500.00, 'Clave': 'B'},
-            ])
+                barra = st.progress(0.0, text="Generando modelos...")
+                with perfilador.seccion('Presentación en lote'):
+                    informe = presentar_lote(
+                        st.session_state.entidades, apuntes, terceros_por_id, ejercicio, periodo,
+                        al_terminar=lambda entidad, hechas, total: barra.progress(
+                            hechas / total, text=f"{hechas}/{total} - {entidad['razon_social']}"
+                        )
+                    )
+                barra.empty()
+                st.session_state.informe_presentacion = informe
+        
+            informe = st.session_state.get('informe_presentacion')
+            if informe is not None:
+                col_a, col_b, col_c, col_d = st.columns(4)
+                with col_a:
+                    st.metric("Ficheros generados", len(informe.generados))
+                with col_b:
+                    st.metric("Errores", len(informe.errores))
+                with col_c:
+                    st.metric("No disponibles", len(informe.no_disponibles))
+                with col_d:
+                    st.metric("Tiempo", f"{informe.segundos:.1f} s")
             
-            st.dataframe(df_ops, use_container_width=True, hide_index=True)
+                st.dataframe(perfilador.dataframe(informe.como_dataframe()), use_container_width=True, hide_index=True)
             
-            if st.button("📥 Generar fichero 347"):
-                st.success("Fichero generado correctamente")
+                # El ZIP se comprime al pulsar, no en cada rerun de la sección
+                def generar_zip(informe=informe):
+                    zip_lote = BytesIO()
+                    informe.escribir_zip(zip_lote)
+                    return zip_lote.getvalue()
+                st.download_button(
+                    "📥 Descargar ficheros e informe (ZIP)",
+                    generar_zip,
+                    file_name=f"modelos_{informe.ejercicio}_{informe.periodo}.zip",
+                    mime="application/zip",
+                    on_click='ignore'
+                )
 
 # =====================================================
-# TAB 5: COBROS Y PAGOS
+# SECCIÓN 5: COBROS Y PAGOS
 # =====================================================
 
-with tab5:
-    st.header("💰 Gestión de Cobros y Pagos")
+if seccion_activa == SECCION_COBROS:
+    with perfilador.seccion('Cobros y pagos'):
+        st.header("💰 Gestión de Cobros y Pagos")
     
-    subtab1, subtab2, subtab3, subtab4 = st.tabs([
-        "📋 Recibos Pendientes",
-        "📦 Generar Remesa SEPA",
-        "💳 Enlace Pago Tarjeta",
-        "💸 Pagos a Proveedores"
-    ])
+        # Solo se ejecuta el apartado elegido (como las secciones principales)
+        apartado_cobros = st.radio(
+            "Apartado:", [
+                "📋 Recibos Pendientes",
+                "📦 Generar Remesa SEPA",
+                "💳 Enlace Pago Tarjeta",
+                "💸 Pagos a Proveedores",
+                "🔗 Conciliación",
+            ], key='apartado_cobros', horizontal=True, label_visibility="collapsed"
+        )
     
-    with subtab1:
-        st.subheader("Recibos pendientes de cobro")
-        
-        if entidad_seleccionada['tipo'] == 'comunidad_propietarios':
-            # Generar recibos de cuotas
-            if st.button("➕ Generar cuotas del mes"):
-                mes_actual = date.today().replace(day=1)
-                propietarios = [t for t in st.session_state.terceros if t['tipo'] == 'propietario']
+        if apartado_cobros == "📋 Recibos Pendientes":
+            st.subheader("Recibos pendientes de cobro")
+        
+            if entidad_seleccionada['tipo'] == 'comunidad_propietarios':
+                # Emisión de cuotas y derramas del mes para todas las comunidades
+                if st.button("➕ Generar cuotas del mes (todas las comunidades)"):
+                    mes_actual = date.today().replace(day=1)
+                    comunidades = [e for e in st.session_state.entidades
+                                   if e['tipo'] == 'comunidad_propietarios']
+                    terceros_por_id = {t['id']: t for t in st.session_state.terceros}
+                    for comunidad in comunidades:
+                        persistencia.cargar_entidad(comunidad['id'], terceros_por_id)
+                    ids_comunidades = {c['id'] for c in comunidades}
                 
-                for prop in propietarios:
-                    nuevo_recibo = {
-                        'id': len(st.session_state.recibos) + 1,
-                        'entidad_id': entidad_seleccionada['id'],
-                        'numero': f"R-{mes_actual.strftime('%Y%m')}-{prop['id']:03d}",
-                        'tercero': prop,
-                        'importe': 125.50,
-                        'concepto': f"Cuota ordinaria {mes_actual.strftime('%B %Y')}",
-                        'fecha_emision': date.today().isoformat(),
-                        'fecha_vencimiento': (mes_actual + timedelta(days=10)).isoformat(),
-                        'estado': 'pendiente',
-                        'metodo': 'domiciliacion'
-                    }
-                    st.session_state.recibos.append(nuevo_recibo)
+                    with perfilador.seccion('Emisión de cuotas'):
+                        emision = emitir_cuotas(
+                            mes_actual,
+                            comunidades,
+                            almacen.cargar_propietarios(),
+                            almacen.cargar_presupuestos(mes_actual.year),
+                            terceros_por_id,
+                            {r['numero'] for r in st.session_state.recibos
+                             if r['entidad_id'] in ids_comunidades},
+                            persistencia.nuevo_id_recibo
+                        )
                 
-                st.success(f"✅ Generados {len(propietarios)} recibos de cuotas")
-        
-        # Mostrar recibos pendientes
-        recibos_entidad = [r for r in st.session_state.recibos 
-                          if r['entidad_id'] == entidad_seleccionada['id'] 
-                          and r['estado'] == 'pendiente']
-        
-        if recibos_entidad:
-            df_recibos = pd.DataFrame([{
-                'Número': r['numero'],
-                'Deudor': r['tercero']['nombre'][:30],
-                'Concepto': r['concepto'][:30],
-                'Importe': f"{r['importe']:.2f} €",
-                'Vencimiento': r['fecha_vencimiento'],
-                'Estado': r['estado'].title()
-            } for r in recibos_entidad])
-            
-            st.dataframe(df_recibos, use_container_width=True, hide_index=True)
-            
-            total_pendiente = sum(r['importe'] for r in recibos_entidad)
-            st.metric("Total pendiente", f"{total_pendiente:,.2f} €")
-        else:
-            st.info("No hay recibos pendientes")
+                    libro.contabilizar_lote(emision.asientos)
+                    # Recibos y asientos de emisión se guardan juntos o no se guarda nada
+                    confirmar_cambios(emision.recibos)
+                    st.session_state.recibos.extend(emision.recibos)
+                
+                    if emision.recibos:
+                        st.success(f"✅ Generados {len(emision.recibos)} recibos "
+                                   f"({emision.importe_total:,.2f} €) en {emision.comunidades} comunidades "
+                                   f"y {len(emision.asientos)} asientos de emisión")
+                    if emision.ya_emitidos:
+                        st.info(f"{emision.ya_emitidos} recibos del periodo ya estaban emitidos")
+                    if not emision.recibos and not emision.ya_emitidos:
+                        st.info("No hay cuotas presupuestadas para este mes")
+            
+                with st.expander("➕ Nueva derrama"):
+                    with st.form("form_derrama"):
+                        concepto_derrama = st.text_input("Concepto:", "Derrama")
+                        importe_derrama = st.number_input("Importe total (€):", min_value=0.0, step=100.0)
+                        col_d1, col_d2 = st.columns(2)
+                        with col_d1:
+                            mes_inicio_derrama = st.number_input("Mes de inicio:", 1, 12, date.today().month)
+                        with col_d2:
+                            num_cuotas_derrama = st.number_input("Número de cuotas:", 1, 12, 1)
+                    
+                        if st.form_submit_button("Guardar derrama") and importe_derrama > 0:
+                            almacen.guardar_presupuesto({
+                                'entidad_id': entidad_seleccionada['id'],
+                                'ejercicio': date.today().year,
+                                'concepto': concepto_derrama,
+                                'tipo': 'derrama',
+                                'importe': a_centimos(importe_derrama),
+                                'mes_inicio': mes_inicio_derrama,
+                                # las cuotas no pasan de diciembre del ejercicio
+                                'num_cuotas': min(num_cuotas_derrama, 13 - mes_inicio_derrama),
+                            })
+                            st.success("✅ Derrama guardada; se emitirá con las cuotas de sus meses")
+        
+            # Mostrar recibos pendientes (también los rechazados y devueltos)
+            recibos_entidad = indice_recibos.abiertos(entidad_seleccionada['id'])
+        
+            if recibos_entidad:
+                df_recibos = vista_recibos('recibos_pendientes', entidad_seleccionada, (), lambda: pd.DataFrame([{
+                    'Número': r['numero'],
+                    'Deudor': r['tercero']['nombre'][:30],
+                    'Concepto': r['concepto'][:30],
+                    'Importe': f"{r['importe']:.2f} €",
+                    'Vencimiento': r['fecha_vencimiento'],
+                    'Estado': r['estado'].title()
+                } for r in recibos_entidad]))
+            
+                st.dataframe(perfilador.dataframe(df_recibos), use_container_width=True, hide_index=True)
+            
+                total_pendiente = sum(r['importe'] for r in recibos_entidad)
+                st.metric("Total pendiente", f"{total_pendiente:,.2f} €")
+            else:
+                st.info("No hay recibos pendientes")
+
+            with st.expander("📤 Exportar todos los recibos de la entidad"):
+                botones_exportacion(tabla_recibos([r for r in st.session_state.recibos
+                                                   if r['entidad_id'] == entidad_seleccionada['id']]),
+                                    'recibos')
     
-    with subtab2:
-        st.subheader("📦 Generar Remesa SEPA (Domiciliaciones)")
+        if apartado_cobros == "📦 Generar Remesa SEPA":
+            st.subheader("📦 Generar Remesa SEPA (Domiciliaciones)")
         
-        recibos_domiciliables = [r for r in st.session_state.recibos 
-                                  if r['entidad_id'] == entidad_seleccionada['id'] 
-                                  and r['estado'] == 'pendiente'
-                                  and r['metodo'] == 'domiciliacion']
+            recibos_domiciliables = [r for r in indice_recibos.abiertos(entidad_seleccionada['id'], (PENDIENTE,))
+                                      if r['metodo'] == 'domiciliacion']
         
-        if not recibos_domiciliables:
-            st.info("No hay recibos pendientes con domiciliación")
-        else:
-            st.write(f"**{len(recibos_domiciliables)} recibos** disponibles para domiciliar")
+            if not recibos_domiciliables:
+                st.info("No hay recibos pendientes con domiciliación")
+            else:
+                st.write(f"**{len(recibos_domiciliables)} recibos** disponibles para domiciliar")
             
-            fecha_cobro = st.date_input(
-                "Fecha de cobro solicitada:",
-                value=date.today() + timedelta(days=5),
-                min_value=date.today() + timedelta(days=2)
-            )
+                fecha_cobro = st.date_input(
+                    "Fecha de cobro solicitada:",
+                    value=date.today() + timedelta(days=5),
+                    min_value=date.today() + timedelta(days=2)
+                )
             
-            if st.button("🏦 Generar fichero SEPA XML", type="primary"):
-                # Generar XML SEPA
-                from datetime import datetime
-                import uuid
-                
-                msg_id = f"SEPA-{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8].upper()}"
+                if st.button("🏦 Generar fichero SEPA XML", type="primary"):
+                    config_sepa = ConfiguracionAcreedorSEPA(
+                        creditor_id=calcular_creditor_id(entidad_seleccionada['nif']),
+                        creditor_name=entidad_seleccionada['razon_social'],
+                        creditor_iban=CUENTA_BANCARIA_EJEMPLO['iban'],
+                        creditor_bic=CUENTA_BANCARIA_EJEMPLO['bic']
+                    )
+                    generador = GeneradorSEPADirectDebit(
+                        config_sepa, max_transacciones=MAX_TRANSACCIONES_FICHERO_SEPA
+                    )
                 
-                total = sum(r['importe'] for r in recibos_domiciliables)
+                    # FRST para el primer recibo de cada deudor, RCUR para el resto
+                    primer_recibo = {}
+                    for r in st.session_state.recibos:
+                        if r['entidad_id'] == entidad_seleccionada['id']:
+                            tercero_id = r['tercero']['id']
+                            primer_recibo[tercero_id] = min(primer_recibo.get(tercero_id, r['id']), r['id'])
                 
-                xml_content = f'''<?xml version="1.0" encoding="UTF-8"?>
-<Document xmlns="urn:iso:std:iso:20022:tech:xsd:pain.008.001.02">
-  <CstmrDrctDbtInitn>
-    <GrpHdr>
-      <MsgId>{msg_id}</MsgId>
-      <CreDtTm>{datetime.now().isoformat()}</CreDtTm>
-      <NbOfTxs>{len(recibos_domiciliables)}</NbOfTxs>
-      <CtrlSum>{total:.2f}</CtrlSum>
-      <InitgPty>
-        <Nm>{entidad_seleccionada['razon_social'][:70]}</Nm>
-      </InitgPty>
-    </GrpHdr>
-    <PmtInf>
-      <PmtInfId>{msg_id}-001</PmtInfId>
-      <PmtMtd>DD</PmtMtd>
-      <NbOfTxs>{len(recibos_domiciliables)}</NbOfTxs>
-      <CtrlSum>{total:.2f}</CtrlSum>
-      <PmtTpInf>
-        <SvcLvl><Cd>SEPA</Cd></SvcLvl>
-        <LclInstrm><Cd>CORE</Cd></LclInstrm>
-        <SeqTp>RCUR</SeqTp>
-      </PmtTpInf>
-      <ReqdColltnDt>{fecha_cobro.isoformat()}</ReqdColltnDt>
-      <Cdtr>
-        <Nm>{entidad_seleccionada['razon_social'][:70]}</Nm>
-      </Cdtr>
-      <CdtrAcct>
-        <Id><IBAN>ES9121000418450200051332</IBAN></Id>
-      </CdtrAcct>
-      <CdtrAgt>
-        <FinInstnId><BIC>CAIXESBBXXX</BIC></FinInstnId>
-      </CdtrAgt>'''
+                    recibos_sepa = [
+                        ReciboSEPA(
+                            id_interno=r['numero'],
+                            importe=Decimal(str(r['importe'])),
+                            concepto=r['concepto'],
+                            mandato=DatosMandato(
+                                mandate_id=f"MAND-{r['tercero']['id']:03d}",
+                                fecha_firma=date(2024, 1, 1),
+                                deudor_nombre=r['tercero']['nombre'],
+                                deudor_iban=r['tercero']['iban'],
+                                tipo='FRST' if primer_recibo[r['tercero']['id']] == r['id'] else 'RCUR'
+                            )
+                        )
+                        for r in recibos_domiciliables
+                    ]
                 
-                for recibo in recibos_domiciliables:
-                    xml_content += f'''
-      <DrctDbtTxInf>
-        <PmtId>
-          <EndToEndId>E2E-{recibo['numero']}</EndToEndId>
-        </PmtId>
-        <InstdAmt Ccy="EUR">{recibo['importe']:.2f}</InstdAmt>
-        <DrctDbtTx>
-          <MndtRltdInf>
-            <MndtId>MAND-{recibo['tercero']['id']:03d}</MndtId>
-            <DtOfSgntr>2024-01-01</DtOfSgntr>
-          </MndtRltdInf>
-        </DrctDbtTx>
-        <DbtrAgt>
-          <FinInstnId><Othr><Id>NOTPROVIDED</Id></Othr></FinInstnId>
-        </DbtrAgt>
-        <Dbtr>
-          <Nm>{recibo['tercero']['nombre'][:70]}</Nm>
-        </Dbtr>
-        <DbtrAcct>
-          <Id><IBAN>{recibo['tercero']['iban']}</IBAN></Id>
-        </DbtrAcct>
-        <RmtInf>
-          <Ustrd>{recibo['concepto'][:140]}</Ustrd>
-        </RmtInf>
-      </DrctDbtTxInf>'''
+                    with perfilador.seccion('SEPA pain.008'):
+                        fichero = BytesIO()
+                        if len(recibos_sepa) <= MAX_TRANSACCIONES_FICHERO_SEPA:
+                            resumen = generador.generar(recibos_sepa, fecha_cobro, lambda _i, _m: fichero)
+                            nombre_fichero, mime = f"remesa_{resumen.ficheros[0]}.xml", "application/xml"
+                        else:
+                            resumen = generador.generar_zip(recibos_sepa, fecha_cobro, fichero)
+                            nombre_fichero, mime = f"remesa_{resumen.ficheros[0]}.zip", "application/zip"
                 
-                xml_content += '''
-    </PmtInf>
-  </CstmrDrctDbtInitn>
-</Document>'''
+                    st.success(f"""
+                    ✅ Remesa generada correctamente
                 
-                st.success(f"""
-                ✅ Remesa generada correctamente
+                    - **Ficheros:** {len(resumen.ficheros)} ({resumen.num_bloques} bloques PmtInf)
+                    - **Recibos:** {resumen.num_transacciones}
+                    - **Importe total:** {resumen.importe_total:,.2f} €
+                    - **Fecha cobro:** {fecha_cobro.strftime('%d/%m/%Y')}
+                    - **Rendimiento:** {resumen.transacciones_por_segundo:,.0f} recibos/s
+                    """)
                 
-                - **ID Mensaje:** {msg_id}
-                - **Recibos:** {len(recibos_domiciliables)}
-                - **Importe total:** {total:,.2f} €
-                - **Fecha cobro:** {fecha_cobro.strftime('%d/%m/%Y')}
-                """)
+                    if resumen.rechazados:
+                        st.warning("Recibos excluidos de la remesa:\n\n" + "\n".join(
+                            f"- {numero}: {motivo}" for numero, motivo in resumen.rechazados
+                        ))
                 
-                st.download_button(
-                    "📥 Descargar fichero SEPA (XML)",
-                    xml_content,
-                    file_name=f"remesa_{msg_id}.xml",
-                    mime="application/xml"
-                )
+                    st.download_button(
+                        "📥 Descargar fichero SEPA",
+                        fichero.getvalue(),
+                        file_name=nombre_fichero,
+                        mime=mime
+                    )
     
-    with subtab3:
-        st.subheader("💳 Generar enlace de pago con tarjeta")
+        if apartado_cobros == "💳 Enlace Pago Tarjeta":
+            st.subheader("💳 Generar enlace de pago con tarjeta")
         
-        st.info("""
-        **Integración con pasarelas de pago:**
-        - Stripe (recomendado para empezar)
-        - Redsys (TPV bancario español)
+            st.info("""
+            **Integración con pasarelas de pago:**
+            - Stripe (recomendado para empezar)
+            - Redsys (TPV bancario español)
         
-        Configura las claves API en el archivo de configuración.
-        """)
+            Configura las claves API en el archivo de configuración.
+            """)
         
-        recibo_pago = st.selectbox(
-            "Seleccionar recibo:",
-            [r for r in st.session_state.recibos 
-             if r['entidad_id'] == entidad_seleccionada['id'] 
-             and r['estado'] == 'pendiente'],
-            format_func=lambda r: f"{r['numero']} - {r['tercero']['nombre'][:20]} - {r['importe']:.2f}€"
-        )
+            recibo_pago = st.selectbox(
+                "Seleccionar recibo:",
+                indice_recibos.abiertos(entidad_seleccionada['id']),
+                format_func=lambda r: f"{r['numero']} - {r['tercero']['nombre'][:20]} - {r['importe']:.2f}€"
+            )
         
-        if recibo_pago:
-            if st.button("🔗 Generar enlace de pago"):
-                # En producción, esto llamaría a la API de Stripe
-                enlace_ficticio = f"https://checkout.stripe.com/pay/cs_test_{uuid.uuid4().hex[:24]}"
+            if recibo_pago:
+                if st.button("🔗 Generar enlace de pago"):
+                    # En producción, esto llamaría a la API de Stripe
+                    enlace_ficticio = f"https://checkout.stripe.com/pay/cs_test_{uuid.uuid4().hex[:24]}"
                 
-                st.success("✅ Enlace generado")
-                st.code(enlace_ficticio)
+                    st.success("✅ Enlace generado")
+                    st.code(enlace_ficticio)
                 
-                st.info("Puedes enviar este enlace al cliente por email o WhatsApp")
+                    st.info("Puedes enviar este enlace al cliente por email o WhatsApp")
     
-    with subtab4:
-        st.subheader("💸 Remesa de pagos a proveedores (SEPA Transfer)")
-        
-        st.write("Programa transferencias a tus proveedores")
+        if apartado_cobros == "💸 Pagos a Proveedores":
+            st.subheader("💸 Remesa de pagos a proveedores (SEPA Transfer)")
         
-        # Simulación de facturas pendientes de pago
-        facturas_pagar = [
-            {'id': 1, 'proveedor': 'SUMINISTROS INDUSTRIALES SL', 'nif': 'B98765432', 
-             'iban': 'ES7620770024003102575766', 'importe': 1210.00, 'concepto': 'Fra. 2024/123'},
-            {'id': 2, 'proveedor': 'SEGUROS MAPFRE', 'nif': 'A28141935', 
-             'iban': 'ES8901280001000123456789', 'importe': 850.00, 'concepto': 'Póliza anual'},
-        ]
+            st.write("Programa transferencias a tus proveedores por su saldo pendiente (400/410)")
         
-        df_pagos = pd.DataFrame(facturas_pagar)
-        st.dataframe(df_pagos[['proveedor', 'importe', 'concepto']], use_container_width=True, hide_index=True)
+            terceros_por_id = {t['id']: t for t in st.session_state.terceros}
+            pagos = pagos_pendientes(apuntes, entidad_seleccionada['id'], terceros_por_id)
         
-        if st.button("🏦 Generar remesa de pagos SEPA"):
-            st.success("✅ Fichero SEPA Credit Transfer generado")
-            st.download_button(
-                "📥 Descargar XML",
-                "<xml>Contenido SEPA CT</xml>",
-                file_name="remesa_pagos_sepa.xml",
-                mime="application/xml"
-            )
+            if not pagos:
+                st.info("No hay saldos pendientes de pago a proveedores")
+            else:
+                df_pagos = vista_libro('pagos_pendientes', entidad_seleccionada, (), lambda: pd.DataFrame([{
+                    'Proveedor': p.nombre,
+                    'NIF': p.nif,
+                    'Cuenta': p.cuenta,
+                    'IBAN': p.iban or '—',
+                    'Importe': f"{p.importe_euros:,.2f} €",
+                } for p in pagos]))
+                st.dataframe(perfilador.dataframe(df_pagos), use_container_width=True, hide_index=True)
+                st.metric("Total pendiente de pago", f"{sum(p.importe_euros for p in pagos):,.2f} €")
+            
+                fecha_ejecucion = st.date_input(
+                    "Fecha de ejecución:",
+                    value=date.today() + timedelta(days=1),
+                    min_value=date.today()
+                )
+            
+                if st.button("🏦 Generar remesa de pagos SEPA", type="primary"):
+                    config_ct = ConfiguracionOrdenanteSEPA(
+                        debtor_name=entidad_seleccionada['razon_social'],
+                        debtor_iban=CUENTA_BANCARIA_EJEMPLO['iban'],
+                        debtor_bic=CUENTA_BANCARIA_EJEMPLO['bic'],
+                        debtor_id=entidad_seleccionada['nif']
+                    )
+                    generador_ct = GeneradorSEPACreditTransfer(
+                        config_ct, max_transacciones=MAX_TRANSACCIONES_FICHERO_SEPA
+                    )
+                    transferencias = transferencias_de_pagos(pagos, fecha_ejecucion)
+                
+                    with perfilador.seccion('SEPA pain.001'):
+                        fichero = BytesIO()
+                        try:
+                            if len(transferencias) <= MAX_TRANSACCIONES_FICHERO_SEPA:
+                                resumen = generador_ct.generar(transferencias, fecha_ejecucion,
+                                                               lambda _i, _m: fichero)
+                                nombre_fichero, mime = f"pagos_{resumen.ficheros[0]}.xml", "application/xml"
+                            else:
+                                resumen = generador_ct.generar_zip(transferencias, fecha_ejecucion, fichero)
+                                nombre_fichero, mime = f"pagos_{resumen.ficheros[0]}.zip", "application/zip"
+                        except ValueError as e:
+                            st.error(f"❌ {e}")
+                            resumen = None
+                
+                    if resumen:
+                        # Asientos de pago de las transferencias incluidas, en un solo lote
+                        rechazados = {referencia for referencia, _motivo in resumen.rechazados}
+                        pagados = [p for p in pagos if p.referencia not in rechazados]
+                        libro.contabilizar_lote(
+                            asientos_de_pagos(entidad_seleccionada['id'], pagados, fecha_ejecucion)
+                        )
+                        confirmar_cambios()
+                    
+                        st.success(f"""
+                        ✅ Fichero SEPA Credit Transfer generado
+                    
+                        - **Ficheros:** {len(resumen.ficheros)} ({resumen.num_bloques} bloques PmtInf)
+                        - **Transferencias:** {resumen.num_transacciones}
+                        - **Importe total:** {resumen.importe_total:,.2f} €
+                        - **Asientos de pago contabilizados:** {len(pagados)}
+                        - **Rendimiento:** {resumen.transacciones_por_segundo:,.0f} transferencias/s
+                        """)
+                    
+                        if resumen.rechazados:
+                            st.warning("Pagos excluidos de la remesa:\n\n" + "\n".join(
+                                f"- {referencia}: {motivo}" for referencia, motivo in resumen.rechazados
+                            ))
+                    
+                        st.download_button(
+                            "📥 Descargar fichero SEPA",
+                            fichero.getvalue(),
+                            file_name=nombre_fichero,
+                            mime=mime
+                        )
+
+        if apartado_cobros == "🔗 Conciliación":
+            st.subheader("🔗 Conciliación de cobros y devoluciones")
+
+            st.write("Casa los abonos del extracto y los rechazos de la remesa con los recibos abiertos "
+                     "(por EndToEndId, IBAN e importe o importe y vencimiento) y contabiliza los cobros "
+                     "(572/4300) y devoluciones (4309/572) en un solo lote.")
+
+            col_c1, col_c2 = st.columns(2)
+            with col_c1:
+                fichero_cobros = st.file_uploader("Extracto bancario (Norma 43 o CAMT.053)",
+                                                  type=['n43', 'c43', 'aeb', 'txt', 'xml'],
+                                                  key='fichero_conciliacion')
+            with col_c2:
+                fichero_pain002 = st.file_uploader("Informe de devoluciones (pain.002)", type=['xml'],
+                                                   key='fichero_pain002')
+
+            st.metric("Recibos abiertos", len(indice_recibos.abiertos(entidad_seleccionada['id'])))
+
+            if st.button("🔗 Conciliar y contabilizar", type="primary",
+                         disabled=not (fichero_cobros or fichero_pain002)):
+                conciliador = ConciliadorRecibos(indice_recibos, st.session_state.referencias)
+                # Una sola conciliación: el pain.002 ve los cobros casados en el extracto
+                conciliacion = Conciliacion()
+                try:
+                    with perfilador.seccion('Conciliación'):
+                        if fichero_cobros:
+                            conciliador.conciliar_extracto(BytesIO(fichero_cobros.getvalue()),
+                                                           entidad_seleccionada['id'], conciliacion)
+                        if fichero_pain002:
+                            conciliador.conciliar_devoluciones(BytesIO(fichero_pain002.getvalue()),
+                                                               entidad_seleccionada['id'], conciliacion)
+                except ErrorExtracto as e:
+                    st.error(f"❌ {e}")
+                    conciliacion = None
+
+                if conciliacion is not None:
+                    libro.contabilizar_lote(conciliacion.asientos)
+                    confirmar_cambios(conciliacion.aplicar())
+
+                    cobros, devoluciones = conciliacion.cobros, conciliacion.devoluciones
+                    c1, c2, c3, c4 = st.columns(4)
+                    c1.metric("Cobros", len(cobros))
+                    c2.metric("Devoluciones", len(devoluciones))
+                    c3.metric("Sin conciliar", conciliacion.sin_conciliar)
+                    c4.metric("Ya conciliados", conciliacion.ya_conciliados)
+                    st.success(f"✅ {len(conciliacion.asientos)} asientos contabilizados en "
+                               f"{conciliacion.segundos:.2f} s")
+
+                    if cobros or devoluciones:
+                        st.dataframe(perfilador.dataframe(pd.DataFrame([{
+                            'Recibo': r['numero'],
+                            'Deudor': r['tercero']['nombre'][:30],
+                            'Importe': f"{r['importe']:.2f} €",
+                            'Resultado': 'Cobrado',
+                            'Detalle': metodo,
+                        } for r, metodo in cobros] + [{
+                            'Recibo': r['numero'],
+                            'Deudor': r['tercero']['nombre'][:30],
+                            'Importe': f"{r['importe']:.2f} €",
+                            'Resultado': r['estado'].title(),
+                            'Detalle': motivo,
+                        } for r, motivo in devoluciones])), use_container_width=True, hide_index=True)
 
 # =====================================================
-# TAB 6: CONFIGURACIÓN
+# SECCIÓN 6: CONFIGURACIÓN
 # =====================================================
 
-with tab6:
-    st.header("⚙️ Configuración")
+if seccion_activa == SECCION_CONFIGURACION:
+    with perfilador.seccion('Configuración'):
+        st.header("⚙️ Configuración")
+    
+        # Solo se ejecuta el apartado elegido (como las secciones principales)
+        apartado_configuracion = st.radio(
+            "Apartado:", [
+                "🏢 Entidades",
+                "👥 Terceros",
+                "🏦 Cuentas Bancarias",
+                "🔒 Cierre del ejercicio",
+            ], key='apartado_configuracion', horizontal=True, label_visibility="collapsed"
+        )
     
-    subtab_config1, subtab_config2, subtab_config3 = st.tabs([
-        "🏢 Entidades",
-        "👥 Terceros",
-        "🏦 Cuentas Bancarias"
-    ])
+        if apartado_configuracion == "🏢 Entidades":
+            st.subheader("Gestión de Entidades")
+        
+            if st.button("➕ Nueva Entidad"):
+                st.session_state.nueva_entidad = True
+        
+            for entidad in st.session_state.entidades:
+                with st.expander(f"{entidad['razon_social']} ({entidad['nif']})"):
+                    st.write(f"**Tipo:** {entidad['tipo']}")
+                    st.write(f"**Régimen IVA:** {entidad['regimen_iva']}")
+                    st.write(f"**Plan contable:** {entidad['plan_contable']}")
     
-    with subtab_config1:
-        st.subheader("Gestión de Entidades")
+        if apartado_configuracion == "👥 Terceros":
+            st.subheader("Gestión de Terceros (Clientes/Proveedores/Propietarios)")
         
-        if st.button("➕ Nueva Entidad"):
-            st.session_state.nueva_entidad = True
+            if st.button("➕ Nuevo Tercero"):
+                st.session_state.nuevo_tercero = True
         
-        for entidad in st.session_state.entidades:
-            with st.expander(f"{entidad['razon_social']} ({entidad['nif']})"):
-                st.write(f"**Tipo:** {entidad['tipo']}")
-                st.write(f"**Régimen IVA:** {entidad['regimen_iva']}")
-                st.write(f"**Plan contable:** {entidad['plan_contable']}")
+            df_terceros = pd.DataFrame(st.session_state.terceros)
+            st.dataframe(perfilador.dataframe(df_terceros), use_container_width=True, hide_index=True)
     
-    with subtab_config2:
-        st.subheader("Gestión de Terceros (Clientes/Proveedores/Propietarios)")
+        if apartado_configuracion == "🏦 Cuentas Bancarias":
+            st.subheader("Cuentas Bancarias")
         
-        if st.button("➕ Nuevo Tercero"):
-            st.session_state.nuevo_tercero = True
+            st.info("""
+            **Para domiciliaciones SEPA necesitas:**
+            - IBAN de la cuenta
+            - BIC/SWIFT del banco
+            - Identificador de acreedor SEPA (solicitar al banco)
+            """)
         
-        df_terceros = pd.DataFrame(st.session_state.terceros)
-        st.dataframe(df_terceros, use_container_width=True, hide_index=True)
+            st.json(CUENTA_BANCARIA_EJEMPLO)
     
-    with subtab_config3:
-        st.subheader("Cuentas Bancarias")
-        
-        st.info("""
-        **Para domiciliaciones SEPA necesitas:**
-        - IBAN de la cuenta
-        - BIC/SWIFT del banco
-        - Identificador de acreedor SEPA (solicitar al banco)
-        """)
+        if apartado_configuracion == "🔒 Cierre del ejercicio":
+            st.subheader(f"Cierre del ejercicio {ejercicio} (todas las entidades)")
+            st.caption("Regularización de los grupos 6 y 7 contra la 129, asiento de cierre a 31/12 "
+                       f"y asiento de apertura a 01/01/{ejercicio + 1}, calculados desde los saldos")
         
-        cuenta_ejemplo = {
-            'nombre': 'Cuenta Principal',
-            'iban': 'ES91 2100 0418 4502 0005 1332',
-            'bic': 'CAIXESBBXXX',
-            'banco': 'CaixaBank',
-            'creditor_id': 'ES12000B12345678'
-        }
+            simulacion = st.checkbox("Simulación (calcula y mide tiempos sin contabilizar)", value=True)
+        
+            if st.button(f"🔒 {'Simular' if simulacion else 'Ejecutar'} cierre de {ejercicio}", type="primary"):
+                terceros_por_id = {t['id']: t for t in st.session_state.terceros}
+                for entidad in st.session_state.entidades:
+                    persistencia.cargar_entidad(entidad['id'], terceros_por_id)
+            
+                barra = st.progress(0.0, text="Preparando cierres...")
+                with perfilador.seccion('Cierre del ejercicio'):
+                    informe = preparar_cierres(
+                        st.session_state.entidades, apuntes, st.session_state.referencias, ejercicio,
+                        simulacion=simulacion,
+                        al_terminar=lambda entidad, hechas, total: barra.progress(
+                            hechas / total, text=f"{hechas}/{total} - {entidad['razon_social']}"
+                        )
+                    )
+                barra.empty()
+            
+                if not simulacion and informe.asientos:
+                    libro.contabilizar_lote(informe.asientos)
+                    confirmar_cambios()
+                    st.success(f"✅ {len(informe.asientos)} asientos de cierre contabilizados")
+                st.session_state.informe_cierre = informe
         
-        st.json(cuenta_ejemplo)
+            informe = st.session_state.get('informe_cierre')
+            if informe is not None:
+                col_a, col_b, col_c = st.columns(3)
+                with col_a:
+                    st.metric("Entidades", len(informe.cierres))
+                with col_b:
+                    st.metric("Asientos" + (" (simulación)" if informe.simulacion else ""), len(informe.asientos))
+                with col_c:
+                    st.metric("Tiempo total", f"{informe.segundos:.2f} s")
+            
+                st.dataframe(pd.DataFrame([{
+                    'Entidad': c.razon_social,
+                    'Estado': c.estado,
+                    'Resultado': c.resultado / 100,
+                    'Saldos cerrados': c.saldos_cerrados,
+                    'Apuntes': c.apuntes_analizados,
+                    **{f"{paso} (ms)": round(segundos * 1000, 2) for paso, segundos in c.segundos.items()},
+                    'Error': c.error,
+                } for c in informe.cierres]), use_container_width=True, hide_index=True)
 
 # =====================================================
 # FOOTER
@@ -990,5 +1568,40 @@ st.divider()
 st.caption("""
 **ContaFácil v0.1** - Prototipo MVP  
 Desarrollado para POINT · Contabilidad PGC Español  
-⚠️ Este es un prototipo de demostración. Los datos no se guardan de forma persistente.
+💾 Datos guardados en base de datos (DATABASE_URL o SQLite local).
 """)
+
+# Escribir en lote cualquier cambio pendiente del libro
+confirmar_cambios(detener=False)
+
+perfilador.terminar_rerun()
+
+# Estadísticas de la caché de vistas (al final, con las consultas de este rerun)
+with st.sidebar:
+    with st.expander("⚡ Caché de vistas"):
+        if vistas.estadisticas:
+            st.caption(f"{len(vistas)} de {vistas.max_entradas} entradas")
+            st.dataframe(vistas.como_dataframe(), use_container_width=True, hide_index=True)
+        else:
+            st.caption("Sin consultas todavía")
+    
+    with st.expander("🐞 Perfilador"):
+        st.toggle("Medir cada rerun", key='perfilador_activo')
+        if perfilador.ultimo_rerun:
+            st.caption(f"Rerun {perfilador.ultimo_rerun[0].rerun}: "
+                       f"{sum(m.segundos for m in perfilador.ultimo_rerun if not m.padre) * 1000:,.0f} ms "
+                       "en las secciones medidas")
+            st.dataframe(perfilador.como_dataframe(), use_container_width=True, hide_index=True)
+        if perfilador.historial:
+            # El historial se serializa al pulsar, no en cada rerun
+            def generar_jsonl():
+                exportacion = StringIO()
+                perfilador.exportar_jsonl(exportacion)
+                return exportacion.getvalue()
+            st.download_button(
+                f"📥 Exportar {perfilador.num_mediciones} mediciones (JSONL)",
+                generar_jsonl,
+                file_name="perfil_contafacil.jsonl",
+                mime="application/jsonl",
+                on_click='ignore'
+            )
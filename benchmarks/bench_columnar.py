@@ -0,0 +1,121 @@
+"""
+Benchmark: agregaciones sobre apuntes en diccionarios vs almacén columnar
+
+Compara los bucles originales de app_main.py (totales del Diario, agrupación
+del Mayor y las cuatro pasadas del Modelo 303) con los group-bys vectoriales
+de ApuntesColumnares.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_columnar [num_apuntes]
+"""
+
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+from core.columnar import ApuntesColumnares
+from core.contabilizador import LibroAsientos
+
+
+CUENTAS_GASTO = ['600', '621', '622', '623', '628', '629']
+
+
+def generar_asientos(num_apuntes: int, entidad_id: int = 1, semilla: int = 42):
+    """Genera asientos de factura recibida/emitida (3 apuntes cada uno)"""
+    rnd = random.Random(semilla)
+    inicio = date(2026, 1, 1)
+    for i in range(num_apuntes // 3):
+        fecha = (inicio + timedelta(days=rnd.randrange(365))).isoformat()
+        base = round(rnd.uniform(10, 5000), 2)
+        cuota = round(base * 0.21, 2)
+        total = round(base + cuota, 2)
+        if i % 2:
+            apuntes = [
+                {'cuenta': rnd.choice(CUENTAS_GASTO), 'debe': base, 'haber': 0},
+                {'cuenta': '472', 'debe': cuota, 'haber': 0},
+                {'cuenta': '400', 'debe': 0, 'haber': total},
+            ]
+        else:
+            apuntes = [
+                {'cuenta': '430', 'debe': total, 'haber': 0},
+                {'cuenta': '700', 'debe': 0, 'haber': base},
+                {'cuenta': '477', 'debe': 0, 'haber': cuota},
+            ]
+        yield {'entidad_id': entidad_id, 'fecha': fecha,
+               'concepto': f"Fra. {i}", 'apuntes': apuntes}
+
+
+def agregaciones_diccionarios(asientos_entidad):
+    """Réplica de los bucles originales de las pestañas 2, 3 y 4"""
+    total_debe = sum(sum(a['debe'] for a in asiento['apuntes']) for asiento in asientos_entidad)
+    total_haber = sum(sum(a['haber'] for a in asiento['apuntes']) for asiento in asientos_entidad)
+
+    movimientos_por_cuenta = {}
+    for asiento in asientos_entidad:
+        for apunte in asiento['apuntes']:
+            datos = movimientos_por_cuenta.setdefault(
+                apunte['cuenta'], {'total_debe': 0, 'total_haber': 0}
+            )
+            datos['total_debe'] += apunte['debe']
+            datos['total_haber'] += apunte['haber']
+
+    modelo_303 = {}
+    for cuenta, lado in (('477', 'haber'), ('472', 'debe'), ('700', 'haber'), ('600', 'debe')):
+        modelo_303[cuenta] = sum(
+            apunte[lado]
+            for asiento in asientos_entidad
+            for apunte in asiento['apuntes']
+            if apunte['cuenta'] == cuenta
+        )
+    return total_debe, total_haber, movimientos_por_cuenta, modelo_303
+
+
+def agregaciones_columnares(apuntes: ApuntesColumnares, entidad_id: int = 1):
+    """Las mismas agregaciones sobre el almacén columnar"""
+    totales = apuntes.totales(entidad_id)
+    sumas = apuntes.sumas_por_cuenta(entidad_id)
+    modelo_303 = apuntes.sumas_cuentas(entidad_id, ['477', '472', '700', '600'])
+    return totales, sumas, modelo_303
+
+
+def cronometrar(funcion, *args, repeticiones: int = 3) -> float:
+    """Mejor tiempo (s) de varias ejecuciones"""
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion(*args)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+
+if __name__ == "__main__":
+    num_apuntes = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+    libro = LibroAsientos()
+    apuntes = ApuntesColumnares()
+    libro.suscribir(apuntes)
+
+    inicio = time.perf_counter()
+    for asiento in generar_asientos(num_apuntes):
+        libro.contabilizar(asiento)
+    t_carga = time.perf_counter() - inicio
+
+    asientos_entidad = libro.asientos_entidad(1)
+    t_dict = cronometrar(agregaciones_diccionarios, asientos_entidad)
+    t_col = cronometrar(agregaciones_columnares, apuntes)
+
+    # Comprobación de exactitud: céntimos enteros frente a sumas en float
+    debe_cent, haber_cent = apuntes.totales(1)
+    debe_float, haber_float, _, _ = agregaciones_diccionarios(asientos_entidad)
+
+    print("=" * 60)
+    print(f"BENCHMARK COLUMNAR - {apuntes.num_apuntes(1):,} apuntes")
+    print("=" * 60)
+    print(f"Carga (contabilizar + indexar): {t_carga:8.2f} s")
+    print(f"Diccionarios (Diario+Mayor+303): {t_dict * 1000:8.1f} ms")
+    print(f"Columnar     (Diario+Mayor+303): {t_col * 1000:8.1f} ms")
+    print(f"Aceleración: x{t_dict / t_col:.1f}")
+    print(f"Cuadre en céntimos: {debe_cent - haber_cent} (exacto)")
+    print(f"Cuadre en float:    {debe_float - haber_float!r}")
+    print("=" * 60)
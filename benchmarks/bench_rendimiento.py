@@ -0,0 +1,275 @@
+"""
+Benchmark de las rutas críticas a varias escalas, con histórico de resultados
+
+Con datos sintéticos reproducibles (benchmarks.datos_sinteticos) mide:
+
+- numeracion: contabilizar el lote en un LibroAsientos sin observadores
+- contabilizar: el mismo lote con los observadores de la sesión que se
+  alimentan en cada alta (saldos, columnar, diario, balance, referencias)
+- diario: rango de un trimestre, todas sus páginas con ``filas_diario`` y los
+  totales del rango
+- mayor: sumas por cuenta y movimientos de la cuenta 430
+- modelo_303: los cuatro trimestres sin caché
+- modelo_347: la declaración anual sin caché
+- sepa_pain008: la remesa de todos los recibos en memoria
+
+Las operaciones por entidad usan la primera sociedad. Cada resultado (mejor
+de N repeticiones) se añade como una línea JSON a ``benchmarks/resultados.jsonl``
+con la fecha, el commit y la escala; al terminar se compara con la ejecución
+anterior de la misma escala y se marcan las regresiones que superan el umbral.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_rendimiento                     # escala pequeña
+    python -m benchmarks.bench_rendimiento pequena media grande
+    python -m benchmarks.bench_rendimiento media --repeticiones 5 --umbral 0.1
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from io import BytesIO
+from typing import Callable, Dict, List, Optional
+
+from benchmarks.datos_sinteticos import DatosSinteticos, generar_datos
+from core.columnar import ApuntesColumnares
+from core.contabilizador import LibroAsientos
+from core.diario import IndiceDiario, filas_diario
+from core.plan_cuentas import compilar_plan
+from core.referencias import IndiceReferencias
+from core.saldos import CacheSaldos
+from core.sumas_saldos import BalanceSumasSaldos
+from modelos_aeat.base import TRIMESTRES
+from modelos_aeat.modelo_303 import Modelo303
+from modelos_aeat.modelo_347 import Modelo347
+from pagos.sepa_direct_debit import (
+    ConfiguracionAcreedorSEPA, DatosMandato, GeneradorSEPADirectDebit, ReciboSEPA,
+    calcular_creditor_id,
+)
+
+
+# Escala -> (entidades, asientos, terceros, recibos)
+ESCALAS = {
+    'pequena': (3, 10_000, 1_000, 1_000),
+    'media': (10, 100_000, 10_000, 10_000),
+    'grande': (30, 500_000, 40_000, 50_000),
+}
+
+FICHERO_RESULTADOS = os.path.join(os.path.dirname(__file__), 'resultados.jsonl')
+EJERCICIO = 2026
+ASIENTOS_POR_PAGINA = 100
+
+
+@dataclass
+class Resultado:
+    fecha: str
+    commit: str
+    python: str
+    escala: str
+    operacion: str
+    segundos: float
+    elementos: int
+
+    @property
+    def por_segundo(self) -> float:
+        return self.elementos / self.segundos if self.segundos else 0.0
+
+
+def commit_actual() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def cronometrar(funcion: Callable[[], object], repeticiones: int,
+                preparar: Optional[Callable[[], object]] = None) -> float:
+    """Mejor tiempo (s) de varias ejecuciones; ``preparar`` no se cronometra"""
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        argumentos = (preparar(),) if preparar else ()
+        inicio = time.perf_counter()
+        funcion(*argumentos)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+
+def copia_asientos(datos: DatosSinteticos) -> List[dict]:
+    """Copia de los asientos sin id ni número (el libro escribe en el dict)"""
+    return [{**asiento} for asiento in datos.asientos]
+
+
+def libro_de_sesion():
+    """LibroAsientos con los observadores que mantiene la aplicación al contabilizar"""
+    libro = LibroAsientos()
+    observadores = {
+        'saldos': CacheSaldos(),
+        'apuntes': ApuntesColumnares(),
+        'diario': IndiceDiario(),
+        'sumas_saldos': BalanceSumasSaldos(),
+        'referencias': IndiceReferencias(),
+    }
+    for observador in observadores.values():
+        libro.suscribir(observador)
+    return libro, observadores
+
+
+def recibos_sepa(datos: DatosSinteticos) -> List[ReciboSEPA]:
+    """Recibos de la remesa como los construye la pestaña de cobros"""
+    return [
+        ReciboSEPA(
+            id_interno=r['numero'],
+            importe=Decimal(str(r['importe'])),
+            concepto=r['concepto'],
+            mandato=DatosMandato(
+                mandate_id=f"MAND-{r['tercero']['id']:03d}",
+                fecha_firma=date(2024, 1, 1),
+                deudor_nombre=r['tercero']['nombre'],
+                deudor_iban=r['tercero']['iban'],
+                tipo='RCUR',
+            ),
+        )
+        for r in datos.recibos
+    ]
+
+
+def medir_escala(escala: str, repeticiones: int) -> List[Resultado]:
+    num_entidades, num_asientos, num_terceros, num_recibos = ESCALAS[escala]
+    datos = generar_datos(num_entidades, num_asientos, num_terceros, num_recibos, EJERCICIO)
+    entidad = next(e for e in datos.entidades if e['tipo'] != 'comunidad_propietarios')
+    terceros_por_id = datos.terceros_por_id
+    tiempos: Dict[str, tuple] = {}
+
+    tiempos['numeracion'] = (cronometrar(
+        lambda asientos: LibroAsientos().contabilizar_lote(asientos),
+        repeticiones, preparar=lambda: copia_asientos(datos)), num_asientos)
+
+    def contabilizar(asientos: List[dict]) -> None:
+        libro, _ = libro_de_sesion()
+        libro.contabilizar_lote(asientos)
+    tiempos['contabilizar'] = (cronometrar(contabilizar, repeticiones,
+                                           preparar=lambda: copia_asientos(datos)), num_asientos)
+
+    libro, observadores = libro_de_sesion()
+    libro.contabilizar_lote(copia_asientos(datos))
+    diario, apuntes = observadores['diario'], observadores['apuntes']
+    plan = compilar_plan(entidad, datos.terceros)
+    desde, hasta = date(EJERCICIO, 4, 1), date(EJERCICIO, 6, 30)
+
+    def recorrer_diario() -> int:
+        num = diario.num_asientos_rango(entidad['id'], desde, hasta)
+        for pagina in range(-(-num // ASIENTOS_POR_PAGINA)):
+            filas_diario(diario.pagina(entidad['id'], desde, hasta, pagina, ASIENTOS_POR_PAGINA), plan)
+        diario.totales_rango(entidad['id'], desde, hasta)
+        return num
+    tiempos['diario'] = (cronometrar(recorrer_diario, repeticiones),
+                         diario.num_asientos_rango(entidad['id'], desde, hasta))
+
+    def mayor() -> None:
+        apuntes.sumas_por_cuenta(entidad['id'])
+        apuntes.movimientos_cuenta(entidad['id'], '430')
+    tiempos['mayor'] = (cronometrar(mayor, repeticiones), apuntes.num_apuntes(entidad['id']))
+
+    def modelo_303() -> None:
+        motor = Modelo303(apuntes)
+        for trimestre in TRIMESTRES:
+            motor.calcular(entidad['id'], EJERCICIO, trimestre)
+    tiempos['modelo_303'] = (cronometrar(modelo_303, repeticiones), apuntes.num_apuntes(entidad['id']))
+
+    tiempos['modelo_347'] = (cronometrar(
+        lambda: Modelo347(apuntes).calcular(entidad['id'], EJERCICIO, terceros_por_id),
+        repeticiones), apuntes.num_apuntes(entidad['id']))
+
+    if datos.recibos:
+        config = ConfiguracionAcreedorSEPA(
+            creditor_id=calcular_creditor_id(entidad['nif']),
+            creditor_name=entidad['razon_social'],
+            creditor_iban=datos.terceros[0]['iban'],
+        )
+        generador = GeneradorSEPADirectDebit(config, validar_fecha=False)
+        remesa = recibos_sepa(datos)
+        tiempos['sepa_pain008'] = (cronometrar(
+            lambda: generador.generar(remesa, date(EJERCICIO, 12, 1), lambda _i, _m: BytesIO()),
+            repeticiones), len(remesa))
+
+    comunes = dict(fecha=datetime.now().isoformat(timespec='seconds'), commit=commit_actual(),
+                   python=platform.python_version(), escala=escala)
+    return [Resultado(operacion=operacion, segundos=segundos, elementos=elementos, **comunes)
+            for operacion, (segundos, elementos) in tiempos.items()]
+
+
+def cargar_anteriores(ruta: str) -> Dict[tuple, Resultado]:
+    """Último resultado guardado de cada (escala, operación)"""
+    anteriores: Dict[tuple, Resultado] = {}
+    if not os.path.exists(ruta):
+        return anteriores
+    with open(ruta, encoding='utf-8') as fichero:
+        for linea in fichero:
+            if linea.strip():
+                resultado = Resultado(**json.loads(linea))
+                anteriores[(resultado.escala, resultado.operacion)] = resultado
+    return anteriores
+
+
+def guardar(resultados: List[Resultado], ruta: str) -> None:
+    with open(ruta, 'a', encoding='utf-8') as fichero:
+        for resultado in resultados:
+            fichero.write(json.dumps(asdict(resultado), ensure_ascii=False) + '\n')
+
+
+def informe(resultados: List[Resultado], anteriores: Dict[tuple, Resultado],
+            umbral: float) -> int:
+    """Imprime la tabla comparada con la ejecución anterior. Devuelve las regresiones."""
+    regresiones = 0
+    escala = None
+    for resultado in resultados:
+        if resultado.escala != escala:
+            escala = resultado.escala
+            print("=" * 78)
+            print(f"ESCALA {escala.upper()} - {ESCALAS[escala][0]} entidades, "
+                  f"{ESCALAS[escala][1]:,} asientos, {ESCALAS[escala][2]:,} terceros, "
+                  f"{ESCALAS[escala][3]:,} recibos")
+            print("=" * 78)
+            print(f"{'Operación':<14}{'ms':>12}{'elementos':>12}{'elem/s':>14}  anterior")
+        anterior = anteriores.get((resultado.escala, resultado.operacion))
+        comparacion = ''
+        if anterior and anterior.segundos:
+            relacion = resultado.segundos / anterior.segundos
+            comparacion = f"x{relacion:.2f} ({anterior.commit or 'sin commit'})"
+            if relacion > 1 + umbral:
+                comparacion += "  ⚠ REGRESIÓN"
+                regresiones += 1
+        print(f"{resultado.operacion:<14}{resultado.segundos * 1000:>12.1f}"
+              f"{resultado.elementos:>12,}{resultado.por_segundo:>14,.0f}  {comparacion}")
+    return regresiones
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('escalas', nargs='*',
+                        help=f"Escalas a medir: {', '.join(ESCALAS)} (por defecto, pequena)")
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--umbral', type=float, default=0.2,
+                        help="Empeoramiento relativo que se marca como regresión (0.2 = 20%%)")
+    parser.add_argument('--resultados', default=FICHERO_RESULTADOS)
+    parser.add_argument('--sin-guardar', action='store_true')
+    argumentos = parser.parse_args()
+    desconocidas = set(argumentos.escalas) - set(ESCALAS)
+    if desconocidas:
+        parser.error(f"escalas desconocidas: {', '.join(sorted(desconocidas))}")
+
+    anteriores = cargar_anteriores(argumentos.resultados)
+    resultados = []
+    for escala in argumentos.escalas or ['pequena']:
+        resultados.extend(medir_escala(escala, argumentos.repeticiones))
+    regresiones = informe(resultados, anteriores, argumentos.umbral)
+    if not argumentos.sin_guardar:
+        guardar(resultados, argumentos.resultados)
+    sys.exit(1 if regresiones else 0)
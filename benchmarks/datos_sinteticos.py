@@ -0,0 +1,183 @@
+"""
+Datos sintéticos reproducibles para los benchmarks
+
+Genera N entidades, K terceros, M asientos y los recibos de las comunidades
+con una semilla fija, con la misma forma que los que crea la aplicación:
+
+- Sociedades y autónomos: facturas recibidas (6xx/472/400) y emitidas
+  (430/700/477) como las propuestas de la pestaña de documentos, con tipo de
+  IVA, tercero y referencia de factura.
+- Comunidades: asientos de emisión de cuotas (4300 por propietario / 7400) y
+  sus recibos domiciliados, como los de ``comunidades.cuotas``.
+
+Uso:
+    datos = generar_datos(num_entidades=10, num_asientos=100_000, num_terceros=5_000)
+    libro.contabilizar_lote(datos.asientos)
+"""
+
+import random
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, List
+
+from core.referencias import referencia_factura
+
+
+TIPOS_ENTIDAD = ['sociedad_limitada', 'autonomo_directa', 'comunidad_propietarios']
+CUENTAS_GASTO = ['600', '621', '622', '623', '628', '629']
+TIPOS_IVA = [21, 21, 21, 10, 4]
+LETRAS_NIF = 'TRWAGMYFPDXBNJZSQVHLCKE'
+
+
+@dataclass
+class DatosSinteticos:
+    entidades: List[dict] = field(default_factory=list)
+    terceros: List[dict] = field(default_factory=list)
+    asientos: List[dict] = field(default_factory=list)     # sin id ni número
+    recibos: List[dict] = field(default_factory=list)
+
+    @property
+    def terceros_por_id(self) -> Dict[int, dict]:
+        return {t['id']: t for t in self.terceros}
+
+    @property
+    def num_apuntes(self) -> int:
+        return sum(len(a['apuntes']) for a in self.asientos)
+
+
+def iban_espanol(banco: int, cuenta: int) -> str:
+    """IBAN español válido (dígitos de control ISO 7064) para un banco y cuenta"""
+    bban = f"{banco:04d}0001{cuenta % 100:02d}{cuenta:010d}"
+    control = 98 - int(bban + '142800') % 97      # 'ES00' -> 14 28 00
+    return f"ES{control:02d}{bban}"
+
+
+def _nif(numero: int) -> str:
+    return f"{numero:08d}{LETRAS_NIF[numero % 23]}"
+
+
+def _cif(letra: str, numero: int) -> str:
+    return f"{letra}{numero:08d}"
+
+
+def generar_datos(num_entidades: int = 3, num_asientos: int = 10_000, num_terceros: int = 1_000,
+                  num_recibos: int = 1_000, ejercicio: int = 2026, semilla: int = 42) -> DatosSinteticos:
+    """
+    Genera un conjunto de datos completo y determinista para la semilla.
+
+    Args:
+        num_entidades: Entidades (los tipos se alternan; una de cada tres es comunidad)
+        num_asientos: Asientos en total, repartidos entre las entidades
+        num_terceros: Terceros (proveedores, clientes y propietarios a partes iguales)
+        num_recibos: Recibos de cuotas de las comunidades (0 si no hay comunidades)
+        ejercicio: Año de los asientos y recibos
+        semilla: Semilla del generador aleatorio
+    """
+    rnd = random.Random(semilla)
+    datos = DatosSinteticos()
+
+    for i in range(num_entidades):
+        tipo = TIPOS_ENTIDAD[i % len(TIPOS_ENTIDAD)]
+        comunidad = tipo == 'comunidad_propietarios'
+        datos.entidades.append({
+            'id': i + 1,
+            'nif': _cif('H' if comunidad else 'B', 10_000_000 + i),
+            'razon_social': f"{'COMUNIDAD PROP.' if comunidad else 'EMPRESA'} SINTÉTICA {i + 1:05d}",
+            'tipo': tipo,
+            'regimen_iva': 'no_sujeto' if comunidad else 'general',
+            'plan_contable': 'comunidades' if comunidad else 'pymes',
+        })
+
+    por_tipo: Dict[str, List[dict]] = {'proveedor': [], 'cliente': [], 'propietario': []}
+    for i in range(num_terceros):
+        tipo = ('proveedor', 'cliente', 'propietario')[i % 3]
+        tercero = {
+            'id': i + 1,
+            'nif': _nif(20_000_000 + i) if tipo == 'propietario' else _cif('B', 20_000_000 + i),
+            'nombre': f"{tipo.upper()} SINTÉTICO {i + 1:06d}",
+            'tipo': tipo,
+            'iban': iban_espanol(2100 + i % 50, i + 1),
+        }
+        datos.terceros.append(tercero)
+        por_tipo[tipo].append(tercero)
+
+    inicio = date(ejercicio, 1, 1)
+    for i in range(num_asientos):
+        entidad = datos.entidades[i % num_entidades]
+        fecha = inicio + timedelta(days=rnd.randrange(365))
+        if entidad['tipo'] == 'comunidad_propietarios' and por_tipo['propietario']:
+            datos.asientos.append(_asiento_cuotas(rnd, entidad, fecha, por_tipo['propietario']))
+        else:
+            datos.asientos.append(_asiento_factura(rnd, entidad, fecha, i, por_tipo))
+
+    comunidades = [e for e in datos.entidades if e['tipo'] == 'comunidad_propietarios']
+    if comunidades and por_tipo['propietario']:
+        for i in range(num_recibos):
+            comunidad = comunidades[i % len(comunidades)]
+            propietario = rnd.choice(por_tipo['propietario'])
+            mes = rnd.randrange(1, 13)
+            datos.recibos.append({
+                'id': i + 1,
+                'entidad_id': comunidad['id'],
+                'numero': f"R-{ejercicio}{mes:02d}-{comunidad['id']}-{propietario['id']}-{i}",
+                'tercero': propietario,
+                'importe': round(rnd.uniform(30, 300), 2),
+                'concepto': f"Cuota ordinaria {mes:02d}/{ejercicio}",
+                'fecha_emision': date(ejercicio, mes, 1).isoformat(),
+                'fecha_vencimiento': date(ejercicio, mes, 10).isoformat(),
+                'estado': 'pendiente',
+                'metodo': 'domiciliacion',
+            })
+    return datos
+
+
+def _asiento_factura(rnd: random.Random, entidad: dict, fecha: date, indice: int,
+                     por_tipo: Dict[str, List[dict]]) -> dict:
+    """Factura recibida o emitida con la forma de ``propuesta_asiento``"""
+    tipo_iva = rnd.choice(TIPOS_IVA)
+    base = round(rnd.uniform(10, 5_000), 2)
+    cuota = round(base * tipo_iva / 100, 2)
+    total = round(base + cuota, 2)
+    numero_factura = f"{fecha.year}/{indice + 1:07d}"
+    emitida = indice % 2 == 0
+    candidatos = por_tipo['cliente' if emitida else 'proveedor']
+    tercero = rnd.choice(candidatos) if candidatos else None
+    tercero_id = tercero['id'] if tercero else None
+    nif = tercero['nif'] if tercero else entidad['nif']
+    if emitida:
+        concepto = f"Fra. emitida {numero_factura}"
+        apuntes = [
+            {'cuenta': '430', 'debe': total, 'haber': 0, 'tercero_id': tercero_id},
+            {'cuenta': '700', 'debe': 0, 'haber': base, 'tipo_iva': tipo_iva},
+            {'cuenta': '477', 'debe': 0, 'haber': cuota, 'tipo_iva': tipo_iva},
+        ]
+    else:
+        concepto = f"Fra. {numero_factura}"
+        apuntes = [
+            {'cuenta': rnd.choice(CUENTAS_GASTO), 'debe': base, 'haber': 0, 'tipo_iva': tipo_iva},
+            {'cuenta': '472', 'debe': cuota, 'haber': 0, 'tipo_iva': tipo_iva},
+            {'cuenta': '400', 'debe': 0, 'haber': total, 'tercero_id': tercero_id},
+        ]
+    return {
+        'entidad_id': entidad['id'],
+        'fecha': fecha.isoformat(),
+        'concepto': concepto,
+        'referencia': referencia_factura(nif, numero_factura),
+        'apuntes': apuntes,
+    }
+
+
+def _asiento_cuotas(rnd: random.Random, entidad: dict, fecha: date,
+                    propietarios: List[dict]) -> dict:
+    """Emisión de cuotas de unos cuantos propietarios (4300 / 7400)"""
+    lineas = []
+    for propietario in rnd.sample(propietarios, min(len(propietarios), rnd.randint(2, 8))):
+        importe = round(rnd.uniform(30, 300), 2)
+        lineas.append({'cuenta': '4300', 'debe': importe, 'haber': 0, 'tercero_id': propietario['id']})
+    total = round(sum(l['debe'] for l in lineas), 2)
+    return {
+        'entidad_id': entidad['id'],
+        'fecha': fecha.replace(day=1).isoformat(),
+        'concepto': f"Emisión Cuota ordinaria {fecha.month:02d}/{fecha.year}",
+        'apuntes': lineas + [{'cuenta': '7400', 'debe': 0, 'haber': total}],
+    }
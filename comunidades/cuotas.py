@@ -0,0 +1,189 @@
+"""
+Emisión masiva de cuotas de comunidades de propietarios
+
+Para un mes dado y cualquier número de comunidades, reparte cada concepto
+presupuestado del ejercicio (cuota ordinaria o derrama) entre los propietarios
+según su coeficiente de participación. El reparto de todos los conceptos de
+todas las comunidades es una única operación vectorial en céntimos enteros,
+con el método del resto mayor para que la suma de los recibos coincida
+exactamente con la cuota del concepto.
+
+Cada recibo tiene un número determinista (comunidad, periodo, concepto y
+propietario), así que volver a emitir el mismo mes no genera duplicados. Los
+asientos de emisión (4300/7400 para cuotas, 4301/7401 para derramas) se
+devuelven juntos para contabilizarlos en un solo lote.
+"""
+
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Callable, Dict, List, Set
+
+import numpy as np
+
+from modelos_aeat.base import euros
+
+
+# Cuentas (propietarios, ingresos) por tipo de concepto
+CUENTAS_CONCEPTO = {
+    'ordinaria': ('4300', '7400'),
+    'derrama': ('4301', '7401'),
+}
+
+# Escala entera de los coeficientes (porcentaje con 4 decimales)
+ESCALA_COEFICIENTE = 10_000
+
+DIAS_VENCIMIENTO = 10
+
+
+@dataclass
+class EmisionCuotas:
+    """Resultado de una emisión: recibos nuevos y asientos a contabilizar"""
+    periodo: str                                   # AAAAMM
+    recibos: List[dict] = field(default_factory=list)
+    asientos: List[dict] = field(default_factory=list)
+    comunidades: int = 0
+    ya_emitidos: int = 0                           # recibos que ya existían
+
+    @property
+    def importe_total(self) -> Decimal:
+        return sum((Decimal(str(r['importe'])) for r in self.recibos), Decimal('0.00'))
+
+
+def numero_recibo(periodo: str, presupuesto_id: int, tercero_id: int) -> str:
+    """Número (clave idempotente) del recibo de un concepto, periodo y propietario"""
+    return f"R-{periodo}-{presupuesto_id}-{tercero_id}"
+
+
+def cuota_del_mes(presupuesto: dict, mes: int) -> int:
+    """
+    Parte del importe del concepto que corresponde al mes (céntimos).
+
+    El importe se reparte en ``num_cuotas`` mensualidades desde ``mes_inicio``;
+    fuera de ese intervalo la cuota es 0.
+    """
+    k = mes - presupuesto['mes_inicio']
+    n = presupuesto['num_cuotas']
+    if not 0 <= k < n:
+        return 0
+    importe = presupuesto['importe']
+    return importe * (k + 1) // n - importe * k // n
+
+
+def repartir(importes: np.ndarray, grupos: np.ndarray, pesos: np.ndarray) -> np.ndarray:
+    """
+    Reparte el importe de cada grupo entre sus filas en proporción a los pesos.
+
+    Args:
+        importes: Importe (céntimos) de cada grupo
+        grupos: Índice de grupo de cada fila
+        pesos: Peso entero de cada fila
+
+    Returns:
+        Céntimos de cada fila; las de un mismo grupo suman exactamente su importe
+    """
+    num_grupos = len(importes)
+    total_pesos = np.bincount(grupos, weights=pesos, minlength=num_grupos).astype(np.int64)
+    divisor = np.maximum(total_pesos[grupos], 1)
+    exacto = importes[grupos] * pesos
+    partes = exacto // divisor
+    restos = exacto % divisor
+
+    # Resto mayor: un céntimo más a las filas con mayor resto de cada grupo
+    faltan = importes - np.bincount(grupos, weights=partes, minlength=num_grupos).astype(np.int64)
+    orden = np.lexsort((-restos, grupos))
+    inicio_grupo = np.searchsorted(grupos[orden], np.arange(num_grupos))
+    posicion = np.empty_like(orden)
+    posicion[orden] = np.arange(len(orden)) - inicio_grupo[grupos[orden]]
+    return partes + (posicion < faltan[grupos])
+
+
+def emitir_cuotas(mes: date, comunidades: List[dict], propietarios: List[dict],
+                  presupuestos: List[dict], terceros_por_id: Dict[int, dict],
+                  numeros_existentes: Set[str],
+                  nuevo_id_recibo: Callable[[], int]) -> EmisionCuotas:
+    """
+    Recibos y asientos de emisión del mes para todas las comunidades.
+
+    Args:
+        mes: Cualquier día del mes a emitir
+        comunidades: Entidades de tipo comunidad de propietarios
+        propietarios: Coeficientes (entidad_id, tercero_id, coeficiente en %)
+        presupuestos: Conceptos presupuestados del ejercicio del mes
+        terceros_por_id: Terceros indexados por id
+        numeros_existentes: Números de recibo ya emitidos (se omiten)
+        nuevo_id_recibo: Función que reserva un id de recibo
+    """
+    mes = mes.replace(day=1)
+    periodo = mes.strftime('%Y%m')
+    emision = EmisionCuotas(periodo=periodo, comunidades=len(comunidades))
+    ids_comunidad = {c['id'] for c in comunidades}
+
+    conceptos = [p for p in presupuestos
+                 if p['entidad_id'] in ids_comunidad and p['ejercicio'] == mes.year
+                 and cuota_del_mes(p, mes.month) > 0]
+    if not conceptos:
+        return emision
+
+    # Filas (concepto, propietario) de todas las comunidades
+    propietarios_por_comunidad: Dict[int, List[dict]] = {}
+    for propietario in propietarios:
+        if propietario['entidad_id'] in ids_comunidad:
+            propietarios_por_comunidad.setdefault(propietario['entidad_id'], []).append(propietario)
+
+    grupos, terceros, pesos = [], [], []
+    for indice, concepto in enumerate(conceptos):
+        for propietario in propietarios_por_comunidad.get(concepto['entidad_id'], []):
+            grupos.append(indice)
+            terceros.append(propietario['tercero_id'])
+            pesos.append(int(Decimal(str(propietario['coeficiente'])) * ESCALA_COEFICIENTE))
+    if not grupos:
+        return emision
+
+    importes = np.array([cuota_del_mes(c, mes.month) for c in conceptos], dtype=np.int64)
+    grupos = np.array(grupos, dtype=np.int64)
+    cuotas = repartir(importes, grupos, np.array(pesos, dtype=np.int64))
+
+    vencimiento = (mes + timedelta(days=DIAS_VENCIMIENTO)).isoformat()
+    nombre_mes = mes.strftime('%m/%Y')
+    apuntes_concepto: Dict[int, List[dict]] = {}
+    totales_concepto: Dict[int, int] = {}
+    for indice, tercero_id, centimos in zip(grupos.tolist(), terceros, cuotas.tolist()):
+        concepto = conceptos[indice]
+        numero = numero_recibo(periodo, concepto['id'], tercero_id)
+        if numero in numeros_existentes:
+            emision.ya_emitidos += 1
+            continue
+        if centimos <= 0:
+            continue
+        importe = float(euros(centimos))
+        emision.recibos.append({
+            'id': nuevo_id_recibo(),
+            'entidad_id': concepto['entidad_id'],
+            'numero': numero,
+            'tercero': terceros_por_id[tercero_id],
+            'importe': importe,
+            'concepto': f"{concepto['concepto']} {nombre_mes}",
+            'fecha_emision': date.today().isoformat(),
+            'fecha_vencimiento': vencimiento,
+            'estado': 'pendiente',
+            'metodo': 'domiciliacion'
+        })
+        cuenta_propietario, _cuenta_ingreso = CUENTAS_CONCEPTO[concepto['tipo']]
+        apuntes_concepto.setdefault(indice, []).append(
+            {'cuenta': cuenta_propietario, 'debe': importe, 'haber': 0, 'tercero_id': tercero_id}
+        )
+        totales_concepto[indice] = totales_concepto.get(indice, 0) + centimos
+
+    # Un asiento por comunidad y concepto con una línea por propietario
+    for indice, lineas in apuntes_concepto.items():
+        concepto = conceptos[indice]
+        _cuenta_propietario, cuenta_ingreso = CUENTAS_CONCEPTO[concepto['tipo']]
+        total = euros(totales_concepto[indice])
+        emision.asientos.append({
+            'entidad_id': concepto['entidad_id'],
+            'fecha': mes.isoformat(),
+            'concepto': f"Emisión {concepto['concepto']} {nombre_mes}",
+            'apuntes': lineas + [{'cuenta': cuenta_ingreso, 'debe': 0, 'haber': float(total)}],
+        })
+    return emision
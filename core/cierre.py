@@ -0,0 +1,244 @@
+"""
+Cierre del ejercicio: regularización, cierre y apertura
+
+Los tres asientos se obtienen de los saldos agregados por (cuenta, tercero)
+a 31 de diciembre, calculados con un único group-by vectorial sobre las
+columnas de apuntes de la entidad, sin recorrer los asientos uno a uno:
+
+1. Regularización (31/12): salda las cuentas de los grupos 6 y 7 contra la
+   129 "Resultado del ejercicio".
+2. Cierre (31/12): salda todas las cuentas con saldo tras la regularización.
+3. Apertura (01/01 del ejercicio siguiente): el cierre invertido.
+
+Los saldos son acumulados desde el origen, así que un ejercicio anterior sin
+cerrar se regulariza junto con este y los asientos siempre cuadran. Los
+saldos de clientes y proveedores se cierran y reabren por tercero.
+
+Los asientos llevan una referencia por ejercicio (``REGULARIZACION/2026``,
+``CIERRE/2026``, ``APERTURA/2027``) con la que se detecta un ejercicio ya
+cerrado. El cálculo de cada entidad es independiente y se reparte en un pool
+de procesos; en modo simulación solo se informa del resultado y los tiempos.
+
+Uso:
+    informe = preparar_cierres(entidades, apuntes, referencias, 2026)
+    if not simulacion:
+        libro.contabilizar_lote(informe.asientos)
+"""
+
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.columnar import ApuntesColumnares, prefijo_cuentas
+from core.lotes import ejecutar_por_entidad
+from core.referencias import IndiceReferencias
+
+
+CUENTA_RESULTADO = 129
+GRUPOS_RESULTADOS = (6, 7)
+
+PREPARADO = 'preparado'
+YA_CERRADO = 'ya cerrado'
+SIN_SALDOS = 'sin saldos'
+ERROR = 'error'
+
+
+def referencia_cierre(ejercicio: int) -> str:
+    return f"CIERRE/{ejercicio}"
+
+
+@dataclass
+class CierreEntidad:
+    """Asientos de cierre propuestos para una entidad y tiempos de cada paso"""
+    entidad_id: int
+    razon_social: str
+    ejercicio: int
+    estado: str = PREPARADO
+    asientos: List[dict] = field(default_factory=list)
+    resultado: int = 0                  # céntimos; positivo = beneficio
+    saldos_cerrados: int = 0            # pares (cuenta, tercero) con saldo al cierre
+    apuntes_analizados: int = 0
+    segundos: Dict[str, float] = field(default_factory=dict)   # paso -> segundos
+    error: str = ''
+
+
+@dataclass
+class InformeCierre:
+    """Resultado del cierre de todas las entidades"""
+    ejercicio: int
+    simulacion: bool
+    cierres: List[CierreEntidad] = field(default_factory=list)
+    segundos: float = 0.0
+
+    @property
+    def asientos(self) -> List[dict]:
+        """Asientos de todas las entidades preparadas, en orden de contabilización"""
+        return [a for c in self.cierres if c.estado == PREPARADO for a in c.asientos]
+
+    def con_estado(self, estado: str) -> List[CierreEntidad]:
+        return [c for c in self.cierres if c.estado == estado]
+
+
+def saldos_agregados(columnas: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Saldo (debe - haber, céntimos) por (cuenta, tercero), solo los no nulos.
+
+    Returns:
+        Tupla de arrays (cuentas, terceros, saldos) ordenados por cuenta y tercero
+    """
+    clave = (columnas['cuenta'].astype(np.int64) << 32) | columnas['tercero'].astype(np.int64)
+    if len(clave) == 0:
+        vacio = np.zeros(0, dtype=np.int64)
+        return vacio, vacio, vacio
+    # Suma exacta en enteros: ordenar por clave y reducir cada tramo
+    orden = np.argsort(clave, kind='stable')
+    clave = clave[orden]
+    inicios = np.concatenate(([0], np.flatnonzero(np.diff(clave)) + 1))
+    neto = (columnas['debe'] - columnas['haber'])[orden]
+    saldos = np.add.reduceat(neto, inicios)
+    claves = clave[inicios]
+    con_saldo = saldos != 0
+    claves = claves[con_saldo]
+    return claves >> 32, claves & 0xFFFFFFFF, saldos[con_saldo]
+
+
+def _apuntes_saldando(cuentas: np.ndarray, terceros: np.ndarray, saldos: np.ndarray) -> List[dict]:
+    """Apuntes que dejan a cero cada saldo (deudor al haber, acreedor al debe)"""
+    apuntes = []
+    for cuenta, tercero, saldo in zip(cuentas.tolist(), terceros.tolist(), saldos.tolist()):
+        importe = abs(saldo) / 100
+        apunte = {'cuenta': str(cuenta),
+                  'debe': importe if saldo < 0 else 0, 'haber': importe if saldo > 0 else 0}
+        if tercero:
+            apunte['tercero_id'] = tercero
+        apuntes.append(apunte)
+    return apuntes
+
+
+def preparar_cierre(entidad: dict, columnas: Dict[str, np.ndarray], ejercicio: int,
+                    ya_cerrado: bool = False) -> CierreEntidad:
+    """
+    Asientos de regularización, cierre y apertura de una entidad.
+
+    Args:
+        entidad: Entidad (id y razón social)
+        columnas: Columnas de todos sus apuntes hasta el 31/12 del ejercicio
+        ejercicio: Año a cerrar
+        ya_cerrado: Si el cierre del ejercicio ya está contabilizado
+    """
+    cierre = CierreEntidad(entidad['id'], entidad['razon_social'], ejercicio,
+                           apuntes_analizados=len(columnas['cuenta']))
+    if ya_cerrado:
+        cierre.estado = YA_CERRADO
+        return cierre
+
+    inicio = time.perf_counter()
+    cuentas, terceros, saldos = saldos_agregados(columnas)
+    cierre.segundos['saldos'] = time.perf_counter() - inicio
+    if len(saldos) == 0:
+        cierre.estado = SIN_SALDOS
+        return cierre
+
+    fin_ejercicio = date(ejercicio, 12, 31).isoformat()
+    comun = {'entidad_id': entidad['id']}
+
+    # 1. Regularización de los grupos 6 y 7 contra la 129
+    inicio = time.perf_counter()
+    de_resultados = np.isin(prefijo_cuentas(cuentas, 1), GRUPOS_RESULTADOS)
+    perdidas = int(saldos[de_resultados].sum())        # gastos - ingresos
+    cierre.resultado = -perdidas
+    if de_resultados.any():
+        apuntes = _apuntes_saldando(cuentas[de_resultados], terceros[de_resultados],
+                                    saldos[de_resultados])
+        if perdidas:
+            apuntes.append({'cuenta': str(CUENTA_RESULTADO),
+                            'debe': perdidas / 100 if perdidas > 0 else 0,
+                            'haber': -perdidas / 100 if perdidas < 0 else 0})
+        cierre.asientos.append({
+            **comun,
+            'fecha': fin_ejercicio,
+            'concepto': f"Regularización del ejercicio {ejercicio}",
+            'referencia': f"REGULARIZACION/{ejercicio}",
+            'apuntes': apuntes,
+        })
+    cierre.segundos['regularizacion'] = time.perf_counter() - inicio
+
+    # 2. Cierre: saldos de balance con la 129 ya incorporada
+    inicio = time.perf_counter()
+    cuentas, terceros, saldos = cuentas[~de_resultados], terceros[~de_resultados], saldos[~de_resultados]
+    if perdidas:
+        posicion = np.searchsorted(cuentas, CUENTA_RESULTADO)
+        sin_tercero = posicion < len(cuentas) and cuentas[posicion] == CUENTA_RESULTADO \
+            and terceros[posicion] == 0
+        if sin_tercero:
+            saldos = saldos.copy()
+            saldos[posicion] += perdidas
+        else:
+            cuentas = np.insert(cuentas, posicion, CUENTA_RESULTADO)
+            terceros = np.insert(terceros, posicion, 0)
+            saldos = np.insert(saldos, posicion, perdidas)
+        con_saldo = saldos != 0
+        cuentas, terceros, saldos = cuentas[con_saldo], terceros[con_saldo], saldos[con_saldo]
+    cierre.saldos_cerrados = len(saldos)
+    if len(saldos):
+        cierre.asientos.append({
+            **comun,
+            'fecha': fin_ejercicio,
+            'concepto': f"Asiento de cierre del ejercicio {ejercicio}",
+            'referencia': referencia_cierre(ejercicio),
+            'apuntes': _apuntes_saldando(cuentas, terceros, saldos),
+        })
+    cierre.segundos['cierre'] = time.perf_counter() - inicio
+
+    # 3. Apertura del ejercicio siguiente (el cierre invertido)
+    inicio = time.perf_counter()
+    if len(saldos):
+        cierre.asientos.append({
+            **comun,
+            'fecha': date(ejercicio + 1, 1, 1).isoformat(),
+            'concepto': f"Asiento de apertura del ejercicio {ejercicio + 1}",
+            'referencia': f"APERTURA/{ejercicio + 1}",
+            'apuntes': _apuntes_saldando(cuentas, terceros, -saldos),
+        })
+    cierre.segundos['apertura'] = time.perf_counter() - inicio
+    return cierre
+
+
+def preparar_cierres(entidades: Sequence[dict], apuntes: ApuntesColumnares,
+                     referencias: IndiceReferencias, ejercicio: int, simulacion: bool = True,
+                     max_procesos: Optional[int] = None,
+                     al_terminar: Optional[Callable[[dict, int, int], None]] = None
+                     ) -> InformeCierre:
+    """
+    Prepara el cierre del ejercicio de todas las entidades en paralelo.
+
+    Args:
+        entidades: Entidades a cerrar (con sus apuntes ya cargados en ``apuntes``)
+        apuntes: Almacén columnar de la sesión
+        referencias: Índice de referencias del libro (detecta cierres ya hechos)
+        ejercicio: Año a cerrar
+        simulacion: Solo informa; el llamador no contabiliza los asientos
+        max_procesos: Procesos del pool (None = CPUs disponibles; 1 = sin pool)
+        al_terminar: Llamada (entidad, terminadas, total) al acabar cada entidad
+    """
+    inicio = time.perf_counter()
+    hasta = date(ejercicio, 12, 31)
+    tareas = [
+        (entidad, apuntes.columnas(entidad['id'], None, hasta), ejercicio,
+         referencias.buscar(entidad['id'], referencia_cierre(ejercicio)) is not None)
+        for entidad in entidades
+    ]
+
+    def fallo(tarea: tuple, error: Exception) -> CierreEntidad:
+        entidad = tarea[0]
+        return CierreEntidad(entidad['id'], entidad['razon_social'], ejercicio, estado=ERROR,
+                             error=f"{type(error).__name__}: {error}")
+
+    informe = InformeCierre(ejercicio, simulacion)
+    informe.cierres = ejecutar_por_entidad(preparar_cierre, tareas, max_procesos,
+                                           al_terminar=al_terminar, al_fallar=fallo)
+    informe.segundos = time.perf_counter() - inicio
+    return informe
@@ -0,0 +1,345 @@
+"""
+Almacén columnar de apuntes en céntimos enteros
+
+Cada entidad tiene un bloque de columnas NumPy (cuenta int32, debe/haber int64
+en céntimos, fecha como ordinal, id de asiento, id de tercero, tipo de IVA,
+-1 si el apunte no lo indica, y si el asiento es de cierre del ejercicio) que
+se amplía por duplicación de capacidad. Las bajas se marcan como filas muertas
+y se compactan cuando superan la mitad del bloque. Sobre estas columnas los
+totales del Diario, las sumas del Mayor y las del Modelo 303 son group-bys
+vectoriales con aritmética exacta en céntimos; los filtros por fechas usan un
+índice ordenado con búsqueda binaria.
+"""
+
+from datetime import date
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from core.referencias import es_asiento_cierre
+
+
+def ordinal_de(fecha) -> int:
+    """Convierte una fecha ISO o date en su ordinal (días desde 0001-01-01)"""
+    if isinstance(fecha, date):
+        return fecha.toordinal()
+    return date.fromisoformat(str(fecha)[:10]).toordinal()
+
+
+# Ordinal de 1970-01-01, para pasar ordinales a datetime64 sin bucles
+EPOCA_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+# Mayor código de cuenta que cabe en la columna int32 (subcuentas de hasta 9
+# dígitos y las de 10 que empiezan por 1 o 2)
+CODIGO_CUENTA_MAXIMO = int(np.iinfo(np.int32).max)
+
+
+def codigo_cuenta(cuenta: str) -> int:
+    """Código de cuenta PGC como entero (las cuentas PGC nunca empiezan por 0)"""
+    return int(cuenta)
+
+
+def prefijo_cuentas(cuentas: np.ndarray, digitos: int) -> np.ndarray:
+    """
+    Recorta códigos de cuenta a sus primeros dígitos (4300001 -> 430 con 3).
+
+    Los códigos con menos dígitos que los pedidos se devuelven sin cambios.
+    """
+    limite = 10 ** digitos
+    prefijos = cuentas.astype(np.int64)
+    while True:
+        largos = prefijos >= limite
+        if not largos.any():
+            return prefijos
+        prefijos = np.where(largos, prefijos // 10, prefijos)
+
+
+class _BloqueApuntes:
+    """Columnas de apuntes de una entidad"""
+
+    COLUMNAS = {
+        'cuenta': np.int32,
+        'debe': np.int64,
+        'haber': np.int64,
+        'fecha': np.int32,
+        'asiento': np.int64,
+        'tercero': np.int32,
+        'iva': np.int8,
+        'cierre': np.bool_,     # regularización, cierre o apertura del ejercicio
+        'vivo': np.bool_,
+    }
+
+    def __init__(self, capacidad: int = 1024):
+        self.n = 0
+        self.muertos = 0
+        self.columnas = {
+            nombre: np.zeros(capacidad, dtype=tipo)
+            for nombre, tipo in self.COLUMNAS.items()
+        }
+        # asiento_id -> (fila_inicio, fila_fin)
+        self.filas_asiento: Dict[int, Tuple[int, int]] = {}
+        # Índice por fecha (orden de filas y fechas ordenadas), se reconstruye
+        # perezosamente la primera vez que se consulta tras un cambio
+        self._indice_fecha: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    def _asegurar_capacidad(self, extra: int) -> None:
+        capacidad = len(self.columnas['cuenta'])
+        if self.n + extra <= capacidad:
+            return
+        while capacidad < self.n + extra:
+            capacidad *= 2
+        for nombre, columna in self.columnas.items():
+            nueva = np.zeros(capacidad, dtype=columna.dtype)
+            nueva[:self.n] = columna[:self.n]
+            self.columnas[nombre] = nueva
+
+    def anadir(self, asiento_id: int, filas: Dict[str, list]) -> None:
+        k = len(filas['cuenta'])
+        self._asegurar_capacidad(k)
+        inicio = self.n
+        for nombre, valores in filas.items():
+            self.columnas[nombre][inicio:inicio + k] = valores
+        self.columnas['asiento'][inicio:inicio + k] = asiento_id
+        self.columnas['vivo'][inicio:inicio + k] = True
+        self.filas_asiento[asiento_id] = (inicio, inicio + k)
+        self.n += k
+        self._indice_fecha = None
+
+    def retirar(self, asiento_id: int) -> None:
+        inicio, fin = self.filas_asiento.pop(asiento_id)
+        self.columnas['vivo'][inicio:fin] = False
+        self.muertos += fin - inicio
+        self._indice_fecha = None
+        if self.muertos * 2 > self.n:
+            self._compactar()
+
+    def _compactar(self) -> None:
+        vivo = self.columnas['vivo'][:self.n].copy()
+        for nombre, columna in self.columnas.items():
+            compacta = columna[:self.n][vivo]
+            columna[:len(compacta)] = compacta
+        self.n = int(vivo.sum())
+        self.muertos = 0
+        self._indexar_asientos()
+
+    @classmethod
+    def desde_columnas(cls, columnas: Dict[str, np.ndarray]) -> '_BloqueApuntes':
+        """Bloque con las filas vivas dadas (las de cada asiento, contiguas)"""
+        n = len(columnas['cuenta'])
+        bloque = cls(capacidad=max(n, 1))
+        for nombre in cls.COLUMNAS:
+            if nombre != 'vivo':
+                bloque.columnas[nombre][:n] = columnas[nombre]
+        bloque.columnas['vivo'][:n] = True
+        bloque.n = n
+        bloque._indexar_asientos()
+        return bloque
+
+    def _indexar_asientos(self) -> None:
+        """Reconstruye filas_asiento a partir de la columna de asientos"""
+        asientos = self.columnas['asiento'][:self.n]
+        self.filas_asiento = {}
+        if self.n:
+            # Las filas de cada asiento son contiguas (también tras compactar)
+            cortes = np.flatnonzero(np.diff(asientos)) + 1
+            inicios = np.concatenate(([0], cortes))
+            fines = np.concatenate((cortes, [self.n]))
+            for inicio, fin in zip(inicios.tolist(), fines.tolist()):
+                self.filas_asiento[int(asientos[inicio])] = (inicio, fin)
+
+    def filas_entre(self, desde: Optional[int], hasta: Optional[int]) -> np.ndarray:
+        """Filas vivas con fecha en [desde, hasta] (ordinales) por búsqueda binaria"""
+        if self._indice_fecha is None:
+            orden = np.argsort(self.columnas['fecha'][:self.n], kind='stable')
+            orden = orden[self.columnas['vivo'][:self.n][orden]]
+            self._indice_fecha = (orden, self.columnas['fecha'][:self.n][orden])
+        orden, fechas = self._indice_fecha
+        inicio = 0 if desde is None else np.searchsorted(fechas, desde, side='left')
+        fin = len(fechas) if hasta is None else np.searchsorted(fechas, hasta, side='right')
+        return orden[inicio:fin]
+
+    def vista(self) -> Dict[str, np.ndarray]:
+        """Columnas recortadas a las filas ocupadas (sin copiar)"""
+        return {nombre: columna[:self.n] for nombre, columna in self.columnas.items()}
+
+
+class ApuntesColumnares:
+    """
+    Apuntes de todas las entidades en formato columnar, por entidad.
+
+    Se suscribe al LibroAsientos como la caché de saldos:
+
+        apuntes = ApuntesColumnares()
+        libro.suscribir(apuntes)
+
+        apuntes.totales(1)                       # (debe, haber) en céntimos
+        apuntes.sumas_por_cuenta(1)              # DataFrame por cuenta
+        apuntes.sumas_cuentas(1, ['472', '477']) # dict cuenta -> (debe, haber)
+    """
+
+    def __init__(self):
+        self._bloques: Dict[int, _BloqueApuntes] = {}
+
+    # -------------------------------------------------
+    # Observador del LibroAsientos
+    # -------------------------------------------------
+
+    def asiento_contabilizado(self, asiento: dict) -> None:
+        apuntes = asiento['apuntes']
+        if not apuntes:
+            return
+        ordinal = ordinal_de(asiento['fecha'])
+        filas = {
+            'cuenta': [codigo_cuenta(a['cuenta']) for a in apuntes],
+            'debe': [a['debe_centimos'] for a in apuntes],
+            'haber': [a['haber_centimos'] for a in apuntes],
+            'fecha': ordinal,
+            'tercero': [a.get('tercero_id') or 0 for a in apuntes],
+            'iva': [-1 if a.get('tipo_iva') is None else a['tipo_iva'] for a in apuntes],
+            'cierre': es_asiento_cierre(asiento),
+        }
+        bloque = self._bloques.get(asiento['entidad_id'])
+        if bloque is None:
+            bloque = self._bloques[asiento['entidad_id']] = _BloqueApuntes()
+        bloque.anadir(asiento['id'], filas)
+
+    def asiento_retirado(self, asiento: dict) -> None:
+        bloque = self._bloques.get(asiento['entidad_id'])
+        if bloque is not None and asiento['id'] in bloque.filas_asiento:
+            bloque.retirar(asiento['id'])
+
+    # -------------------------------------------------
+    # Consultas vectoriales
+    # -------------------------------------------------
+
+    def columnas(self, entidad_id: int, desde: Optional[date] = None,
+                 hasta: Optional[date] = None,
+                 sin_cierre: bool = False) -> Dict[str, np.ndarray]:
+        """
+        Columnas de los apuntes vivos de la entidad, opcionalmente por fechas.
+
+        Args:
+            entidad_id: Entidad
+            desde: Fecha inicial incluida (None = sin límite)
+            hasta: Fecha final incluida (None = sin límite)
+            sin_cierre: Excluye los asientos de regularización, cierre y
+                apertura (los modelos tributarios solo declaran operaciones)
+
+        Returns:
+            Diccionario nombre de columna -> array NumPy
+        """
+        bloque = self._bloques.get(entidad_id)
+        if bloque is None:
+            return {nombre: np.zeros(0, dtype=tipo)
+                    for nombre, tipo in _BloqueApuntes.COLUMNAS.items()}
+
+        cols = bloque.vista()
+        if desde is None and hasta is None:
+            if bloque.muertos:
+                cols = {nombre: columna[cols['vivo']] for nombre, columna in cols.items()}
+        else:
+            # Rango de fechas: búsqueda binaria sobre el índice por fecha
+            filas = bloque.filas_entre(
+                None if desde is None else ordinal_de(desde),
+                None if hasta is None else ordinal_de(hasta),
+            )
+            cols = {nombre: columna[filas] for nombre, columna in cols.items()}
+        if sin_cierre and cols['cierre'].any():
+            mascara = ~cols['cierre']
+            cols = {nombre: columna[mascara] for nombre, columna in cols.items()}
+        return cols
+
+    def cargar_columnas(self, entidad_id: int, columnas: Dict[str, np.ndarray]) -> None:
+        """
+        Sustituye los apuntes de la entidad por las columnas dadas (las que
+        devuelve ``columnas()``), p. ej. para calcular en otro proceso sin el libro.
+        """
+        self._bloques[entidad_id] = _BloqueApuntes.desde_columnas(columnas)
+
+    def num_apuntes(self, entidad_id: int) -> int:
+        """Número de apuntes vivos de la entidad"""
+        bloque = self._bloques.get(entidad_id)
+        return bloque.n - bloque.muertos if bloque else 0
+
+    def totales(self, entidad_id: int, desde: Optional[date] = None,
+                hasta: Optional[date] = None) -> Tuple[int, int]:
+        """Total debe y haber en céntimos"""
+        cols = self.columnas(entidad_id, desde, hasta)
+        return int(cols['debe'].sum()), int(cols['haber'].sum())
+
+    def sumas_por_cuenta(self, entidad_id: int, desde: Optional[date] = None,
+                         hasta: Optional[date] = None) -> pd.DataFrame:
+        """
+        Group-by por cuenta de los apuntes de la entidad.
+
+        Returns:
+            DataFrame indexado por código de cuenta (str) con columnas
+            debe, haber (céntimos int64) y apuntes (número de apuntes)
+        """
+        cols = self.columnas(entidad_id, desde, hasta)
+        df = pd.DataFrame({
+            'cuenta': cols['cuenta'],
+            'debe': cols['debe'],
+            'haber': cols['haber'],
+        })
+        sumas = df.groupby('cuenta', sort=True).agg(
+            debe=('debe', 'sum'), haber=('haber', 'sum'), apuntes=('debe', 'size')
+        )
+        sumas.index = sumas.index.astype(str)
+        return sumas
+
+    def sumas_cuentas(self, entidad_id: int, cuentas: Iterable[str],
+                      desde: Optional[date] = None,
+                      hasta: Optional[date] = None) -> Dict[str, Tuple[int, int]]:
+        """Debe y haber en céntimos de las cuentas pedidas, en una sola pasada"""
+        sumas = self.sumas_por_cuenta(entidad_id, desde, hasta)
+        resultado = {}
+        for cuenta in cuentas:
+            if cuenta in sumas.index:
+                fila = sumas.loc[cuenta]
+                resultado[cuenta] = (int(fila['debe']), int(fila['haber']))
+            else:
+                resultado[cuenta] = (0, 0)
+        return resultado
+
+    def movimientos_cuenta(self, entidad_id: int, cuenta: str) -> pd.DataFrame:
+        """
+        Apuntes de una cuenta para el Libro Mayor.
+
+        Returns:
+            DataFrame con fecha (datetime64), asiento (id), debe y haber (céntimos)
+        """
+        cols = self.columnas(entidad_id)
+        mascara = cols['cuenta'] == codigo_cuenta(cuenta)
+        ordinales = cols['fecha'][mascara].astype(np.int64) - EPOCA_ORDINAL
+        return pd.DataFrame({
+            'fecha': ordinales.astype('datetime64[D]'),
+            'asiento': cols['asiento'][mascara],
+            'debe': cols['debe'][mascara],
+            'haber': cols['haber'][mascara],
+        })
+
+    def saldos_por_tercero(self, entidad_id: int, prefijos: Iterable[str],
+                           hasta: Optional[date] = None) -> pd.DataFrame:
+        """
+        Group-by por (tercero, cuenta) de las cuentas con esos prefijos de 3 dígitos.
+
+        Solo cuenta los apuntes con tercero asignado.
+
+        Returns:
+            DataFrame con columnas tercero, cuenta (str), debe y haber (céntimos)
+        """
+        cols = self.columnas(entidad_id, None, hasta)
+        cuenta3 = prefijo_cuentas(cols['cuenta'], 3)
+        mascara = np.isin(cuenta3, [codigo_cuenta(p) for p in prefijos]) & (cols['tercero'] > 0)
+        df = pd.DataFrame({
+            'tercero': cols['tercero'][mascara],
+            'cuenta': cols['cuenta'][mascara],
+            'debe': cols['debe'][mascara],
+            'haber': cols['haber'][mascara],
+        })
+        sumas = df.groupby(['tercero', 'cuenta'], sort=True, as_index=False)[['debe', 'haber']].sum()
+        sumas['cuenta'] = sumas['cuenta'].astype(str)
+        return sumas
@@ -0,0 +1,254 @@
+"""
+Motor de contabilización - Almacén de asientos indexado por entidad
+
+Sustituye a la lista plana ``st.session_state.asientos``: los asientos se
+guardan particionados por entidad y ejercicio, con contadores propios de
+numeración por entidad e identificadores globales que nunca se reutilizan.
+"""
+
+from collections import Counter
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, List, Optional, Tuple
+
+
+def ejercicio_de(fecha) -> int:
+    """Devuelve el ejercicio (año) de una fecha ISO o date"""
+    if isinstance(fecha, date):
+        return fecha.year
+    return int(str(fecha)[:4])
+
+
+def a_centimos(importe) -> int:
+    """Convierte un importe en euros a céntimos enteros (redondeo comercial)"""
+    return int((Decimal(str(importe)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def fijar_centimos(apuntes: List[dict]) -> None:
+    """Guarda en cada apunte su debe y haber en céntimos ('debe_centimos', 'haber_centimos')"""
+    for apunte in apuntes:
+        apunte['debe_centimos'] = a_centimos(apunte['debe'])
+        apunte['haber_centimos'] = a_centimos(apunte['haber'])
+
+
+class LibroAsientos:
+    """
+    Almacén de asientos contables particionado por entidad y ejercicio.
+
+    Uso:
+        libro = LibroAsientos()
+        asiento = libro.contabilizar({
+            'entidad_id': 1,
+            'fecha': '2026-02-01',
+            'concepto': 'Fra. 2026/1 - PROVEEDOR',
+            'apuntes': [...]
+        })
+        libro.asientos_entidad(1)        # O(1)
+        libro.asientos_ejercicio(1, 2026)
+
+    Los observadores registrados con ``suscribir`` reciben
+    ``asiento_contabilizado(asiento)`` y ``asiento_retirado(asiento)`` en cada
+    alta, baja o modificación (una modificación es una retirada seguida de un
+    alta), lo que permite mantener cachés derivadas de forma incremental.
+
+    Los importes de cada apunte se pasan a céntimos una sola vez, al registrar
+    el asiento: los observadores leen 'debe_centimos' y 'haber_centimos'.
+
+    Sin numerador, ids y números se asignan con contadores en memoria. Con
+    ``usar_numerador`` se piden a un numerador compartido (la persistencia, que
+    los reserva en la base de datos) para que dos sesiones no los repitan.
+    """
+
+    def __init__(self):
+        self._por_id: Dict[int, dict] = {}
+        self._por_entidad: Dict[int, Dict[int, dict]] = {}
+        self._por_ejercicio: Dict[Tuple[int, int], Dict[int, dict]] = {}
+        self._contadores: Dict[int, int] = {}
+        self._siguiente_id = 1
+        self._versiones: Dict[int, int] = {}
+        self._observadores: List = []
+        self._numerador = None
+
+    def suscribir(self, observador) -> None:
+        """Registra un observador y le notifica los asientos ya existentes"""
+        self._observadores.append(observador)
+        for asiento in self._por_id.values():
+            observador.asiento_contabilizado(asiento)
+
+    def _notificar_alta(self, asiento: dict) -> None:
+        for observador in self._observadores:
+            observador.asiento_contabilizado(asiento)
+
+    def _notificar_baja(self, asiento: dict) -> None:
+        for observador in self._observadores:
+            observador.asiento_retirado(asiento)
+
+    # -------------------------------------------------
+    # Numeración
+    # -------------------------------------------------
+
+    def usar_numerador(self, numerador) -> None:
+        """
+        Delega la asignación de ids y números en un numerador compartido.
+
+        El numerador ofrece ``reservar_ids(cantidad)`` y
+        ``reservar_numeros(entidad_id, cantidad)``, que devuelven el primero de
+        los valores reservados, y ``siguiente_numero(entidad_id)``.
+        """
+        self._numerador = numerador
+
+    def siguiente_numero(self, entidad_id: int) -> int:
+        """Devuelve el próximo número de asiento de la entidad (sin consumirlo)"""
+        if self._numerador is not None:
+            return self._numerador.siguiente_numero(entidad_id)
+        return self._contadores.get(entidad_id, 0) + 1
+
+    def _reservar_numeros(self, entidad_id: int, cantidad: int) -> int:
+        if self._numerador is not None:
+            primero = self._numerador.reservar_numeros(entidad_id, cantidad)
+        else:
+            primero = self._contadores.get(entidad_id, 0) + 1
+        self._contadores[entidad_id] = max(self._contadores.get(entidad_id, 0), primero + cantidad - 1)
+        return primero
+
+    def _reservar_ids(self, cantidad: int) -> int:
+        if self._numerador is not None:
+            primero = self._numerador.reservar_ids(cantidad)
+        else:
+            primero = self._siguiente_id
+        self._siguiente_id = max(self._siguiente_id, primero + cantidad)
+        return primero
+
+    # -------------------------------------------------
+    # Escritura
+    # -------------------------------------------------
+
+    def contabilizar(self, asiento: dict) -> dict:
+        """
+        Registra un asiento asignándole id global y número correlativo.
+
+        Args:
+            asiento: Diccionario con entidad_id, fecha, concepto y apuntes
+
+        Returns:
+            El asiento registrado (con 'id', 'numero' y 'ejercicio')
+        """
+        return self.contabilizar_lote([asiento])[0]
+
+    def contabilizar_lote(self, asientos: List[dict]) -> List[dict]:
+        """
+        Registra varios asientos seguidos (numeración correlativa en el orden dado).
+
+        Los ids y los números de cada entidad se reservan de una vez para todo el lote.
+        """
+        asientos = list(asientos)
+        if not asientos:
+            return []
+        for asiento in asientos:
+            fijar_centimos(asiento['apuntes'])
+        numeros = {entidad_id: self._reservar_numeros(entidad_id, cantidad)
+                   for entidad_id, cantidad in Counter(a['entidad_id'] for a in asientos).items()}
+        asiento_id = self._reservar_ids(len(asientos))
+        for asiento in asientos:
+            entidad_id = asiento['entidad_id']
+            asiento['id'] = asiento_id
+            asiento['numero'] = numeros[entidad_id]
+            asiento['ejercicio'] = ejercicio_de(asiento['fecha'])
+            asiento_id += 1
+            numeros[entidad_id] += 1
+            self._indexar(asiento)
+            self._notificar_alta(asiento)
+        return asientos
+
+    def cargar(self, asiento: dict) -> dict:
+        """
+        Incorpora un asiento ya persistido conservando su id y su número.
+
+        Los contadores avanzan si el asiento supera los valores actuales.
+        Los apuntes leídos del almacén ya traen sus céntimos.
+        """
+        entidad_id = asiento['entidad_id']
+        if any('debe_centimos' not in apunte for apunte in asiento['apuntes']):
+            fijar_centimos(asiento['apuntes'])
+        asiento['ejercicio'] = ejercicio_de(asiento['fecha'])
+        self._siguiente_id = max(self._siguiente_id, asiento['id'] + 1)
+        self._contadores[entidad_id] = max(self._contadores.get(entidad_id, 0), asiento['numero'])
+        self._indexar(asiento)
+        self._notificar_alta(asiento)
+        return asiento
+
+    def fijar_contadores(self, siguiente_id: int, ultimos_numeros: Dict[int, int]) -> None:
+        """Avanza los contadores (p. ej. con los máximos guardados en base de datos)"""
+        self._siguiente_id = max(self._siguiente_id, siguiente_id)
+        for entidad_id, numero in ultimos_numeros.items():
+            self._contadores[entidad_id] = max(self._contadores.get(entidad_id, 0), numero)
+
+    def eliminar(self, asiento_id: int) -> dict:
+        """Elimina un asiento. Su id y su número no se reutilizan."""
+        asiento = self._por_id[asiento_id]
+        self._desindexar(asiento)
+        self._notificar_baja(asiento)
+        return asiento
+
+    def modificar(self, asiento_id: int, cambios: dict) -> dict:
+        """
+        Modifica un asiento conservando su id y su número.
+
+        Los campos 'id', 'numero' y 'entidad_id' no se pueden cambiar.
+        """
+        asiento = self._por_id[asiento_id]
+        for campo in ('id', 'numero', 'entidad_id'):
+            if campo in cambios and cambios[campo] != asiento[campo]:
+                raise ValueError(f"No se puede modificar el campo '{campo}' de un asiento")
+        self._desindexar(asiento)
+        self._notificar_baja(asiento)
+        asiento.update(cambios)
+        fijar_centimos(asiento['apuntes'])
+        asiento['ejercicio'] = ejercicio_de(asiento['fecha'])
+        self._indexar(asiento)
+        self._notificar_alta(asiento)
+        return asiento
+
+    def _indexar(self, asiento: dict) -> None:
+        clave = (asiento['entidad_id'], asiento['ejercicio'])
+        self._cambiar_version(asiento['entidad_id'])
+        self._por_id[asiento['id']] = asiento
+        self._por_entidad.setdefault(asiento['entidad_id'], {})[asiento['id']] = asiento
+        self._por_ejercicio.setdefault(clave, {})[asiento['id']] = asiento
+
+    def _desindexar(self, asiento: dict) -> None:
+        clave = (asiento['entidad_id'], asiento['ejercicio'])
+        self._cambiar_version(asiento['entidad_id'])
+        del self._por_id[asiento['id']]
+        del self._por_entidad[asiento['entidad_id']][asiento['id']]
+        del self._por_ejercicio[clave][asiento['id']]
+
+    def _cambiar_version(self, entidad_id: int) -> None:
+        self._versiones[entidad_id] = self._versiones.get(entidad_id, 0) + 1
+
+    # -------------------------------------------------
+    # Lectura
+    # -------------------------------------------------
+
+    def version(self, entidad_id: int) -> int:
+        """Contador que cambia con cada alta, baja o modificación de la entidad"""
+        return self._versiones.get(entidad_id, 0)
+
+    def obtener(self, asiento_id: int) -> Optional[dict]:
+        """Devuelve un asiento por su id global"""
+        return self._por_id.get(asiento_id)
+
+    def asientos_entidad(self, entidad_id: int) -> List[dict]:
+        """Asientos de la entidad, en orden de contabilización"""
+        return list(self._por_entidad.get(entidad_id, {}).values())
+
+    def asientos_ejercicio(self, entidad_id: int, ejercicio: int) -> List[dict]:
+        """Asientos de la entidad en un ejercicio, en orden de contabilización"""
+        return list(self._por_ejercicio.get((entidad_id, ejercicio), {}).values())
+
+    def num_asientos(self, entidad_id: int) -> int:
+        """Número de asientos vivos de la entidad"""
+        return len(self._por_entidad.get(entidad_id, {}))
+
+    def __len__(self) -> int:
+        return len(self._por_id)
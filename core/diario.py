@@ -0,0 +1,147 @@
+"""
+Índice del Libro Diario por fecha
+
+Mantiene, por entidad, los asientos ordenados por (fecha, número) para poder
+filtrar un rango de fechas por búsqueda binaria y servir el Diario página a
+página. Los totales de un rango salen de sumas acumuladas, que solo se
+recalculan cuando el libro cambia, no en cada rerun.
+"""
+
+from bisect import bisect_left, bisect_right, insort
+from datetime import date
+from itertools import accumulate
+from typing import Dict, List, Optional, Tuple
+
+from core.columnar import ordinal_de
+from core.plan_cuentas import PlanCuentas
+
+
+class IndiceDiario:
+    """
+    Asientos de cada entidad ordenados por fecha, con sumas acumuladas.
+
+    Uso:
+        diario = IndiceDiario()
+        libro.suscribir(diario)
+
+        n = diario.num_asientos_rango(1, desde, hasta)
+        asientos = diario.pagina(1, desde, hasta, pagina=0, tamano=100)
+        debe, haber = diario.totales_rango(1, desde, hasta)   # céntimos
+    """
+
+    def __init__(self):
+        # entidad -> lista ordenada de (ordinal, numero, asiento_id)
+        self._claves: Dict[int, List[Tuple[int, int, int]]] = {}
+        self._asientos: Dict[int, dict] = {}
+        self._totales_asiento: Dict[int, Tuple[int, int]] = {}
+        # entidad -> (debe acumulado, haber acumulado); None si hay cambios
+        self._acumulados: Dict[int, Optional[Tuple[List[int], List[int]]]] = {}
+
+    # -------------------------------------------------
+    # Observador del LibroAsientos
+    # -------------------------------------------------
+
+    def asiento_contabilizado(self, asiento: dict) -> None:
+        entidad_id = asiento['entidad_id']
+        clave = (ordinal_de(asiento['fecha']), asiento['numero'], asiento['id'])
+        insort(self._claves.setdefault(entidad_id, []), clave)
+        self._asientos[asiento['id']] = asiento
+        self._totales_asiento[asiento['id']] = (
+            sum(a['debe_centimos'] for a in asiento['apuntes']),
+            sum(a['haber_centimos'] for a in asiento['apuntes']),
+        )
+        self._acumulados[entidad_id] = None
+
+    def asiento_retirado(self, asiento: dict) -> None:
+        entidad_id = asiento['entidad_id']
+        clave = (ordinal_de(asiento['fecha']), asiento['numero'], asiento['id'])
+        claves = self._claves[entidad_id]
+        posicion = bisect_left(claves, clave)
+        if posicion < len(claves) and claves[posicion] == clave:
+            del claves[posicion]
+        del self._asientos[asiento['id']]
+        del self._totales_asiento[asiento['id']]
+        self._acumulados[entidad_id] = None
+
+    # -------------------------------------------------
+    # Consultas
+    # -------------------------------------------------
+
+    def _rango(self, entidad_id: int, desde: Optional[date],
+               hasta: Optional[date]) -> Tuple[int, int]:
+        claves = self._claves.get(entidad_id, [])
+        inicio = 0 if desde is None else bisect_left(claves, (desde.toordinal(),))
+        fin = len(claves) if hasta is None else bisect_right(claves, (hasta.toordinal() + 1,))
+        return inicio, max(inicio, fin)
+
+    def _sumas_acumuladas(self, entidad_id: int) -> Tuple[List[int], List[int]]:
+        acumulados = self._acumulados.get(entidad_id)
+        if acumulados is None:
+            claves = self._claves.get(entidad_id, [])
+            totales = [self._totales_asiento[clave[2]] for clave in claves]
+            acumulados = (
+                list(accumulate((t[0] for t in totales), initial=0)),
+                list(accumulate((t[1] for t in totales), initial=0)),
+            )
+            self._acumulados[entidad_id] = acumulados
+        return acumulados
+
+    def num_asientos_rango(self, entidad_id: int, desde: Optional[date] = None,
+                           hasta: Optional[date] = None) -> int:
+        """Número de asientos con fecha en [desde, hasta]"""
+        inicio, fin = self._rango(entidad_id, desde, hasta)
+        return fin - inicio
+
+    def pagina(self, entidad_id: int, desde: Optional[date], hasta: Optional[date],
+               pagina: int = 0, tamano: int = 100) -> List[dict]:
+        """
+        Asientos de una página del rango, en orden de fecha y número.
+
+        Args:
+            entidad_id: Entidad
+            desde: Fecha inicial incluida (None = sin límite)
+            hasta: Fecha final incluida (None = sin límite)
+            pagina: Número de página empezando en 0
+            tamano: Asientos por página
+        """
+        inicio, fin = self._rango(entidad_id, desde, hasta)
+        primero = inicio + pagina * tamano
+        claves = self._claves.get(entidad_id, [])[primero:min(fin, primero + tamano)]
+        return [self._asientos[clave[2]] for clave in claves]
+
+    def cuadrado(self, asiento_id: int) -> bool:
+        """Indica si el debe y el haber del asiento coinciden"""
+        debe, haber = self._totales_asiento[asiento_id]
+        return debe == haber
+
+    def totales_rango(self, entidad_id: int, desde: Optional[date] = None,
+                      hasta: Optional[date] = None) -> Tuple[int, int]:
+        """Total debe y haber (céntimos) de los asientos del rango"""
+        inicio, fin = self._rango(entidad_id, desde, hasta)
+        debe, haber = self._sumas_acumuladas(entidad_id)
+        return debe[fin] - debe[inicio], haber[fin] - haber[inicio]
+
+
+def filas_diario(asientos: List[dict], plan: PlanCuentas) -> List[dict]:
+    """
+    Aplana los asientos en una fila por apunte para una única tabla.
+
+    Returns:
+        Lista de filas con Asiento, Fecha, Concepto, Cuenta, Descripción,
+        Debe y Haber
+    """
+    filas = []
+    for asiento in asientos:
+        primera = True
+        for apunte in asiento['apuntes']:
+            filas.append({
+                'Asiento': str(asiento['numero']) if primera else '',
+                'Fecha': asiento['fecha'] if primera else '',
+                'Concepto': asiento['concepto'] if primera else '',
+                'Cuenta': apunte['cuenta'],
+                'Descripción': plan.descripcion(apunte['cuenta']),
+                'Debe': f"{apunte['debe']:.2f}" if apunte['debe'] else '',
+                'Haber': f"{apunte['haber']:.2f}" if apunte['haber'] else '',
+            })
+            primera = False
+    return filas
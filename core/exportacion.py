@@ -0,0 +1,355 @@
+"""
+Exportación por trozos de los libros (Diario, Mayor, balance y recibos)
+
+Cada libro se describe como una ``Tabla``: columnas con su tipo y un
+generador de trozos en columnas (``{columna: valores}``) de unos miles de
+filas. Los escritores consumen los trozos de uno en uno, así que exportar un
+libro de un millón de apuntes no construye un DataFrame ni un libro de Excel
+completos en memoria:
+
+- CSV: separador ';' y coma decimal (como lo abre Excel en español), UTF-8
+  con BOM.
+- XLSX: openpyxl en modo write-only (las filas van a un temporal según se
+  escriben); si se pasa del máximo de filas de Excel se continúa en otra hoja.
+- Parquet: pyarrow, un row group por trozo; los importes como decimal(19,2)
+  exactos a partir de los céntimos.
+
+openpyxl y pyarrow se importan al exportar: sin ellos solo falta ese formato.
+
+Uso:
+    tabla = tabla_mayor(apuntes, libro, entidad_id, plan, cuentas=['572'])
+    exportar(tabla, 'parquet', fichero)
+"""
+
+import csv
+import io
+from dataclasses import dataclass
+from datetime import date
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.columnar import EPOCA_ORDINAL, ApuntesColumnares, codigo_cuenta
+from core.contabilizador import LibroAsientos
+from core.diario import IndiceDiario
+from core.plan_cuentas import PlanCuentas
+from core.sumas_saldos import NIVEL_AUXILIAR, BalanceSumasSaldos
+
+
+# Filas por trozo
+TAMANO_TROZO = 20_000
+
+# Máximo de filas de datos por hoja de Excel (1.048.576 menos la cabecera)
+MAX_FILAS_HOJA = 1_048_575
+
+# Tipos de columna
+TEXTO = 'texto'
+FECHA = 'fecha'            # ISO 'AAAA-MM-DD'
+ENTERO = 'entero'
+IMPORTE = 'importe'        # céntimos enteros
+
+# Formato -> (extensión, tipo MIME)
+FORMATOS = {
+    'csv': ('csv', 'text/csv'),
+    'xlsx': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+
+Trozo = Dict[str, Sequence]
+
+
+@dataclass
+class Tabla:
+    """Libro a exportar: columnas (nombre, tipo) y generador de trozos"""
+    nombre: str
+    columnas: List[Tuple[str, str]]
+    trozos: Callable[[], Iterator[Trozo]]
+
+
+def _centimos(importe: float) -> int:
+    """Céntimos de un importe del libro (los apuntes ya vienen redondeados a 2 decimales)"""
+    return round(importe * 100)
+
+
+def _descripciones(plan: PlanCuentas) -> Callable[[str], str]:
+    """plan.descripcion memorizada: hay muchas más filas que cuentas"""
+    cache: Dict[str, str] = {}
+
+    def descripcion(cuenta: str) -> str:
+        if cuenta not in cache:
+            cache[cuenta] = plan.descripcion(cuenta)
+        return cache[cuenta]
+    return descripcion
+
+
+# -------------------------------------------------
+# Libros
+# -------------------------------------------------
+
+COLUMNAS_DIARIO = [
+    ('Asiento', ENTERO), ('Fecha', FECHA), ('Concepto', TEXTO), ('Referencia', TEXTO),
+    ('Cuenta', TEXTO), ('Descripción', TEXTO), ('Tercero', TEXTO),
+    ('Debe', IMPORTE), ('Haber', IMPORTE),
+]
+
+
+def tabla_diario(diario: IndiceDiario, entidad_id: int, plan: PlanCuentas,
+                 terceros_por_id: Dict[int, dict], desde: Optional[date] = None,
+                 hasta: Optional[date] = None, tamano: int = TAMANO_TROZO) -> Tabla:
+    """Libro Diario del rango, una fila por apunte en orden de fecha y número"""
+    descripcion = _descripciones(plan)
+
+    def trozos() -> Iterator[Trozo]:
+        asientos_por_pagina = max(tamano // 4, 1)       # ~4 apuntes por asiento
+        num_paginas = -(-diario.num_asientos_rango(entidad_id, desde, hasta) // asientos_por_pagina)
+        for pagina in range(num_paginas):
+            trozo: Dict[str, list] = {nombre: [] for nombre, _tipo in COLUMNAS_DIARIO}
+            for asiento in diario.pagina(entidad_id, desde, hasta, pagina, asientos_por_pagina):
+                for apunte in asiento['apuntes']:
+                    tercero = terceros_por_id.get(apunte.get('tercero_id'))
+                    trozo['Asiento'].append(asiento['numero'])
+                    trozo['Fecha'].append(asiento['fecha'])
+                    trozo['Concepto'].append(asiento['concepto'])
+                    trozo['Referencia'].append(asiento.get('referencia') or '')
+                    trozo['Cuenta'].append(apunte['cuenta'])
+                    trozo['Descripción'].append(descripcion(apunte['cuenta']))
+                    trozo['Tercero'].append(tercero['nombre'] if tercero else '')
+                    trozo['Debe'].append(_centimos(apunte['debe']))
+                    trozo['Haber'].append(_centimos(apunte['haber']))
+            yield trozo
+
+    return Tabla('libro_diario', COLUMNAS_DIARIO, trozos)
+
+
+COLUMNAS_MAYOR = [
+    ('Cuenta', TEXTO), ('Descripción', TEXTO), ('Fecha', FECHA), ('Asiento', ENTERO),
+    ('Concepto', TEXTO), ('Debe', IMPORTE), ('Haber', IMPORTE), ('Saldo', IMPORTE),
+]
+
+
+def tabla_mayor(apuntes: ApuntesColumnares, libro: LibroAsientos, entidad_id: int,
+                plan: PlanCuentas, cuentas: Optional[Sequence[str]] = None,
+                tamano: int = TAMANO_TROZO) -> Tabla:
+    """
+    Libro Mayor de las cuentas indicadas (todas si ``cuentas`` es None).
+
+    El orden (cuenta, fecha, asiento) y el saldo acumulado de cada cuenta se
+    calculan de una vez sobre las columnas; las filas se forman por trozos.
+    """
+    descripcion = _descripciones(plan)
+
+    def trozos() -> Iterator[Trozo]:
+        cols = apuntes.columnas(entidad_id)
+        filas = np.arange(len(cols['cuenta']))
+        if cuentas is not None:
+            filas = filas[np.isin(cols['cuenta'], [codigo_cuenta(c) for c in cuentas])]
+        cuenta = cols['cuenta'][filas]
+        orden = filas[np.lexsort((cols['asiento'][filas], cols['fecha'][filas], cuenta))]
+        cuenta = cols['cuenta'][orden]
+        debe, haber = cols['debe'][orden], cols['haber'][orden]
+
+        # Saldo acumulado que vuelve a cero al cambiar de cuenta
+        neto = debe - haber
+        acumulado = np.cumsum(neto)
+        inicio_cuenta = _inicio_de_grupo(cuenta)
+        saldo = acumulado - (acumulado[inicio_cuenta] - neto[inicio_cuenta])
+        fechas = (cols['fecha'][orden].astype(np.int64) - EPOCA_ORDINAL).astype('datetime64[D]')
+
+        for inicio in range(0, len(orden), tamano):
+            tramo = slice(inicio, inicio + tamano)
+            asientos = [libro.obtener(int(i)) for i in cols['asiento'][orden[tramo]]]
+            codigos = [str(c) for c in cuenta[tramo].tolist()]
+            yield {
+                'Cuenta': codigos,
+                'Descripción': [descripcion(c) for c in codigos],
+                'Fecha': np.datetime_as_string(fechas[tramo]).tolist(),
+                'Asiento': [a['numero'] for a in asientos],
+                'Concepto': [a['concepto'] for a in asientos],
+                'Debe': debe[tramo],
+                'Haber': haber[tramo],
+                'Saldo': saldo[tramo],
+            }
+
+    nombre = f"libro_mayor_{'_'.join(cuentas)}" if cuentas and len(cuentas) == 1 else 'libro_mayor'
+    return Tabla(nombre, COLUMNAS_MAYOR, trozos)
+
+
+def _inicio_de_grupo(claves: np.ndarray) -> np.ndarray:
+    """Para cada fila de un array ordenado, la posición donde empieza su grupo"""
+    n = len(claves)
+    if not n:
+        return np.zeros(0, dtype=np.int64)
+    cambios = np.r_[True, claves[1:] != claves[:-1]]
+    return np.maximum.accumulate(np.where(cambios, np.arange(n), 0))
+
+
+COLUMNAS_BALANCE = [
+    ('Cuenta', TEXTO), ('Nivel', ENTERO), ('Descripción', TEXTO), ('Apuntes', ENTERO),
+    ('Debe', IMPORTE), ('Haber', IMPORTE), ('Saldo deudor', IMPORTE), ('Saldo acreedor', IMPORTE),
+]
+
+
+def tabla_balance(sumas_saldos: BalanceSumasSaldos, entidad_id: int, ejercicio: int,
+                  plan: PlanCuentas, nivel_maximo: int = NIVEL_AUXILIAR) -> Tabla:
+    """Balance de sumas y saldos del ejercicio (un único trozo: una fila por cuenta)"""
+    def trozos() -> Iterator[Trozo]:
+        filas = sumas_saldos.filas(entidad_id, ejercicio, nivel_maximo)
+        yield {
+            'Cuenta': [f.codigo for f in filas],
+            'Nivel': [f.nivel for f in filas],
+            'Descripción': [plan.descripcion(f.codigo) for f in filas],
+            'Apuntes': [f.apuntes for f in filas],
+            'Debe': [f.debe for f in filas],
+            'Haber': [f.haber for f in filas],
+            'Saldo deudor': [max(f.saldo, 0) for f in filas],
+            'Saldo acreedor': [max(-f.saldo, 0) for f in filas],
+        }
+
+    return Tabla(f"balance_sumas_saldos_{ejercicio}", COLUMNAS_BALANCE, trozos)
+
+
+COLUMNAS_RECIBOS = [
+    ('Número', TEXTO), ('Deudor', TEXTO), ('NIF', TEXTO), ('IBAN', TEXTO), ('Concepto', TEXTO),
+    ('Importe', IMPORTE), ('Emisión', FECHA), ('Vencimiento', FECHA), ('Estado', TEXTO),
+    ('Método', TEXTO),
+]
+
+
+def tabla_recibos(recibos: Sequence[dict], tamano: int = TAMANO_TROZO) -> Tabla:
+    """Recibos (de una entidad, ya filtrados) en el orden recibido"""
+    def trozos() -> Iterator[Trozo]:
+        for inicio in range(0, len(recibos), tamano):
+            lote = recibos[inicio:inicio + tamano]
+            yield {
+                'Número': [r['numero'] for r in lote],
+                'Deudor': [r['tercero']['nombre'] for r in lote],
+                'NIF': [r['tercero']['nif'] for r in lote],
+                'IBAN': [r['tercero'].get('iban') or '' for r in lote],
+                'Concepto': [r['concepto'] for r in lote],
+                'Importe': [_centimos(r['importe']) for r in lote],
+                'Emisión': [r['fecha_emision'] for r in lote],
+                'Vencimiento': [r['fecha_vencimiento'] for r in lote],
+                'Estado': [r['estado'] for r in lote],
+                'Método': [r['metodo'] for r in lote],
+            }
+
+    return Tabla('recibos', COLUMNAS_RECIBOS, trozos)
+
+
+# -------------------------------------------------
+# Escritores
+# -------------------------------------------------
+
+def _importe_texto(centimos: int) -> str:
+    """1234567 -> '12345,67' (exacto, sin pasar por float)"""
+    signo = '-' if centimos < 0 else ''
+    enteros, resto = divmod(abs(int(centimos)), 100)
+    return f"{signo}{enteros},{resto:02d}"
+
+
+def _filas(tabla: Tabla, trozo: Trozo) -> Iterator[tuple]:
+    return zip(*(trozo[nombre] for nombre, _tipo in tabla.columnas))
+
+
+def escribir_csv(tabla: Tabla, destino: BinaryIO) -> int:
+    """CSV con ';' y coma decimal. Devuelve las filas escritas."""
+    texto = io.TextIOWrapper(destino, encoding='utf-8-sig', newline='', write_through=True)
+    escritor = csv.writer(texto, delimiter=';')
+    escritor.writerow([nombre for nombre, _tipo in tabla.columnas])
+    importes = [i for i, (_nombre, tipo) in enumerate(tabla.columnas) if tipo == IMPORTE]
+    filas = 0
+    for trozo in tabla.trozos():
+        lineas = [list(fila) for fila in _filas(tabla, trozo)]
+        for linea in lineas:
+            for i in importes:
+                linea[i] = _importe_texto(linea[i])
+        escritor.writerows(lineas)
+        filas += len(lineas)
+    texto.detach()          # el destino sigue abierto para quien lo pasó
+    return filas
+
+
+def escribir_xlsx(tabla: Tabla, destino: BinaryIO) -> int:
+    """XLSX en modo write-only; una hoja nueva cada MAX_FILAS_HOJA filas"""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    libro = Workbook(write_only=True)
+    tipos = [tipo for _nombre, tipo in tabla.columnas]
+    hoja = None
+    filas_hoja = filas = 0
+
+    def nueva_hoja():
+        numero = len(libro.worksheets) + 1
+        ws = libro.create_sheet(tabla.nombre[:28] if numero == 1 else f"{tabla.nombre[:24]} ({numero})")
+        cabecera = []
+        for nombre, _tipo in tabla.columnas:
+            celda = WriteOnlyCell(ws, value=nombre)
+            celda.font = Font(bold=True)
+            cabecera.append(celda)
+        ws.append(cabecera)
+        return ws
+
+    for trozo in tabla.trozos():
+        for fila in _filas(tabla, trozo):
+            if hoja is None or filas_hoja == MAX_FILAS_HOJA:
+                hoja, filas_hoja = nueva_hoja(), 0
+            valores = []
+            for valor, tipo in zip(fila, tipos):
+                if tipo == IMPORTE:
+                    celda = WriteOnlyCell(hoja, value=int(valor) / 100)
+                    celda.number_format = '#,##0.00'
+                    valores.append(celda)
+                elif tipo == FECHA:
+                    valores.append(date.fromisoformat(valor) if valor else None)
+                else:
+                    valores.append(valor)
+            hoja.append(valores)
+            filas_hoja += 1
+            filas += 1
+    if hoja is None:
+        nueva_hoja()
+    libro.save(destino)
+    return filas
+
+
+def escribir_parquet(tabla: Tabla, destino: BinaryIO) -> int:
+    """Parquet con un row group por trozo; importes decimal(19,2) exactos"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    tipos_arrow = {TEXTO: pa.string(), FECHA: pa.date32(), ENTERO: pa.int64(),
+                   IMPORTE: pa.decimal128(19, 2)}
+    esquema = pa.schema([(nombre, tipos_arrow[tipo]) for nombre, tipo in tabla.columnas])
+
+    def columna(valores: Sequence, tipo: str):
+        if tipo == IMPORTE:
+            # Los céntimos son el entero sin escala del decimal: basta reinterpretarlo
+            return pa.array(valores, pa.int64()).cast(pa.decimal128(19, 0)).view(pa.decimal128(19, 2))
+        if tipo == FECHA:
+            return pa.array(valores, pa.string()).cast(pa.date32())
+        return pa.array(valores, tipos_arrow[tipo])
+
+    filas = 0
+    with pq.ParquetWriter(destino, esquema, compression='zstd') as escritor:
+        for trozo in tabla.trozos():
+            lote = pa.table([columna(trozo[nombre], tipo) for nombre, tipo in tabla.columnas],
+                            schema=esquema)
+            escritor.write_table(lote)
+            filas += lote.num_rows
+    return filas
+
+
+ESCRITORES = {
+    'csv': escribir_csv,
+    'xlsx': escribir_xlsx,
+    'parquet': escribir_parquet,
+}
+
+
+def exportar(tabla: Tabla, formato: str, destino: BinaryIO) -> int:
+    """Escribe la tabla en el formato pedido. Devuelve las filas escritas."""
+    if formato not in ESCRITORES:
+        raise ValueError(f"Formato de exportación desconocido: {formato}")
+    return ESCRITORES[formato](tabla, destino)
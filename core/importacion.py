@@ -0,0 +1,376 @@
+"""
+Importación de diarios históricos (exportaciones CSV/XLSX de otros programas)
+
+Al dar de alta un cliente se traen sus ejercicios anteriores desde el
+programa que usaba. Se reconocen las exportaciones del diario con diseño
+ContaPlus (ASIEN, FECHA, SUBCTA, EURODEBE, EUROHABER...) y A3 (Asiento,
+Fecha, Cuenta, Debe/Haber o Importe con D/H), por las cabeceras.
+
+La validación se hace por columnas, sobre todo el fichero a la vez:
+
+- Importes y fechas se convierten de texto en una pasada por formato.
+- Cada código de cuenta distinto se resuelve una sola vez contra el plan de
+  la entidad: debe existir o colgar de una cuenta del plan (43000001 -> 430),
+  y caber en el almacén columnar (las subcuentas de 10 dígitos como
+  4300000001 se rechazan).
+- El separador decimal se decide una vez para todos los importes: si alguno
+  lleva coma, el punto es separador de miles en todos (1.000 = mil euros).
+- Las fechas deben caer en el ejercicio que se importa.
+- Cuadre: suma de debe menos haber agrupada por asiento; un asiento con
+  apuntes de fechas distintas tampoco se admite.
+
+Un asiento con cualquier error se omite entero, y cada línea afectada queda en
+el informe con su número de fila del fichero. Los asientos válidos se ordenan
+por fecha y se contabilizan de una vez (numeración correlativa a
+continuación de la del libro). Cada uno lleva la referencia
+``HIST/<ejercicio>/<asiento de origen>``: reimportar el mismo fichero no
+duplica asientos.
+
+Uso:
+    importacion = analizar_diario(contenido, 'diario_2023.csv', entidad_id, plan, 2023, referencias)
+    importacion.errores          # DataFrame: Fila, Asiento, Cuenta, Error
+    libro.contabilizar_lote(importacion.asientos)
+"""
+
+import csv
+import io
+import time
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from core.columnar import CODIGO_CUENTA_MAXIMO
+from core.plan_cuentas import PlanCuentas
+from core.referencias import IndiceReferencias
+
+
+@dataclass(frozen=True)
+class DisenoDiario:
+    """Diseño de exportación: cabeceras aceptadas (normalizadas) para cada campo"""
+    nombre: str
+    columnas: Dict[str, Tuple[str, ...]]
+
+
+# Campos: asiento, fecha, cuenta, concepto, documento y debe/haber (o importe + signo D/H)
+DISENOS = (
+    DisenoDiario('ContaPlus', {
+        'asiento': ('asien',),
+        'fecha': ('fecha',),
+        'cuenta': ('subcta',),
+        'concepto': ('concepto',),
+        'documento': ('documento',),
+        'debe': ('eurodebe',),
+        'haber': ('eurohaber',),
+    }),
+    DisenoDiario('A3', {
+        'asiento': ('asiento', 'noasiento', 'nasiento', 'numasiento', 'numeroasiento'),
+        'fecha': ('fecha', 'fechaasiento'),
+        'cuenta': ('cuenta', 'subcuenta', 'codigocuenta'),
+        'concepto': ('concepto', 'descripcionapunte'),
+        'documento': ('documento', 'factura', 'nfactura', 'nofactura'),
+        'debe': ('debe', 'importedebe'),
+        'haber': ('haber', 'importehaber'),
+        'importe': ('importe',),
+        'signo': ('dh', 'debehaber', 'signo'),
+    }),
+)
+
+CAMPOS_OBLIGATORIOS = ('asiento', 'fecha', 'cuenta')
+
+FORMATOS_FECHA = ('%d/%m/%Y', '%Y-%m-%d', '%Y%m%d', '%d-%m-%Y', '%d.%m.%Y', '%d/%m/%y',
+                  '%Y-%m-%d %H:%M:%S')
+
+PREFIJO_REFERENCIA = 'HIST'
+
+# Fila del fichero del primer dato (la 1 es la cabecera)
+PRIMERA_FILA = 2
+
+
+class ErrorDiario(ValueError):
+    """Fichero de diario que no se puede leer o cuyo diseño no se reconoce"""
+
+
+@dataclass
+class ImportacionDiario:
+    """Resultado del análisis: asientos listos para contabilizar e informe de errores"""
+    diseno: str = ''
+    ejercicio: int = 0
+    filas: int = 0
+    apuntes_vacios: int = 0         # líneas sin importe, que se descartan
+    asientos: List[dict] = field(default_factory=list)
+    asientos_con_errores: int = 0
+    ya_importados: int = 0
+    debe: int = 0                   # céntimos de los asientos válidos
+    haber: int = 0
+    errores: pd.DataFrame = field(default_factory=lambda: pd.DataFrame(
+        columns=['Fila', 'Asiento', 'Cuenta', 'Error']))
+    segundos: float = 0.0
+
+
+def referencia_historica(ejercicio: int, asiento_origen: str) -> str:
+    return f"{PREFIJO_REFERENCIA}/{ejercicio}/{asiento_origen}"[:60]
+
+
+# -------------------------------------------------
+# Lectura
+# -------------------------------------------------
+
+def _cabecera(texto: str) -> str:
+    """'Nº Asiento' -> 'noasiento', 'Descripción' -> 'descripcion'"""
+    texto = unicodedata.normalize('NFKD', str(texto)).lower()
+    return ''.join(c for c in texto if c.isalnum())
+
+
+def leer_diario(contenido: bytes, nombre_fichero: str) -> pd.DataFrame:
+    """Fichero CSV/TXT o XLSX a un DataFrame con todas las columnas como texto"""
+    try:
+        if nombre_fichero.lower().endswith(('.xlsx', '.xlsm')):
+            return pd.read_excel(io.BytesIO(contenido), dtype=str).fillna('')
+        try:
+            texto = contenido.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            texto = contenido.decode('cp1252')     # ContaPlus y A3 exportan en ANSI
+        primera_linea = texto[:texto.find('\n')] if '\n' in texto else texto
+        try:
+            separador = csv.Sniffer().sniff(primera_linea, delimiters=';,\t|').delimiter
+        except csv.Error:
+            separador = ';'
+        return pd.read_csv(io.StringIO(texto), sep=separador, dtype=str,
+                           keep_default_na=False, skipinitialspace=True)
+    except ErrorDiario:
+        raise
+    except Exception as e:
+        raise ErrorDiario(f"No se puede leer {nombre_fichero}: {e}") from e
+
+
+def reconocer_diseno(cabeceras) -> Tuple[DisenoDiario, Dict[str, str]]:
+    """Diseño cuyas cabeceras obligatorias aparecen, y columna del fichero de cada campo"""
+    normalizadas = {_cabecera(c): c for c in cabeceras}
+    for diseno in DISENOS:
+        columnas = {}
+        for campo, alias in diseno.columnas.items():
+            encontrada = next((normalizadas[a] for a in alias if a in normalizadas), None)
+            if encontrada is not None:
+                columnas[campo] = encontrada
+        importes = ({'debe', 'haber'} <= columnas.keys() or {'importe', 'signo'} <= columnas.keys())
+        if all(c in columnas for c in CAMPOS_OBLIGATORIOS) and importes:
+            return diseno, columnas
+    raise ErrorDiario("No se reconoce el diseño del diario (se esperan columnas de asiento, "
+                      "fecha, cuenta y debe/haber como en las exportaciones de ContaPlus o A3)")
+
+
+# -------------------------------------------------
+# Conversión por columnas
+# -------------------------------------------------
+
+def _texto(df: pd.DataFrame, columnas: Dict[str, str], campo: str) -> pd.Series:
+    if campo not in columnas:
+        return pd.Series('', index=df.index, dtype=object)
+    return df[columnas[campo]].astype(str).str.strip()
+
+
+def _codigos(serie: pd.Series) -> pd.Series:
+    """Números leídos de Excel como texto: '43000001.0' -> '43000001'"""
+    return serie.str.replace(r'\.0+$', '', regex=True)
+
+
+def _limpiar_importes(serie: pd.Series) -> pd.Series:
+    return serie.str.replace(r'[\s€]', '', regex=True)
+
+
+def _decimal_con_coma(*series: pd.Series) -> bool:
+    """Si los importes usan coma decimal (basta con que un importe la lleve)"""
+    return any(s.str.contains(',', regex=False).any() for s in series)
+
+
+def _centimos(texto: pd.Series, decimal_coma: bool) -> pd.Series:
+    """
+    Importes ya limpios a céntimos (float, NaN si no es un número); vacío = 0.
+
+    Con coma decimal el punto es separador de miles en todos los importes, así
+    que '1.000' es mil euros aunque no lleve ',00'.
+    """
+    if decimal_coma:
+        texto = texto.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+    texto = texto.where(texto != '', '0')
+    try:
+        valores = texto.astype('float64')
+    except ValueError:                      # algún importe no numérico: quedará NaN
+        valores = pd.to_numeric(texto, errors='coerce')
+    return (valores * 100).round()
+
+
+def _fechas(serie: pd.Series) -> pd.Series:
+    """Fechas de texto probando cada formato sobre las que aún no se han leído"""
+    fechas = pd.Series(pd.NaT, index=serie.index, dtype='datetime64[ns]')
+    for formato in FORMATOS_FECHA:
+        pendientes = fechas.isna() & (serie != '')
+        if not pendientes.any():
+            break
+        fechas[pendientes] = pd.to_datetime(serie[pendientes], format=formato, errors='coerce')
+    return fechas
+
+
+def _cuentas_validas(cuentas: pd.Series, plan: PlanCuentas
+                     ) -> Tuple[pd.Series, pd.Series, pd.Series]:
+    """
+    (válida, demasiado larga, tercero_id) de cada línea, resolviendo cada
+    código distinto una vez. Los códigos que no caben en la columna int32 del
+    almacén columnar no son válidos aunque cuelguen de una cuenta del plan.
+    """
+    posiciones, codigos = pd.factorize(cuentas)
+    validas = np.zeros(len(codigos), dtype=bool)
+    largas = np.zeros(len(codigos), dtype=bool)
+    terceros = np.full(len(codigos), np.nan)
+    for i, codigo in enumerate(codigos):
+        if not codigo.isdigit():
+            continue
+        if int(codigo) > CODIGO_CUENTA_MAXIMO:
+            largas[i] = True
+            continue
+        cuenta = plan.resolver(codigo)
+        if cuenta is not None and cuenta.codigo in plan:
+            validas[i] = True
+            if cuenta.tercero_id is not None:
+                terceros[i] = cuenta.tercero_id
+    return (pd.Series(validas[posiciones], index=cuentas.index),
+            pd.Series(largas[posiciones], index=cuentas.index),
+            pd.Series(terceros[posiciones], index=cuentas.index))
+
+
+# -------------------------------------------------
+# Análisis
+# -------------------------------------------------
+
+def analizar_diario(contenido: bytes, nombre_fichero: str, entidad_id: int, plan: PlanCuentas,
+                    ejercicio: int, referencias: Optional[IndiceReferencias] = None
+                    ) -> ImportacionDiario:
+    """
+    Lee y valida un diario exportado de otro programa.
+
+    Args:
+        contenido: Bytes del fichero CSV/TXT o XLSX
+        nombre_fichero: Nombre original (la extensión decide cómo se lee)
+        entidad_id: Entidad a la que se importa
+        plan: Plan de cuentas de la entidad
+        ejercicio: Año que se importa; las fechas de otro año son error
+        referencias: Índice de referencias del libro, para no duplicar
+            asientos de una importación anterior
+
+    Returns:
+        ImportacionDiario con los asientos válidos (ordenados por fecha, sin
+        numerar) y una fila de informe por cada línea con error
+    """
+    inicio = time.perf_counter()
+    df = leer_diario(contenido, nombre_fichero)
+    diseno, columnas = reconocer_diseno(df.columns)
+    importacion = ImportacionDiario(diseno=diseno.nombre, ejercicio=ejercicio, filas=len(df))
+
+    asiento = _codigos(_texto(df, columnas, 'asiento'))
+    cuenta = _codigos(_texto(df, columnas, 'cuenta'))
+    texto_fecha = _texto(df, columnas, 'fecha')
+    fecha = _fechas(texto_fecha)
+    if 'debe' in columnas:
+        texto_debe = _limpiar_importes(_texto(df, columnas, 'debe'))
+        texto_haber = _limpiar_importes(_texto(df, columnas, 'haber'))
+        decimal_coma = _decimal_con_coma(texto_debe, texto_haber)
+        debe, haber = _centimos(texto_debe, decimal_coma), _centimos(texto_haber, decimal_coma)
+    else:
+        texto_importe = _limpiar_importes(_texto(df, columnas, 'importe'))
+        importe = _centimos(texto_importe, _decimal_con_coma(texto_importe))
+        al_haber = _texto(df, columnas, 'signo').str.upper().str.startswith('H')
+        debe, haber = importe.where(~al_haber, 0.0), importe.where(al_haber, 0.0)
+
+    # Líneas sin importe (frecuentes en las exportaciones): se descartan sin más
+    vacias = (debe == 0) & (haber == 0)
+    importacion.apuntes_vacios = int(vacias.sum())
+
+    # Errores por línea: cada comprobación añade su texto a las líneas que la incumplen
+    errores = pd.Series('', index=df.index, dtype=object)
+
+    def anotar(mascara: pd.Series, mensaje) -> None:
+        """mensaje: texto fijo o función de la máscara (solo se evalúa sobre esas líneas)"""
+        if mascara.any():
+            texto = mensaje(mascara) if callable(mensaje) else mensaje
+            errores[mascara] = errores[mascara] + texto + '; '
+
+    anotar(asiento == '', "Falta el número de asiento")
+    anotar(fecha.isna(), lambda m: "Fecha no válida: '" + texto_fecha[m] + "'")
+    anotar(fecha.notna() & (fecha.dt.year != ejercicio), f"Fecha fuera del ejercicio {ejercicio}")
+    cuenta_valida, cuenta_larga, tercero_id = _cuentas_validas(cuenta, plan)
+    anotar(cuenta_larga, lambda m: "Cuenta '" + cuenta[m] + "' demasiado larga (máximo "
+                                   f"{CODIGO_CUENTA_MAXIMO}; use subcuentas de 9 dígitos)")
+    anotar(~cuenta_valida & ~cuenta_larga,
+           lambda m: "Cuenta '" + cuenta[m] + "' no existe en el plan de la entidad")
+    anotar(debe.isna() | haber.isna(), "Importe no válido")
+
+    # Comprobaciones por asiento (sobre las líneas con importe)
+    clave = pd.Series(pd.factorize(asiento)[0], index=df.index)
+    neto = (debe.fillna(0) - haber.fillna(0)).where(~vacias, 0.0)
+    grupos = pd.DataFrame({'neto': neto, 'fecha': fecha}).groupby(clave)
+    descuadre = grupos['neto'].transform('sum')
+    anotar((asiento != '') & (descuadre != 0),
+           lambda m: "Asiento descuadrado en " + (descuadre[m] / 100).map('{:,.2f} €'.format))
+    anotar((asiento != '') & (grupos['fecha'].transform('nunique') > 1),
+           "El asiento tiene apuntes con fechas distintas")
+
+    con_error = errores != ''
+    asiento_erroneo = con_error.groupby(clave).transform('any')
+    importacion.asientos_con_errores = int(asiento[asiento_erroneo].nunique())
+    anotar(asiento_erroneo & ~con_error & ~vacias, "Se omite: el asiento tiene errores en otras líneas")
+    informe = errores != ''
+    importacion.errores = pd.DataFrame({
+        'Fila': df.index[informe.to_numpy()] + PRIMERA_FILA,
+        'Asiento': asiento[informe],
+        'Cuenta': cuenta[informe],
+        'Error': errores[informe].str.rstrip('; '),
+    }).reset_index(drop=True)
+
+    # Asientos válidos en orden de fecha y de aparición en el fichero (la clave
+    # factorizada numera los asientos por orden de aparición)
+    validas = (~asiento_erroneo & ~vacias).to_numpy()
+    orden = np.lexsort((np.arange(len(df)), clave.to_numpy(),
+                        fecha.to_numpy(dtype='datetime64[D]').astype('int64')))
+    orden = orden[validas[orden]]
+
+    v_clave = clave.to_numpy()[orden]
+    inicios = (np.flatnonzero(np.r_[True, v_clave[1:] != v_clave[:-1]]) if len(orden)
+               else np.zeros(0, dtype=np.int64))
+    v_fecha = np.datetime_as_string(fecha.to_numpy(dtype='datetime64[D]')[orden][inicios]).tolist()
+    v_asiento = asiento.to_numpy(dtype=object)[orden].tolist()
+    v_cuenta = cuenta.to_numpy(dtype=object)[orden].tolist()
+    v_concepto = _texto(df, columnas, 'concepto').to_numpy(dtype=object)[orden].tolist()
+    v_documento = _texto(df, columnas, 'documento').to_numpy(dtype=object)[orden].tolist()
+    v_debe = debe.to_numpy()[orden].astype(np.int64).tolist()
+    v_haber = haber.to_numpy()[orden].astype(np.int64).tolist()
+    v_tercero = tercero_id.to_numpy()[orden].tolist()
+
+    for fecha_asiento, desde, hasta in zip(v_fecha, inicios, np.r_[inicios[1:], len(orden)]):
+        referencia = referencia_historica(ejercicio, v_asiento[desde])
+        if referencias is not None and referencias.buscar(entidad_id, referencia):
+            importacion.ya_importados += 1
+            continue
+        concepto = next((c for c in v_concepto[desde:hasta] if c), '')
+        documento = next((d for d in v_documento[desde:hasta] if d), '')
+        importacion.debe += sum(v_debe[desde:hasta])
+        importacion.haber += sum(v_haber[desde:hasta])
+        apuntes = []
+        for i in range(desde, hasta):
+            apunte = {'cuenta': v_cuenta[i], 'debe': v_debe[i] / 100, 'haber': v_haber[i] / 100}
+            if v_tercero[i] == v_tercero[i]:      # NaN = cuenta sin tercero
+                apunte['tercero_id'] = int(v_tercero[i])
+            apuntes.append(apunte)
+        importacion.asientos.append({
+            'entidad_id': entidad_id,
+            'fecha': fecha_asiento,
+            'concepto': concepto or f"Asiento {v_asiento[desde]} ({diseno.nombre})"
+                                    + (f" - Doc. {documento}" if documento else ''),
+            'referencia': referencia,
+            'apuntes': apuntes,
+        })
+
+    importacion.segundos = time.perf_counter() - inicio
+    return importacion
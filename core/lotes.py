@@ -0,0 +1,84 @@
+"""
+Ejecución de tareas por entidad en un pool de procesos
+
+Los procesos por lotes sobre todas las entidades (presentación de modelos,
+cierre del ejercicio) reparten una tarea por entidad. Cada tarea lleva todo
+lo que necesita (p. ej. las columnas de apuntes de la entidad), de modo que
+el proceso hijo no depende del libro ni de la sesión de Streamlit.
+
+Los procesos se crean con 'spawn': la aplicación tiene hilos vivos y un fork
+podría heredar cerrojos tomados. Con un solo proceso (o una sola tarea) se
+ejecuta todo en el proceso actual, sin el coste de arrancar el pool.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, List, Optional, Sequence
+
+
+def procesos_disponibles() -> int:
+    """CPUs utilizables por este proceso"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def ejecutar_por_entidad(funcion: Callable[..., Any], tareas: Sequence[tuple],
+                         max_procesos: Optional[int] = None,
+                         al_terminar: Optional[Callable[[dict, int, int], None]] = None,
+                         al_fallar: Optional[Callable[[tuple, Exception], Any]] = None
+                         ) -> List[Any]:
+    """
+    Ejecuta ``funcion(*tarea)`` para cada tarea, cuyo primer elemento es la entidad.
+
+    Args:
+        funcion: Función de nivel de módulo (los procesos la importan)
+        tareas: Argumentos de cada llamada; el primero, el dict de la entidad
+        max_procesos: Procesos del pool (None = CPUs disponibles; 1 = sin pool)
+        al_terminar: Llamada (entidad, terminadas, total) al acabar cada tarea,
+            siempre desde el proceso que llama
+        al_fallar: Resultado a usar si la tarea lanza una excepción (o si el
+            proceso muere); sin él, la excepción se propaga
+
+    Returns:
+        Resultados en el orden de las tareas
+    """
+    total = len(tareas)
+    resultados: List[Any] = [None] * total
+    terminadas = 0
+
+    def terminar(indice: int, resultado: Any) -> None:
+        nonlocal terminadas
+        resultados[indice] = resultado
+        terminadas += 1
+        if al_terminar:
+            al_terminar(tareas[indice][0], terminadas, total)
+
+    def fallo(indice: int, error: Exception) -> Any:
+        if al_fallar is None:
+            raise error
+        return al_fallar(tareas[indice], error)
+
+    procesos = min(max_procesos or procesos_disponibles(), total)
+    if procesos <= 1:
+        for indice, tarea in enumerate(tareas):
+            try:
+                resultado = funcion(*tarea)
+            except Exception as e:
+                resultado = fallo(indice, e)
+            terminar(indice, resultado)
+        return resultados
+
+    contexto = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto) as pool:
+        futuros = {pool.submit(funcion, *tarea): indice for indice, tarea in enumerate(tareas)}
+        for futuro in as_completed(futuros):
+            indice = futuros[futuro]
+            try:
+                resultado = futuro.result()
+            except Exception as e:   # fallo de la tarea o proceso caído
+                resultado = fallo(indice, e)
+            terminar(indice, resultado)
+    return resultados
@@ -0,0 +1,151 @@
+"""
+Caché de extracciones por contenido del documento
+
+La clave es el SHA-256 de los bytes del fichero, así que el mismo PDF subido
+otra vez (reenviado, duplicado o de una sesión reintentada) no vuelve a pasar
+por OCR + IA. Hay dos niveles:
+
+- Memoria: LRU con un número máximo de entradas.
+- Disco: un JSON por documento; cuando el directorio supera el tamaño máximo
+  se borran los ficheros usados hace más tiempo (fecha de modificación, que se
+  actualiza en cada acierto).
+
+Es segura para hilos: el procesador de documentos la consulta desde su pool.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from core.ocr.extractor import DatosDocumento
+
+
+DIRECTORIO_POR_DEFECTO = os.path.join('.cache', 'extracciones')
+
+
+def huella_documento(contenido: bytes) -> str:
+    """SHA-256 (hex) de los bytes del documento"""
+    return hashlib.sha256(contenido).hexdigest()
+
+
+@dataclass
+class EstadisticasCache:
+    aciertos_memoria: int = 0
+    aciertos_disco: int = 0
+    fallos: int = 0
+    expulsiones_disco: int = 0
+
+
+class CacheExtracciones:
+    """
+    Resultados de extracción por huella SHA-256, en memoria (LRU) y en disco.
+
+    Uso:
+        cache = CacheExtracciones('.cache/extracciones', max_memoria=512,
+                                  max_bytes_disco=50 * 1024 * 1024)
+        datos = cache.obtener(huella)       # None si no está
+        cache.guardar(huella, datos)
+    """
+
+    def __init__(self, directorio: Optional[str] = None, max_memoria: int = 512,
+                 max_bytes_disco: int = 50 * 1024 * 1024):
+        self.directorio = directorio or os.environ.get('CONTAFACIL_CACHE_DIR', DIRECTORIO_POR_DEFECTO)
+        self.max_memoria = max_memoria
+        self.max_bytes_disco = max_bytes_disco
+        self.estadisticas = EstadisticasCache()
+        self._memoria: 'OrderedDict[str, DatosDocumento]' = OrderedDict()
+        self._cerrojo = threading.Lock()
+
+        os.makedirs(self.directorio, exist_ok=True)
+        # Tamaño de cada fichero del disco, para expulsar sin recorrer el directorio
+        self._tamanos: Dict[str, int] = {}
+        for nombre in os.listdir(self.directorio):
+            if nombre.endswith('.json'):
+                self._tamanos[nombre[:-5]] = os.path.getsize(os.path.join(self.directorio, nombre))
+        self._bytes_disco = sum(self._tamanos.values())
+
+    def _ruta(self, huella: str) -> str:
+        return os.path.join(self.directorio, f"{huella}.json")
+
+    # -------------------------------------------------
+    # Lectura y escritura
+    # -------------------------------------------------
+
+    def obtener(self, huella: str) -> Optional[DatosDocumento]:
+        """Datos extraídos del documento con esa huella, o None"""
+        with self._cerrojo:
+            datos = self._memoria.get(huella)
+            if datos is not None:
+                self._memoria.move_to_end(huella)
+                self.estadisticas.aciertos_memoria += 1
+                return datos
+
+            if huella in self._tamanos:
+                ruta = self._ruta(huella)
+                try:
+                    with open(ruta, encoding='utf-8') as fichero:
+                        datos = DatosDocumento.desde_dict(json.load(fichero))
+                    os.utime(ruta)
+                except (OSError, ValueError, KeyError):
+                    self._olvidar_disco(huella)
+                else:
+                    self._guardar_memoria(huella, datos)
+                    self.estadisticas.aciertos_disco += 1
+                    return datos
+
+            self.estadisticas.fallos += 1
+            return None
+
+    def guardar(self, huella: str, datos: DatosDocumento) -> None:
+        """Guarda el resultado en memoria y en disco (escritura atómica)"""
+        contenido = json.dumps(datos.como_dict(), ensure_ascii=False).encode('utf-8')
+        with self._cerrojo:
+            self._guardar_memoria(huella, datos)
+            ruta = self._ruta(huella)
+            temporal = f"{ruta}.{threading.get_ident()}.tmp"
+            with open(temporal, 'wb') as fichero:
+                fichero.write(contenido)
+            os.replace(temporal, ruta)
+            self._bytes_disco += len(contenido) - self._tamanos.get(huella, 0)
+            self._tamanos[huella] = len(contenido)
+            if self._bytes_disco > self.max_bytes_disco:
+                self._expulsar_disco()
+
+    def __len__(self) -> int:
+        return len(self._tamanos)
+
+    # -------------------------------------------------
+    # Expulsión
+    # -------------------------------------------------
+
+    def _guardar_memoria(self, huella: str, datos: DatosDocumento) -> None:
+        self._memoria[huella] = datos
+        self._memoria.move_to_end(huella)
+        while len(self._memoria) > self.max_memoria:
+            self._memoria.popitem(last=False)
+
+    def _olvidar_disco(self, huella: str) -> None:
+        self._bytes_disco -= self._tamanos.pop(huella, 0)
+        try:
+            os.remove(self._ruta(huella))
+        except OSError:
+            pass
+
+    def _expulsar_disco(self) -> None:
+        """Borra los ficheros menos usados hasta dejar el disco al 90% del máximo"""
+        def ultimo_uso(huella: str) -> float:
+            try:
+                return os.path.getmtime(self._ruta(huella))
+            except OSError:
+                return 0.0
+
+        objetivo = self.max_bytes_disco * 9 // 10
+        for huella in sorted(self._tamanos, key=ultimo_uso):
+            if self._bytes_disco <= objetivo:
+                break
+            self._olvidar_disco(huella)
+            self.estadisticas.expulsiones_disco += 1
@@ -0,0 +1,264 @@
+"""
+Procesamiento en lote de documentos subidos
+
+Los documentos se extraen en paralelo en un pool de hilos con un máximo de
+extracciones simultáneas; los fallos transitorios se reintentan con espera
+exponencial. El progreso de cada documento se notifica desde el hilo que
+llama (el de Streamlit), nunca desde los hilos del pool.
+
+Con una caché de extracciones, los documentos ya vistos (misma huella
+SHA-256) se resuelven al momento sin pasar por el pool, y los ficheros
+idénticos dentro de un mismo lote se extraen una sola vez.
+
+Cada extracción correcta produce una propuesta de asiento que entra en la
+cola de revisión, donde se marcan los posibles duplicados (mismo fichero o
+misma factura ya en la cola o ya contabilizada); las propuestas aprobadas se
+contabilizan juntas en un lote.
+"""
+
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from itertools import count
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from core.ocr.cache import CacheExtracciones, huella_documento
+from core.ocr.extractor import DatosDocumento, ErrorTransitorio, Extractor
+from core.referencias import IndiceReferencias, referencia_factura
+
+
+@dataclass
+class DocumentoProcesado:
+    """Estado de un documento en el lote"""
+    id: int
+    nombre: str
+    estado: str = 'pendiente'           # pendiente / extraido / error
+    intentos: int = 0
+    datos: Optional[DatosDocumento] = None
+    error: Optional[str] = None
+    segundos: float = 0.0
+    huella: str = ''                     # SHA-256 del contenido
+    desde_cache: bool = False
+
+
+class ProcesadorDocumentos:
+    """
+    Extracción concurrente con límite de paralelismo, reintentos y espera.
+
+    Uso:
+        procesador = ProcesadorDocumentos(ExtractorSimulado(), max_concurrencia=4)
+        documentos = procesador.procesar(
+            [(fichero.name, fichero.getvalue()) for fichero in ficheros],
+            al_terminar=lambda doc, hechos, total: barra.progress(hechos / total)
+        )
+    """
+
+    def __init__(self, extractor: Extractor, max_concurrencia: int = 4,
+                 reintentos: int = 3, espera_inicial: float = 0.5,
+                 espera_maxima: float = 8.0, cache: Optional[CacheExtracciones] = None):
+        self.extractor = extractor
+        self.cache = cache
+        self.max_concurrencia = max_concurrencia
+        self.reintentos = reintentos
+        self.espera_inicial = espera_inicial
+        self.espera_maxima = espera_maxima
+        self._ids = count(1)
+
+    def _extraer(self, documento: DocumentoProcesado, contenido: bytes) -> DocumentoProcesado:
+        """Extrae un documento con reintentos (se ejecuta en el pool)"""
+        inicio = time.perf_counter()
+        espera = self.espera_inicial
+        while True:
+            documento.intentos += 1
+            try:
+                documento.datos = self.extractor.extraer(documento.nombre, contenido)
+                documento.estado = 'extraido'
+                if self.cache is not None:
+                    self.cache.guardar(documento.huella, documento.datos)
+                break
+            except ErrorTransitorio as e:
+                if documento.intentos > self.reintentos:
+                    documento.estado, documento.error = 'error', f"Reintentos agotados: {e}"
+                    break
+                # Espera exponencial con dispersión aleatoria para no sincronizar reintentos
+                time.sleep(espera * (0.5 + random.random()))
+                espera = min(espera * 2, self.espera_maxima)
+            except Exception as e:
+                documento.estado, documento.error = 'error', str(e)
+                break
+        documento.segundos = time.perf_counter() - inicio
+        return documento
+
+    def procesar(self, ficheros: Iterable[Tuple[str, bytes]],
+                 al_terminar: Optional[Callable[[DocumentoProcesado, int, int], None]] = None
+                 ) -> List[DocumentoProcesado]:
+        """
+        Extrae todos los ficheros y devuelve sus estados en el orden recibido.
+
+        Args:
+            ficheros: Pares (nombre, contenido)
+            al_terminar: Llamada (documento, terminados, total) al acabar cada uno
+        """
+        ficheros_lista = list(ficheros)
+        documentos = [DocumentoProcesado(next(self._ids), nombre, huella=huella_documento(contenido))
+                      for nombre, contenido in ficheros_lista]
+        total = len(documentos)
+        terminados = 0
+
+        def terminar(documento: DocumentoProcesado) -> None:
+            nonlocal terminados
+            terminados += 1
+            if al_terminar:
+                al_terminar(documento, terminados, total)
+
+        # Aciertos de caché y copias de un mismo fichero no pasan por el pool
+        primeros: Dict[str, DocumentoProcesado] = {}
+        copias: List[DocumentoProcesado] = []
+        pendientes: List[Tuple[DocumentoProcesado, bytes]] = []
+        for documento, (_nombre, contenido) in zip(documentos, ficheros_lista):
+            datos = self.cache.obtener(documento.huella) if self.cache is not None else None
+            if datos is not None:
+                documento.datos, documento.estado, documento.desde_cache = datos, 'extraido', True
+                terminar(documento)
+            elif documento.huella in primeros:
+                copias.append(documento)
+            else:
+                primeros[documento.huella] = documento
+                pendientes.append((documento, contenido))
+
+        if pendientes:
+            with ThreadPoolExecutor(max_workers=self.max_concurrencia) as pool:
+                futuros = [pool.submit(self._extraer, documento, contenido)
+                           for documento, contenido in pendientes]
+                for futuro in as_completed(futuros):
+                    terminar(futuro.result())
+
+        for documento in copias:
+            original = primeros[documento.huella]
+            documento.datos, documento.estado, documento.error = (
+                original.datos, original.estado, original.error
+            )
+            documento.desde_cache = original.estado == 'extraido'
+            terminar(documento)
+        return documentos
+
+
+def propuesta_asiento(datos: DatosDocumento, entidad_id: int,
+                      buscar_tercero_id: Callable[[str], Optional[int]]) -> dict:
+    """Asiento propuesto para los datos extraídos (facturas recibidas y emitidas)"""
+    base, cuota, total = float(datos.base), float(datos.cuota), float(datos.total)
+    tercero_id = buscar_tercero_id(datos.nif)
+    if datos.tipo == "Factura emitida":
+        concepto = f"Fra. emitida {datos.numero_factura} - {datos.nombre}"
+        apuntes = [
+            {'cuenta': '430', 'debe': total, 'haber': 0, 'tercero_id': tercero_id},
+            {'cuenta': '700', 'debe': 0, 'haber': base, 'tipo_iva': datos.tipo_iva},
+            {'cuenta': '477', 'debe': 0, 'haber': cuota, 'tipo_iva': datos.tipo_iva},
+        ]
+    elif datos.tipo == "Factura recibida":
+        concepto = f"Fra. {datos.numero_factura} - {datos.nombre}"
+        apuntes = [
+            {'cuenta': datos.cuenta_gasto, 'debe': base, 'haber': 0, 'tipo_iva': datos.tipo_iva},
+            {'cuenta': '472', 'debe': cuota, 'haber': 0, 'tipo_iva': datos.tipo_iva},
+            {'cuenta': '400', 'debe': 0, 'haber': total, 'tercero_id': tercero_id},
+        ]
+    else:
+        raise ValueError(f"Sin propuesta automática para documentos de tipo {datos.tipo}")
+    return {
+        'entidad_id': entidad_id,
+        'fecha': datos.fecha.isoformat(),
+        'concepto': concepto,
+        'referencia': referencia_factura(datos.nif, datos.numero_factura),
+        'apuntes': apuntes,
+    }
+
+
+class ColaRevision:
+    """
+    Propuestas de asiento pendientes de revisión, por documento.
+
+    Al añadir una propuesta se comprueba si es un posible duplicado: el mismo
+    fichero o la misma factura (NIF y número) ya en la cola, o una factura ya
+    contabilizada según el índice de referencias del libro. Las propuestas se
+    aprueban en bloque: ``aprobar`` devuelve los asientos listos para
+    ``libro.contabilizar_lote``, sin las facturas que ya estén contabilizadas
+    ni las repetidas dentro del propio lote.
+    """
+
+    def __init__(self, referencias: Optional[IndiceReferencias] = None):
+        self.referencias = referencias
+        self.propuestas: Dict[int, dict] = {}   # id documento -> propuesta
+        # Índices de la cola: (entidad, huella) y (entidad, referencia) -> id documento
+        self._por_huella: Dict[Tuple[int, str], int] = {}
+        self._por_referencia: Dict[Tuple[int, str], int] = {}
+
+    def _ya_contabilizado(self, asiento: dict) -> Optional[dict]:
+        if self.referencias is None:
+            return None
+        return self.referencias.buscar(asiento['entidad_id'], asiento.get('referencia'))
+
+    def posible_duplicado(self, documento: DocumentoProcesado, asiento: dict) -> Optional[str]:
+        """Motivo por el que la propuesta parece duplicada, o None"""
+        contabilizado = self._ya_contabilizado(asiento)
+        if contabilizado is not None:
+            return f"Factura ya contabilizada en el asiento nº {contabilizado['numero']}"
+        entidad_id = asiento['entidad_id']
+        igual = self._por_huella.get((entidad_id, documento.huella))
+        if igual is not None:
+            return f"Mismo fichero que {self.propuestas[igual]['documento']}"
+        igual = self._por_referencia.get((entidad_id, asiento.get('referencia')))
+        if igual is not None:
+            return f"Misma factura que {self.propuestas[igual]['documento']}"
+        return None
+
+    def anadir(self, documento: DocumentoProcesado, asiento: dict) -> None:
+        self.propuestas[documento.id] = {
+            'documento': documento.nombre,
+            'huella': documento.huella,
+            'datos': documento.datos,
+            'asiento': asiento,
+            'duplicado': self.posible_duplicado(documento, asiento),
+        }
+        entidad_id = asiento['entidad_id']
+        self._por_huella.setdefault((entidad_id, documento.huella), documento.id)
+        if asiento.get('referencia'):
+            self._por_referencia.setdefault((entidad_id, asiento['referencia']), documento.id)
+
+    def _retirar(self, documento_id: int) -> Optional[dict]:
+        propuesta = self.propuestas.pop(documento_id, None)
+        if propuesta is not None:
+            entidad_id = propuesta['asiento']['entidad_id']
+            for indice, clave in ((self._por_huella, propuesta['huella']),
+                                  (self._por_referencia, propuesta['asiento'].get('referencia'))):
+                if indice.get((entidad_id, clave)) == documento_id:
+                    del indice[(entidad_id, clave)]
+        return propuesta
+
+    def descartar(self, ids: Iterable[int]) -> None:
+        for documento_id in ids:
+            self._retirar(documento_id)
+
+    def aprobar(self, ids: Iterable[int]) -> Tuple[List[dict], List[str]]:
+        """
+        Retira de la cola las propuestas aprobadas.
+
+        Returns:
+            Tupla (asientos a contabilizar, documentos omitidos por duplicados)
+        """
+        asientos, omitidos, vistas = [], [], set()
+        for documento_id in list(ids):
+            propuesta = self._retirar(documento_id)
+            if propuesta is None:
+                continue
+            asiento = propuesta['asiento']
+            clave = (asiento['entidad_id'], asiento.get('referencia'))
+            if self._ya_contabilizado(asiento) is not None or clave in vistas:
+                omitidos.append(propuesta['documento'])
+                continue
+            vistas.add(clave)
+            asientos.append(asiento)
+        return asientos, omitidos
+
+    def __len__(self) -> int:
+        return len(self.propuestas)
@@ -0,0 +1,164 @@
+"""
+Perfilador de reruns de Streamlit
+
+Mide cada sección de ``app_main.py`` (barra lateral, cuerpo de cada pestaña y
+generadores de ficheros): tiempo real, apuntes recorridos y tamaño de los
+DataFrames construidos. Las mediciones de cada rerun se guardan en un
+historial acotado y se exportan como JSON lines para analizarlas fuera.
+
+Desactivado, ``seccion`` devuelve siempre el mismo objeto nulo y las
+anotaciones retornan sin hacer nada, así que el coste es una llamada.
+
+Uso:
+    perfilador.iniciar_rerun()
+    with tab2, perfilador.seccion('Libro Diario'):
+        perfilador.anotar_apuntes(n)
+        st.dataframe(perfilador.dataframe(df))
+    perfilador.terminar_rerun()
+    perfilador.exportar_jsonl(fichero)
+"""
+
+import json
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Deque, List, Optional, TextIO
+
+import pandas as pd
+
+
+# Reruns que se conservan en el historial
+MAX_RERUNS = 200
+
+
+@dataclass
+class Medicion:
+    """Una sección de un rerun"""
+    rerun: int
+    inicio: str                 # fecha y hora ISO
+    seccion: str
+    padre: str                  # sección que la contiene ('' = nivel superior)
+    segundos: float = 0.0
+    apuntes: int = 0            # apuntes recorridos
+    filas: int = 0              # filas de los DataFrames construidos
+    bytes: int = 0              # memoria de esos DataFrames
+
+
+class _SeccionNula:
+    """Sección del perfilador desactivado: no mide nada"""
+
+    def __enter__(self) -> '_SeccionNula':
+        return self
+
+    def __exit__(self, *_excepcion) -> None:
+        return None
+
+
+_SECCION_NULA = _SeccionNula()
+
+
+class _Seccion:
+    def __init__(self, perfilador: 'Perfilador', nombre: str):
+        self._perfilador = perfilador
+        self._nombre = nombre
+        self._inicio = 0.0
+        self.medicion: Optional[Medicion] = None
+
+    def __enter__(self) -> '_Seccion':
+        perfilador = self._perfilador
+        padre = perfilador._pila[-1].seccion if perfilador._pila else ''
+        self.medicion = Medicion(perfilador.rerun, datetime.now().isoformat(timespec='milliseconds'),
+                                 self._nombre, padre)
+        perfilador._pila.append(self.medicion)
+        perfilador._actual.append(self.medicion)
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *_excepcion) -> None:
+        self.medicion.segundos = time.perf_counter() - self._inicio
+        self._perfilador._pila.pop()
+
+
+class Perfilador:
+    """
+    Mediciones por sección de cada rerun (una instancia por sesión).
+
+    ``activo`` se puede cambiar entre reruns; con él a False no se registra nada.
+    """
+
+    def __init__(self, activo: bool = False, max_reruns: int = MAX_RERUNS):
+        self.activo = activo
+        self.rerun = 0
+        self.historial: Deque[List[Medicion]] = deque(maxlen=max_reruns)
+        self._actual: List[Medicion] = []
+        self._pila: List[Medicion] = []
+
+    # -------------------------------------------------
+    # Ciclo del rerun
+    # -------------------------------------------------
+
+    def iniciar_rerun(self) -> None:
+        self.rerun += 1
+        self._actual = []
+        self._pila = []
+
+    def terminar_rerun(self) -> None:
+        if self._actual:
+            self.historial.append(self._actual)
+        self._actual = []
+
+    # -------------------------------------------------
+    # Instrumentación
+    # -------------------------------------------------
+
+    def seccion(self, nombre: str):
+        """Context manager que mide una sección (anidable)"""
+        if not self.activo:
+            return _SECCION_NULA
+        return _Seccion(self, nombre)
+
+    def anotar_apuntes(self, apuntes: int) -> None:
+        """Suma apuntes recorridos a la sección en curso"""
+        if self.activo and self._pila:
+            self._pila[-1].apuntes += apuntes
+
+    def dataframe(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Anota el tamaño del DataFrame en la sección en curso y lo devuelve"""
+        if self.activo and self._pila:
+            medicion = self._pila[-1]
+            medicion.filas += len(df)
+            medicion.bytes += int(df.memory_usage(index=True).sum())
+        return df
+
+    # -------------------------------------------------
+    # Consulta y exportación
+    # -------------------------------------------------
+
+    @property
+    def ultimo_rerun(self) -> List[Medicion]:
+        return self.historial[-1] if self.historial else []
+
+    @property
+    def num_mediciones(self) -> int:
+        """Mediciones de todo el historial (las líneas que escribe exportar_jsonl)"""
+        return sum(len(mediciones) for mediciones in self.historial)
+
+    def como_dataframe(self, mediciones: Optional[List[Medicion]] = None) -> pd.DataFrame:
+        mediciones = self.ultimo_rerun if mediciones is None else mediciones
+        return pd.DataFrame([{
+            'Sección': f"{'↳ ' if m.padre else ''}{m.seccion}",
+            'ms': round(m.segundos * 1000, 2),
+            'Apuntes': m.apuntes,
+            'Filas': m.filas,
+            'KB': round(m.bytes / 1024, 1),
+        } for m in mediciones])
+
+    def exportar_jsonl(self, destino: TextIO) -> int:
+        """Escribe todo el historial, una medición por línea. Devuelve cuántas escribió."""
+        lineas = 0
+        for mediciones in self.historial:
+            for medicion in mediciones:
+                destino.write(json.dumps(asdict(medicion), ensure_ascii=False) + '\n')
+                lineas += 1
+        return lineas
@@ -0,0 +1,233 @@
+"""
+Plan de cuentas compilado por entidad
+
+Cada entidad tiene un ``PlanCuentas`` que une el plan PGC base de su tipo
+(PYMES o comunidades) con sus subcuentas propias, una por tercero (4300001
+para el propietario 1, 4000001 para el proveedor 1...). Se compila una vez
+por entidad y resuelve cualquier código:
+
+- Código del plan: búsqueda directa en un diccionario, O(1).
+- Subcuenta no dada de alta: su ascendiente más próximo del plan, probando
+  prefijos de mayor a menor longitud (O(dígitos)); el resultado se memoriza,
+  así que las siguientes consultas del mismo código son O(1).
+- Grupos y subgrupos (1 y 2 dígitos): nombres del cuadro de cuentas del PGC,
+  que también describen los códigos sin ninguna cuenta del plan por encima.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+
+# Planes base por tipo de entidad
+PLAN_CUENTAS_PYMES = {
+    '100': {'descripcion': 'Capital social', 'tipo': 'patrimonio'},
+    '129': {'descripcion': 'Resultado del ejercicio', 'tipo': 'patrimonio'},
+    '400': {'descripcion': 'Proveedores', 'tipo': 'pasivo'},
+    '410': {'descripcion': 'Acreedores por prestación servicios', 'tipo': 'pasivo'},
+    '430': {'descripcion': 'Clientes', 'tipo': 'activo'},
+    '465': {'descripcion': 'Remuneraciones pendientes pago', 'tipo': 'pasivo'},
+    '472': {'descripcion': 'H.P. IVA soportado', 'tipo': 'activo'},
+    '475': {'descripcion': 'H.P. acreedora conceptos fiscales', 'tipo': 'pasivo'},
+    '4750': {'descripcion': 'H.P. acreedora por IVA', 'tipo': 'pasivo'},
+    '4751': {'descripcion': 'H.P. acreedora por retenciones', 'tipo': 'pasivo'},
+    '476': {'descripcion': 'Organismos Seg. Social acreedores', 'tipo': 'pasivo'},
+    '477': {'descripcion': 'H.P. IVA repercutido', 'tipo': 'pasivo'},
+    '570': {'descripcion': 'Caja, euros', 'tipo': 'activo'},
+    '572': {'descripcion': 'Bancos c/c', 'tipo': 'activo'},
+    '600': {'descripcion': 'Compras de mercaderías', 'tipo': 'gasto'},
+    '621': {'descripcion': 'Arrendamientos y cánones', 'tipo': 'gasto'},
+    '622': {'descripcion': 'Reparaciones y conservación', 'tipo': 'gasto'},
+    '623': {'descripcion': 'Servicios profesionales indep.', 'tipo': 'gasto'},
+    '624': {'descripcion': 'Transportes', 'tipo': 'gasto'},
+    '625': {'descripcion': 'Primas de seguros', 'tipo': 'gasto'},
+    '626': {'descripcion': 'Servicios bancarios', 'tipo': 'gasto'},
+    '627': {'descripcion': 'Publicidad y propaganda', 'tipo': 'gasto'},
+    '628': {'descripcion': 'Suministros', 'tipo': 'gasto'},
+    '629': {'descripcion': 'Otros servicios', 'tipo': 'gasto'},
+    '640': {'descripcion': 'Sueldos y salarios', 'tipo': 'gasto'},
+    '642': {'descripcion': 'Seguridad Social empresa', 'tipo': 'gasto'},
+    '700': {'descripcion': 'Ventas de mercaderías', 'tipo': 'ingreso'},
+    '705': {'descripcion': 'Prestaciones de servicios', 'tipo': 'ingreso'},
+    '759': {'descripcion': 'Ingresos por servicios diversos', 'tipo': 'ingreso'},
+    '769': {'descripcion': 'Otros ingresos financieros', 'tipo': 'ingreso'},
+}
+
+PLAN_CUENTAS_COMUNIDADES = {
+    '100': {'descripcion': 'Fondo de reserva', 'tipo': 'patrimonio'},
+    '110': {'descripcion': 'Remanente', 'tipo': 'patrimonio'},
+    '129': {'descripcion': 'Resultado del ejercicio', 'tipo': 'patrimonio'},
+    '410': {'descripcion': 'Acreedores prestación servicios', 'tipo': 'pasivo'},
+    '430': {'descripcion': 'Propietarios cuenta corriente', 'tipo': 'activo'},
+    '4300': {'descripcion': 'Propietarios - Cuotas ordinarias', 'tipo': 'activo'},
+    '4301': {'descripcion': 'Propietarios - Derramas', 'tipo': 'activo'},
+    '4309': {'descripcion': 'Propietarios - Dudoso cobro', 'tipo': 'activo'},
+    '465': {'descripcion': 'Remuneraciones pendientes pago', 'tipo': 'pasivo'},
+    '4751': {'descripcion': 'H.P. acreedora retenciones', 'tipo': 'pasivo'},
+    '476': {'descripcion': 'Organismos Seg. Social acreedores', 'tipo': 'pasivo'},
+    '570': {'descripcion': 'Caja', 'tipo': 'activo'},
+    '572': {'descripcion': 'Bancos c/c', 'tipo': 'activo'},
+    '5721': {'descripcion': 'Banco cuenta ordinaria', 'tipo': 'activo'},
+    '5722': {'descripcion': 'Banco fondo reserva', 'tipo': 'activo'},
+    '621': {'descripcion': 'Arrendamientos y cánones', 'tipo': 'gasto'},
+    '622': {'descripcion': 'Reparaciones y conservación', 'tipo': 'gasto'},
+    '623': {'descripcion': 'Servicios profesionales', 'tipo': 'gasto'},
+    '6230': {'descripcion': 'Honorarios administrador', 'tipo': 'gasto'},
+    '625': {'descripcion': 'Primas de seguros', 'tipo': 'gasto'},
+    '626': {'descripcion': 'Servicios bancarios', 'tipo': 'gasto'},
+    '628': {'descripcion': 'Suministros', 'tipo': 'gasto'},
+    '6280': {'descripcion': 'Suministro eléctrico', 'tipo': 'gasto'},
+    '6281': {'descripcion': 'Suministro agua', 'tipo': 'gasto'},
+    '629': {'descripcion': 'Otros servicios', 'tipo': 'gasto'},
+    '6290': {'descripcion': 'Limpieza', 'tipo': 'gasto'},
+    '6291': {'descripcion': 'Jardinería', 'tipo': 'gasto'},
+    '6293': {'descripcion': 'Mantenimiento ascensor', 'tipo': 'gasto'},
+    '630': {'descripcion': 'Tributos', 'tipo': 'gasto'},
+    '640': {'descripcion': 'Sueldos y salarios', 'tipo': 'gasto'},
+    '642': {'descripcion': 'Seguridad Social empresa', 'tipo': 'gasto'},
+    '740': {'descripcion': 'Cuotas de propietarios', 'tipo': 'ingreso'},
+    '7400': {'descripcion': 'Cuotas ordinarias', 'tipo': 'ingreso'},
+    '7401': {'descripcion': 'Derramas', 'tipo': 'ingreso'},
+    '752': {'descripcion': 'Ingresos por arrendamientos', 'tipo': 'ingreso'},
+}
+
+GRUPOS_PGC = {
+    '1': 'Financiación básica',
+    '2': 'Activo no corriente',
+    '3': 'Existencias',
+    '4': 'Acreedores y deudores por operaciones comerciales',
+    '5': 'Cuentas financieras',
+    '6': 'Compras y gastos',
+    '7': 'Ventas e ingresos',
+    '8': 'Gastos imputados al patrimonio neto',
+    '9': 'Ingresos imputados al patrimonio neto',
+}
+
+SUBGRUPOS_PGC = {
+    '10': 'Capital',
+    '11': 'Reservas y otros instrumentos de patrimonio',
+    '12': 'Resultados pendientes de aplicación',
+    '40': 'Proveedores',
+    '41': 'Acreedores varios',
+    '43': 'Clientes',
+    '46': 'Personal',
+    '47': 'Administraciones públicas',
+    '57': 'Tesorería',
+    '60': 'Compras',
+    '62': 'Servicios exteriores',
+    '63': 'Tributos',
+    '64': 'Gastos de personal',
+    '70': 'Ventas de mercaderías, de producción propia, de servicios, etc.',
+    '74': 'Subvenciones, donaciones y legados',
+    '75': 'Otros ingresos de gestión',
+    '76': 'Ingresos financieros',
+}
+
+# Cuenta de la que cuelga la subcuenta de cada tipo de tercero
+CUENTAS_TERCERO = {
+    'proveedor': '400',
+    'acreedor': '410',
+    'cliente': '430',
+    'propietario': '430',
+}
+
+DIGITOS_TERCERO = 4
+CUENTA_NO_ENCONTRADA = 'Cuenta no encontrada'
+
+
+def plan_base(tipo_entidad: str) -> Dict[str, dict]:
+    """Plan PGC base según el tipo de entidad"""
+    if tipo_entidad == 'comunidad_propietarios':
+        return PLAN_CUENTAS_COMUNIDADES
+    return PLAN_CUENTAS_PYMES
+
+
+def subcuenta_tercero(cuenta: str, tercero_id: int) -> str:
+    """Código de la subcuenta de un tercero (430 + tercero 1 -> 4300001)"""
+    return f"{cuenta}{tercero_id:0{DIGITOS_TERCERO}d}"
+
+
+@dataclass(frozen=True)
+class CuentaPlan:
+    """Cuenta resuelta del plan"""
+    codigo: str                         # código del plan que la describe
+    descripcion: str
+    tipo: str = ''                      # activo / pasivo / patrimonio / gasto / ingreso
+    tercero_id: Optional[int] = None
+
+
+class PlanCuentas:
+    """
+    Plan de cuentas de una entidad, con resolución por ascendiente más próximo.
+
+    Uso:
+        plan = compilar_plan(entidad, terceros)
+        plan.descripcion('4300001')   # 'Propietarios cuenta corriente - PROPIETARIO 1A ...'
+        plan.descripcion('6282')      # 'Suministros' (heredada de 628)
+        plan.tipo('4751')             # 'pasivo'
+    """
+
+    def __init__(self, base: Dict[str, dict], subcuentas: Iterable[CuentaPlan] = ()):
+        self._cuentas: Dict[str, CuentaPlan] = {
+            codigo: CuentaPlan(codigo, datos['descripcion'], datos.get('tipo', ''))
+            for codigo, datos in base.items()
+        }
+        for subcuenta in subcuentas:
+            self._cuentas[subcuenta.codigo] = subcuenta
+        # Resoluciones ya hechas (incluidas las de códigos fuera del plan)
+        self._resueltas: Dict[str, Optional[CuentaPlan]] = dict(self._cuentas)
+
+    def __contains__(self, codigo: str) -> bool:
+        return codigo in self._cuentas
+
+    def __len__(self) -> int:
+        return len(self._cuentas)
+
+    def codigos(self) -> List[str]:
+        """Códigos dados de alta en el plan, ordenados"""
+        return sorted(self._cuentas)
+
+    def resolver(self, codigo: str) -> Optional[CuentaPlan]:
+        """Cuenta del plan que describe el código (él mismo o su ascendiente más próximo)"""
+        try:
+            return self._resueltas[codigo]
+        except KeyError:
+            pass
+        cuenta = None
+        for longitud in range(len(codigo), 0, -1):
+            prefijo = codigo[:longitud]
+            cuenta = self._cuentas.get(prefijo)
+            if cuenta is None and longitud <= 2:
+                nombre = (GRUPOS_PGC if longitud == 1 else SUBGRUPOS_PGC).get(prefijo)
+                cuenta = CuentaPlan(prefijo, nombre) if nombre else None
+            if cuenta is not None:
+                break
+        self._resueltas[codigo] = cuenta
+        return cuenta
+
+    def descripcion(self, codigo: str) -> str:
+        cuenta = self.resolver(codigo)
+        return cuenta.descripcion if cuenta else CUENTA_NO_ENCONTRADA
+
+    def tipo(self, codigo: str) -> str:
+        cuenta = self.resolver(codigo)
+        return cuenta.tipo if cuenta else ''
+
+
+def compilar_plan(entidad: dict, terceros: Iterable[dict]) -> PlanCuentas:
+    """
+    Plan de la entidad: plan base de su tipo más una subcuenta por tercero
+    (según su tipo: proveedor 400, acreedor 410, cliente y propietario 430).
+    """
+    base = plan_base(entidad['tipo'])
+    subcuentas = []
+    for tercero in terceros:
+        cuenta = CUENTAS_TERCERO.get(tercero.get('tipo'))
+        if cuenta is None or cuenta not in base:
+            continue
+        subcuentas.append(CuentaPlan(
+            subcuenta_tercero(cuenta, tercero['id']),
+            f"{base[cuenta]['descripcion']} - {tercero['nombre']}",
+            base[cuenta].get('tipo', ''),
+            tercero['id'],
+        ))
+    return PlanCuentas(base, subcuentas)
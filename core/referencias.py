@@ -0,0 +1,68 @@
+"""
+Índice de documentos de origen ya contabilizados
+
+Los asientos generados a partir de una factura llevan una 'referencia'
+(NIF del emisor/receptor y número de factura). Este índice, suscrito al
+LibroAsientos, permite comprobar en O(1) si una factura ya está contabilizada
+antes de volver a registrarla.
+
+Los asientos del cierre del ejercicio (regularización, cierre y apertura) se
+reconocen por el prefijo de su referencia; no son operaciones del periodo y
+los modelos tributarios los excluyen.
+"""
+
+from typing import Dict, Optional, Tuple
+
+
+def referencia_factura(nif: str, numero_factura: str) -> str:
+    """Referencia normalizada de una factura (NIF/número)"""
+    nif = nif.replace(' ', '').replace('-', '').upper()
+    numero = ''.join(numero_factura.split()).upper()
+    return f"{nif}/{numero}"[:60]
+
+
+# Prefijos de las referencias de los asientos de core.cierre
+PREFIJOS_CIERRE = ('REGULARIZACION/', 'CIERRE/', 'APERTURA/')
+
+
+def es_asiento_cierre(asiento: dict) -> bool:
+    """Si el asiento es de regularización, cierre o apertura de un ejercicio"""
+    return (asiento.get('referencia') or '').startswith(PREFIJOS_CIERRE)
+
+
+class IndiceReferencias:
+    """
+    Asientos por (entidad, referencia del documento de origen).
+
+    Uso:
+        referencias = IndiceReferencias()
+        libro.suscribir(referencias)
+
+        asiento = referencias.buscar(1, referencia_factura('B98765432', '2024/123'))
+    """
+
+    def __init__(self):
+        self._asientos: Dict[Tuple[int, str], dict] = {}
+
+    # -------------------------------------------------
+    # Observador del LibroAsientos
+    # -------------------------------------------------
+
+    def asiento_contabilizado(self, asiento: dict) -> None:
+        if asiento.get('referencia'):
+            self._asientos[(asiento['entidad_id'], asiento['referencia'])] = asiento
+
+    def asiento_retirado(self, asiento: dict) -> None:
+        clave = (asiento['entidad_id'], asiento.get('referencia'))
+        if self._asientos.get(clave) is asiento:
+            del self._asientos[clave]
+
+    # -------------------------------------------------
+    # Consultas
+    # -------------------------------------------------
+
+    def buscar(self, entidad_id: int, referencia: Optional[str]) -> Optional[dict]:
+        """Asiento ya contabilizado con esa referencia, o None"""
+        if not referencia:
+            return None
+        return self._asientos.get((entidad_id, referencia))
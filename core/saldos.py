@@ -0,0 +1,144 @@
+"""
+Caché de saldos por (entidad, cuenta, mes)
+
+Se mantiene de forma incremental: se suscribe al LibroAsientos y suma cada
+asiento al contabilizarlo y lo resta al eliminarlo o modificarlo, de modo que
+el Libro Mayor y las métricas no tienen que volver a recorrer los apuntes.
+Los importes se acumulan en céntimos enteros para evitar errores de redondeo.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+
+
+def mes_de(fecha) -> str:
+    """Devuelve el mes 'AAAA-MM' de una fecha ISO o date"""
+    return str(fecha)[:7]
+
+
+class CacheSaldos:
+    """
+    Saldos acumulados por (entidad, cuenta, mes), actualizados en cada asiento.
+
+    Uso:
+        saldos = CacheSaldos()
+        libro.suscribir(saldos)
+
+        saldos.totales_cuenta(1, '572')   # (debe, haber) en euros, O(1)
+        saldos.saldo(1, '572')            # debe - haber
+        saldos.cuentas(1)                 # cuentas con movimientos
+    """
+
+    def __init__(self):
+        # [debe, haber, num_apuntes] en céntimos
+        self._por_mes: Dict[Tuple[int, str, str], List[int]] = {}
+        self._por_cuenta: Dict[Tuple[int, str], List[int]] = {}
+        self._meses_cuenta: Dict[Tuple[int, str], Dict[str, None]] = {}
+        self._cuentas: Dict[int, Dict[str, None]] = {}
+        self._num_apuntes: Dict[int, int] = {}
+
+    # -------------------------------------------------
+    # Observador del LibroAsientos
+    # -------------------------------------------------
+
+    def asiento_contabilizado(self, asiento: dict) -> None:
+        """Suma los apuntes del asiento a los saldos"""
+        self._aplicar(asiento, 1)
+
+    def asiento_retirado(self, asiento: dict) -> None:
+        """Deshace la aportación del asiento a los saldos"""
+        self._aplicar(asiento, -1)
+
+    def _aplicar(self, asiento: dict, signo: int) -> None:
+        entidad_id = asiento['entidad_id']
+        mes = mes_de(asiento['fecha'])
+
+        for apunte in asiento['apuntes']:
+            cuenta = apunte['cuenta']
+            debe = signo * apunte['debe_centimos']
+            haber = signo * apunte['haber_centimos']
+
+            for acumulado in (
+                self._por_mes.setdefault((entidad_id, cuenta, mes), [0, 0, 0]),
+                self._por_cuenta.setdefault((entidad_id, cuenta), [0, 0, 0]),
+            ):
+                acumulado[0] += debe
+                acumulado[1] += haber
+                acumulado[2] += signo
+
+            self._actualizar_indices(asiento, cuenta, mes, signo)
+
+        self._num_apuntes[entidad_id] = (
+            self._num_apuntes.get(entidad_id, 0) + signo * len(asiento['apuntes'])
+        )
+
+    def _actualizar_indices(self, asiento: dict, cuenta: str, mes: str, signo: int) -> None:
+        entidad_id = asiento['entidad_id']
+        clave = (entidad_id, cuenta)
+
+        if signo > 0:
+            self._cuentas.setdefault(entidad_id, {})[cuenta] = None
+            self._meses_cuenta.setdefault(clave, {})[mes] = None
+            return
+
+        # Retirada: limpiar las entradas que se quedan sin apuntes
+        if self._por_mes[(entidad_id, cuenta, mes)][2] == 0:
+            del self._por_mes[(entidad_id, cuenta, mes)]
+            self._meses_cuenta[clave].pop(mes, None)
+        if self._por_cuenta[clave][2] == 0:
+            del self._por_cuenta[clave]
+            del self._meses_cuenta[clave]
+            del self._cuentas[entidad_id][cuenta]
+
+    # -------------------------------------------------
+    # Consultas
+    # -------------------------------------------------
+
+    def cuentas(self, entidad_id: int) -> List[str]:
+        """Cuentas con movimientos de la entidad, ordenadas"""
+        return sorted(self._cuentas.get(entidad_id, {}))
+
+    def num_cuentas(self, entidad_id: int) -> int:
+        """Número de cuentas con movimientos"""
+        return len(self._cuentas.get(entidad_id, {}))
+
+    def num_apuntes(self, entidad_id: int) -> int:
+        """Número de apuntes contabilizados de la entidad"""
+        return self._num_apuntes.get(entidad_id, 0)
+
+    def totales_cuenta(self, entidad_id: int, cuenta: str,
+                       mes: Optional[str] = None) -> Tuple[float, float]:
+        """
+        Total debe y haber de una cuenta, en euros.
+
+        Args:
+            entidad_id: Entidad
+            cuenta: Código de cuenta
+            mes: 'AAAA-MM' para limitar al mes; None para todo el histórico
+
+        Returns:
+            Tupla (total_debe, total_haber)
+        """
+        if mes is None:
+            acumulado = self._por_cuenta.get((entidad_id, cuenta))
+        else:
+            acumulado = self._por_mes.get((entidad_id, cuenta, mes))
+        if not acumulado:
+            return 0.0, 0.0
+        return acumulado[0] / 100, acumulado[1] / 100
+
+    def totales_periodo(self, entidad_id: int, cuenta: str,
+                        desde_mes: str, hasta_mes: str) -> Tuple[float, float]:
+        """Total debe y haber de una cuenta entre dos meses 'AAAA-MM' (incluidos)"""
+        debe = haber = 0
+        for mes in self._meses_cuenta.get((entidad_id, cuenta), {}):
+            if desde_mes <= mes <= hasta_mes:
+                acumulado = self._por_mes[(entidad_id, cuenta, mes)]
+                debe += acumulado[0]
+                haber += acumulado[1]
+        return debe / 100, haber / 100
+
+    def saldo(self, entidad_id: int, cuenta: str, mes: Optional[str] = None) -> float:
+        """Saldo (debe - haber) de una cuenta, en euros"""
+        debe, haber = self.totales_cuenta(entidad_id, cuenta, mes)
+        return round(debe - haber, 2)
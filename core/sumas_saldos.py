@@ -0,0 +1,179 @@
+"""
+Balance de sumas y saldos con agregación por niveles del PGC
+
+Los códigos de cuenta forman un árbol de prefijos: grupo (1 dígito),
+subgrupo (2), cuenta (3), subcuenta (4) y, debajo, las cuentas auxiliares de
+más dígitos (4300001 cuelga de 4300). El índice de prefijos resuelve una vez
+los ascendientes de cada código, y el balance suma cada apunte en su cuenta y
+en todos sus ascendientes al contabilizarlo (y lo resta al retirarlo), de modo
+que cualquier nivel del balance se lee directamente sin agregar apuntes.
+
+Los acumulados son por (entidad, ejercicio).
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+from core.contabilizador import ejercicio_de
+
+
+# Niveles del PGC por número de dígitos
+NIVELES = {1: 'Grupo', 2: 'Subgrupo', 3: 'Cuenta', 4: 'Subcuenta'}
+NIVEL_AUXILIAR = 5          # cualquier código de más de 4 dígitos
+
+
+def nivel_de(codigo: str) -> int:
+    """Nivel PGC de un código (1-4; 5 para auxiliares de más dígitos)"""
+    return min(len(codigo), NIVEL_AUXILIAR)
+
+
+class IndicePrefijos:
+    """
+    Ascendientes de cada código de cuenta en el árbol del PGC, resueltos una
+    sola vez por código.
+
+        IndicePrefijos().ascendientes('4751')     # ('4', '47', '475')
+        IndicePrefijos().ascendientes('4300001')  # ('4', '43', '430', '4300')
+    """
+
+    def __init__(self):
+        self._ascendientes: Dict[str, Tuple[str, ...]] = {}
+
+    def ascendientes(self, codigo: str) -> Tuple[str, ...]:
+        resultado = self._ascendientes.get(codigo)
+        if resultado is None:
+            resultado = tuple(codigo[:n] for n in NIVELES if n < len(codigo))
+            self._ascendientes[codigo] = resultado
+        return resultado
+
+    def padre(self, codigo: str) -> str:
+        """Nodo padre ('' para los grupos)"""
+        ascendientes = self.ascendientes(codigo)
+        return ascendientes[-1] if ascendientes else ''
+
+
+@dataclass
+class FilaBalance:
+    """Una fila del balance (importes en céntimos)"""
+    codigo: str
+    nivel: int
+    debe: int
+    haber: int
+    apuntes: int
+    tiene_desglose: bool
+
+    @property
+    def saldo(self) -> int:
+        return self.debe - self.haber
+
+
+class BalanceSumasSaldos:
+    """
+    Sumas y saldos de todos los niveles del PGC, mantenidos de forma incremental.
+
+    Uso:
+        balance = BalanceSumasSaldos()
+        libro.suscribir(balance)
+
+        balance.filas(1, 2026, nivel_maximo=3)     # grupos, subgrupos y cuentas
+        balance.filas(1, 2026, raiz='47')          # desglose del subgrupo 47
+        balance.nodo(1, 2026, '475')               # incluye 4750, 4751...
+    """
+
+    def __init__(self, indice: Optional[IndicePrefijos] = None):
+        self.indice = indice or IndicePrefijos()
+        # (entidad, ejercicio) -> código -> [debe, haber, apuntes] en céntimos
+        self._nodos: Dict[Tuple[int, int], Dict[str, List[int]]] = {}
+        # (entidad, ejercicio) -> código padre ('' = raíz) -> códigos hijos
+        self._hijos: Dict[Tuple[int, int], Dict[str, Set[str]]] = {}
+
+    # -------------------------------------------------
+    # Observador del LibroAsientos
+    # -------------------------------------------------
+
+    def asiento_contabilizado(self, asiento: dict) -> None:
+        self._aplicar(asiento, 1)
+
+    def asiento_retirado(self, asiento: dict) -> None:
+        self._aplicar(asiento, -1)
+
+    def _aplicar(self, asiento: dict, signo: int) -> None:
+        clave = (asiento['entidad_id'], ejercicio_de(asiento['fecha']))
+        nodos = self._nodos.setdefault(clave, {})
+        hijos = self._hijos.setdefault(clave, {})
+
+        for apunte in asiento['apuntes']:
+            cuenta = str(apunte['cuenta'])
+            debe = signo * apunte['debe_centimos']
+            haber = signo * apunte['haber_centimos']
+            padre = ''
+            for codigo in self.indice.ascendientes(cuenta) + (cuenta,):
+                acumulado = nodos.get(codigo)
+                if acumulado is None:
+                    acumulado = nodos[codigo] = [0, 0, 0]
+                    hijos.setdefault(padre, set()).add(codigo)
+                acumulado[0] += debe
+                acumulado[1] += haber
+                acumulado[2] += signo
+                if acumulado[2] == 0:
+                    # Sin apuntes por debajo: se retira el nodo del árbol
+                    del nodos[codigo]
+                    hijos[padre].discard(codigo)
+                padre = codigo
+
+    # -------------------------------------------------
+    # Consultas
+    # -------------------------------------------------
+
+    def nodo(self, entidad_id: int, ejercicio: int, codigo: str) -> Tuple[int, int]:
+        """(debe, haber) en céntimos de un código, con todo lo que cuelga de él"""
+        acumulado = self._nodos.get((entidad_id, ejercicio), {}).get(codigo)
+        return (acumulado[0], acumulado[1]) if acumulado else (0, 0)
+
+    def hijos(self, entidad_id: int, ejercicio: int, codigo: str = '') -> List[str]:
+        """Códigos que cuelgan directamente de un nodo ('' = grupos), ordenados"""
+        return sorted(self._hijos.get((entidad_id, ejercicio), {}).get(codigo, ()))
+
+    def totales(self, entidad_id: int, ejercicio: int) -> Tuple[int, int]:
+        """Total debe y haber del ejercicio (suma de los grupos), en céntimos"""
+        nodos = self._nodos.get((entidad_id, ejercicio), {})
+        debe = haber = 0
+        for grupo in self.hijos(entidad_id, ejercicio):
+            debe += nodos[grupo][0]
+            haber += nodos[grupo][1]
+        return debe, haber
+
+    def filas(self, entidad_id: int, ejercicio: int, nivel_maximo: int = NIVEL_AUXILIAR,
+              raiz: str = '') -> List[FilaBalance]:
+        """
+        Filas del balance en orden jerárquico (cada nodo seguido de su desglose).
+
+        Args:
+            entidad_id: Entidad
+            ejercicio: Año
+            nivel_maximo: Nivel más detallado a mostrar (1 = solo grupos)
+            raiz: Código cuyo desglose se quiere ('' = balance completo); la
+                propia raíz encabeza las filas
+        """
+        clave = (entidad_id, ejercicio)
+        nodos = self._nodos.get(clave, {})
+        hijos = self._hijos.get(clave, {})
+        filas: List[FilaBalance] = []
+
+        def visitar(codigo: str) -> None:
+            acumulado = nodos[codigo]
+            nivel = nivel_de(codigo)
+            descendientes = hijos.get(codigo)
+            filas.append(FilaBalance(codigo, nivel, acumulado[0], acumulado[1], acumulado[2],
+                                     bool(descendientes)))
+            if descendientes and nivel < nivel_maximo:
+                for hijo in sorted(descendientes):
+                    visitar(hijo)
+
+        if raiz:
+            if raiz in nodos:
+                visitar(raiz)
+        else:
+            for grupo in sorted(hijos.get('', ())):
+                visitar(grupo)
+        return filas
@@ -0,0 +1,113 @@
+"""
+Caché de vistas derivadas entre reruns de Streamlit
+
+Streamlit vuelve a ejecutar todo el script en cada cambio de un widget. Las
+vistas que solo dependen del libro (la página del Diario, el Mayor de una
+cuenta, el balance, las tablas de los modelos y de recibos) se guardan con la
+clave (vista, entidad, versión, parámetros del filtro): mientras la versión
+de la entidad no cambie, el DataFrame se reutiliza sin recalcularlo.
+
+La versión la da quien conoce los cambios: ``LibroAsientos.version`` para los
+asientos y ``PersistenciaContable.version_recibos`` para los recibos (o una
+tupla de versiones si la vista depende de varios datos, p. ej. también de los
+terceros). Al
+pedir una vista con una versión nueva se descartan sus entradas de versiones
+anteriores de la misma entidad; además hay un máximo de entradas con
+expulsión LRU.
+
+Uso:
+    vistas = CacheVistas(max_entradas=128)
+    df = vistas.obtener('mayor', entidad_id, libro.version(entidad_id), (cuenta,),
+                        lambda: construir_mayor(entidad_id, cuenta))
+    vistas.como_dataframe()      # aciertos y fallos por vista
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+import pandas as pd
+
+
+@dataclass
+class EstadisticasVista:
+    aciertos: int = 0
+    fallos: int = 0
+    invalidadas: int = 0        # entradas descartadas por una versión nueva
+    expulsiones: int = 0        # entradas descartadas por el máximo (LRU)
+
+    @property
+    def tasa_aciertos(self) -> float:
+        consultas = self.aciertos + self.fallos
+        return self.aciertos / consultas if consultas else 0.0
+
+
+class CacheVistas:
+    """
+    Vistas calculadas por (vista, entidad, versión, parámetros), con LRU.
+
+    No es segura para hilos: cada sesión de Streamlit tiene la suya.
+    """
+
+    def __init__(self, max_entradas: int = 128):
+        self.max_entradas = max_entradas
+        self.estadisticas: Dict[str, EstadisticasVista] = {}
+        # (vista, entidad, versión, parámetros) -> valor
+        self._entradas: 'OrderedDict[Tuple, Any]' = OrderedDict()
+        # (vista, entidad) -> última versión pedida
+        self._versiones: Dict[Tuple[str, int], Hashable] = {}
+
+    def obtener(self, vista: str, entidad_id: int, version: Hashable, parametros: Hashable,
+                calcular: Callable[[], Any]) -> Any:
+        """
+        Valor de la vista; si no está en caché se calcula y se guarda.
+
+        Args:
+            vista: Nombre de la vista ('diario', 'mayor', ...)
+            entidad_id: Entidad
+            version: Versión de los datos de la entidad de los que sale la vista
+            parametros: Filtros que afectan al resultado (hashables)
+            calcular: Función sin argumentos que construye el valor
+        """
+        estadisticas = self.estadisticas.setdefault(vista, EstadisticasVista())
+        if self._versiones.get((vista, entidad_id)) != version:
+            self._invalidar(vista, entidad_id, estadisticas)
+            self._versiones[(vista, entidad_id)] = version
+
+        clave = (vista, entidad_id, version, parametros)
+        if clave in self._entradas:
+            self._entradas.move_to_end(clave)
+            estadisticas.aciertos += 1
+            return self._entradas[clave]
+
+        estadisticas.fallos += 1
+        valor = calcular()
+        self._entradas[clave] = valor
+        while len(self._entradas) > self.max_entradas:
+            expulsada, _ = self._entradas.popitem(last=False)
+            self.estadisticas[expulsada[0]].expulsiones += 1
+        return valor
+
+    def _invalidar(self, vista: str, entidad_id: int, estadisticas: EstadisticasVista) -> None:
+        obsoletas = [c for c in self._entradas if c[0] == vista and c[1] == entidad_id]
+        for clave in obsoletas:
+            del self._entradas[clave]
+        estadisticas.invalidadas += len(obsoletas)
+
+    def vaciar(self) -> None:
+        """Descarta todas las entradas (las estadísticas se conservan)"""
+        self._entradas.clear()
+        self._versiones.clear()
+
+    def __len__(self) -> int:
+        return len(self._entradas)
+
+    def como_dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame([{
+            'Vista': vista,
+            'Aciertos': e.aciertos,
+            'Fallos': e.fallos,
+            'Tasa de aciertos': f"{e.tasa_aciertos:.0%}",
+            'Invalidadas': e.invalidadas,
+            'Expulsadas': e.expulsiones,
+        } for vista, e in sorted(self.estadisticas.items())])
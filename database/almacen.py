@@ -0,0 +1,628 @@
+"""
+Almacén persistente de la contabilidad (SQLite local o PostgreSQL)
+
+La URL se toma de DATABASE_URL; sin ella se usa un fichero SQLite local en
+modo WAL. Las escrituras de asientos se agrupan y se envían en lotes
+(executemany) dentro de una única transacción, y los asientos de cada entidad
+se cargan en memoria solo cuando se selecciona, página a página.
+
+El almacén es compartido por todas las sesiones. Los ids y los números de
+asiento se reservan en la tabla de contadores, dentro de una transacción de
+escritura, así que dos sesiones nunca reciben el mismo valor; los asientos y
+recibos nuevos se insertan sin borrar nada, y un id o número repetido hace
+fallar la escritura en lugar de sustituir la fila de otra sesión. Si una
+escritura falla, la sesión descarta sus cambios y vuelve a cargar la entidad;
+cuando el contador de números de una entidad avanza por otra sesión, también.
+"""
+
+import os
+from contextlib import contextmanager
+from datetime import date
+from typing import Dict, Iterator, List, Optional, Set
+
+from sqlalchemy import (
+    UniqueConstraint, create_engine, delete, event, func, insert, inspect, select, text, update,
+)
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from core.contabilizador import LibroAsientos, a_centimos
+from database.models import (
+    apuntes, asientos, contadores, entidades, metadata, presupuestos, propietarios, recibos,
+    terceros,
+)
+
+
+URL_POR_DEFECTO = 'sqlite:///contafacil.db'
+
+# Claves de la tabla de contadores
+CONTADOR_ASIENTOS = 'asientos'
+CONTADOR_RECIBOS = 'recibos'
+
+
+def contador_numeros(entidad_id: int) -> str:
+    """Clave del contador de números de asiento de una entidad"""
+    return f'numero:{entidad_id}'
+
+
+def url_base_datos() -> str:
+    """URL de la base de datos: DATABASE_URL o SQLite local"""
+    return os.environ.get('DATABASE_URL') or URL_POR_DEFECTO
+
+
+def _configurar_sqlite(conexion_dbapi, _registro) -> None:
+    """WAL para lecturas concurrentes con escritura, y claves foráneas activas"""
+    cursor = conexion_dbapi.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
+
+class ErrorPersistencia(RuntimeError):
+    """Cambios de la sesión que la base de datos no ha aceptado (ya descartados)"""
+
+
+def _trozos(lista: list, tamano: int) -> Iterator[list]:
+    for inicio in range(0, len(lista), tamano):
+        yield lista[inicio:inicio + tamano]
+
+
+def _fecha(valor) -> date:
+    return valor if isinstance(valor, date) else date.fromisoformat(str(valor)[:10])
+
+
+class AlmacenContable:
+    """
+    Acceso a la base de datos de entidades, terceros, asientos y recibos.
+
+    Uso:
+        almacen = AlmacenContable()                    # DATABASE_URL o SQLite
+        almacen.inicializar(ENTIDADES, TERCEROS)        # datos semilla si está vacía
+        primer_id = almacen.reservar(CONTADOR_ASIENTOS, 100)  # ids exclusivos de la sesión
+        almacen.guardar_asientos(nuevos)                # inserción por lotes
+        for pagina in almacen.paginas_asientos(1):      # carga perezosa
+            ...
+    """
+
+    TAMANO_LOTE = 1000
+    TAMANO_PAGINA = 5000
+
+    def __init__(self, url: Optional[str] = None):
+        self.url = url or url_base_datos()
+        self.engine = create_engine(self.url)
+        if self.engine.dialect.name == 'sqlite':
+            event.listen(self.engine, 'connect', _configurar_sqlite)
+        metadata.create_all(self.engine)
+        self._anadir_columnas_nuevas()
+        self._anadir_indices_nuevos()
+
+    def _anadir_columnas_nuevas(self) -> None:
+        """Añade a tablas ya existentes las columnas opcionales creadas después"""
+        inspector = inspect(self.engine)
+        with self.engine.begin() as conn:
+            for tabla in metadata.sorted_tables:
+                existentes = {c['name'] for c in inspector.get_columns(tabla.name)}
+                for columna in tabla.columns:
+                    if columna.name not in existentes and columna.nullable:
+                        tipo = columna.type.compile(dialect=self.engine.dialect)
+                        conn.execute(text(
+                            f'ALTER TABLE {tabla.name} ADD COLUMN {columna.name} {tipo}'
+                        ))
+
+    def _anadir_indices_nuevos(self) -> None:
+        """
+        Crea en tablas ya existentes las restricciones únicas e índices
+        definidos después (``create_all`` no toca las tablas que ya están).
+        Si los datos guardados ya tienen duplicados, la creación falla.
+        """
+        inspector = inspect(self.engine)
+        with self.engine.begin() as conn:
+            for tabla in metadata.sorted_tables:
+                unicas = {tuple(u['column_names'])
+                          for u in inspector.get_unique_constraints(tabla.name)}
+                unicas.update(tuple(i['column_names'])
+                              for i in inspector.get_indexes(tabla.name) if i['unique'])
+                for restriccion in tabla.constraints:
+                    columnas = tuple(c.name for c in restriccion.columns)
+                    if isinstance(restriccion, UniqueConstraint) and columnas not in unicas:
+                        conn.execute(text(
+                            f'CREATE UNIQUE INDEX IF NOT EXISTS {restriccion.name} '
+                            f'ON {tabla.name} ({", ".join(columnas)})'
+                        ))
+                for indice in tabla.indexes:
+                    indice.create(conn, checkfirst=True)
+
+    # -------------------------------------------------
+    # Entidades y terceros
+    # -------------------------------------------------
+
+    def inicializar(self, entidades_semilla: List[dict], terceros_semilla: List[dict],
+                    propietarios_semilla: Optional[List[dict]] = None,
+                    presupuestos_semilla: Optional[List[dict]] = None) -> None:
+        """Inserta los datos semilla en las tablas que estén vacías"""
+        with self.engine.begin() as conn:
+            for tabla, semilla in ((entidades, entidades_semilla),
+                                   (terceros, terceros_semilla),
+                                   (propietarios, propietarios_semilla),
+                                   (presupuestos, presupuestos_semilla)):
+                if semilla and not conn.execute(select(func.count()).select_from(tabla)).scalar():
+                    conn.execute(insert(tabla), semilla)
+
+    def cargar_entidades(self) -> List[dict]:
+        with self.engine.connect() as conn:
+            filas = conn.execute(select(entidades).order_by(entidades.c.id))
+            return [dict(fila._mapping) for fila in filas]
+
+    def cargar_terceros(self) -> List[dict]:
+        with self.engine.connect() as conn:
+            filas = conn.execute(select(terceros).order_by(terceros.c.id))
+            return [dict(fila._mapping) for fila in filas]
+
+    # -------------------------------------------------
+    # Comunidades: coeficientes y presupuestos
+    # -------------------------------------------------
+
+    def cargar_propietarios(self) -> List[dict]:
+        """Coeficientes de participación de cada propietario en su comunidad"""
+        with self.engine.connect() as conn:
+            filas = conn.execute(
+                select(propietarios).order_by(propietarios.c.entidad_id, propietarios.c.tercero_id)
+            )
+            return [dict(fila._mapping) for fila in filas]
+
+    def cargar_presupuestos(self, ejercicio: int) -> List[dict]:
+        """Conceptos presupuestados (cuotas y derramas) del ejercicio, importes en céntimos"""
+        with self.engine.connect() as conn:
+            filas = conn.execute(
+                select(presupuestos).where(presupuestos.c.ejercicio == ejercicio)
+                .order_by(presupuestos.c.entidad_id, presupuestos.c.id)
+            )
+            return [dict(fila._mapping) for fila in filas]
+
+    def guardar_presupuesto(self, presupuesto: dict) -> int:
+        """Da de alta un concepto presupuestado. Devuelve su id."""
+        with self.engine.begin() as conn:
+            resultado = conn.execute(insert(presupuestos), presupuesto)
+            return resultado.inserted_primary_key[0]
+
+    # -------------------------------------------------
+    # Contadores
+    # -------------------------------------------------
+
+    def reservar(self, clave: str, cantidad: int = 1) -> int:
+        """
+        Reserva ``cantidad`` valores consecutivos de un contador compartido.
+
+        El incremento se hace en una transacción de escritura (bloqueo de la
+        fila en PostgreSQL, de la base en SQLite): ninguna otra sesión puede
+        recibir los mismos valores.
+
+        Returns:
+            El primero de los valores reservados
+        """
+        try:
+            return self._reservar(clave, cantidad)
+        except IntegrityError:
+            # Otra sesión creó el contador a la vez: ya existe y se incrementa
+            return self._reservar(clave, cantidad)
+
+    def _reservar(self, clave: str, cantidad: int) -> int:
+        with self.engine.begin() as conn:
+            fila = contadores.c.clave == clave
+            if conn.execute(update(contadores).where(fila)
+                            .values(valor=contadores.c.valor + cantidad)).rowcount:
+                return conn.execute(select(contadores.c.valor).where(fila)).scalar() - cantidad + 1
+            ultimo = self._ultimo_valor(conn, clave)
+            conn.execute(insert(contadores), {'clave': clave, 'valor': ultimo + cantidad})
+            return ultimo + 1
+
+    def siguiente_valor(self, clave: str) -> int:
+        """Próximo valor del contador, sin reservarlo"""
+        with self.engine.connect() as conn:
+            valor = conn.execute(select(contadores.c.valor).where(contadores.c.clave == clave)).scalar()
+            return (self._ultimo_valor(conn, clave) if valor is None else valor) + 1
+
+    @staticmethod
+    def _ultimo_valor(conn, clave: str) -> int:
+        """Valor inicial de un contador aún sin fila (bases anteriores a la tabla)"""
+        if clave == CONTADOR_ASIENTOS:
+            consulta = select(func.max(asientos.c.id))
+        elif clave == CONTADOR_RECIBOS:
+            consulta = select(func.max(recibos.c.id))
+        else:
+            entidad_id = int(clave.split(':', 1)[1])
+            consulta = select(func.max(asientos.c.numero)).where(asientos.c.entidad_id == entidad_id)
+        return conn.execute(consulta).scalar() or 0
+
+    # -------------------------------------------------
+    # Asientos
+    # -------------------------------------------------
+
+    def guardar_asientos(self, nuevos: List[dict], reemplazados: List[dict] = (),
+                         eliminados: List[int] = (), recibos_nuevos: List[dict] = (),
+                         recibos_reemplazados: List[dict] = ()) -> None:
+        """
+        Escribe asientos y sus apuntes en lotes, en una sola transacción.
+
+        Args:
+            nuevos: Asientos que aún no están en la base; se insertan sin más y
+                un id o número ya usado hace fallar toda la transacción
+            reemplazados: Asientos ya guardados que han cambiado (se borran y se
+                vuelven a insertar)
+            eliminados: Ids de asientos guardados que se dan de baja
+            recibos_nuevos, recibos_reemplazados: Recibos que se escriben en la
+                misma transacción (los emitidos o conciliados con esos asientos)
+        """
+        if not (nuevos or reemplazados or eliminados or recibos_nuevos or recibos_reemplazados):
+            return
+        with self.engine.begin() as conn:
+            self._borrar_asientos(conn, list(eliminados) + [a['id'] for a in reemplazados])
+            for lote in _trozos(list(reemplazados) + list(nuevos), self.TAMANO_LOTE):
+                conn.execute(insert(asientos), [
+                    {
+                        'id': a['id'],
+                        'entidad_id': a['entidad_id'],
+                        'numero': a['numero'],
+                        'fecha': _fecha(a['fecha']),
+                        'ejercicio': a['ejercicio'],
+                        'concepto': a['concepto'][:250],
+                        'referencia': a.get('referencia'),
+                    }
+                    for a in lote
+                ])
+                conn.execute(insert(apuntes), [
+                    {
+                        'asiento_id': a['id'],
+                        'linea': linea,
+                        'entidad_id': a['entidad_id'],
+                        'fecha': _fecha(a['fecha']),
+                        'cuenta': apunte['cuenta'],
+                        'debe': apunte['debe_centimos'],
+                        'haber': apunte['haber_centimos'],
+                        'tercero_id': apunte.get('tercero_id'),
+                        'tipo_iva': apunte.get('tipo_iva'),
+                    }
+                    for a in lote
+                    for linea, apunte in enumerate(a['apuntes'], start=1)
+                ])
+            self._escribir_recibos(conn, recibos_nuevos, recibos_reemplazados)
+
+    def eliminar_asientos(self, ids: List[int]) -> None:
+        """Elimina asientos (y sus apuntes) por id"""
+        with self.engine.begin() as conn:
+            self._borrar_asientos(conn, ids)
+
+    def _borrar_asientos(self, conn, ids: List[int]) -> None:
+        for lote in _trozos(list(ids), self.TAMANO_LOTE):
+            conn.execute(delete(apuntes).where(apuntes.c.asiento_id.in_(lote)))
+            conn.execute(delete(asientos).where(asientos.c.id.in_(lote)))
+
+    def paginas_asientos(self, entidad_id: int,
+                         tamano: Optional[int] = None) -> Iterator[List[dict]]:
+        """
+        Recorre los asientos de una entidad por páginas (paginación por id).
+
+        Yields:
+            Listas de asientos con el mismo formato que usa LibroAsientos
+        """
+        tamano = tamano or self.TAMANO_PAGINA
+        ultimo_id = 0
+        with self.engine.connect() as conn:
+            while True:
+                cabeceras = conn.execute(
+                    select(asientos)
+                    .where(asientos.c.entidad_id == entidad_id, asientos.c.id > ultimo_id)
+                    .order_by(asientos.c.id)
+                    .limit(tamano)
+                ).all()
+                if not cabeceras:
+                    return
+                ultimo_id = cabeceras[-1].id
+
+                pagina = {
+                    fila.id: {
+                        'id': fila.id,
+                        'entidad_id': fila.entidad_id,
+                        'numero': fila.numero,
+                        'fecha': fila.fecha.isoformat(),
+                        'concepto': fila.concepto,
+                        'referencia': fila.referencia,
+                        'apuntes': [],
+                    }
+                    for fila in cabeceras
+                }
+                lineas = conn.execute(
+                    select(apuntes)
+                    .where(apuntes.c.entidad_id == entidad_id,
+                           apuntes.c.asiento_id.between(cabeceras[0].id, ultimo_id))
+                    .order_by(apuntes.c.asiento_id, apuntes.c.linea)
+                )
+                for linea in lineas:
+                    apunte = {'cuenta': linea.cuenta, 'debe': linea.debe / 100,
+                              'haber': linea.haber / 100, 'debe_centimos': linea.debe,
+                              'haber_centimos': linea.haber}
+                    if linea.tercero_id is not None:
+                        apunte['tercero_id'] = linea.tercero_id
+                    if linea.tipo_iva is not None:
+                        apunte['tipo_iva'] = linea.tipo_iva
+                    pagina[linea.asiento_id]['apuntes'].append(apunte)
+                yield list(pagina.values())
+
+    # -------------------------------------------------
+    # Recibos
+    # -------------------------------------------------
+
+    def guardar_recibos(self, nuevos: List[dict], reemplazados: List[dict] = ()) -> None:
+        """
+        Escribe recibos en lotes, en una transacción: los nuevos se insertan (un
+        id o número repetido hace fallar la escritura) y los ya guardados que han
+        cambiado se reemplazan.
+        """
+        if not (nuevos or reemplazados):
+            return
+        with self.engine.begin() as conn:
+            self._escribir_recibos(conn, nuevos, reemplazados)
+
+    def _escribir_recibos(self, conn, nuevos: List[dict], reemplazados: List[dict]) -> None:
+        for lote in _trozos([r['id'] for r in reemplazados], self.TAMANO_LOTE):
+            conn.execute(delete(recibos).where(recibos.c.id.in_(lote)))
+        for lote in _trozos(list(reemplazados) + list(nuevos), self.TAMANO_LOTE):
+            conn.execute(insert(recibos), [
+                {
+                    'id': r['id'],
+                    'entidad_id': r['entidad_id'],
+                    'numero': r['numero'],
+                    'tercero_id': r['tercero']['id'],
+                    'importe': a_centimos(r['importe']),
+                    'concepto': r['concepto'][:140],
+                    'fecha_emision': _fecha(r['fecha_emision']),
+                    'fecha_vencimiento': _fecha(r['fecha_vencimiento']),
+                    'estado': r['estado'],
+                    'metodo': r['metodo'],
+                }
+                for r in lote
+            ])
+
+    def cargar_recibos(self, entidad_id: int, terceros_por_id: Dict[int, dict]) -> List[dict]:
+        """Recibos de una entidad, con el tercero enlazado como en la sesión"""
+        with self.engine.connect() as conn:
+            filas = conn.execute(
+                select(recibos).where(recibos.c.entidad_id == entidad_id).order_by(recibos.c.id)
+            )
+            return [
+                {
+                    'id': fila.id,
+                    'entidad_id': fila.entidad_id,
+                    'numero': fila.numero,
+                    'tercero': terceros_por_id[fila.tercero_id],
+                    'importe': fila.importe / 100,
+                    'concepto': fila.concepto,
+                    'fecha_emision': fila.fecha_emision.isoformat(),
+                    'fecha_vencimiento': fila.fecha_vencimiento.isoformat(),
+                    'estado': fila.estado,
+                    'metodo': fila.metodo,
+                }
+                for fila in filas
+            ]
+
+
+class PersistenciaContable:
+    """
+    Enlaza el LibroAsientos y los recibos de la sesión con el almacén.
+
+    Se suscribe al libro como observador: acumula altas y bajas y las escribe
+    en un único lote al llamar a ``confirmar()``. ``cargar_entidad`` trae los
+    asientos y recibos de una entidad la primera vez que se necesita.
+
+    Es también el numerador del libro: los números de asiento se reservan en
+    la base de datos lote a lote, y los ids (asientos y recibos) por bloques de
+    ``BLOQUE_IDS`` que solo usa esta sesión. Solo se borran en la base los
+    asientos y recibos que la sesión cargó o ya escribió.
+
+    Si la base rechaza una escritura, los cambios pendientes se descartan, las
+    entidades afectadas se vuelven a cargar y ``confirmar`` lanza
+    ``ErrorPersistencia`` una sola vez. Una entidad ya cargada se vuelve a
+    cargar cuando su contador de números avanza por asientos de otra sesión.
+    """
+
+    BLOQUE_IDS = 1000
+
+    def __init__(self, almacen: AlmacenContable, libro: LibroAsientos, recibos_sesion: List[dict]):
+        self.almacen = almacen
+        self.libro = libro
+        self.recibos = recibos_sesion
+        self._pendientes: Dict[int, Optional[dict]] = {}
+        self._entidades_pendientes: Set[int] = set()   # con cambios sin escribir
+        self._guardados: Set[int] = set()              # asientos cargados o ya escritos
+        self._recibos_guardados: Set[int] = set()
+        self._bloques_ids: Dict[str, List[int]] = {}    # contador -> [siguiente, límite)
+        self._cargando = False
+        self._entidades_cargadas: Set[int] = set()
+        # entidad -> último número de asiento conocido por la sesión
+        self._numeros_vistos: Dict[int, int] = {}
+        self._versiones_recibos: Dict[int, int] = {}
+        self._observadores_recibos: List = []
+        self._terceros_por_id: Dict[int, dict] = {}    # los de la última carga
+
+        libro.usar_numerador(self)
+
+    # -------------------------------------------------
+    # Numerador del LibroAsientos
+    # -------------------------------------------------
+
+    def reservar_ids(self, cantidad: int) -> int:
+        return self._reservar_ids(CONTADOR_ASIENTOS, cantidad)
+
+    def reservar_numeros(self, entidad_id: int, cantidad: int) -> int:
+        primero = self.almacen.reservar(contador_numeros(entidad_id), cantidad)
+        # Si otra sesión ha numerado asientos en medio, lo visto no avanza y la
+        # entidad se recargará
+        if self._numeros_vistos.get(entidad_id) == primero - 1:
+            self._numeros_vistos[entidad_id] = primero + cantidad - 1
+        return primero
+
+    def siguiente_numero(self, entidad_id: int) -> int:
+        return self.almacen.siguiente_valor(contador_numeros(entidad_id))
+
+    def _reservar_ids(self, clave: str, cantidad: int) -> int:
+        bloque = self._bloques_ids.get(clave)
+        if bloque is None or bloque[0] + cantidad > bloque[1]:
+            tamano = max(cantidad, self.BLOQUE_IDS)
+            primero = self.almacen.reservar(clave, tamano)
+            bloque = self._bloques_ids[clave] = [primero, primero + tamano]
+        primero = bloque[0]
+        bloque[0] += cantidad
+        return primero
+
+    # -------------------------------------------------
+    # Observador del LibroAsientos
+    # -------------------------------------------------
+
+    def asiento_contabilizado(self, asiento: dict) -> None:
+        if self._cargando:
+            self._guardados.add(asiento['id'])
+        else:
+            self._pendientes[asiento['id']] = asiento
+            self._entidades_pendientes.add(asiento['entidad_id'])
+
+    def asiento_retirado(self, asiento: dict) -> None:
+        if not self._cargando:
+            self._pendientes[asiento['id']] = None
+            self._entidades_pendientes.add(asiento['entidad_id'])
+
+    def confirmar(self, recibos: List[dict] = ()) -> int:
+        """
+        Escribe en lote los cambios pendientes. Devuelve cuántos asientos escribió.
+
+        Args:
+            recibos: Recibos nuevos o modificados que se escriben en la misma
+                transacción que los asientos (o se guardan todos o ninguno)
+
+        Raises:
+            ErrorPersistencia: La base rechazó la escritura; los cambios se han
+                descartado y las entidades afectadas se han vuelto a cargar
+        """
+        if not (self._pendientes or recibos):
+            return 0
+        nuevos, reemplazados, bajas = [], [], []
+        for asiento_id, asiento in self._pendientes.items():
+            if asiento is None:
+                if asiento_id in self._guardados:
+                    bajas.append(asiento_id)
+            elif asiento_id in self._guardados:
+                reemplazados.append(asiento)
+            else:
+                nuevos.append(asiento)
+        entidades = self._entidades_pendientes
+        self._pendientes, self._entidades_pendientes = {}, set()
+        try:
+            self.almacen.guardar_asientos(
+                nuevos, reemplazados, bajas,
+                [r for r in recibos if r['id'] not in self._recibos_guardados],
+                [r for r in recibos if r['id'] in self._recibos_guardados],
+            )
+        except SQLAlchemyError as e:
+            for entidad_id in entidades:
+                self._recargar_asientos(entidad_id)
+            for entidad_id in {r['entidad_id'] for r in recibos}:
+                self._cargar_recibos(entidad_id, self._terceros_por_id)
+            raise ErrorPersistencia(
+                f"No se han podido guardar {len(nuevos) + len(reemplazados) + len(bajas)} "
+                f"asiento(s) y {len(recibos)} recibo(s): {type(e).__name__}. Se han "
+                "descartado y se muestra la contabilidad guardada."
+            ) from e
+        self._guardados.update(a['id'] for a in nuevos)
+        self._guardados.difference_update(bajas)
+        if recibos:
+            self._recibos_guardados_en_sesion(recibos)
+        return len(nuevos) + len(reemplazados) + len(bajas)
+
+    # -------------------------------------------------
+    # Carga perezosa
+    # -------------------------------------------------
+
+    @contextmanager
+    def _modo_carga(self):
+        self._cargando = True
+        try:
+            yield
+        finally:
+            self._cargando = False
+
+    def cargar_entidad(self, entidad_id: int, terceros_por_id: Dict[int, dict]) -> None:
+        """
+        Carga los asientos y recibos de la entidad la primera vez, y de nuevo
+        cuando otra sesión ha contabilizado en ella (su contador de números ha
+        avanzado) y esta no tiene cambios sin escribir.
+        """
+        self._terceros_por_id = terceros_por_id
+        if entidad_id in self._entidades_cargadas:
+            if entidad_id in self._entidades_pendientes or not self._desactualizada(entidad_id):
+                return
+            self._recargar_asientos(entidad_id)
+        else:
+            self._cargar_asientos(entidad_id)
+        self._cargar_recibos(entidad_id, terceros_por_id)
+        self._entidades_cargadas.add(entidad_id)
+
+    def _desactualizada(self, entidad_id: int) -> bool:
+        ultimo = self.almacen.siguiente_valor(contador_numeros(entidad_id)) - 1
+        return self._numeros_vistos.get(entidad_id) != ultimo
+
+    def _cargar_asientos(self, entidad_id: int) -> None:
+        # El contador se lee antes: lo que se numere durante la carga provoca otra
+        self._numeros_vistos[entidad_id] = self.almacen.siguiente_valor(contador_numeros(entidad_id)) - 1
+        with self._modo_carga():
+            for pagina in self.almacen.paginas_asientos(entidad_id):
+                for asiento in pagina:
+                    self.libro.cargar(asiento)
+
+    def _recargar_asientos(self, entidad_id: int) -> None:
+        """Sustituye los asientos de la entidad en el libro por los guardados"""
+        with self._modo_carga():
+            for asiento in list(self.libro.asientos_entidad(entidad_id)):
+                self.libro.eliminar(asiento['id'])
+                self._guardados.discard(asiento['id'])
+        self._cargar_asientos(entidad_id)
+
+    def _cargar_recibos(self, entidad_id: int, terceros_por_id: Dict[int, dict]) -> None:
+        cargados = self.almacen.cargar_recibos(entidad_id, terceros_por_id)
+        self._recibos_guardados.update(r['id'] for r in cargados)
+        # La lista de la sesión se actualiza en su sitio (la comparte la app)
+        self.recibos[:] = [r for r in self.recibos if r['entidad_id'] != entidad_id] + cargados
+        self._notificar_recibos(cargados)
+        self._cambiar_version_recibos(entidad_id)
+
+    # -------------------------------------------------
+    # Recibos
+    # -------------------------------------------------
+
+    def nuevo_id_recibo(self) -> int:
+        """Id global de recibo, de un bloque reservado en la base para esta sesión"""
+        return self._reservar_ids(CONTADOR_RECIBOS, 1)
+
+    def suscribir_recibos(self, observador) -> None:
+        """``observador.recibos_guardados(lista)`` tras cada carga o guardado de recibos"""
+        self._observadores_recibos.append(observador)
+
+    def _notificar_recibos(self, lista: List[dict]) -> None:
+        for observador in self._observadores_recibos:
+            observador.recibos_guardados(lista)
+
+    def guardar_recibos(self, lista: List[dict]) -> None:
+        self.almacen.guardar_recibos([r for r in lista if r['id'] not in self._recibos_guardados],
+                                     [r for r in lista if r['id'] in self._recibos_guardados])
+        self._recibos_guardados_en_sesion(lista)
+
+    def _recibos_guardados_en_sesion(self, lista: List[dict]) -> None:
+        self._recibos_guardados.update(r['id'] for r in lista)
+        self._notificar_recibos(lista)
+        for entidad_id in {r['entidad_id'] for r in lista}:
+            self._cambiar_version_recibos(entidad_id)
+
+    def _cambiar_version_recibos(self, entidad_id: int) -> None:
+        self._versiones_recibos[entidad_id] = self._versiones_recibos.get(entidad_id, 0) + 1
+
+    def version_recibos(self, entidad_id: int) -> int:
+        """Contador que cambia cada vez que se cargan o guardan recibos de la entidad"""
+        return self._versiones_recibos.get(entidad_id, 0)
@@ -0,0 +1,113 @@
+"""
+Modelos de base de datos (SQLAlchemy Core)
+
+El mismo esquema sirve para SQLite (por defecto en local) y PostgreSQL
+(DATABASE_URL). Los importes se guardan en céntimos enteros.
+"""
+
+from sqlalchemy import (
+    BigInteger, Column, Date, ForeignKey, Index, Integer, MetaData, Numeric, SmallInteger,
+    String, Table, UniqueConstraint,
+)
+
+
+metadata = MetaData()
+
+
+entidades = Table(
+    'entidades', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('nif', String(9), nullable=False, unique=True),
+    Column('razon_social', String(200), nullable=False),
+    Column('tipo', String(40), nullable=False),
+    Column('regimen_iva', String(40), nullable=False),
+    Column('plan_contable', String(20), nullable=False),
+)
+
+terceros = Table(
+    'terceros', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('nif', String(9), nullable=False, index=True),
+    Column('nombre', String(200), nullable=False),
+    Column('tipo', String(20), nullable=False),
+    Column('iban', String(34)),
+)
+
+asientos = Table(
+    'asientos', metadata,
+    Column('id', BigInteger, primary_key=True, autoincrement=False),
+    Column('entidad_id', Integer, ForeignKey('entidades.id'), nullable=False),
+    Column('numero', Integer, nullable=False),
+    Column('fecha', Date, nullable=False),
+    Column('ejercicio', SmallInteger, nullable=False),
+    Column('concepto', String(250), nullable=False),
+    # documento de origen (NIF/número de factura) para detectar duplicados
+    Column('referencia', String(60)),
+    UniqueConstraint('entidad_id', 'numero', name='uq_asientos_entidad_numero'),
+    Index('ix_asientos_entidad_fecha', 'entidad_id', 'fecha'),
+    Index('ix_asientos_entidad_ejercicio', 'entidad_id', 'ejercicio'),
+    Index('ix_asientos_entidad_referencia', 'entidad_id', 'referencia'),
+)
+
+apuntes = Table(
+    'apuntes', metadata,
+    Column('asiento_id', BigInteger, ForeignKey('asientos.id', ondelete='CASCADE'),
+           primary_key=True),
+    Column('linea', SmallInteger, primary_key=True),
+    # entidad y fecha duplicadas del asiento para indexar el Mayor sin join
+    Column('entidad_id', Integer, nullable=False),
+    Column('fecha', Date, nullable=False),
+    Column('cuenta', String(12), nullable=False),
+    Column('debe', BigInteger, nullable=False, default=0),
+    Column('haber', BigInteger, nullable=False, default=0),
+    Column('tercero_id', Integer),
+    Column('tipo_iva', SmallInteger),
+    Index('ix_apuntes_entidad_cuenta_fecha', 'entidad_id', 'cuenta', 'fecha'),
+    Index('ix_apuntes_entidad_fecha', 'entidad_id', 'fecha'),
+)
+
+recibos = Table(
+    'recibos', metadata,
+    Column('id', BigInteger, primary_key=True, autoincrement=False),
+    Column('entidad_id', Integer, ForeignKey('entidades.id'), nullable=False),
+    Column('numero', String(40), nullable=False),
+    Column('tercero_id', Integer, ForeignKey('terceros.id'), nullable=False),
+    Column('importe', BigInteger, nullable=False),
+    Column('concepto', String(140), nullable=False),
+    Column('fecha_emision', Date, nullable=False),
+    Column('fecha_vencimiento', Date, nullable=False),
+    Column('estado', String(20), nullable=False),
+    Column('metodo', String(20), nullable=False),
+    # el número de los recibos de cuotas codifica periodo, concepto y propietario
+    UniqueConstraint('entidad_id', 'numero', name='uq_recibos_entidad_numero'),
+    Index('ix_recibos_entidad_estado', 'entidad_id', 'estado'),
+)
+
+propietarios = Table(
+    'propietarios', metadata,
+    Column('entidad_id', Integer, ForeignKey('entidades.id'), primary_key=True),
+    Column('tercero_id', Integer, ForeignKey('terceros.id'), primary_key=True),
+    Column('coeficiente', Numeric(9, 4), nullable=False),   # % de participación
+)
+
+presupuestos = Table(
+    'presupuestos', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('entidad_id', Integer, ForeignKey('entidades.id'), nullable=False),
+    Column('ejercicio', SmallInteger, nullable=False),
+    Column('concepto', String(100), nullable=False),
+    Column('tipo', String(20), nullable=False),             # ordinaria / derrama
+    Column('importe', BigInteger, nullable=False),          # total a repartir
+    Column('mes_inicio', SmallInteger, nullable=False),
+    Column('num_cuotas', SmallInteger, nullable=False),
+    Index('ix_presupuestos_entidad_ejercicio', 'entidad_id', 'ejercicio'),
+)
+
+# Últimos valores asignados, compartidos por todas las sesiones: 'asientos' e
+# 'recibos' (ids globales) y 'numero:<entidad_id>' (número de asiento).
+# Se incrementan dentro de la transacción que los reserva.
+contadores = Table(
+    'contadores', metadata,
+    Column('clave', String(40), primary_key=True),
+    Column('valor', BigInteger, nullable=False),
+)
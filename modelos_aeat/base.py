@@ -0,0 +1,214 @@
+"""
+Utilidades comunes a los modelos fiscales AEAT
+
+Periodos de liquidación (1T-4T, meses 01-12 y anual 0A), importes en céntimos
+y escritura de ficheros de registros de longitud fija a partir de diseños
+declarativos (posición, longitud y tipo de cada campo, como en el BOE).
+"""
+
+import unicodedata
+from calendar import monthrange
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal
+from typing import BinaryIO, Dict, List, Optional, Sequence, Tuple
+
+
+TRIMESTRES = {'1T': (1, 3), '2T': (4, 6), '3T': (7, 9), '4T': (10, 12)}
+PERIODO_ANUAL = '0A'
+
+
+def rango_periodo(ejercicio: int, periodo: str) -> Tuple[date, date]:
+    """
+    Fechas inicial y final (incluidas) de un periodo de liquidación.
+
+    Args:
+        ejercicio: Año
+        periodo: '1T'-'4T', '01'-'12' o '0A'
+
+    Returns:
+        Tupla (desde, hasta)
+    """
+    if periodo == PERIODO_ANUAL:
+        return date(ejercicio, 1, 1), date(ejercicio, 12, 31)
+    if periodo in TRIMESTRES:
+        mes_inicio, mes_fin = TRIMESTRES[periodo]
+    else:
+        mes_inicio = mes_fin = int(periodo)
+        if not 1 <= mes_inicio <= 12:
+            raise ValueError(f"Periodo no válido: {periodo}")
+    ultimo_dia = monthrange(ejercicio, mes_fin)[1]
+    return date(ejercicio, mes_inicio, 1), date(ejercicio, mes_fin, ultimo_dia)
+
+
+def periodos_de_fecha(fecha) -> List[str]:
+    """Periodos (trimestre, mes y anual) que contienen una fecha ISO o date"""
+    mes = int(str(fecha)[5:7])
+    trimestre = f"{(mes - 1) // 3 + 1}T"
+    return [trimestre, f"{mes:02d}", PERIODO_ANUAL]
+
+
+def euros(centimos: int) -> Decimal:
+    """Convierte céntimos enteros a euros (Decimal exacto)"""
+    return Decimal(int(centimos)) / 100
+
+
+# -------------------------------------------------
+# Registros de longitud fija
+# -------------------------------------------------
+
+# Tipos de campo de los diseños de registro de la AEAT
+ALFANUMERICO = 'An'   # ajustado a la izquierda, relleno con blancos, en mayúsculas
+NUMERICO = 'Num'      # ajustado a la derecha, relleno con ceros
+IMPORTE = 'Imp'       # 'N' si es negativo o blanco, seguido de los céntimos con ceros
+
+
+# Letras acentuadas (Latin-1 y Latin Extended-A) a su letra base, salvo Ñ y Ç
+_SIN_TILDES = {
+    codigo: unicodedata.normalize('NFKD', chr(codigo))[0]
+    for codigo in range(0xC0, 0x180)
+    if chr(codigo) not in 'ÑÇ' and len(unicodedata.normalize('NFKD', chr(codigo))) > 1
+}
+
+
+def texto_aeat(valor) -> str:
+    """Texto en mayúsculas sin tildes (se conservan Ñ y Ç) para los ficheros AEAT"""
+    return str(valor or '').upper().translate(_SIN_TILDES)
+
+
+@dataclass(frozen=True)
+class Campo:
+    """Campo de un diseño de registro (posiciones desde 1, como en el BOE)"""
+    nombre: str
+    posicion: int
+    longitud: int
+    tipo: str = ALFANUMERICO
+    fijo: Optional[str] = None      # valor constante del campo
+
+    def formatear(self, valor) -> str:
+        if self.fijo is not None:
+            valor = self.fijo
+        if self.tipo == ALFANUMERICO:
+            return texto_aeat(valor)[:self.longitud].ljust(self.longitud)
+        if self.tipo == NUMERICO:
+            numero = str(int(valor or 0))
+            if len(numero) > self.longitud:
+                raise ValueError(f"{self.nombre}: {numero} no cabe en {self.longitud} posiciones")
+            return numero.rjust(self.longitud, '0')
+        if self.tipo == IMPORTE:
+            centimos = int(valor or 0)
+            digitos = str(abs(centimos)).rjust(self.longitud - 1, '0')
+            if len(digitos) > self.longitud - 1:
+                raise ValueError(f"{self.nombre}: importe {centimos} fuera de rango")
+            return ('N' if centimos < 0 else ' ') + digitos
+        raise ValueError(f"Tipo de campo desconocido: {self.tipo}")
+
+
+class DisenoRegistro:
+    """
+    Diseño de un registro de longitud fija.
+
+    Los huecos entre campos se rellenan con blancos. Los campos se validan una
+    vez al crear el diseño (sin solapes y dentro de la longitud).
+
+    Uso:
+        DISENO = DisenoRegistro(500, [
+            Campo('tipo', 1, 1, fijo='2'),
+            Campo('modelo', 2, 3, fijo='347'),
+            Campo('ejercicio', 5, 4, NUMERICO),
+            Campo('importe', 83, 16, IMPORTE),
+        ])
+        linea = DISENO.formatear({'ejercicio': 2026, 'importe': 1234567})
+    """
+
+    def __init__(self, longitud: int, campos: Sequence[Campo]):
+        self.longitud = longitud
+        self.campos = sorted(campos, key=lambda c: c.posicion)
+        fin_anterior = 1
+        for campo in self.campos:
+            if campo.posicion < fin_anterior:
+                raise ValueError(f"El campo {campo.nombre} se solapa con el anterior")
+            fin_anterior = campo.posicion + campo.longitud
+        if fin_anterior - 1 > longitud:
+            raise ValueError(f"Los campos ocupan más de {longitud} posiciones")
+
+        # (blancos previos, campo, texto si el valor falta) en orden de posición
+        self._plantilla = []
+        actual = 1
+        for campo in self.campos:
+            self._plantilla.append((' ' * (campo.posicion - actual), campo, campo.formatear(None)))
+            actual = campo.posicion + campo.longitud
+        self._final = ' ' * (longitud + 1 - actual)
+
+    def formatear(self, valores: Dict[str, object]) -> str:
+        partes = []
+        for hueco, campo, vacio in self._plantilla:
+            partes.append(hueco)
+            valor = valores.get(campo.nombre)
+            partes.append(vacio if valor is None else campo.formatear(valor))
+        partes.append(self._final)
+        return ''.join(partes)
+
+
+class EscritorRegistros:
+    """
+    Escritura con búfer de registros de longitud fija (ISO-8859-1, fin de línea CRLF).
+
+    Uso:
+        escritor = EscritorRegistros(fichero_binario)
+        escritor.escribir(DISENO_TIPO_1, valores_declarante)
+        for valores in declarados:
+            escritor.escribir(DISENO_TIPO_2, valores)
+        escritor.vaciar()
+    """
+
+    FIN_LINEA = '\r\n'
+
+    def __init__(self, destino: BinaryIO, registros_bufer: int = 1000):
+        self.destino = destino
+        self.registros_bufer = registros_bufer
+        self.num_registros = 0
+        self._lineas: List[str] = []
+
+    def escribir(self, diseno: DisenoRegistro, valores: Dict[str, object]) -> None:
+        self._lineas.append(diseno.formatear(valores))
+        self.num_registros += 1
+        if len(self._lineas) >= self.registros_bufer:
+            self.vaciar()
+
+    def vaciar(self) -> None:
+        if self._lineas:
+            texto = self.FIN_LINEA.join(self._lineas) + self.FIN_LINEA
+            self.destino.write(texto.encode('iso-8859-1', errors='replace'))
+            self._lineas = []
+
+
+def diseno_autoliquidacion(modelo: str, casillas: Sequence[str],
+                           contadores: Sequence[str] = ()) -> DisenoRegistro:
+    """
+    Registro de una autoliquidación (303, 111, 115...): cabecera <T{modelo}0>,
+    ejercicio, periodo, NIF, razón social y tipo de declaración, seguidos de
+    las casillas en orden (importes de 17 posiciones; los contadores, como el
+    número de perceptores, numéricos de 15) y el cierre </T{modelo}>.
+
+    Los valores de las casillas se pasan con su número como nombre ('07', '71').
+    """
+    campos = [
+        Campo('inicio', 1, 6, fijo=f"<T{modelo}0"),
+        Campo('ejercicio', 7, 4, NUMERICO),
+        Campo('periodo', 11, 2),
+        Campo('nif', 13, 9),
+        Campo('razon_social', 22, 40),
+        Campo('tipo_declaracion', 62, 1),
+    ]
+    posicion = 63
+    for casilla in casillas:
+        if casilla in contadores:
+            campos.append(Campo(casilla, posicion, 15, NUMERICO))
+            posicion += 15
+        else:
+            campos.append(Campo(casilla, posicion, 17, IMPORTE))
+            posicion += 17
+    cierre = f"</T{modelo}>"
+    campos.append(Campo('fin', posicion, len(cierre), fijo=cierre))
+    return DisenoRegistro(posicion + len(cierre) - 1, campos)
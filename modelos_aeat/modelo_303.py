@@ -0,0 +1,191 @@
+"""
+Modelo 303 - IVA. Autoliquidación
+
+Motor de cálculo de una sola pasada: toma los apuntes de la entidad dentro del
+periodo (índice por fecha del almacén columnar) y obtiene todas las casillas a
+la vez, con bases y cuotas devengadas separadas por tipo de IVA (4/10/21).
+
+El tipo de cada apunte es el indicado en 'tipo_iva' al contabilizar; si falta,
+se deduce de la proporción cuota/base del propio asiento. Los asientos de
+regularización, cierre y apertura del ejercicio no son operaciones del periodo
+y no se computan.
+
+Los resultados se cachean por (entidad, ejercicio, periodo) y se invalidan
+cuando se contabiliza, modifica o elimina un asiento con fecha en ese periodo.
+
+El fichero de la autoliquidación se escribe con el diseño de registro común
+de las autoliquidaciones (modelos_aeat.base.diseno_autoliquidacion).
+"""
+
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import BinaryIO, Dict, Tuple
+
+import numpy as np
+
+from core.columnar import ApuntesColumnares, prefijo_cuentas
+from modelos_aeat.base import (
+    EscritorRegistros, diseno_autoliquidacion, euros, periodos_de_fecha, rango_periodo,
+)
+
+
+TIPOS_IVA = (4, 10, 21)
+
+# Casillas (base, cuota) del IVA devengado en régimen general por tipo
+CASILLAS_DEVENGADO = {4: ('01', '03'), 10: ('04', '06'), 21: ('07', '09')}
+
+DISENO_303 = diseno_autoliquidacion('303', [
+    '01', '03', '04', '06', '07', '09', '27', '28', '29', '45', '46', '64', '66', '69', '71',
+])
+
+
+@dataclass
+class Liquidacion303:
+    """Resultado del Modelo 303 para una entidad y periodo"""
+    entidad_id: int
+    ejercicio: int
+    periodo: str
+    casillas: Dict[str, int] = field(default_factory=dict)  # importes en céntimos
+    apuntes_analizados: int = 0
+
+    def importe(self, casilla: str) -> Decimal:
+        """Importe de una casilla en euros"""
+        return euros(self.casillas.get(casilla, 0))
+
+    @property
+    def resultado(self) -> Decimal:
+        """[71] Resultado de la liquidación"""
+        return self.importe('71')
+
+
+def _tipo_por_asiento(inverso: np.ndarray, num_asientos: int,
+                      bases: np.ndarray, cuotas: np.ndarray) -> np.ndarray:
+    """Tipo de IVA deducido de la proporción cuota/base de cada asiento"""
+    base = np.bincount(inverso, weights=bases, minlength=num_asientos).astype(np.float64)
+    cuota = np.bincount(inverso, weights=cuotas, minlength=num_asientos).astype(np.float64)
+    proporcion = np.divide(cuota * 100, base, out=np.zeros_like(base), where=base != 0)
+    candidatos = np.array((0,) + TIPOS_IVA)
+    mas_cercano = np.abs(proporcion[:, None] - candidatos[None, :]).argmin(axis=1)
+    return candidatos[mas_cercano]
+
+
+class Modelo303:
+    """
+    Motor de cálculo del Modelo 303 con caché por periodo.
+
+    Uso:
+        modelo_303 = Modelo303(apuntes)
+        libro.suscribir(modelo_303)
+
+        liquidacion = modelo_303.calcular(entidad_id=1, ejercicio=2026, periodo='1T')
+        liquidacion.importe('09')   # cuota devengada al 21%
+        liquidacion.resultado       # casilla 71
+    """
+
+    def __init__(self, apuntes: ApuntesColumnares):
+        self.apuntes = apuntes
+        self._cache: Dict[Tuple[int, int, str], Liquidacion303] = {}
+
+    # -------------------------------------------------
+    # Observador del LibroAsientos (invalidación)
+    # -------------------------------------------------
+
+    def asiento_contabilizado(self, asiento: dict) -> None:
+        self._invalidar(asiento)
+
+    def asiento_retirado(self, asiento: dict) -> None:
+        self._invalidar(asiento)
+
+    def _invalidar(self, asiento: dict) -> None:
+        ejercicio = int(str(asiento['fecha'])[:4])
+        for periodo in periodos_de_fecha(asiento['fecha']):
+            self._cache.pop((asiento['entidad_id'], ejercicio, periodo), None)
+
+    # -------------------------------------------------
+    # Cálculo
+    # -------------------------------------------------
+
+    def calcular(self, entidad_id: int, ejercicio: int, periodo: str) -> Liquidacion303:
+        """
+        Calcula (o devuelve de la caché) todas las casillas del periodo.
+
+        Args:
+            entidad_id: Entidad
+            ejercicio: Año
+            periodo: '1T'-'4T', '01'-'12' o '0A'
+        """
+        clave = (entidad_id, ejercicio, periodo)
+        if clave not in self._cache:
+            self._cache[clave] = self._calcular(entidad_id, ejercicio, periodo)
+        return self._cache[clave]
+
+    def _calcular(self, entidad_id: int, ejercicio: int, periodo: str) -> Liquidacion303:
+        desde, hasta = rango_periodo(ejercicio, periodo)
+        cols = self.apuntes.columnas(entidad_id, desde, hasta, sin_cierre=True)
+        liquidacion = Liquidacion303(entidad_id, ejercicio, periodo,
+                                     apuntes_analizados=len(cols['cuenta']))
+
+        cuenta3 = prefijo_cuentas(cols['cuenta'], 3)
+        cuenta2 = cuenta3 // 10
+        neto_haber = cols['haber'] - cols['debe']
+        neto_debe = -neto_haber
+
+        es_venta = cuenta2 == 70
+        es_repercutido = cuenta3 == 477
+        es_gasto = (cuenta2 == 60) | (cuenta2 == 62)
+        es_soportado = cuenta3 == 472
+
+        # Tipo de IVA por apunte: explícito o deducido del asiento
+        asientos, inverso = np.unique(cols['asiento'], return_inverse=True)
+        tipo_devengado = _tipo_por_asiento(
+            inverso, len(asientos),
+            np.where(es_venta, neto_haber, 0), np.where(es_repercutido, neto_haber, 0)
+        )[inverso]
+        tipo = np.where(cols['iva'] >= 0, cols['iva'], tipo_devengado)
+
+        casillas = liquidacion.casillas
+        total_devengado = 0
+        for tipo_iva in TIPOS_IVA:
+            casilla_base, casilla_cuota = CASILLAS_DEVENGADO[tipo_iva]
+            del_tipo = tipo == tipo_iva
+            casillas[casilla_base] = int(neto_haber[es_venta & del_tipo].sum())
+            casillas[casilla_cuota] = int(neto_haber[es_repercutido & del_tipo].sum())
+            total_devengado += casillas[casilla_cuota]
+
+        # Deducible: bases de compras/gastos de asientos con IVA soportado
+        con_soportado = np.bincount(inverso, weights=es_soportado, minlength=len(asientos)) > 0
+        casillas['28'] = int(neto_debe[es_gasto & con_soportado[inverso]].sum())
+        casillas['29'] = int(neto_debe[es_soportado].sum())
+
+        casillas['27'] = total_devengado
+        casillas['45'] = casillas['29']
+        casillas['46'] = casillas['27'] - casillas['45']
+        casillas['64'] = casillas['46']
+        casillas['66'] = casillas['64']   # 100% atribuible a la Administración del Estado
+        casillas['69'] = casillas['66']
+        casillas['71'] = casillas['69']
+        return liquidacion
+
+    # -------------------------------------------------
+    # Fichero
+    # -------------------------------------------------
+
+    @staticmethod
+    def generar_fichero(liquidacion: Liquidacion303, entidad: dict, destino: BinaryIO) -> int:
+        """
+        Escribe el registro de la autoliquidación. Devuelve los registros escritos.
+
+        El tipo de declaración es I (a ingresar), C (a compensar) o N (sin actividad).
+        """
+        resultado = liquidacion.casillas.get('71', 0)
+        escritor = EscritorRegistros(destino)
+        escritor.escribir(DISENO_303, {
+            **liquidacion.casillas,
+            'ejercicio': liquidacion.ejercicio,
+            'periodo': liquidacion.periodo,
+            'nif': entidad['nif'],
+            'razon_social': entidad['razon_social'],
+            'tipo_declaracion': 'I' if resultado > 0 else 'C' if resultado < 0 else 'N',
+        })
+        escritor.vaciar()
+        return escritor.num_registros
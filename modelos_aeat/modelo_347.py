@@ -0,0 +1,304 @@
+"""
+Modelo 347 - Declaración anual de operaciones con terceras personas
+
+Una sola pasada vectorial sobre los apuntes del ejercicio acumula, por
+tercero, clave y trimestre:
+
+- Clave A (adquisiciones): abonos en 400/410 (facturas recibidas, IVA incluido).
+- Clave B (entregas): cargos en 430 salvo la 4309 (facturas emitidas, IVA
+  incluido).
+
+Las facturas rectificativas restan en su trimestre: cargos en 400/410 y abonos
+en 430 de asientos sin tesorería ni traspaso a otra cuenta del mismo subgrupo
+(como la reclasificación a dudoso cobro).
+
+Se excluyen los asientos que no son operaciones con terceros: regularización,
+cierre y apertura del ejercicio, y devoluciones de cobros y pagos, que vuelven
+a cargar la 430/4309 con salida de tesorería (57x) o a abonar la 400/410 con
+entrada.
+
+Los terceros se agrupan después por NIF, y se declaran los que superan
+3.005,06 € anuales en una clave. La acumulación por tercero se cachea por
+(entidad, ejercicio) y se invalida al contabilizar en ese ejercicio.
+
+El fichero se escribe en streaming con los diseños de registro de 500
+posiciones (tipo 1 declarante, tipo 2 declarados).
+"""
+
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import BinaryIO, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from core.columnar import EPOCA_ORDINAL, ApuntesColumnares, prefijo_cuentas
+from core.contabilizador import ejercicio_de
+from modelos_aeat.base import (
+    IMPORTE, NUMERICO, Campo, DisenoRegistro, EscritorRegistros, euros, rango_periodo,
+    PERIODO_ANUAL,
+)
+
+
+UMBRAL_347 = 300506   # 3.005,06 € en céntimos
+
+CUENTA_DUDOSO_COBRO = 4309    # recibos devueltos: no es una nueva entrega
+GRUPO_TESORERIA = 57
+
+CLAVES_347 = {'A': 'Adquisiciones de bienes y servicios', 'B': 'Entregas de bienes y prestaciones'}
+
+DISENO_DECLARANTE = DisenoRegistro(500, [
+    Campo('tipo_registro', 1, 1, fijo='1'),
+    Campo('modelo', 2, 3, fijo='347'),
+    Campo('ejercicio', 5, 4, NUMERICO),
+    Campo('nif_declarante', 9, 9),
+    Campo('razon_social', 18, 40),
+    Campo('tipo_soporte', 58, 1, fijo='T'),
+    Campo('telefono', 59, 9, NUMERICO),
+    Campo('contacto', 68, 40),
+    Campo('justificante', 108, 13, NUMERICO),
+    Campo('complementaria', 121, 1),
+    Campo('sustitutiva', 122, 1),
+    Campo('justificante_anterior', 123, 13, NUMERICO),
+    Campo('num_declarados', 136, 9, NUMERICO),
+    Campo('importe_total', 145, 16, IMPORTE),
+    Campo('num_inmuebles', 161, 9, NUMERICO),
+    Campo('importe_arrendamientos', 170, 16, IMPORTE),
+    Campo('nif_representante', 391, 9),
+])
+
+DISENO_DECLARADO = DisenoRegistro(500, [
+    Campo('tipo_registro', 1, 1, fijo='2'),
+    Campo('modelo', 2, 3, fijo='347'),
+    Campo('ejercicio', 5, 4, NUMERICO),
+    Campo('nif_declarante', 9, 9),
+    Campo('nif_declarado', 18, 9),
+    Campo('nif_representante', 27, 9),
+    Campo('nombre', 36, 40),
+    Campo('tipo_hoja', 76, 1, fijo='D'),
+    Campo('provincia', 77, 2, NUMERICO),
+    Campo('pais', 79, 2),
+    Campo('clave', 82, 1),
+    Campo('importe_anual', 83, 16, IMPORTE),
+    Campo('operacion_seguro', 99, 1),
+    Campo('arrendamiento_local', 100, 1),
+    Campo('importe_metalico', 101, 15, NUMERICO),
+    Campo('importe_inmuebles', 116, 16, IMPORTE),
+    Campo('ejercicio_metalico', 132, 4, NUMERICO),
+    Campo('importe_1t', 136, 16, IMPORTE),
+    Campo('inmuebles_1t', 152, 16, IMPORTE),
+    Campo('importe_2t', 168, 16, IMPORTE),
+    Campo('inmuebles_2t', 184, 16, IMPORTE),
+    Campo('importe_3t', 200, 16, IMPORTE),
+    Campo('inmuebles_3t', 216, 16, IMPORTE),
+    Campo('importe_4t', 232, 16, IMPORTE),
+    Campo('inmuebles_4t', 248, 16, IMPORTE),
+])
+
+
+@dataclass
+class Declarado347:
+    """Operaciones con un tercero en una clave (importes en céntimos)"""
+    nif: str
+    nombre: str
+    clave: str
+    importe: int
+    trimestres: Tuple[int, int, int, int]
+    provincia: str = ''
+
+    def importe_euros(self) -> Decimal:
+        return euros(self.importe)
+
+
+@dataclass
+class Declaracion347:
+    """Resultado del Modelo 347 de una entidad y ejercicio"""
+    entidad_id: int
+    ejercicio: int
+    declarados: List[Declarado347] = field(default_factory=list)
+    terceros_analizados: int = 0
+    apuntes_analizados: int = 0
+
+    @property
+    def importe_total(self) -> int:
+        return sum(d.importe for d in self.declarados)
+
+
+def _trimestre_de_ordinal(ordinales: np.ndarray) -> np.ndarray:
+    """Trimestre (0-3) de cada fecha dada como ordinal"""
+    meses = ((ordinales.astype(np.int64) - EPOCA_ORDINAL).astype('datetime64[D]')
+             .astype('datetime64[M]').astype(np.int64) % 12)
+    return meses // 3
+
+
+class Modelo347:
+    """
+    Motor de cálculo del Modelo 347 con caché por ejercicio.
+
+    Uso:
+        modelo_347 = Modelo347(apuntes)
+        libro.suscribir(modelo_347)
+
+        declaracion = modelo_347.calcular(1, 2026, terceros_por_id)
+        with open('347.txt', 'wb') as f:
+            modelo_347.generar_fichero(declaracion, entidad, f)
+    """
+
+    def __init__(self, apuntes: ApuntesColumnares):
+        self.apuntes = apuntes
+        # (entidad, ejercicio) -> DataFrame (tercero, clave) x trimestre, y nº de apuntes
+        self._cache: Dict[Tuple[int, int], Tuple[pd.DataFrame, int]] = {}
+
+    # -------------------------------------------------
+    # Observador del LibroAsientos (invalidación)
+    # -------------------------------------------------
+
+    def asiento_contabilizado(self, asiento: dict) -> None:
+        self._cache.pop((asiento['entidad_id'], ejercicio_de(asiento['fecha'])), None)
+
+    def asiento_retirado(self, asiento: dict) -> None:
+        self._cache.pop((asiento['entidad_id'], ejercicio_de(asiento['fecha'])), None)
+
+    # -------------------------------------------------
+    # Cálculo
+    # -------------------------------------------------
+
+    def _acumular(self, entidad_id: int, ejercicio: int) -> Tuple[pd.DataFrame, int]:
+        """Importes por (tercero, clave) y trimestre en una sola pasada"""
+        clave_cache = (entidad_id, ejercicio)
+        if clave_cache in self._cache:
+            return self._cache[clave_cache]
+
+        desde, hasta = rango_periodo(ejercicio, PERIODO_ANUAL)
+        cols = self.apuntes.columnas(entidad_id, desde, hasta, sin_cierre=True)
+        cuenta3 = prefijo_cuentas(cols['cuenta'], 3)
+        con_tercero = cols['tercero'] > 0
+        # Devoluciones: el abono en 400/410 entra por el banco y el cargo en
+        # 430 sale por él (una factura al contado mueve el banco al revés)
+        subgrupo = cuenta3 // 10
+        cargo, abono = cols['debe'] != 0, cols['haber'] != 0
+
+        def en_asiento(lineas: np.ndarray) -> np.ndarray:
+            return np.isin(cols['asiento'], cols['asiento'][lineas])
+
+        entra_banco = en_asiento((subgrupo == GRUPO_TESORERIA) & cargo)
+        sale_banco = en_asiento((subgrupo == GRUPO_TESORERIA) & abono)
+        proveedor = ((cuenta3 == 400) | (cuenta3 == 410)) & con_tercero
+        cliente = (cuenta3 == 430) & (prefijo_cuentas(cols['cuenta'], 4) != CUENTA_DUDOSO_COBRO) \
+            & con_tercero
+        es_a = proveedor & abono & ~entra_banco
+        es_b = cliente & cargo & ~sale_banco
+        # Rectificativas: sin banco y sin contrapartida en el mismo subgrupo
+        sin_banco = ~(entra_banco | sale_banco)
+        rectifica_a = proveedor & cargo & sin_banco \
+            & ~en_asiento(((subgrupo == 40) | (subgrupo == 41)) & abono)
+        rectifica_b = cliente & abono & sin_banco & ~en_asiento((subgrupo == 43) & cargo)
+        clave_a = es_a | rectifica_a
+        mascara = clave_a | es_b | rectifica_b
+
+        acumulado = pd.DataFrame({
+            'tercero': cols['tercero'][mascara],
+            'clave': np.where(clave_a[mascara], 'A', 'B'),
+            'trimestre': _trimestre_de_ordinal(cols['fecha'][mascara]),
+            'importe': np.where(clave_a, cols['haber'] - cols['debe'],
+                                cols['debe'] - cols['haber'])[mascara],
+        }).groupby(['tercero', 'clave', 'trimestre'])['importe'].sum().unstack(fill_value=0)
+        acumulado = acumulado.reindex(columns=range(4), fill_value=0).astype(np.int64)
+
+        self._cache[clave_cache] = (acumulado, len(cols['cuenta']))
+        return self._cache[clave_cache]
+
+    def calcular(self, entidad_id: int, ejercicio: int, terceros_por_id: Dict[int, dict],
+                 claves: Sequence[str] = ('A', 'B'),
+                 umbral: int = UMBRAL_347) -> Declaracion347:
+        """
+        Terceros a declarar, agrupados por NIF.
+
+        Args:
+            entidad_id: Entidad declarante
+            ejercicio: Año
+            terceros_por_id: Terceros indexados por id (NIF, nombre y, si la
+                hay, provincia)
+            claves: Claves de operación a incluir
+            umbral: Importe anual mínimo (céntimos) para declarar un tercero
+        """
+        acumulado, num_apuntes = self._acumular(entidad_id, ejercicio)
+        declaracion = Declaracion347(entidad_id, ejercicio,
+                                     terceros_analizados=acumulado.index.get_level_values(0).nunique(),
+                                     apuntes_analizados=num_apuntes)
+        if acumulado.empty:
+            return declaracion
+
+        # NIF de cada tercero (una consulta por tercero distinto)
+        tercero_ids = acumulado.index.get_level_values('tercero').to_numpy()
+        claves_fila = acumulado.index.get_level_values('clave').to_numpy()
+        unicos, inverso = np.unique(tercero_ids, return_inverse=True)
+        nif_de = np.array([(terceros_por_id.get(t) or {}).get('nif') or ''
+                           for t in unicos.tolist()], dtype=object)
+        nifs = nif_de[inverso]
+        validas = (nifs != '') & np.isin(claves_fila, list(claves))
+
+        filas = pd.DataFrame(acumulado.to_numpy()[validas], columns=range(4))
+        filas['nif'] = nifs[validas]
+        filas['clave'] = claves_fila[validas]
+        filas['tercero'] = tercero_ids[validas]
+        grupos = filas.groupby(['nif', 'clave'], sort=True)
+        sumas = grupos[list(range(4))].sum()
+        primer_tercero = grupos['tercero'].first()
+        anual = sumas.sum(axis=1)
+        sumas = sumas[anual > umbral]
+        primer_tercero = primer_tercero[anual > umbral]
+
+        for (nif, clave), tercero_id, trimestres in zip(sumas.index, primer_tercero.tolist(),
+                                                        sumas.to_numpy().tolist()):
+            tercero = terceros_por_id[tercero_id]
+            declaracion.declarados.append(Declarado347(
+                nif=nif,
+                nombre=tercero['nombre'],
+                clave=clave,
+                importe=sum(trimestres),
+                trimestres=tuple(trimestres),
+                provincia=str(tercero.get('provincia') or ''),
+            ))
+        return declaracion
+
+    # -------------------------------------------------
+    # Fichero
+    # -------------------------------------------------
+
+    @staticmethod
+    def generar_fichero(declaracion: Declaracion347, declarante: dict, destino: BinaryIO,
+                        telefono: str = '', contacto: str = '',
+                        justificante: Optional[str] = None) -> int:
+        """
+        Escribe el fichero del 347 (registro de declarante y uno por declarado).
+
+        Returns:
+            Número de registros escritos
+        """
+        escritor = EscritorRegistros(destino)
+        comun = {'ejercicio': declaracion.ejercicio, 'nif_declarante': declarante['nif']}
+        escritor.escribir(DISENO_DECLARANTE, {
+            **comun,
+            'razon_social': declarante['razon_social'],
+            'telefono': ''.join(c for c in telefono if c.isdigit()) or 0,
+            'contacto': contacto,
+            'justificante': justificante or f"347{declaracion.ejercicio}{declaracion.entidad_id:06d}",
+            'num_declarados': len(declaracion.declarados),
+            'importe_total': declaracion.importe_total,
+        })
+        for declarado in declaracion.declarados:
+            escritor.escribir(DISENO_DECLARADO, {
+                **comun,
+                'nif_declarado': declarado.nif,
+                'nombre': declarado.nombre,
+                'provincia': declarado.provincia[:2] or 0,
+                'clave': declarado.clave,
+                'importe_anual': declarado.importe,
+                'importe_1t': declarado.trimestres[0],
+                'importe_2t': declarado.trimestres[1],
+                'importe_3t': declarado.trimestres[2],
+                'importe_4t': declarado.trimestres[3],
+            })
+        escritor.vaciar()
+        return escritor.num_registros
@@ -0,0 +1,223 @@
+"""
+Presentación en lote: todos los modelos de todas las entidades
+
+Para un ejercicio y periodo se generan los ficheros de cada modelo aplicable
+a cada entidad (según su tipo) en un pool de procesos (core.lotes). Cada tarea recibe las
+columnas de apuntes de una entidad y los terceros que aparecen en ellas, así
+que los procesos no necesitan el libro ni la base de datos. Un fallo en un
+modelo o en una entidad queda en el informe sin detener el resto del lote.
+
+Uso:
+    informe = presentar_lote(entidades, apuntes, terceros_por_id, 2026, '1T')
+    informe.como_dataframe()
+    informe.escribir_zip(fichero)    # ficheros + informe.csv
+"""
+
+import time
+import zipfile
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import BinaryIO, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from core.columnar import ApuntesColumnares
+from core.lotes import ejecutar_por_entidad
+from modelos_aeat.base import PERIODO_ANUAL, euros
+from modelos_aeat.modelo_303 import Modelo303
+from modelos_aeat.modelo_347 import Modelo347
+from modelos_aeat.retenciones import MotorRetenciones
+
+
+# Modelos de cada tipo de entidad por periodicidad
+MODELOS_SOCIEDAD = {
+    'Trimestral': ['303 - IVA', '111 - Retenciones IRPF', '115 - Ret. Alquileres'],
+    'Anual': ['390 - Resumen IVA', '190 - Resumen Ret.', '200 - Impuesto Sociedades', '347 - Op. Terceros'],
+}
+MODELOS_AUTONOMO = {
+    'Trimestral': ['303 - IVA', '130 - Pago frac. IRPF', '111 - Retenciones'],
+    'Anual': ['390 - Resumen IVA', '100 - IRPF', '347 - Op. Terceros'],
+}
+MODELOS_COMUNIDAD = {
+    'Trimestral': ['111 - Retenciones IRPF', '115 - Ret. Alquileres'],
+    'Anual': ['190 - Resumen Ret.', '180 - Resumen Alq.', '184 - Atribución rentas', '347 - Op. Terceros'],
+}
+MODELOS_POR_TIPO = {
+    'sociedad_limitada': MODELOS_SOCIEDAD,
+    'sociedad_anonima': MODELOS_SOCIEDAD,
+    'autonomo_directa': MODELOS_AUTONOMO,
+    'autonomo_modulos': MODELOS_AUTONOMO,
+    'comunidad_propietarios': MODELOS_COMUNIDAD,
+}
+
+# Modelos con cálculo y fichero
+MODELOS_GENERABLES = ('303', '111', '115', '190', '180', '347')
+
+GENERADO = 'generado'
+ERROR = 'error'
+NO_DISPONIBLE = 'no disponible'
+
+
+def modelos_disponibles(tipo_entidad: str) -> Dict[str, List[str]]:
+    """Modelos (etiquetas 'número - descripción') por periodicidad para un tipo de entidad"""
+    return MODELOS_POR_TIPO.get(tipo_entidad, MODELOS_COMUNIDAD)
+
+
+def modelos_del_periodo(tipo_entidad: str, periodo: str) -> List[str]:
+    """Números de modelo que tocan a un tipo de entidad en un periodo ('1T', '01', '0A')"""
+    disponibles = modelos_disponibles(tipo_entidad)
+    etiquetas = disponibles['Anual'] if periodo == PERIODO_ANUAL else disponibles['Trimestral']
+    return [etiqueta.split(' - ')[0] for etiqueta in etiquetas]
+
+
+@dataclass
+class ResultadoPresentacion:
+    """Resultado de un modelo de una entidad"""
+    entidad_id: int
+    nif: str
+    razon_social: str
+    modelo: str
+    estado: str                     # generado / error / no disponible
+    fichero: str = ''
+    registros: int = 0
+    importe: int = 0                # resultado o importe total declarado (céntimos)
+    error: str = ''
+    segundos: float = 0.0
+    contenido: bytes = b''
+
+
+@dataclass
+class InformePresentacion:
+    """Resultados del lote"""
+    ejercicio: int
+    periodo: str
+    resultados: List[ResultadoPresentacion] = field(default_factory=list)
+    segundos: float = 0.0
+
+    def _con_estado(self, estado: str) -> List[ResultadoPresentacion]:
+        return [r for r in self.resultados if r.estado == estado]
+
+    @property
+    def generados(self) -> List[ResultadoPresentacion]:
+        return self._con_estado(GENERADO)
+
+    @property
+    def errores(self) -> List[ResultadoPresentacion]:
+        return self._con_estado(ERROR)
+
+    @property
+    def no_disponibles(self) -> List[ResultadoPresentacion]:
+        return self._con_estado(NO_DISPONIBLE)
+
+    def como_dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame([{
+            'Entidad': r.entidad_id,
+            'NIF': r.nif,
+            'Razón social': r.razon_social,
+            'Modelo': r.modelo,
+            'Estado': r.estado,
+            'Fichero': r.fichero,
+            'Registros': r.registros,
+            'Importe': float(euros(r.importe)),
+            'Error': r.error,
+            'Segundos': round(r.segundos, 3),
+        } for r in self.resultados])
+
+    def escribir_zip(self, destino: BinaryIO) -> None:
+        """ZIP con un fichero por modelo generado e informe.csv con todos los resultados"""
+        with zipfile.ZipFile(destino, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for resultado in self.generados:
+                zf.writestr(resultado.fichero, resultado.contenido)
+            zf.writestr('informe.csv', self.como_dataframe().to_csv(index=False, sep=';'))
+
+
+def _presentar_entidad(entidad: dict, columnas: Dict[str, np.ndarray],
+                       terceros_por_id: Dict[int, dict], ejercicio: int, periodo: str,
+                       modelos: Sequence[str]) -> List[ResultadoPresentacion]:
+    """Genera los modelos de una entidad (se ejecuta en un proceso del pool)"""
+    apuntes = ApuntesColumnares()
+    apuntes.cargar_columnas(entidad['id'], columnas)
+    modelo_303 = Modelo303(apuntes)
+    modelo_347 = Modelo347(apuntes)
+    retenciones = MotorRetenciones(apuntes)
+    sufijo = f"{ejercicio}" if periodo == PERIODO_ANUAL else f"{ejercicio}_{periodo}"
+
+    resultados = []
+    for modelo in modelos:
+        resultado = ResultadoPresentacion(entidad['id'], entidad['nif'], entidad['razon_social'],
+                                          modelo, NO_DISPONIBLE)
+        resultados.append(resultado)
+        if modelo not in MODELOS_GENERABLES:
+            continue
+
+        inicio = time.perf_counter()
+        fichero = BytesIO()
+        try:
+            if modelo == '303':
+                liquidacion = modelo_303.calcular(entidad['id'], ejercicio, periodo)
+                resultado.registros = Modelo303.generar_fichero(liquidacion, entidad, fichero)
+                resultado.importe = liquidacion.casillas['71']
+            elif modelo == '347':
+                claves = ('A',) if entidad['tipo'] == 'comunidad_propietarios' else ('A', 'B')
+                declaracion = modelo_347.calcular(entidad['id'], ejercicio, terceros_por_id, claves=claves)
+                resultado.registros = Modelo347.generar_fichero(declaracion, entidad, fichero)
+                resultado.importe = declaracion.importe_total
+            else:
+                liquidacion = retenciones.calcular(modelo, entidad['id'], ejercicio, periodo,
+                                                   terceros_por_id)
+                resultado.registros = MotorRetenciones.generar_fichero(liquidacion, entidad, fichero)
+                resultado.importe = int(liquidacion.resultado * 100)
+        except Exception as e:
+            resultado.estado, resultado.error = ERROR, f"{type(e).__name__}: {e}"
+        else:
+            resultado.estado = GENERADO
+            resultado.contenido = fichero.getvalue()
+            resultado.fichero = f"{entidad['nif']}/modelo{modelo}_{sufijo}.txt"
+        resultado.segundos = time.perf_counter() - inicio
+    return resultados
+
+
+def presentar_lote(entidades: Sequence[dict], apuntes: ApuntesColumnares,
+                   terceros_por_id: Dict[int, dict], ejercicio: int, periodo: str,
+                   max_procesos: Optional[int] = None,
+                   al_terminar: Optional[Callable[[dict, int, int], None]] = None
+                   ) -> InformePresentacion:
+    """
+    Genera todos los modelos del periodo para todas las entidades.
+
+    Args:
+        entidades: Entidades a presentar (con sus apuntes ya cargados en ``apuntes``)
+        apuntes: Almacén columnar de la sesión
+        terceros_por_id: Terceros indexados por id
+        ejercicio: Año
+        periodo: '1T'-'4T', '01'-'12' o '0A'
+        max_procesos: Procesos del pool (None = CPUs disponibles; 1 = sin pool)
+        al_terminar: Llamada (entidad, terminadas, total) al acabar cada entidad
+
+    Returns:
+        Informe con un resultado por entidad y modelo, en el orden de las entidades
+    """
+    inicio = time.perf_counter()
+    tareas = []
+    for entidad in entidades:
+        columnas = apuntes.columnas(entidad['id'])
+        terceros = {t: terceros_por_id[t] for t in np.unique(columnas['tercero']).tolist()
+                    if t in terceros_por_id}
+        tareas.append((entidad, columnas, terceros, ejercicio, periodo,
+                       modelos_del_periodo(entidad['tipo'], periodo)))
+
+    def fallo(tarea: tuple, error: Exception) -> List[ResultadoPresentacion]:
+        entidad = tarea[0]
+        return [ResultadoPresentacion(entidad['id'], entidad['nif'], entidad['razon_social'],
+                                      modelo, ERROR, error=f"{type(error).__name__}: {error}")
+                for modelo in tarea[5]]
+
+    por_entidad = ejecutar_por_entidad(_presentar_entidad, tareas, max_procesos,
+                                       al_terminar=al_terminar, al_fallar=fallo)
+
+    informe = InformePresentacion(ejercicio, periodo)
+    for resultados in por_entidad:
+        informe.resultados.extend(resultados)
+    informe.segundos = time.perf_counter() - inicio
+    return informe
@@ -0,0 +1,434 @@
+"""
+Modelos de retenciones: 111, 115 (trimestrales) y 190, 180 (resúmenes anuales)
+
+Un único motor acumula, en una pasada vectorial por periodo, la base y la
+retención de cada perceptor a partir de los asientos que tienen apuntes en
+las cuentas de gasto sujetas a retención y en la 4751 (H.P. acreedora por
+retenciones practicadas):
+
+- 640 Sueldos y salarios        -> rendimientos del trabajo (111 / 190 clave A)
+- 623 Servicios profesionales   -> actividades económicas (111 / 190 clave G)
+- 621 Arrendamientos            -> alquileres de inmuebles urbanos (115 / 180)
+
+Se acumula por asiento y perceptor: los perceptores son los terceros de los
+apuntes de 4751 y de gasto (una nómina de varios empleados tiene uno por
+empleado) o, si no los llevan, el de cualquier otro apunte del asiento (465,
+410...). Los apuntes sin tercero de perceptor, como el 640 de toda la nómina,
+se reparten entre ellos según lo abonado a cada uno. Las nóminas se incluyen
+siempre; servicios profesionales y alquileres, solo si se practicó retención.
+Los asientos de regularización, cierre y apertura del ejercicio se excluyen.
+
+La acumulación se cachea por (entidad, ejercicio, periodo) y se invalida
+cuando se contabiliza o retira un asiento del periodo. Los resúmenes anuales
+se construyen sumando las acumulaciones de los cuatro trimestres, sin volver
+a recorrer los apuntes del año.
+
+Los ficheros de 111/115 usan el registro común de autoliquidaciones; los de
+190/180, registros de 500 posiciones (tipo 1 declarante, tipo 2 perceptores).
+"""
+
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import BinaryIO, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from core.columnar import ApuntesColumnares, prefijo_cuentas
+from modelos_aeat.base import (
+    IMPORTE, NUMERICO, PERIODO_ANUAL, TRIMESTRES, Campo, DisenoRegistro, EscritorRegistros,
+    diseno_autoliquidacion, euros, periodos_de_fecha, rango_periodo,
+)
+
+
+TRABAJO = 'trabajo'
+PROFESIONALES = 'profesionales'
+ARRENDAMIENTOS = 'arrendamientos'
+
+# Cuenta de gasto (3 dígitos) de cada categoría de rendimiento
+CUENTAS_CATEGORIA = {TRABAJO: 640, PROFESIONALES: 623, ARRENDAMIENTOS: 621}
+CUENTA_RETENCIONES = 4751
+
+# Categorías que declara cada modelo
+CATEGORIAS_MODELO = {
+    '111': (TRABAJO, PROFESIONALES),
+    '190': (TRABAJO, PROFESIONALES),
+    '115': (ARRENDAMIENTOS,),
+    '180': (ARRENDAMIENTOS,),
+}
+
+# Clave de percepción del 190
+CLAVES_190 = {TRABAJO: 'A', PROFESIONALES: 'G'}
+
+_CATEGORIAS = (TRABAJO, PROFESIONALES, ARRENDAMIENTOS)
+
+DISENO_111 = diseno_autoliquidacion('111', ['01', '02', '03', '07', '08', '09', '28', '30'],
+                                    contadores=['01', '07'])
+DISENO_115 = diseno_autoliquidacion('115', ['01', '02', '03', '05'], contadores=['01'])
+
+
+def _diseno_declarante(modelo: str) -> DisenoRegistro:
+    return DisenoRegistro(500, [
+        Campo('tipo_registro', 1, 1, fijo='1'),
+        Campo('modelo', 2, 3, fijo=modelo),
+        Campo('ejercicio', 5, 4, NUMERICO),
+        Campo('nif_declarante', 9, 9),
+        Campo('razon_social', 18, 40),
+        Campo('tipo_soporte', 58, 1, fijo='T'),
+        Campo('telefono', 59, 9, NUMERICO),
+        Campo('contacto', 68, 40),
+        Campo('justificante', 108, 13, NUMERICO),
+        Campo('complementaria', 121, 1),
+        Campo('sustitutiva', 122, 1),
+        Campo('justificante_anterior', 123, 13, NUMERICO),
+        Campo('num_perceptores', 136, 9, NUMERICO),
+        Campo('total_percepciones', 145, 16, IMPORTE),
+        Campo('total_retenciones', 161, 16, IMPORTE),
+    ])
+
+
+DISENO_190_DECLARANTE = _diseno_declarante('190')
+DISENO_180_DECLARANTE = _diseno_declarante('180')
+
+DISENO_190_PERCEPTOR = DisenoRegistro(500, [
+    Campo('tipo_registro', 1, 1, fijo='2'),
+    Campo('modelo', 2, 3, fijo='190'),
+    Campo('ejercicio', 5, 4, NUMERICO),
+    Campo('nif_declarante', 9, 9),
+    Campo('nif_perceptor', 18, 9),
+    Campo('nif_representante', 27, 9),
+    Campo('nombre', 36, 40),
+    Campo('provincia', 76, 2, NUMERICO),
+    Campo('clave', 78, 1),
+    Campo('subclave', 79, 2, NUMERICO),
+    Campo('percepcion', 81, 14, IMPORTE),
+    Campo('retencion', 95, 14, IMPORTE),
+])
+
+DISENO_180_PERCEPTOR = DisenoRegistro(500, [
+    Campo('tipo_registro', 1, 1, fijo='2'),
+    Campo('modelo', 2, 3, fijo='180'),
+    Campo('ejercicio', 5, 4, NUMERICO),
+    Campo('nif_declarante', 9, 9),
+    Campo('nif_perceptor', 18, 9),
+    Campo('nif_representante', 27, 9),
+    Campo('nombre', 36, 40),
+    Campo('provincia', 76, 2, NUMERICO),
+    Campo('modalidad', 78, 1, fijo='1'),
+    Campo('base', 79, 14, IMPORTE),
+    Campo('porcentaje', 93, 4, NUMERICO),
+    Campo('retencion', 97, 14, IMPORTE),
+    Campo('ejercicio_devengo', 111, 4, NUMERICO),
+])
+
+
+@dataclass
+class Perceptor:
+    """Percepciones y retenciones de un tercero en una categoría (céntimos)"""
+    tercero_id: int
+    nif: str
+    nombre: str
+    categoria: str
+    base: int
+    retencion: int
+
+    @property
+    def clave(self) -> str:
+        return CLAVES_190.get(self.categoria, '')
+
+
+@dataclass
+class LiquidacionRetenciones:
+    """Resultado de un modelo de retenciones para una entidad y periodo"""
+    modelo: str
+    entidad_id: int
+    ejercicio: int
+    periodo: str
+    casillas: Dict[str, int] = field(default_factory=dict)   # importes en céntimos
+    perceptores: List[Perceptor] = field(default_factory=list)
+    asientos_sin_tercero: int = 0       # asientos con retención sin perceptor identificado
+    apuntes_analizados: int = 0
+
+    def importe(self, casilla: str) -> Decimal:
+        """Importe de una casilla en euros"""
+        return euros(self.casillas.get(casilla, 0))
+
+    @property
+    def resultado(self) -> Decimal:
+        return self.importe({'111': '30', '115': '05'}.get(self.modelo, 'total_retenciones'))
+
+
+@dataclass
+class _Acumulado:
+    """Base y retención por (tercero, categoría) de un periodo"""
+    importes: pd.DataFrame
+    asientos_sin_tercero: int
+    apuntes_analizados: int
+
+
+class MotorRetenciones:
+    """
+    Motor de cálculo de los modelos 111, 115, 190 y 180 con caché por periodo.
+
+    Uso:
+        retenciones = MotorRetenciones(apuntes)
+        libro.suscribir(retenciones)
+
+        liquidacion = retenciones.calcular('111', 1, 2026, '1T', terceros_por_id)
+        liquidacion.importe('03')    # retenciones de rendimientos del trabajo
+        resumen = retenciones.calcular('190', 1, 2026, '0A', terceros_por_id)
+    """
+
+    def __init__(self, apuntes: ApuntesColumnares):
+        self.apuntes = apuntes
+        self._cache: Dict[Tuple[int, int, str], _Acumulado] = {}
+
+    # -------------------------------------------------
+    # Observador del LibroAsientos (invalidación)
+    # -------------------------------------------------
+
+    def asiento_contabilizado(self, asiento: dict) -> None:
+        self._invalidar(asiento)
+
+    def asiento_retirado(self, asiento: dict) -> None:
+        self._invalidar(asiento)
+
+    def _invalidar(self, asiento: dict) -> None:
+        ejercicio = int(str(asiento['fecha'])[:4])
+        for periodo in periodos_de_fecha(asiento['fecha']):
+            self._cache.pop((asiento['entidad_id'], ejercicio, periodo), None)
+
+    # -------------------------------------------------
+    # Acumulación
+    # -------------------------------------------------
+
+    def _acumular(self, entidad_id: int, ejercicio: int, periodo: str) -> _Acumulado:
+        """Base y retención por perceptor y categoría (una pasada, cacheada)"""
+        clave = (entidad_id, ejercicio, periodo)
+        if clave in self._cache:
+            return self._cache[clave]
+
+        if periodo == PERIODO_ANUAL:
+            # El año es la suma de los trimestres (cada uno ya cacheado)
+            trimestrales = [self._acumular(entidad_id, ejercicio, t) for t in TRIMESTRES]
+            importes = pd.concat([t.importes for t in trimestrales])
+            acumulado = _Acumulado(
+                importes.groupby(level=['tercero', 'categoria']).sum(),
+                sum(t.asientos_sin_tercero for t in trimestrales),
+                sum(t.apuntes_analizados for t in trimestrales),
+            )
+        else:
+            acumulado = self._acumular_periodo(entidad_id, ejercicio, periodo)
+        self._cache[clave] = acumulado
+        return acumulado
+
+    def _acumular_periodo(self, entidad_id: int, ejercicio: int, periodo: str) -> _Acumulado:
+        desde, hasta = rango_periodo(ejercicio, periodo)
+        cols = self.apuntes.columnas(entidad_id, desde, hasta, sin_cierre=True)
+        num_apuntes = len(cols['cuenta'])
+
+        cuenta3 = prefijo_cuentas(cols['cuenta'], 3)
+        es_retencion = prefijo_cuentas(cols['cuenta'], 4) == CUENTA_RETENCIONES
+        categoria = np.zeros(num_apuntes, dtype=np.int8)   # 0 = ninguna, 1.. = _CATEGORIAS
+        for i, nombre in enumerate(_CATEGORIAS, start=1):
+            categoria[cuenta3 == CUENTAS_CATEGORIA[nombre]] = i
+
+        # Asientos con algún apunte de gasto sujeto o de retención
+        relevantes = es_retencion | (categoria > 0)
+        asientos = np.unique(cols['asiento'][relevantes])
+        vacio = pd.DataFrame({'base': [], 'retencion': []}, dtype=np.int64,
+                             index=pd.MultiIndex.from_arrays([[], []], names=['tercero', 'categoria']))
+        if len(asientos) == 0:
+            return _Acumulado(vacio, 0, num_apuntes)
+
+        # Todos los apuntes de esos asientos (el perceptor puede ir en la 465/410)
+        en_asiento = np.isin(cols['asiento'], asientos)
+        posicion = np.searchsorted(asientos, cols['asiento'][en_asiento])
+        n = len(asientos)
+        neto_debe = (cols['debe'] - cols['haber'])[en_asiento]
+        categoria = categoria[en_asiento]
+        es_retencion = es_retencion[en_asiento]
+        tercero = cols['tercero'][en_asiento].astype(np.int64)
+
+        # Perceptores del asiento: los terceros de la 4751 y del gasto (una
+        # nómina puede llevar varios) o, si no hay, cualquier tercero del asiento
+        de_perceptor = (es_retencion | (categoria > 0)) & (tercero > 0)
+        con_perceptor = np.bincount(posicion[de_perceptor], minlength=n) > 0
+        tercero_asiento = np.zeros(n, dtype=np.int64)
+        np.maximum.at(tercero_asiento, posicion, tercero)
+        sin_perceptor = np.flatnonzero(~con_perceptor)
+        pares = pd.DataFrame({
+            'asiento': np.concatenate([posicion[de_perceptor], sin_perceptor]),
+            'tercero': np.concatenate([tercero[de_perceptor], tercero_asiento[sin_perceptor]]),
+        }).drop_duplicates()
+
+        lineas = pd.DataFrame({
+            'asiento': posicion,
+            'tercero': tercero,
+            'categoria': categoria,
+            'base': np.where(categoria > 0, neto_debe, 0),
+            'retencion': np.where(es_retencion, -neto_debe, 0),
+            'peso': np.maximum(-neto_debe, 0),
+        }).merge(pares.assign(propia=True), how='left', on=['asiento', 'tercero'])
+        propia = lineas['propia'].notna().to_numpy()
+        propias = lineas[propia]
+        comunes = lineas[~propia & ((lineas['categoria'] > 0) | (lineas['retencion'] != 0))]
+
+        # Lo que no lleva el tercero de un perceptor (el 640 de toda la nómina)
+        # se reparte entre los del asiento según lo abonado a cada uno; el
+        # redondeo acumulado hace que las partes sumen el total
+        pesos = pares.merge(propias.groupby(['asiento', 'tercero'], as_index=False)['peso'].sum(),
+                            how='left', on=['asiento', 'tercero']).fillna({'peso': 0})
+        pesos.loc[pesos.groupby('asiento')['peso'].transform('sum') == 0, 'peso'] = 1
+        reparto = comunes.groupby(['asiento', 'categoria'], as_index=False)[['base', 'retencion']] \
+            .sum().merge(pesos, on='asiento')
+        grupo = [reparto['asiento'], reparto['categoria']]
+        pesos_grupo = reparto['peso'].groupby(grupo)
+        fraccion = pesos_grupo.cumsum() / pesos_grupo.transform('sum')
+        for columna in ('base', 'retencion'):
+            hasta = np.rint(reparto[columna] * fraccion)
+            reparto[columna] = hasta - hasta.groupby(grupo).shift(fill_value=0)
+
+        importes = pd.concat([propias, reparto]).groupby(['asiento', 'tercero', 'categoria'])[
+            ['base', 'retencion']].sum()
+        bases = importes['base'].unstack('categoria').reindex(columns=range(1, 4), fill_value=0) \
+            .fillna(0)
+        por_perceptor = pd.DataFrame({
+            # La categoría es la de mayor base del perceptor en el asiento
+            'categoria': bases.to_numpy().argmax(axis=1) + 1,
+            'base': bases.sum(axis=1).astype(np.int64),
+        }, index=bases.index).join(
+            importes['retencion'].groupby(level=['asiento', 'tercero']).sum().astype(np.int64))
+        perceptor = por_perceptor.index.get_level_values('tercero').to_numpy()
+        categoria_perceptor = por_perceptor['categoria'].to_numpy()
+        base_perceptor = por_perceptor['base'].to_numpy()
+        retencion_perceptor = por_perceptor['retencion'].to_numpy()
+
+        declarable = (base_perceptor != 0) & (
+            (categoria_perceptor == _CATEGORIAS.index(TRABAJO) + 1) | (retencion_perceptor != 0)
+        )
+        sin_tercero = int((declarable & (perceptor == 0)).sum())
+        declarable &= perceptor > 0
+
+        importes = pd.DataFrame({
+            'tercero': perceptor[declarable],
+            'categoria': np.array(_CATEGORIAS)[categoria_perceptor[declarable] - 1],
+            'base': base_perceptor[declarable],
+            'retencion': retencion_perceptor[declarable],
+        }).groupby(['tercero', 'categoria'])[['base', 'retencion']].sum()
+        return _Acumulado(importes if len(importes) else vacio, sin_tercero, num_apuntes)
+
+    # -------------------------------------------------
+    # Modelos
+    # -------------------------------------------------
+
+    def calcular(self, modelo: str, entidad_id: int, ejercicio: int, periodo: str,
+                 terceros_por_id: Dict[int, dict]) -> LiquidacionRetenciones:
+        """
+        Calcula un modelo de retenciones.
+
+        Args:
+            modelo: '111' o '115' (periodo '1T'-'4T' o '01'-'12'), '190' o '180' ('0A')
+            entidad_id: Entidad retenedora
+            ejercicio: Año
+            periodo: Periodo de liquidación
+            terceros_por_id: Terceros indexados por id (NIF y nombre de los perceptores)
+        """
+        if modelo not in CATEGORIAS_MODELO:
+            raise ValueError(f"Modelo de retenciones no soportado: {modelo}")
+        anual = modelo in ('190', '180')
+        if anual != (periodo == PERIODO_ANUAL):
+            raise ValueError(f"Periodo {periodo} no válido para el modelo {modelo}")
+
+        acumulado = self._acumular(entidad_id, ejercicio, periodo)
+        liquidacion = LiquidacionRetenciones(
+            modelo, entidad_id, ejercicio, periodo,
+            asientos_sin_tercero=acumulado.asientos_sin_tercero,
+            apuntes_analizados=acumulado.apuntes_analizados,
+        )
+        categorias = CATEGORIAS_MODELO[modelo]
+        for (tercero_id, categoria), base, retencion in zip(
+                acumulado.importes.index, acumulado.importes['base'].tolist(),
+                acumulado.importes['retencion'].tolist()):
+            if categoria not in categorias:
+                continue
+            tercero = terceros_por_id.get(tercero_id) or {}
+            liquidacion.perceptores.append(Perceptor(
+                tercero_id=int(tercero_id),
+                nif=tercero.get('nif', ''),
+                nombre=tercero.get('nombre', f"Tercero {tercero_id}"),
+                categoria=categoria,
+                base=int(base),
+                retencion=int(retencion),
+            ))
+
+        totales = {c: [0, 0, 0] for c in categorias}   # perceptores, base, retención
+        for perceptor in liquidacion.perceptores:
+            total = totales[perceptor.categoria]
+            total[0] += 1
+            total[1] += perceptor.base
+            total[2] += perceptor.retencion
+
+        casillas = liquidacion.casillas
+        if modelo == '111':
+            casillas['01'], casillas['02'], casillas['03'] = totales[TRABAJO]
+            casillas['07'], casillas['08'], casillas['09'] = totales[PROFESIONALES]
+            casillas['28'] = casillas['03'] + casillas['09']
+            casillas['30'] = casillas['28']
+        elif modelo == '115':
+            casillas['01'], casillas['02'], casillas['03'] = totales[ARRENDAMIENTOS]
+            casillas['05'] = casillas['03']
+        else:
+            casillas['num_perceptores'] = sum(t[0] for t in totales.values())
+            casillas['total_percepciones'] = sum(t[1] for t in totales.values())
+            casillas['total_retenciones'] = sum(t[2] for t in totales.values())
+        return liquidacion
+
+    # -------------------------------------------------
+    # Fichero
+    # -------------------------------------------------
+
+    @staticmethod
+    def generar_fichero(liquidacion: LiquidacionRetenciones, entidad: dict,
+                        destino: BinaryIO) -> int:
+        """
+        Escribe el fichero del modelo (111/115: autoliquidación; 190/180:
+        declarante y un registro por perceptor). Devuelve los registros escritos.
+        """
+        escritor = EscritorRegistros(destino)
+        if liquidacion.modelo in ('111', '115'):
+            escritor.escribir(DISENO_111 if liquidacion.modelo == '111' else DISENO_115, {
+                **liquidacion.casillas,
+                'ejercicio': liquidacion.ejercicio,
+                'periodo': liquidacion.periodo,
+                'nif': entidad['nif'],
+                'razon_social': entidad['razon_social'],
+                'tipo_declaracion': 'I' if liquidacion.resultado > 0 else 'N',
+            })
+        else:
+            es_190 = liquidacion.modelo == '190'
+            comun = {'ejercicio': liquidacion.ejercicio, 'nif_declarante': entidad['nif']}
+            escritor.escribir(DISENO_190_DECLARANTE if es_190 else DISENO_180_DECLARANTE, {
+                **comun,
+                **liquidacion.casillas,
+                'razon_social': entidad['razon_social'],
+                'justificante': f"{liquidacion.modelo}{liquidacion.ejercicio}{liquidacion.entidad_id:06d}",
+            })
+            for perceptor in liquidacion.perceptores:
+                valores = {
+                    **comun,
+                    'nif_perceptor': perceptor.nif,
+                    'nombre': perceptor.nombre,
+                    'retencion': perceptor.retencion,
+                }
+                if es_190:
+                    valores.update(clave=perceptor.clave, percepcion=perceptor.base,
+                                   subclave=1 if perceptor.categoria == PROFESIONALES else 0)
+                    escritor.escribir(DISENO_190_PERCEPTOR, valores)
+                else:
+                    porcentaje = round(perceptor.retencion * 10000 / perceptor.base) if perceptor.base else 0
+                    valores.update(base=perceptor.base, porcentaje=porcentaje,
+                                   ejercicio_devengo=liquidacion.ejercicio)
+                    escritor.escribir(DISENO_180_PERCEPTOR, valores)
+        escritor.vaciar()
+        return escritor.num_registros
@@ -0,0 +1,345 @@
+"""
+Conciliación de cobros y devoluciones de recibos
+
+``IndiceRecibos`` mantiene índices hash de los recibos de la sesión: abiertos
+por entidad, por EndToEndId (el ``E2E-<número>`` de la remesa pain.008), por
+(IBAN del deudor, importe) y por (importe, vencimiento). Se suscribe a
+``PersistenciaContable``, así que cada carga o guardado de recibos lo
+actualiza sin volver a recorrer la lista de la sesión.
+
+``ConciliadorRecibos`` casa en bloque:
+
+- Abonos de un extracto (Norma 43 / CAMT.053) con recibos abiertos: primero
+  por EndToEndId, después por IBAN e importe (el de vencimiento más antiguo)
+  y, si no, por importe y vencimiento cuando hay un único candidato. Cada
+  cobro es un asiento 572 a 4300 (o a 4309 si el recibo estaba devuelto) con
+  la misma referencia que le daría la importación del extracto, así que
+  importarlo después no lo duplica.
+- Cargos con EndToEndId de un recibo cobrado (devoluciones R-transaction):
+  asiento 4309 a 572 y el recibo pasa a devuelto.
+- Informes pain.002 de la remesa: los rechazos de recibos aún no cobrados
+  solo cambian el estado (rechazado); los de recibos cobrados, como una
+  devolución.
+
+Los asientos se devuelven juntos para contabilizarlos en un solo lote; los
+estados cambian al llamar a ``Conciliacion.aplicar()``. Un extracto y un
+pain.002 que se concilian a la vez comparten la misma ``Conciliacion``: un
+recibo cobrado en el extracto y rechazado en el pain.002 es una devolución.
+
+Uso:
+    conciliacion = conciliador.conciliar_extracto(fichero, entidad_id)
+    conciliador.conciliar_devoluciones(pain002, entidad_id, conciliacion)
+    libro.contabilizar_lote(conciliacion.asientos)
+    persistencia.confirmar(conciliacion.aplicar())   # asientos y recibos juntos
+"""
+
+import re
+import time
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from datetime import date
+from typing import BinaryIO, Dict, Iterable, List, Optional, Set, Tuple
+
+from core.contabilizador import a_centimos
+from core.referencias import IndiceReferencias
+from pagos.extractos import ErrorExtracto, MovimientoBancario, movimientos_referenciados, textos_por_ruta
+from pagos.proveedores import CUENTA_BANCO
+
+
+CUENTA_RECIBOS = '4300'
+CUENTA_DEVUELTOS = '4309'
+
+# Estados de un recibo
+PENDIENTE = 'pendiente'
+COBRADO = 'cobrado'
+RECHAZADO = 'rechazado'       # rechazado por el banco antes del cobro
+DEVUELTO = 'devuelto'         # devuelto después de cobrado (R-transaction)
+ESTADOS_ABIERTOS = (PENDIENTE, RECHAZADO, DEVUELTO)
+
+# Cómo se casó cada cobro
+POR_END_TO_END = 'EndToEndId'
+POR_IBAN = 'IBAN e importe'
+POR_VENCIMIENTO = 'Importe y vencimiento'
+
+_END_TO_END = re.compile(r'E2E-[\w\-/]+')
+
+
+def end_to_end_recibo(recibo: dict) -> str:
+    """EndToEndId con el que el recibo va en la remesa pain.008"""
+    return f"E2E-{recibo['numero']}"[:35]
+
+
+def _iban(texto: str) -> str:
+    return texto.replace(' ', '').upper()
+
+
+class IndiceRecibos:
+    """
+    Recibos de la sesión indexados para conciliar sin recorrerlos.
+
+    Guarda referencias a los mismos dicts que ``st.session_state.recibos``;
+    tras cambiar un estado hay que volver a notificar el recibo (lo hace
+    ``PersistenciaContable`` al guardarlo).
+    """
+
+    def __init__(self):
+        self._abiertos: Dict[int, Dict[int, dict]] = {}
+        self._por_end_to_end: Dict[Tuple[int, str], dict] = {}
+        self._por_iban: Dict[Tuple[int, str, int], List[dict]] = {}
+        self._por_vencimiento: Dict[Tuple[int, int, str], List[dict]] = {}
+        # id -> claves con que está indexado (para quitarlo al cambiar)
+        self._claves: Dict[int, Tuple] = {}
+
+    # -------------------------------------------------
+    # Observador de PersistenciaContable
+    # -------------------------------------------------
+
+    def recibos_guardados(self, lista: Iterable[dict]) -> None:
+        for recibo in lista:
+            self._quitar(recibo['id'])
+            self._poner(recibo)
+
+    def _poner(self, recibo: dict) -> None:
+        entidad_id = recibo['entidad_id']
+        clave_e2e = (entidad_id, end_to_end_recibo(recibo))
+        self._por_end_to_end[clave_e2e] = recibo
+        if recibo['estado'] not in ESTADOS_ABIERTOS:
+            self._claves[recibo['id']] = (clave_e2e, None, None)
+            return
+
+        centimos = a_centimos(recibo['importe'])
+        clave_iban = (entidad_id, _iban(recibo['tercero'].get('iban') or ''), centimos)
+        clave_vencimiento = (entidad_id, centimos, recibo['fecha_vencimiento'])
+        self._abiertos.setdefault(entidad_id, {})[recibo['id']] = recibo
+        self._por_iban.setdefault(clave_iban, []).append(recibo)
+        self._por_vencimiento.setdefault(clave_vencimiento, []).append(recibo)
+        self._claves[recibo['id']] = (clave_e2e, clave_iban, clave_vencimiento)
+
+    def _quitar(self, recibo_id: int) -> None:
+        claves = self._claves.pop(recibo_id, None)
+        if claves is None:
+            return
+        clave_e2e, clave_iban, clave_vencimiento = claves
+        recibo = self._por_end_to_end.pop(clave_e2e)
+        if clave_iban is None:
+            return
+        del self._abiertos[recibo['entidad_id']][recibo_id]
+        for indice, clave in ((self._por_iban, clave_iban), (self._por_vencimiento, clave_vencimiento)):
+            candidatos = [r for r in indice[clave] if r['id'] != recibo_id]
+            if candidatos:
+                indice[clave] = candidatos
+            else:
+                del indice[clave]
+
+    # -------------------------------------------------
+    # Consultas
+    # -------------------------------------------------
+
+    def abiertos(self, entidad_id: int, estados: Tuple[str, ...] = ESTADOS_ABIERTOS) -> List[dict]:
+        """Recibos abiertos de la entidad (por defecto, en cualquier estado abierto)"""
+        return [r for r in self._abiertos.get(entidad_id, {}).values() if r['estado'] in estados]
+
+    def por_end_to_end(self, entidad_id: int, end_to_end: str) -> Optional[dict]:
+        return self._por_end_to_end.get((entidad_id, end_to_end))
+
+    def por_iban(self, entidad_id: int, iban: str, centimos: int) -> List[dict]:
+        return self._por_iban.get((entidad_id, _iban(iban), centimos), [])
+
+    def por_vencimiento(self, entidad_id: int, centimos: int, vencimiento: date) -> List[dict]:
+        return self._por_vencimiento.get((entidad_id, centimos, vencimiento.isoformat()), [])
+
+
+@dataclass
+class Conciliacion:
+    """Cobros y devoluciones casados, con sus asientos y los estados nuevos"""
+    movimientos: int = 0
+    cobros: List[Tuple[dict, str]] = field(default_factory=list)          # (recibo, cómo se casó)
+    devoluciones: List[Tuple[dict, str]] = field(default_factory=list)    # (recibo, motivo)
+    asientos: List[dict] = field(default_factory=list)
+    sin_conciliar: int = 0            # abonos y devoluciones sin recibo
+    ya_conciliados: int = 0           # movimientos con asiento en el libro
+    segundos: float = 0.0
+    # id -> (recibo, estado nuevo); se escribe en los recibos con aplicar()
+    _estados: Dict[int, Tuple[dict, str]] = field(default_factory=dict, repr=False)
+
+    def estado(self, recibo: dict) -> str:
+        """Estado del recibo teniendo en cuenta lo ya casado en esta conciliación"""
+        return self._estados.get(recibo['id'], (recibo, recibo['estado']))[1]
+
+    def cambiar(self, recibo: dict, estado: str) -> None:
+        self._estados[recibo['id']] = (recibo, estado)
+
+    def aplicar(self) -> List[dict]:
+        """Escribe los estados nuevos en los recibos. Devuelve los que han cambiado."""
+        cambiados = []
+        for recibo, estado in self._estados.values():
+            if recibo['estado'] != estado:
+                recibo['estado'] = estado
+                cambiados.append(recibo)
+        self._estados = {}
+        return cambiados
+
+
+class ConciliadorRecibos:
+    """Casa extractos e informes de devolución con los recibos abiertos"""
+
+    def __init__(self, indice: IndiceRecibos, referencias: IndiceReferencias,
+                 cuenta_banco: str = CUENTA_BANCO, cuenta_recibos: str = CUENTA_RECIBOS,
+                 cuenta_devueltos: str = CUENTA_DEVUELTOS):
+        self.indice = indice
+        self.referencias = referencias
+        self.cuenta_banco = cuenta_banco
+        self.cuenta_recibos = cuenta_recibos
+        self.cuenta_devueltos = cuenta_devueltos
+
+    # -------------------------------------------------
+    # Extractos bancarios
+    # -------------------------------------------------
+
+    def conciliar_extracto(self, flujo: BinaryIO, entidad_id: int,
+                           conciliacion: Optional[Conciliacion] = None) -> Conciliacion:
+        """
+        Cobros y devoluciones de un extracto Norma 43 o CAMT.053.
+
+        Con ``conciliacion`` se añaden a ella y parten de los estados que ya
+        ha casado; si no, a una nueva.
+        """
+        inicio = time.perf_counter()
+        conciliacion = conciliacion if conciliacion is not None else Conciliacion()
+        for referencia, movimiento in movimientos_referenciados(flujo):
+            conciliacion.movimientos += 1
+            if self.referencias.buscar(entidad_id, referencia) is not None:
+                conciliacion.ya_conciliados += 1
+            elif movimiento.es_abono:
+                self._cobro(conciliacion, entidad_id, referencia, movimiento)
+            elif movimiento.end_to_end or movimiento.motivo_devolucion:
+                self._devolucion_extracto(conciliacion, entidad_id, referencia, movimiento)
+        conciliacion.segundos += time.perf_counter() - inicio
+        return conciliacion
+
+    def _end_to_end(self, movimiento: MovimientoBancario) -> Set[str]:
+        """EndToEndId del movimiento o, en Norma 43, los que aparezcan en su texto"""
+        if movimiento.end_to_end:
+            return {movimiento.end_to_end}
+        return set(_END_TO_END.findall(f"{movimiento.referencia} {movimiento.concepto}"))
+
+    def _cobro(self, conciliacion: Conciliacion, entidad_id: int, referencia: str,
+               movimiento: MovimientoBancario) -> None:
+        def abierto(recibo: dict) -> bool:
+            return conciliacion.estado(recibo) in ESTADOS_ABIERTOS
+
+        recibo, metodo = None, ''
+        for end_to_end in self._end_to_end(movimiento):
+            candidato = self.indice.por_end_to_end(entidad_id, end_to_end)
+            if candidato and abierto(candidato) and a_centimos(candidato['importe']) == movimiento.importe:
+                recibo, metodo = candidato, POR_END_TO_END
+                break
+        if recibo is None and movimiento.iban_contraparte:
+            recibo = next((r for r in sorted(
+                self.indice.por_iban(entidad_id, movimiento.iban_contraparte, movimiento.importe),
+                key=lambda r: r['fecha_vencimiento']) if abierto(r)), None)
+            metodo = POR_IBAN
+        if recibo is None:
+            candidatos = [r for r in self.indice.por_vencimiento(entidad_id, movimiento.importe,
+                                                                 movimiento.fecha_valor) if abierto(r)]
+            if len(candidatos) == 1:
+                recibo, metodo = candidatos[0], POR_VENCIMIENTO
+        if recibo is None:
+            conciliacion.sin_conciliar += 1
+            return
+
+        cuenta = self.cuenta_devueltos if conciliacion.estado(recibo) == DEVUELTO else self.cuenta_recibos
+        importe = movimiento.importe / 100
+        conciliacion.asientos.append({
+            'entidad_id': entidad_id,
+            'fecha': movimiento.fecha.isoformat(),
+            'concepto': f"Cobro recibo {recibo['numero']} - {recibo['tercero']['nombre']}"[:120],
+            'referencia': referencia,
+            'apuntes': [
+                {'cuenta': self.cuenta_banco, 'debe': importe, 'haber': 0},
+                {'cuenta': cuenta, 'debe': 0, 'haber': importe, 'tercero_id': recibo['tercero']['id']},
+            ],
+        })
+        conciliacion.cambiar(recibo, COBRADO)
+        conciliacion.cobros.append((recibo, metodo))
+
+    def _devolucion_extracto(self, conciliacion: Conciliacion, entidad_id: int, referencia: str,
+                             movimiento: MovimientoBancario) -> None:
+        for end_to_end in self._end_to_end(movimiento):
+            recibo = self.indice.por_end_to_end(entidad_id, end_to_end)
+            if recibo and conciliacion.estado(recibo) == COBRADO:
+                self._devolver(conciliacion, recibo, movimiento.fecha, -movimiento.importe,
+                               movimiento.motivo_devolucion, referencia)
+                return
+        conciliacion.sin_conciliar += 1
+
+    def _devolver(self, conciliacion: Conciliacion, recibo: dict, fecha: date, centimos: int,
+                  motivo: str, referencia: str) -> None:
+        importe = centimos / 100
+        conciliacion.asientos.append({
+            'entidad_id': recibo['entidad_id'],
+            'fecha': fecha.isoformat(),
+            'concepto': f"Devolución recibo {recibo['numero']} ({motivo or 'sin motivo'})"[:120],
+            'referencia': referencia,
+            'apuntes': [
+                {'cuenta': self.cuenta_devueltos, 'debe': importe, 'haber': 0,
+                 'tercero_id': recibo['tercero']['id']},
+                {'cuenta': self.cuenta_banco, 'debe': 0, 'haber': importe},
+            ],
+        })
+        conciliacion.cambiar(recibo, DEVUELTO)
+        conciliacion.devoluciones.append((recibo, motivo))
+
+    # -------------------------------------------------
+    # Informes de estado pain.002
+    # -------------------------------------------------
+
+    def conciliar_devoluciones(self, flujo: BinaryIO, entidad_id: int,
+                               conciliacion: Optional[Conciliacion] = None) -> Conciliacion:
+        """
+        Rechazos y devoluciones de un informe pain.002 de la remesa.
+
+        Solo se tratan las operaciones con estado RJCT en TxInfAndSts; un
+        rechazo del bloque entero sin detalle por operación no identifica
+        recibos. Con ``conciliacion`` (p. ej. la del extracto del mismo día),
+        un recibo que ya se ha casado como cobrado se devuelve con su asiento.
+        """
+        inicio = time.perf_counter()
+        conciliacion = conciliacion if conciliacion is not None else Conciliacion()
+        fecha_informe = date.today()
+        mensaje = ''
+        try:
+            for _evento, elemento in ET.iterparse(flujo, events=('end',)):
+                nombre = elemento.tag[elemento.tag.rfind('}') + 1:]
+                if nombre == 'GrpHdr':
+                    valores = textos_por_ruta(elemento)
+                    mensaje = valores.get('MsgId', '')
+                    if valores.get('CreDtTm'):
+                        fecha_informe = date.fromisoformat(valores['CreDtTm'][:10])
+                elif nombre == 'TxInfAndSts':
+                    conciliacion.movimientos += 1
+                    self._rechazo(conciliacion, entidad_id, textos_por_ruta(elemento),
+                                  fecha_informe, mensaje)
+                    elemento.clear()
+        except ET.ParseError as e:
+            raise ErrorExtracto(f"pain.002: XML no válido ({e})") from e
+        conciliacion.segundos += time.perf_counter() - inicio
+        return conciliacion
+
+    def _rechazo(self, conciliacion: Conciliacion, entidad_id: int, valores: Dict[str, str],
+                 fecha: date, mensaje: str) -> None:
+        if valores.get('TxSts') != 'RJCT':
+            return
+        recibo = self.indice.por_end_to_end(entidad_id, valores.get('OrgnlEndToEndId', ''))
+        motivo = valores.get('StsRsnInf/Rsn/Cd', '')
+        if recibo is None:
+            conciliacion.sin_conciliar += 1
+            return
+        referencia = f"DEV/{mensaje}/{recibo['numero']}"[:60]
+        if self.referencias.buscar(entidad_id, referencia) is not None:
+            conciliacion.ya_conciliados += 1
+        elif conciliacion.estado(recibo) == COBRADO:
+            self._devolver(conciliacion, recibo, fecha, a_centimos(recibo['importe']), motivo, referencia)
+        elif conciliacion.estado(recibo) == PENDIENTE:
+            conciliacion.cambiar(recibo, RECHAZADO)
+            conciliacion.devoluciones.append((recibo, motivo))
@@ -0,0 +1,549 @@
+"""
+Importación de extractos bancarios (AEB Norma 43 y CAMT.053)
+
+Los dos formatos se leen en streaming: Norma 43 registro a registro y
+CAMT.053 con ``iterparse``, retirando del árbol cada apunte (Ntry) una vez
+leído. Un extracto de cientos de miles de movimientos no se carga nunca
+entero; solo vive el lote de asientos que se está contabilizando.
+
+Cada movimiento se clasifica para proponer su asiento contra la 572:
+
+1. Contraparte: el IBAN o el nombre del ordenante/beneficiario (CAMT) o un
+   NIF que aparezca en el concepto (Norma 43) identifican al tercero, que
+   aporta su cuenta (400 proveedor, 430 cliente...).
+2. Reglas de texto sobre el concepto (comisiones, intereses, Seguridad
+   Social, AEAT...), en orden.
+3. Reglas por concepto común AEB (17 = gastos bancarios, 15 = nóminas...).
+4. Si nada coincide, 555 "Partidas pendientes de aplicación".
+
+Cada asiento lleva la referencia ``BANCO/<huella del movimiento>``, así que
+importar dos veces el mismo extracto no duplica asientos.
+
+Uso:
+    clasificador = ClasificadorMovimientos(terceros)
+    importacion = importar_extracto(fichero, entidad_id, clasificador, referencias,
+                                    contabilizar=lambda lote: libro.contabilizar_lote(lote))
+"""
+
+import hashlib
+import re
+import time
+import unicodedata
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from datetime import date
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from core.plan_cuentas import CUENTAS_TERCERO
+from core.referencias import IndiceReferencias
+from pagos.proveedores import CUENTA_BANCO
+
+
+CUENTA_PENDIENTE_APLICACION = '555'
+
+NORMA43 = 'Norma 43'
+CAMT053 = 'CAMT.053'
+
+# Conceptos comunes AEB (Norma 43)
+CONCEPTOS_COMUNES = {
+    '01': 'Talones - Reintegros',
+    '02': 'Abonarés - Entregas - Ingresos',
+    '03': 'Domiciliados - Recibos - Letras - Pagos por su cuenta',
+    '04': 'Giros - Transferencias - Traspasos - Cheques',
+    '05': 'Amortizaciones préstamos, créditos, etc.',
+    '06': 'Remesas efectos',
+    '07': 'Suscripciones - Dividendos pasivos - Canjes',
+    '08': 'Dividendos - Cupones - Prima junta - Amortizaciones',
+    '09': 'Operaciones de bolsa y/o compra/venta valores',
+    '10': 'Cheques gasolina',
+    '11': 'Cajero automático',
+    '12': 'Tarjetas de crédito - Tarjetas débito',
+    '13': 'Operaciones extranjero',
+    '14': 'Devoluciones e impagados',
+    '15': 'Nóminas - Seguros sociales',
+    '16': 'Timbres - Corretaje - Póliza',
+    '17': 'Intereses - Comisiones - Custodia - Gastos e impuestos',
+    '98': 'Anulaciones - Correcciones asiento',
+    '99': 'Varios',
+}
+
+_NIF = re.compile(r'\b(?:[A-HJ-NP-SUVW]\d{8}|\d{8}[A-Z]|[XYZ]\d{7}[A-Z])\b')
+
+
+class ErrorExtracto(ValueError):
+    """Fichero de extracto con un formato que no se puede leer"""
+
+
+@dataclass
+class MovimientoBancario:
+    """Un movimiento del extracto; importes en céntimos (positivo = abono)"""
+    cuenta: str                     # IBAN o CCC de la cuenta del extracto
+    fecha: date                     # fecha de operación
+    fecha_valor: date
+    importe: int
+    concepto: str = ''              # conceptos complementarios o información de remesa
+    concepto_comun: str = ''        # Norma 43 (2 dígitos) o código de transacción CAMT
+    documento: str = ''
+    referencia: str = ''            # Norma 43: referencias 1 y 2; CAMT: referencia del banco
+    contraparte: str = ''           # ordenante (abonos) o beneficiario (cargos)
+    iban_contraparte: str = ''
+    end_to_end: str = ''            # CAMT: EndToEndId de la operación SEPA
+    motivo_devolucion: str = ''     # CAMT: código de motivo de una devolución (RtrInf)
+
+    @property
+    def es_abono(self) -> bool:
+        return self.importe > 0
+
+    def huella(self) -> str:
+        """Identificador estable del movimiento (mismo extracto = misma huella)"""
+        clave = '|'.join((self.cuenta, self.fecha.isoformat(), self.fecha_valor.isoformat(),
+                          str(self.importe), self.concepto_comun, self.documento,
+                          self.referencia, self.end_to_end, self.concepto))
+        return hashlib.sha1(clave.encode('utf-8')).hexdigest()[:20]
+
+
+@dataclass
+class ResumenExtracto:
+    """Totales del extracto, acumulados mientras se lee"""
+    formato: str = ''
+    cuentas: List[str] = field(default_factory=list)
+    movimientos: int = 0
+    abonos: int = 0                 # céntimos
+    cargos: int = 0                 # céntimos (positivo)
+    avisos: List[str] = field(default_factory=list)
+
+    def anotar(self, movimiento: MovimientoBancario) -> None:
+        self.movimientos += 1
+        if movimiento.importe > 0:
+            self.abonos += movimiento.importe
+        else:
+            self.cargos -= movimiento.importe
+
+
+# -------------------------------------------------
+# Norma 43
+# -------------------------------------------------
+
+def _fecha_aammdd(texto: str) -> date:
+    return date(2000 + int(texto[0:2]), int(texto[2:4]), int(texto[4:6]))
+
+
+def _importe_n43(clave_debe_haber: str, texto: str) -> int:
+    """Importe con signo: clave 1 = debe (cargo), 2 = haber (abono)"""
+    importe = int(texto)
+    return -importe if clave_debe_haber == '1' else importe
+
+
+def leer_norma43(flujo: BinaryIO, resumen: Optional[ResumenExtracto] = None
+                 ) -> Iterator[MovimientoBancario]:
+    """
+    Movimientos de un fichero AEB Norma 43 (cuaderno 43), uno a uno.
+
+    Los conceptos complementarios (registros 23) se añaden al movimiento
+    anterior, que se entrega al llegar el siguiente registro 22 o el final de
+    cuenta (33). Los totales del registro 33 se contrastan con los leídos.
+    """
+    resumen = resumen if resumen is not None else ResumenExtracto()
+    resumen.formato = NORMA43
+    cuenta = ''
+    pendiente: Optional[MovimientoBancario] = None
+    conceptos: List[str] = []
+    num_debe = num_haber = total_debe = total_haber = 0
+
+    def cerrar() -> Optional[MovimientoBancario]:
+        nonlocal pendiente, conceptos
+        movimiento = pendiente
+        if movimiento is not None and conceptos:
+            movimiento.concepto = ' '.join(conceptos)
+        pendiente, conceptos = None, []
+        return movimiento
+
+    for numero, bruto in enumerate(flujo, 1):
+        linea = bruto.decode('latin-1').rstrip('\r\n').ljust(80)
+        registro = linea[0:2]
+        if not linea.strip():
+            continue
+        try:
+            if registro == '11':
+                cuenta = f"{linea[2:6]}{linea[6:10]}{linea[10:20]}"
+                resumen.cuentas.append(cuenta)
+                num_debe = num_haber = total_debe = total_haber = 0
+            elif registro == '22':
+                movimiento = cerrar()
+                if movimiento is not None:
+                    resumen.anotar(movimiento)
+                    yield movimiento
+                importe = _importe_n43(linea[27], linea[28:42])
+                if importe < 0:
+                    num_debe, total_debe = num_debe + 1, total_debe - importe
+                else:
+                    num_haber, total_haber = num_haber + 1, total_haber + importe
+                pendiente = MovimientoBancario(
+                    cuenta=cuenta,
+                    fecha=_fecha_aammdd(linea[10:16]),
+                    fecha_valor=_fecha_aammdd(linea[16:22]),
+                    importe=importe,
+                    concepto_comun=linea[22:24],
+                    documento=linea[42:52].strip(),
+                    referencia=f"{linea[52:64].strip()} {linea[64:80].strip()}".strip(),
+                )
+            elif registro == '23':
+                if pendiente is not None:
+                    conceptos.extend(t for t in (linea[4:42].strip(), linea[42:80].strip()) if t)
+            elif registro == '33':
+                movimiento = cerrar()
+                if movimiento is not None:
+                    resumen.anotar(movimiento)
+                    yield movimiento
+                esperado = (int(linea[20:25]), int(linea[25:39]), int(linea[39:44]), int(linea[44:58]))
+                if esperado != (num_debe, total_debe, num_haber, total_haber):
+                    resumen.avisos.append(
+                        f"Cuenta {cuenta}: los totales del registro 33 (línea {numero}) "
+                        "no coinciden con los movimientos leídos"
+                    )
+            elif registro not in ('24', '88'):
+                raise ErrorExtracto(f"Registro desconocido '{registro}'")
+        except ValueError as e:
+            raise ErrorExtracto(f"Norma 43, línea {numero}: {e}") from e
+
+    movimiento = cerrar()
+    if movimiento is not None:
+        resumen.anotar(movimiento)
+        yield movimiento
+
+
+# -------------------------------------------------
+# CAMT.053
+# -------------------------------------------------
+
+def textos_por_ruta(elemento: ET.Element, prefijo: str = '',
+                    valores: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """
+    Textos del subárbol por ruta sin espacio de nombres ('Amt', 'BookgDt/Dt'...).
+
+    Un recorrido por apunte es mucho más barato que una búsqueda ``find`` por
+    campo. Las rutas repetidas (varias líneas ``Ustrd``) se unen con espacios.
+    Los detalles de un apunte CAMT (NtryDtls) se omiten: se leen aparte.
+    """
+    valores = {} if valores is None else valores
+    for hijo in elemento:
+        etiqueta = hijo.tag[hijo.tag.rfind('}') + 1:]
+        if etiqueta == 'NtryDtls':
+            continue
+        ruta = prefijo + etiqueta
+        texto = hijo.text.strip() if hijo.text else ''
+        if texto:
+            valores[ruta] = f"{valores[ruta]} {texto}" if ruta in valores else texto
+        if len(hijo):
+            textos_por_ruta(hijo, ruta + '/', valores)
+    return valores
+
+
+def _fecha_camt(valores: Dict[str, str], ruta: str) -> Optional[date]:
+    texto = valores.get(f"{ruta}/Dt") or valores.get(f"{ruta}/DtTm")
+    return date.fromisoformat(texto[:10]) if texto else None
+
+
+def _centimos(texto: str) -> int:
+    entero, _, decimales = texto.partition('.')
+    return int(entero) * 100 + int((decimales + '00')[:2])
+
+
+def _movimientos_camt(entrada: ET.Element, cuenta: str) -> Iterator[MovimientoBancario]:
+    """Un movimiento por detalle de transacción (o uno por apunte si no hay detalle)"""
+    valores = textos_por_ruta(entrada)
+    signo = -1 if valores.get('CdtDbtInd') == 'DBIT' else 1
+    fecha = _fecha_camt(valores, 'BookgDt') or _fecha_camt(valores, 'ValDt')
+    if fecha is None:
+        raise ErrorExtracto("Apunte sin fecha de contabilización")
+    fecha_valor = _fecha_camt(valores, 'ValDt') or fecha
+    codigo = valores.get('BkTxCd/Domn/Fmly/SubFmlyCd') or valores.get('BkTxCd/Prtry/Cd', '')
+    detalles = [textos_por_ruta(detalle)
+                for bloque in entrada if bloque.tag.endswith('NtryDtls')
+                for detalle in bloque if detalle.tag.endswith('TxDtls')]
+    lado = 'Dbtr' if signo > 0 else 'Cdtr'
+
+    for detalle in detalles or [{}]:
+        importe = _centimos(valores['Amt'])
+        if len(detalles) > 1:
+            importe = _centimos(detalle.get('AmtDtls/TxAmt/Amt') or detalle.get('Amt') or '0')
+        yield MovimientoBancario(
+            cuenta=cuenta,
+            fecha=fecha,
+            fecha_valor=fecha_valor,
+            importe=signo * importe,
+            concepto=detalle.get('RmtInf/Ustrd') or valores.get('AddtlNtryInf', ''),
+            concepto_comun=codigo,
+            referencia=valores.get('AcctSvcrRef', ''),
+            contraparte=(detalle.get(f"RltdPties/{lado}/Nm")
+                         or detalle.get(f"RltdPties/{lado}/Pty/Nm", '')),
+            iban_contraparte=detalle.get(f"RltdPties/{lado}Acct/Id/IBAN", ''),
+            end_to_end=detalle.get('Refs/EndToEndId', ''),
+            motivo_devolucion=detalle.get('RtrInf/Rsn/Cd', ''),
+        )
+
+
+def leer_camt053(flujo: BinaryIO, resumen: Optional[ResumenExtracto] = None
+                 ) -> Iterator[MovimientoBancario]:
+    """
+    Movimientos de un extracto ISO 20022 CAMT.053, uno a uno.
+
+    Cada Ntry se retira del árbol en cuanto se ha leído, de modo que la
+    memoria no crece con el número de apuntes.
+    """
+    resumen = resumen if resumen is not None else ResumenExtracto()
+    resumen.formato = CAMT053
+    pila: List[ET.Element] = []
+    cuenta = ''
+    try:
+        for evento, elemento in ET.iterparse(flujo, events=('start', 'end')):
+            if evento == 'start':
+                pila.append(elemento)
+                continue
+            pila.pop()
+            nombre = elemento.tag.rsplit('}', 1)[-1]
+            padre = pila[-1] if pila else None
+            if nombre == 'Acct' and padre is not None and padre.tag.endswith('Stmt'):
+                valores = textos_por_ruta(elemento)
+                cuenta = valores.get('Id/IBAN') or valores.get('Id/Othr/Id', '')
+                resumen.cuentas.append(cuenta)
+            elif nombre == 'Ntry':
+                for movimiento in _movimientos_camt(elemento, cuenta):
+                    resumen.anotar(movimiento)
+                    yield movimiento
+                padre.remove(elemento)
+            elif nombre == 'Stmt' and padre is not None:
+                padre.remove(elemento)
+    except ET.ParseError as e:
+        raise ErrorExtracto(f"CAMT.053: XML no válido ({e})") from e
+
+
+def leer_extracto(flujo: BinaryIO, resumen: Optional[ResumenExtracto] = None
+                  ) -> Iterator[MovimientoBancario]:
+    """Detecta el formato (XML = CAMT.053; si no, Norma 43) y lee los movimientos"""
+    inicio = flujo.read(256).lstrip(b'\xef\xbb\xbf \t\r\n')
+    flujo.seek(0)
+    if inicio.startswith(b'<'):
+        return leer_camt053(flujo, resumen)
+    if inicio.startswith(b'11'):
+        return leer_norma43(flujo, resumen)
+    raise ErrorExtracto("Formato no reconocido: se esperaba Norma 43 o CAMT.053")
+
+
+# -------------------------------------------------
+# Clasificación y asientos
+# -------------------------------------------------
+
+@dataclass(frozen=True)
+class ReglaExtracto:
+    """Cuenta de contrapartida para los movimientos que cumplen la regla"""
+    cuenta: str
+    descripcion: str
+    texto: str = ''             # subcadena del concepto (en mayúsculas)
+    concepto_comun: str = ''    # concepto común AEB o código de transacción
+    signo: int = 0              # 1 = solo abonos, -1 = solo cargos, 0 = ambos
+
+
+REGLAS_POR_DEFECTO = [
+    ReglaExtracto('476', "Seguridad Social", texto='SEGURIDAD SOCIAL', signo=-1),
+    ReglaExtracto('476', "Seguridad Social", texto='TGSS', signo=-1),
+    ReglaExtracto('4750', "Hacienda Pública", texto='AEAT', signo=-1),
+    ReglaExtracto('662', "Intereses de deudas", texto='INTERES', signo=-1),
+    ReglaExtracto('769', "Otros ingresos financieros", texto='INTERES', signo=1),
+    ReglaExtracto('626', "Servicios bancarios", texto='COMISION', signo=-1),
+    ReglaExtracto('626', "Servicios bancarios", concepto_comun='17', signo=-1),
+    ReglaExtracto('769', "Otros ingresos financieros", concepto_comun='17', signo=1),
+    ReglaExtracto('465', "Nóminas", concepto_comun='15', signo=-1),
+    ReglaExtracto('520', "Préstamos a corto plazo", concepto_comun='05', signo=-1),
+]
+
+
+@dataclass
+class Clasificacion:
+    cuenta: str
+    descripcion: str
+    tercero_id: Optional[int] = None
+
+
+def _normalizar(nombre: str) -> str:
+    """'Suministros Industriales, S.L.' -> 'SUMINISTROS INDUSTRIALES SL'"""
+    sin_tildes = unicodedata.normalize('NFKD', nombre.upper()).encode('ascii', 'ignore').decode()
+    return ' '.join(re.sub(r'[^A-Z0-9 ]', '', sin_tildes).split())
+
+
+class ClasificadorMovimientos:
+    """
+    Cuenta de contrapartida de cada movimiento por contraparte y concepto.
+
+    Los terceros se indexan por IBAN, nombre normalizado y NIF; las reglas de
+    concepto común, por (código, signo). Solo las reglas de texto se recorren
+    en orden.
+    """
+
+    def __init__(self, terceros: Iterable[dict], reglas: Iterable[ReglaExtracto] = REGLAS_POR_DEFECTO,
+                 cuentas_tercero: Optional[Dict[str, str]] = None,
+                 cuenta_pendiente: str = CUENTA_PENDIENTE_APLICACION):
+        # Las comunidades llevan a los propietarios a la 4300 (cuotas ordinarias)
+        self._cuentas_tercero = cuentas_tercero or CUENTAS_TERCERO
+        self._por_iban: Dict[str, dict] = {}
+        self._por_nombre: Dict[str, dict] = {}
+        self._por_nif: Dict[str, dict] = {}
+        for tercero in terceros:
+            if tercero.get('tipo') not in self._cuentas_tercero:
+                continue
+            if tercero.get('iban'):
+                self._por_iban[tercero['iban'].replace(' ', '').upper()] = tercero
+            self._por_nombre[_normalizar(tercero['nombre'])] = tercero
+            self._por_nif[tercero['nif'].upper()] = tercero
+
+        self._reglas_texto: List[ReglaExtracto] = []
+        self._reglas_codigo: Dict[Tuple[str, int], ReglaExtracto] = {}
+        for regla in reglas:
+            if regla.texto:
+                self._reglas_texto.append(regla)
+            elif regla.concepto_comun:
+                for signo in ((regla.signo,) if regla.signo else (1, -1)):
+                    self._reglas_codigo.setdefault((regla.concepto_comun, signo), regla)
+        self._pendiente = Clasificacion(cuenta_pendiente, "Partidas pendientes de aplicación")
+
+    def tercero(self, movimiento: MovimientoBancario) -> Optional[dict]:
+        if movimiento.iban_contraparte:
+            tercero = self._por_iban.get(movimiento.iban_contraparte.replace(' ', '').upper())
+            if tercero:
+                return tercero
+        if movimiento.contraparte:
+            tercero = self._por_nombre.get(_normalizar(movimiento.contraparte))
+            if tercero:
+                return tercero
+        for nif in _NIF.findall(movimiento.concepto.upper()):
+            tercero = self._por_nif.get(nif)
+            if tercero:
+                return tercero
+        return None
+
+    def clasificar(self, movimiento: MovimientoBancario) -> Clasificacion:
+        tercero = self.tercero(movimiento)
+        if tercero is not None:
+            return Clasificacion(self._cuentas_tercero[tercero['tipo']], tercero['nombre'], tercero['id'])
+
+        signo = 1 if movimiento.es_abono else -1
+        concepto = movimiento.concepto.upper()
+        for regla in self._reglas_texto:
+            if regla.signo in (0, signo) and regla.texto in concepto:
+                return Clasificacion(regla.cuenta, regla.descripcion)
+        regla = self._reglas_codigo.get((movimiento.concepto_comun, signo))
+        if regla is not None:
+            return Clasificacion(regla.cuenta, regla.descripcion)
+        return self._pendiente
+
+
+def referencia_movimiento(huella: str) -> str:
+    return f"BANCO/{huella}"
+
+
+def movimientos_referenciados(flujo: BinaryIO, resumen: Optional[ResumenExtracto] = None
+                              ) -> Iterator[Tuple[str, MovimientoBancario]]:
+    """
+    (referencia del asiento, movimiento) de cada movimiento del extracto.
+
+    Movimientos idénticos del mismo día se distinguen por su orden; los
+    extractos van por fecha, así que basta con recordar el día en curso.
+    """
+    dia_actual: Optional[date] = None
+    vistos_dia: Dict[str, int] = {}
+    for movimiento in leer_extracto(flujo, resumen):
+        if movimiento.fecha != dia_actual:
+            dia_actual, vistos_dia = movimiento.fecha, {}
+        huella = movimiento.huella()
+        orden = vistos_dia.get(huella, 0)
+        vistos_dia[huella] = orden + 1
+        yield referencia_movimiento(f"{huella}-{orden}" if orden else huella), movimiento
+
+
+def asiento_movimiento(entidad_id: int, movimiento: MovimientoBancario, clasificacion: Clasificacion,
+                       referencia: str, cuenta_banco: str = CUENTA_BANCO) -> dict:
+    """Asiento del movimiento contra bancos (abono: 572 al debe; cargo: 572 al haber)"""
+    importe = abs(movimiento.importe) / 100
+    abono = movimiento.es_abono
+    contrapartida = {'cuenta': clasificacion.cuenta,
+                     'debe': 0 if abono else importe, 'haber': importe if abono else 0}
+    if clasificacion.tercero_id is not None:
+        contrapartida['tercero_id'] = clasificacion.tercero_id
+    concepto = movimiento.concepto or movimiento.contraparte or \
+        CONCEPTOS_COMUNES.get(movimiento.concepto_comun, 'Movimiento bancario')
+    return {
+        'entidad_id': entidad_id,
+        'fecha': movimiento.fecha.isoformat(),
+        'concepto': f"Banco: {concepto}"[:120],
+        'referencia': referencia,
+        'apuntes': [
+            {'cuenta': cuenta_banco, 'debe': importe if abono else 0, 'haber': 0 if abono else importe},
+            contrapartida,
+        ],
+    }
+
+
+@dataclass
+class ImportacionExtracto:
+    """Resultado de analizar o importar un extracto"""
+    resumen: ResumenExtracto = field(default_factory=ResumenExtracto)
+    propuestos: int = 0
+    contabilizados: int = 0
+    ya_importados: int = 0
+    # cuenta de contrapartida -> [descripción, movimientos, céntimos con signo]
+    por_cuenta: Dict[str, list] = field(default_factory=dict)
+    muestra: List[dict] = field(default_factory=list)
+    segundos: float = 0.0
+
+
+def importar_extracto(flujo: BinaryIO, entidad_id: int, clasificador: ClasificadorMovimientos,
+                      referencias: Optional[IndiceReferencias] = None,
+                      contabilizar: Optional[Callable[[List[dict]], object]] = None,
+                      tamano_lote: int = 5_000, max_muestra: int = 200,
+                      al_progresar: Optional[Callable[[int], None]] = None) -> ImportacionExtracto:
+    """
+    Propone (y, con ``contabilizar``, registra por lotes) los asientos del extracto.
+
+    Args:
+        flujo: Fichero Norma 43 o CAMT.053 (binario, con seek)
+        entidad_id: Entidad titular de la cuenta
+        clasificador: Contrapartidas por contraparte y concepto
+        referencias: Índice del libro para saltar movimientos ya importados
+        contabilizar: Llamada con cada lote de asientos; sin ella solo se analiza
+        tamano_lote: Asientos por lote
+        max_muestra: Asientos propuestos que se guardan para mostrarlos
+        al_progresar: Llamada (movimientos leídos) después de cada lote
+    """
+    inicio = time.perf_counter()
+    importacion = ImportacionExtracto()
+    lote: List[dict] = []
+
+    def vaciar_lote() -> None:
+        if contabilizar is not None and lote:
+            contabilizar(lote)
+            importacion.contabilizados += len(lote)
+        lote.clear()
+        if al_progresar:
+            al_progresar(importacion.resumen.movimientos)
+
+    for referencia, movimiento in movimientos_referenciados(flujo, importacion.resumen):
+        if referencias is not None and referencias.buscar(entidad_id, referencia) is not None:
+            importacion.ya_importados += 1
+            continue
+
+        clasificacion = clasificador.clasificar(movimiento)
+        asiento = asiento_movimiento(entidad_id, movimiento, clasificacion, referencia)
+        importacion.propuestos += 1
+        acumulado = importacion.por_cuenta.setdefault(clasificacion.cuenta,
+                                                      [clasificacion.descripcion, 0, 0])
+        acumulado[1] += 1
+        acumulado[2] += movimiento.importe
+        if len(importacion.muestra) < max_muestra:
+            importacion.muestra.append(asiento)
+        if contabilizar is not None:
+            lote.append(asiento)
+            if len(lote) >= tamano_lote:
+                vaciar_lote()
+    vaciar_lote()
+    importacion.segundos = time.perf_counter() - inicio
+    return importacion
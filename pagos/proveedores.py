@@ -0,0 +1,107 @@
+"""
+Pagos pendientes a proveedores y acreedores
+
+Los importes pendientes salen del propio libro: saldo acreedor de las cuentas
+400/410 de cada tercero, obtenido con un group-by sobre el almacén columnar.
+Cada pago pendiente se convierte en una transferencia SEPA y, una vez incluida
+en la remesa, en su asiento de pago (400/410 a 572), que se contabilizan todos
+en un único lote.
+"""
+
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+from core.columnar import ApuntesColumnares
+from modelos_aeat.base import euros
+from pagos.sepa_credit_transfer import TransferenciaSEPA
+
+
+CUENTAS_PROVEEDORES = ('400', '410')
+CUENTA_BANCO = '572'
+
+
+@dataclass
+class PagoPendiente:
+    """Saldo pendiente de pago a un tercero en una cuenta de proveedores"""
+    tercero_id: int
+    cuenta: str
+    nombre: str
+    nif: str
+    iban: str
+    importe: int          # céntimos
+
+    @property
+    def referencia(self) -> str:
+        """Referencia interna del pago (id_interno de la transferencia)"""
+        return f"PAG-{self.cuenta}-{self.tercero_id}"
+
+    @property
+    def importe_euros(self) -> Decimal:
+        return euros(self.importe)
+
+
+def pagos_pendientes(apuntes: ApuntesColumnares, entidad_id: int,
+                     terceros_por_id: Dict[int, dict],
+                     hasta: Optional[date] = None) -> List[PagoPendiente]:
+    """
+    Saldos acreedores abiertos en 400/410 por tercero y cuenta.
+
+    Args:
+        apuntes: Almacén columnar de apuntes
+        entidad_id: Entidad
+        terceros_por_id: Terceros indexados por id (nombre, NIF e IBAN)
+        hasta: Fecha de corte incluida (None = todos los apuntes)
+    """
+    sumas = apuntes.saldos_por_tercero(entidad_id, CUENTAS_PROVEEDORES, hasta)
+    abiertos = sumas[sumas['haber'] > sumas['debe']]
+    pendientes = []
+    for tercero_id, cuenta, debe, haber in zip(abiertos['tercero'].tolist(),
+                                               abiertos['cuenta'].tolist(),
+                                               abiertos['debe'].tolist(),
+                                               abiertos['haber'].tolist()):
+        tercero = terceros_por_id.get(tercero_id, {})
+        pendientes.append(PagoPendiente(
+            tercero_id=tercero_id,
+            cuenta=cuenta,
+            nombre=tercero.get('nombre', f"Tercero {tercero_id}"),
+            nif=tercero.get('nif', ''),
+            iban=tercero.get('iban') or '',
+            importe=haber - debe,
+        ))
+    return pendientes
+
+
+def transferencias_de_pagos(pagos: Iterable[PagoPendiente],
+                            fecha_ejecucion: date) -> List[TransferenciaSEPA]:
+    """Una transferencia SEPA por pago pendiente"""
+    return [
+        TransferenciaSEPA(
+            id_interno=pago.referencia,
+            importe=pago.importe_euros,
+            concepto=f"Pago facturas pendientes a {fecha_ejecucion.strftime('%d/%m/%Y')}",
+            beneficiario_nombre=pago.nombre,
+            beneficiario_iban=pago.iban,
+            end_to_end_id=f"E2E-{pago.referencia}-{fecha_ejecucion.strftime('%Y%m%d')}",
+        )
+        for pago in pagos
+    ]
+
+
+def asientos_de_pagos(entidad_id: int, pagos: Iterable[PagoPendiente], fecha: date,
+                      cuenta_banco: str = CUENTA_BANCO) -> List[dict]:
+    """Asientos de pago (cargo en 400/410 del tercero, abono en bancos) listos para el libro"""
+    return [
+        {
+            'entidad_id': entidad_id,
+            'fecha': fecha.isoformat(),
+            'concepto': f"Pago transferencia SEPA - {pago.nombre}",
+            'apuntes': [
+                {'cuenta': pago.cuenta, 'debe': float(pago.importe_euros), 'haber': 0,
+                 'tercero_id': pago.tercero_id},
+                {'cuenta': cuenta_banco, 'debe': 0, 'haber': float(pago.importe_euros)},
+            ],
+        }
+        for pago in pagos
+    ]
@@ -0,0 +1,163 @@
+"""
+Piezas comunes de los generadores de remesas SEPA (pain.008 y pain.001)
+
+Validación de IBAN, escritura de XML con búfer sobre un flujo binario y el
+reparto de una remesa en uno o varios ficheros (sueltos o dentro de un ZIP).
+Cada formato solo define cómo se validan y ordenan sus operaciones y cómo se
+escribe un fichero completo.
+"""
+
+import re
+import time
+import uuid
+import zipfile
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from decimal import Decimal
+from io import BytesIO
+from typing import BinaryIO, Callable, Iterable, List, Optional, Tuple
+
+
+@dataclass
+class ResumenRemesa:
+    """Resultado de la generación: ficheros, totales, rechazos y rendimiento"""
+    ficheros: List[str] = field(default_factory=list)   # MsgId de cada fichero
+    num_transacciones: int = 0
+    importe_total: Decimal = Decimal('0.00')
+    num_bloques: int = 0                                 # PmtInf escritos
+    rechazados: List[Tuple[str, str]] = field(default_factory=list)  # (id_interno, motivo)
+    segundos: float = 0.0
+
+    @property
+    def transacciones_por_segundo(self) -> float:
+        return self.num_transacciones / self.segundos if self.segundos else 0.0
+
+
+def _valor_iso7064(texto: str) -> int:
+    """Convierte letras a números (A=10, B=11, etc.) y aplica módulo 97"""
+    numerico = ''.join(str(int(c, 36)) for c in texto)
+    return int(numerico) % 97
+
+
+def validar_iban(iban: str) -> bool:
+    """Valida un IBAN español"""
+    iban = iban.replace(' ', '').upper()
+
+    if not re.match(r'^ES\d{22}$', iban):
+        return False
+
+    # Mover los 4 primeros caracteres al final y aplicar módulo 97
+    return _valor_iso7064(iban[4:] + iban[:4]) == 1
+
+
+class _EscritorXML:
+    """Escritura con búfer de fragmentos de texto sobre un flujo binario"""
+
+    def __init__(self, destino: BinaryIO, tamano_bufer: int = 1 << 16):
+        self.destino = destino
+        self.tamano_bufer = tamano_bufer
+        self._fragmentos: List[str] = []
+        self._tamano = 0
+
+    def escribir(self, texto: str) -> None:
+        self._fragmentos.append(texto)
+        self._tamano += len(texto)
+        if self._tamano >= self.tamano_bufer:
+            self.vaciar()
+
+    def vaciar(self) -> None:
+        if self._fragmentos:
+            self.destino.write(''.join(self._fragmentos).encode('utf-8'))
+            self._fragmentos = []
+            self._tamano = 0
+
+
+class _GeneradorRemesaSEPA:
+    """
+    Reparto de una remesa en ficheros de como mucho ``max_transacciones``.
+
+    Las subclases implementan ``_preparar`` (validar y ordenar por bloque
+    PmtInf) y ``_escribir_fichero`` (un documento completo).
+    """
+
+    def __init__(self, max_transacciones: Optional[int] = None, validar_fecha: bool = True):
+        self.max_transacciones = max_transacciones
+        self.validar_fecha = validar_fecha
+
+    @staticmethod
+    def generar_mensaje_id() -> str:
+        """Genera un Message ID único"""
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        random_part = uuid.uuid4().hex[:8].upper()
+        return f"SEPA-{timestamp}-{random_part}"
+
+    def _preparar(self, operaciones: Iterable, fecha: date,
+                  resumen: ResumenRemesa) -> List:
+        raise NotImplementedError
+
+    def _escribir_fichero(self, destino: BinaryIO, mensaje_id: str,
+                          operaciones: List, fecha: date) -> int:
+        raise NotImplementedError
+
+    def generar(self, operaciones: Iterable, fecha: date,
+                abrir_destino: Callable[[int, str], BinaryIO]) -> ResumenRemesa:
+        """
+        Escribe la remesa en uno o varios ficheros.
+
+        Args:
+            operaciones: Recibos o transferencias de la remesa
+            fecha: Fecha de cobro o ejecución por defecto
+            abrir_destino: Función (índice, mensaje_id) -> flujo binario de escritura
+                para cada fichero. El generador no cierra los flujos.
+
+        Returns:
+            ResumenRemesa con los ficheros generados, totales, rechazos y tiempo
+        """
+        return self._generar(operaciones, fecha, abrir_destino, self.max_transacciones)
+
+    def _generar(self, operaciones: Iterable, fecha: date,
+                 abrir_destino: Callable[[int, str], BinaryIO],
+                 max_transacciones: Optional[int]) -> ResumenRemesa:
+        inicio = time.perf_counter()
+        resumen = ResumenRemesa()
+        validas = self._preparar(operaciones, fecha, resumen)
+        if not validas:
+            raise ValueError("No hay operaciones válidas en la remesa")
+
+        tamano = max_transacciones or len(validas)
+        for indice, primera in enumerate(range(0, len(validas), tamano)):
+            lote = validas[primera:primera + tamano]
+            mensaje_id = self.generar_mensaje_id()
+            destino = abrir_destino(indice, mensaje_id)
+            resumen.num_bloques += self._escribir_fichero(destino, mensaje_id, lote, fecha)
+            resumen.ficheros.append(mensaje_id)
+            resumen.num_transacciones += len(lote)
+            resumen.importe_total += sum((o.importe for o in lote), Decimal('0.00'))
+
+        resumen.segundos = time.perf_counter() - inicio
+        return resumen
+
+    def generar_zip(self, operaciones: Iterable, fecha: date,
+                    destino: BinaryIO) -> ResumenRemesa:
+        """Escribe todos los ficheros de la remesa dentro de un ZIP"""
+        with zipfile.ZipFile(destino, 'w', compression=zipfile.ZIP_DEFLATED) as zip_remesa:
+            abiertos: List[BinaryIO] = []
+
+            def abrir(indice: int, mensaje_id: str) -> BinaryIO:
+                if abiertos:
+                    abiertos.pop().close()
+                entrada = zip_remesa.open(f"remesa_{indice + 1:03d}_{mensaje_id}.xml", 'w')
+                abiertos.append(entrada)
+                return entrada
+
+            try:
+                return self.generar(operaciones, fecha, abrir)
+            finally:
+                for entrada in abiertos:
+                    entrada.close()
+
+    def generar_xml(self, operaciones: Iterable, fecha: date) -> str:
+        """Genera la remesa completa como un único XML (sin límite de transacciones)"""
+        salida = BytesIO()
+        self._generar(operaciones, fecha, lambda _indice, _mensaje_id: salida, None)
+        return salida.getvalue().decode('utf-8')
@@ -0,0 +1,225 @@
+"""
+Generador de ficheros SEPA Credit Transfer (pain.001.001.03)
+Sustituto del antiguo Cuaderno 34 (N34)
+
+Especificación: ISO 20022
+
+Igual que las remesas de domiciliaciones, el XML se escribe en streaming y la
+remesa se reparte en varios ficheros (o un ZIP) cuando supera el máximo de
+transacciones. Las transferencias se agrupan en bloques PmtInf por fecha de
+ejecución y cuenta del ordenante.
+"""
+
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from itertools import groupby
+from typing import BinaryIO, Iterable, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from pagos.sepa_comun import ResumenRemesa, _EscritorXML, _GeneradorRemesaSEPA, validar_iban
+
+
+@dataclass
+class TransferenciaSEPA:
+    """Transferencia individual para incluir en remesa SEPA"""
+    id_interno: str                    # Referencia interna del pago
+    importe: Decimal                   # Importe a pagar
+    concepto: str                      # Concepto (máx 140 caracteres)
+    beneficiario_nombre: str           # Nombre del beneficiario
+    beneficiario_iban: str             # IBAN del beneficiario
+    beneficiario_bic: Optional[str] = None
+    end_to_end_id: Optional[str] = None       # ID trazabilidad (por defecto E2E-<id_interno>)
+    fecha_ejecucion: Optional[date] = None    # Si falta, la fecha de ejecución de la remesa
+    cuenta_ordenante: Optional[str] = None    # Si falta, el IBAN de la configuración
+
+    def __post_init__(self):
+        if not self.end_to_end_id:
+            self.end_to_end_id = f"E2E-{self.id_interno}"
+        self.end_to_end_id = self.end_to_end_id[:35]
+        self.concepto = self.concepto[:140]
+        self.beneficiario_iban = (self.beneficiario_iban or '').replace(' ', '').upper()
+        if self.cuenta_ordenante:
+            self.cuenta_ordenante = self.cuenta_ordenante.replace(' ', '').upper()
+
+
+@dataclass
+class ConfiguracionOrdenanteSEPA:
+    """Configuración del ordenante SEPA (quien paga)"""
+    debtor_name: str      # Nombre del ordenante
+    debtor_iban: str      # IBAN del ordenante
+    debtor_bic: Optional[str] = None   # BIC
+    debtor_id: Optional[str] = None    # NIF del ordenante (InitgPty)
+
+    def __post_init__(self):
+        self.debtor_iban = self.debtor_iban.replace(' ', '').upper()
+
+
+class GeneradorSEPACreditTransfer(_GeneradorRemesaSEPA):
+    """
+    Genera ficheros SEPA Credit Transfer (pain.001.001.03) en streaming
+    para pagos a proveedores y acreedores.
+
+    Uso:
+        config = ConfiguracionOrdenanteSEPA(
+            debtor_name="MI EMPRESA SL",
+            debtor_iban="ES9121000418450200051332",
+            debtor_id="B12345678"
+        )
+
+        generador = GeneradorSEPACreditTransfer(config, max_transacciones=5000)
+        xml = generador.generar_xml(transferencias, fecha_ejecucion=date(2024, 2, 5))
+    """
+
+    NAMESPACE = "urn:iso:std:iso:20022:tech:xsd:pain.001.001.03"
+
+    def __init__(self, config: ConfiguracionOrdenanteSEPA,
+                 max_transacciones: Optional[int] = None,
+                 validar_fecha: bool = True):
+        super().__init__(max_transacciones, validar_fecha)
+        self.config = config
+
+        # Validar configuración
+        if not validar_iban(config.debtor_iban):
+            raise ValueError(f"IBAN del ordenante no válido: {config.debtor_iban}")
+
+    # -------------------------------------------------
+    # Preparación: validación y agrupación
+    # -------------------------------------------------
+
+    def _clave_bloque(self, transferencia: TransferenciaSEPA,
+                      fecha_ejecucion: date) -> Tuple[date, str]:
+        return (
+            transferencia.fecha_ejecucion or fecha_ejecucion,
+            transferencia.cuenta_ordenante or self.config.debtor_iban,
+        )
+
+    def _preparar(self, transferencias: Iterable[TransferenciaSEPA], fecha_ejecucion: date,
+                  resumen: ResumenRemesa) -> List[TransferenciaSEPA]:
+        """Descarta transferencias no válidas y ordena el resto por bloque PmtInf"""
+        validas = []
+        for transferencia in transferencias:
+            fecha = transferencia.fecha_ejecucion or fecha_ejecucion
+            if not validar_iban(transferencia.beneficiario_iban):
+                resumen.rechazados.append(
+                    (transferencia.id_interno, "IBAN del beneficiario no válido")
+                )
+            elif transferencia.importe <= 0:
+                resumen.rechazados.append((transferencia.id_interno, "Importe no positivo"))
+            elif self.validar_fecha and fecha < date.today():
+                resumen.rechazados.append(
+                    (transferencia.id_interno, "Fecha de ejecución anterior a hoy")
+                )
+            else:
+                validas.append(transferencia)
+        validas.sort(key=lambda t: self._clave_bloque(t, fecha_ejecucion))
+        return validas
+
+    # -------------------------------------------------
+    # Generación
+    # -------------------------------------------------
+
+    def _escribir_fichero(self, destino: BinaryIO, mensaje_id: str,
+                          transferencias: List[TransferenciaSEPA],
+                          fecha_ejecucion: date) -> int:
+        """Escribe un fichero pain.001 completo. Devuelve el número de PmtInf."""
+        xml = _EscritorXML(destino)
+        total = sum((t.importe for t in transferencias), Decimal('0.00'))
+        if self.config.debtor_id:
+            identificacion = (f"\n        <Id><OrgId><Othr><Id>{escape(self.config.debtor_id)}"
+                              f"</Id></Othr></OrgId></Id>")
+        else:
+            identificacion = ""
+
+        xml.escribir(f'''<?xml version="1.0" encoding="UTF-8"?>
+<Document xmlns="{self.NAMESPACE}">
+  <CstmrCdtTrfInitn>
+    <GrpHdr>
+      <MsgId>{escape(mensaje_id[:35])}</MsgId>
+      <CreDtTm>{datetime.now().strftime('%Y-%m-%dT%H:%M:%S')}</CreDtTm>
+      <NbOfTxs>{len(transferencias)}</NbOfTxs>
+      <CtrlSum>{total:.2f}</CtrlSum>
+      <InitgPty>
+        <Nm>{escape(self.config.debtor_name[:70])}</Nm>{identificacion}
+      </InitgPty>
+    </GrpHdr>''')
+
+        num_bloques = 0
+        bloques = groupby(transferencias, key=lambda t: self._clave_bloque(t, fecha_ejecucion))
+        for num_bloques, ((fecha, cuenta), grupo) in enumerate(bloques, start=1):
+            self._escribir_bloque(xml, mensaje_id, num_bloques, fecha, cuenta, list(grupo))
+
+        xml.escribir('''
+  </CstmrCdtTrfInitn>
+</Document>
+''')
+        xml.vaciar()
+        return num_bloques
+
+    def _escribir_bloque(self, xml: _EscritorXML, mensaje_id: str, indice: int,
+                         fecha: date, cuenta: str,
+                         transferencias: List[TransferenciaSEPA]) -> None:
+        """Escribe un bloque PmtInf y sus transacciones"""
+        ctrl_sum = sum((t.importe for t in transferencias), Decimal('0.00'))
+        pmt_inf_id = f"{mensaje_id[:28]}-TRF-{indice:02d}"[:35]
+        if self.config.debtor_bic:
+            agente = f"<BIC>{escape(self.config.debtor_bic)}</BIC>"
+        else:
+            agente = "<Othr><Id>NOTPROVIDED</Id></Othr>"
+
+        xml.escribir(f'''
+    <PmtInf>
+      <PmtInfId>{escape(pmt_inf_id)}</PmtInfId>
+      <PmtMtd>TRF</PmtMtd>
+      <BtchBookg>true</BtchBookg>
+      <NbOfTxs>{len(transferencias)}</NbOfTxs>
+      <CtrlSum>{ctrl_sum:.2f}</CtrlSum>
+      <PmtTpInf>
+        <SvcLvl><Cd>SEPA</Cd></SvcLvl>
+      </PmtTpInf>
+      <ReqdExctnDt>{fecha.isoformat()}</ReqdExctnDt>
+      <Dbtr>
+        <Nm>{escape(self.config.debtor_name[:70])}</Nm>
+      </Dbtr>
+      <DbtrAcct>
+        <Id><IBAN>{escape(cuenta)}</IBAN></Id>
+      </DbtrAcct>
+      <DbtrAgt>
+        <FinInstnId>{agente}</FinInstnId>
+      </DbtrAgt>
+      <ChrgBr>SLEV</ChrgBr>''')
+
+        for transferencia in transferencias:
+            self._escribir_transaccion(xml, transferencia)
+
+        xml.escribir('''
+    </PmtInf>''')
+
+    def _escribir_transaccion(self, xml: _EscritorXML, transferencia: TransferenciaSEPA) -> None:
+        """Escribe una transacción CdtTrfTxInf"""
+        if transferencia.beneficiario_bic:
+            agente = f'''
+        <CdtrAgt>
+          <FinInstnId><BIC>{escape(transferencia.beneficiario_bic)}</BIC></FinInstnId>
+        </CdtrAgt>'''
+        else:
+            agente = ""
+
+        xml.escribir(f'''
+      <CdtTrfTxInf>
+        <PmtId>
+          <EndToEndId>{escape(transferencia.end_to_end_id)}</EndToEndId>
+        </PmtId>
+        <Amt>
+          <InstdAmt Ccy="EUR">{transferencia.importe:.2f}</InstdAmt>
+        </Amt>{agente}
+        <Cdtr>
+          <Nm>{escape(transferencia.beneficiario_nombre[:70])}</Nm>
+        </Cdtr>
+        <CdtrAcct>
+          <Id><IBAN>{escape(transferencia.beneficiario_iban)}</IBAN></Id>
+        </CdtrAcct>
+        <RmtInf>
+          <Ustrd>{escape(transferencia.concepto)}</Ustrd>
+        </RmtInf>
+      </CdtTrfTxInf>''')
@@ -0,0 +1,275 @@
+"""
+Generador de ficheros SEPA Direct Debit (pain.008.001.02)
+Sustituto del antiguo Cuaderno 19 (N19)
+
+Especificación: ISO 20022
+
+El XML se escribe de forma incremental sobre un flujo (fichero, BytesIO o una
+entrada de un ZIP) con un búfer de tamaño fijo, de modo que una remesa de
+decenas de miles de recibos no se construye nunca entera en memoria. Los
+recibos se agrupan en bloques PmtInf por tipo de secuencia (FRST/RCUR/...),
+fecha de cobro y cuenta del acreedor, y la remesa se reparte en varios
+ficheros cuando supera el máximo de transacciones configurado.
+"""
+
+import re
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from itertools import groupby
+from typing import BinaryIO, Iterable, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from pagos.sepa_comun import (
+    ResumenRemesa, _EscritorXML, _GeneradorRemesaSEPA, _valor_iso7064, validar_iban,
+)
+
+
+@dataclass
+class DatosMandato:
+    """Datos del mandato SEPA (autorización de domiciliación)"""
+    mandate_id: str                    # Referencia única del mandato
+    fecha_firma: date                  # Fecha de firma
+    deudor_nombre: str                 # Nombre del deudor
+    deudor_iban: str                   # IBAN del deudor
+    deudor_bic: Optional[str] = None   # BIC (opcional)
+    tipo: str = 'RCUR'                 # RCUR=Recurrente, OOFF=Único, FRST=Primera, FNAL=Final
+
+    def __post_init__(self):
+        # Limpiar IBAN
+        self.deudor_iban = self.deudor_iban.replace(' ', '').upper()
+
+
+@dataclass
+class ReciboSEPA:
+    """Recibo individual para incluir en remesa SEPA"""
+    id_interno: str                    # Referencia interna (número de recibo)
+    importe: Decimal                   # Importe a cobrar
+    concepto: str                      # Concepto (máx 140 caracteres)
+    mandato: DatosMandato              # Datos del mandato
+    end_to_end_id: Optional[str] = None     # ID trazabilidad (por defecto E2E-<id_interno>)
+    fecha_cobro: Optional[date] = None      # Si falta, la fecha de cobro de la remesa
+    cuenta_acreedor: Optional[str] = None   # Si falta, el IBAN de la configuración
+
+    def __post_init__(self):
+        if not self.end_to_end_id:
+            self.end_to_end_id = f"E2E-{self.id_interno}"
+        self.end_to_end_id = self.end_to_end_id[:35]
+        # Truncar concepto a 140 caracteres
+        self.concepto = self.concepto[:140]
+        if self.cuenta_acreedor:
+            self.cuenta_acreedor = self.cuenta_acreedor.replace(' ', '').upper()
+
+
+@dataclass
+class ConfiguracionAcreedorSEPA:
+    """Configuración del acreedor SEPA (quien cobra)"""
+    creditor_id: str      # Identificador acreedor SEPA (ES + control + sufijo + NIF)
+    creditor_name: str    # Nombre del acreedor
+    creditor_iban: str    # IBAN del acreedor
+    creditor_bic: Optional[str] = None  # BIC
+    esquema: str = 'CORE' # CORE (particulares), B2B (empresas), COR1 (rápido)
+
+    def __post_init__(self):
+        self.creditor_iban = self.creditor_iban.replace(' ', '').upper()
+
+
+def validar_creditor_id(creditor_id: str) -> bool:
+    """Valida un identificador de acreedor SEPA español"""
+    # Formato: ES + 2 dígitos control + 3 caracteres sufijo + NIF
+    # Ejemplo: ES12000B12345678
+    if not re.match(r'^ES\d{2}[A-Z0-9]{3}[A-Z0-9]{9}$', creditor_id):
+        return False
+    return True
+
+
+def calcular_creditor_id(nif: str, sufijo: str = '000') -> str:
+    """Identificador de acreedor SEPA a partir del NIF (dígitos de control ISO 7064)"""
+    nif = nif.replace(' ', '').upper()
+    control = 98 - _valor_iso7064(nif + 'ES00')
+    return f"ES{control:02d}{sufijo}{nif}"
+
+
+class GeneradorSEPADirectDebit(_GeneradorRemesaSEPA):
+    """
+    Genera ficheros SEPA Direct Debit (pain.008.001.02) en streaming
+    para domiciliaciones bancarias.
+
+    Uso:
+        config = ConfiguracionAcreedorSEPA(
+            creditor_id="ES12000B12345678",
+            creditor_name="MI EMPRESA SL",
+            creditor_iban="ES9121000418450200051332"
+        )
+
+        generador = GeneradorSEPADirectDebit(config, max_transacciones=5000)
+
+        # Un único XML en memoria (remesas pequeñas)
+        xml = generador.generar_xml(recibos, fecha_cobro=date(2024, 2, 5))
+
+        # Remesa grande: un ZIP con tantos ficheros como haga falta
+        with open("remesa.zip", "wb") as f:
+            resumen = generador.generar_zip(recibos, date(2024, 2, 5), f)
+    """
+
+    NAMESPACE = "urn:iso:std:iso:20022:tech:xsd:pain.008.001.02"
+
+    def __init__(self, config: ConfiguracionAcreedorSEPA,
+                 max_transacciones: Optional[int] = None,
+                 validar_fecha: bool = True):
+        super().__init__(max_transacciones, validar_fecha)
+        self.config = config
+
+        # Validar configuración
+        if not validar_iban(config.creditor_iban):
+            raise ValueError(f"IBAN del acreedor no válido: {config.creditor_iban}")
+
+    # -------------------------------------------------
+    # Preparación: validación y agrupación
+    # -------------------------------------------------
+
+    def _clave_bloque(self, recibo: ReciboSEPA, fecha_cobro: date) -> Tuple[str, date, str]:
+        return (
+            recibo.mandato.tipo,
+            recibo.fecha_cobro or fecha_cobro,
+            recibo.cuenta_acreedor or self.config.creditor_iban,
+        )
+
+    def _preparar(self, recibos: Iterable[ReciboSEPA], fecha_cobro: date,
+                  resumen: ResumenRemesa) -> List[ReciboSEPA]:
+        """Descarta recibos no válidos y ordena el resto por bloque PmtInf"""
+        dias_minimos = 1 if self.config.esquema == 'COR1' else 2
+        validos = []
+        for recibo in recibos:
+            fecha = recibo.fecha_cobro or fecha_cobro
+            if not validar_iban(recibo.mandato.deudor_iban):
+                resumen.rechazados.append((recibo.id_interno, "IBAN del deudor no válido"))
+            elif recibo.importe <= 0:
+                resumen.rechazados.append((recibo.id_interno, "Importe no positivo"))
+            elif self.validar_fecha and (fecha - date.today()).days < dias_minimos:
+                resumen.rechazados.append(
+                    (recibo.id_interno, f"Fecha de cobro debe ser al menos D+{dias_minimos}")
+                )
+            else:
+                validos.append(recibo)
+        validos.sort(key=lambda r: self._clave_bloque(r, fecha_cobro))
+        return validos
+
+    # -------------------------------------------------
+    # Generación
+    # -------------------------------------------------
+
+    def _escribir_fichero(self, destino: BinaryIO, mensaje_id: str,
+                          recibos: List[ReciboSEPA], fecha_cobro: date) -> int:
+        """Escribe un fichero pain.008 completo. Devuelve el número de PmtInf."""
+        xml = _EscritorXML(destino)
+        total = sum((r.importe for r in recibos), Decimal('0.00'))
+        nombre = escape(self.config.creditor_name[:70])
+
+        xml.escribir(f'''<?xml version="1.0" encoding="UTF-8"?>
+<Document xmlns="{self.NAMESPACE}">
+  <CstmrDrctDbtInitn>
+    <GrpHdr>
+      <MsgId>{escape(mensaje_id[:35])}</MsgId>
+      <CreDtTm>{datetime.now().strftime('%Y-%m-%dT%H:%M:%S')}</CreDtTm>
+      <NbOfTxs>{len(recibos)}</NbOfTxs>
+      <CtrlSum>{total:.2f}</CtrlSum>
+      <InitgPty>
+        <Nm>{nombre}</Nm>
+        <Id><OrgId><Othr><Id>{escape(self.config.creditor_id)}</Id></Othr></OrgId></Id>
+      </InitgPty>
+    </GrpHdr>''')
+
+        num_bloques = 0
+        bloques = groupby(recibos, key=lambda r: self._clave_bloque(r, fecha_cobro))
+        for num_bloques, ((seq_type, fecha, cuenta), grupo) in enumerate(bloques, start=1):
+            grupo = list(grupo)
+            self._escribir_bloque(xml, mensaje_id, num_bloques, seq_type, fecha, cuenta, grupo)
+
+        xml.escribir('''
+  </CstmrDrctDbtInitn>
+</Document>
+''')
+        xml.vaciar()
+        return num_bloques
+
+    def _escribir_bloque(self, xml: _EscritorXML, mensaje_id: str, indice: int,
+                         seq_type: str, fecha: date, cuenta: str,
+                         recibos: List[ReciboSEPA]) -> None:
+        """Escribe un bloque PmtInf y sus transacciones"""
+        ctrl_sum = sum((r.importe for r in recibos), Decimal('0.00'))
+        pmt_inf_id = f"{mensaje_id[:26]}-{seq_type}-{indice:02d}"[:35]
+        if self.config.creditor_bic:
+            agente = f"<BIC>{escape(self.config.creditor_bic)}</BIC>"
+        else:
+            agente = "<Othr><Id>NOTPROVIDED</Id></Othr>"
+
+        xml.escribir(f'''
+    <PmtInf>
+      <PmtInfId>{escape(pmt_inf_id)}</PmtInfId>
+      <PmtMtd>DD</PmtMtd>
+      <BtchBookg>true</BtchBookg>
+      <NbOfTxs>{len(recibos)}</NbOfTxs>
+      <CtrlSum>{ctrl_sum:.2f}</CtrlSum>
+      <PmtTpInf>
+        <SvcLvl><Cd>SEPA</Cd></SvcLvl>
+        <LclInstrm><Cd>{escape(self.config.esquema)}</Cd></LclInstrm>
+        <SeqTp>{escape(seq_type)}</SeqTp>
+      </PmtTpInf>
+      <ReqdColltnDt>{fecha.isoformat()}</ReqdColltnDt>
+      <Cdtr>
+        <Nm>{escape(self.config.creditor_name[:70])}</Nm>
+      </Cdtr>
+      <CdtrAcct>
+        <Id><IBAN>{escape(cuenta)}</IBAN></Id>
+      </CdtrAcct>
+      <CdtrAgt>
+        <FinInstnId>{agente}</FinInstnId>
+      </CdtrAgt>
+      <ChrgBr>SLEV</ChrgBr>
+      <CdtrSchmeId>
+        <Id><PrvtId><Othr>
+          <Id>{escape(self.config.creditor_id)}</Id>
+          <SchmeNm><Prtry>SEPA</Prtry></SchmeNm>
+        </Othr></PrvtId></Id>
+      </CdtrSchmeId>''')
+
+        for recibo in recibos:
+            self._escribir_transaccion(xml, recibo)
+
+        xml.escribir('''
+    </PmtInf>''')
+
+    def _escribir_transaccion(self, xml: _EscritorXML, recibo: ReciboSEPA) -> None:
+        """Escribe una transacción DrctDbtTxInf"""
+        mandato = recibo.mandato
+        if mandato.deudor_bic:
+            agente = f"<BIC>{escape(mandato.deudor_bic)}</BIC>"
+        else:
+            agente = "<Othr><Id>NOTPROVIDED</Id></Othr>"
+
+        xml.escribir(f'''
+      <DrctDbtTxInf>
+        <PmtId>
+          <EndToEndId>{escape(recibo.end_to_end_id)}</EndToEndId>
+        </PmtId>
+        <InstdAmt Ccy="EUR">{recibo.importe:.2f}</InstdAmt>
+        <DrctDbtTx>
+          <MndtRltdInf>
+            <MndtId>{escape(mandato.mandate_id[:35])}</MndtId>
+            <DtOfSgntr>{mandato.fecha_firma.isoformat()}</DtOfSgntr>
+          </MndtRltdInf>
+        </DrctDbtTx>
+        <DbtrAgt>
+          <FinInstnId>{agente}</FinInstnId>
+        </DbtrAgt>
+        <Dbtr>
+          <Nm>{escape(mandato.deudor_nombre[:70])}</Nm>
+        </Dbtr>
+        <DbtrAcct>
+          <Id><IBAN>{escape(mandato.deudor_iban)}</IBAN></Id>
+        </DbtrAcct>
+        <RmtInf>
+          <Ustrd>{escape(recibo.concepto)}</Ustrd>
+        </RmtInf>
+      </DrctDbtTxInf>''')
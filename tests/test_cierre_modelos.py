@@ -0,0 +1,116 @@
+"""
+Los asientos de regularización, cierre y apertura no alteran los modelos
+
+Se calculan 303, 347 y 111/115/190/180 de un ejercicio, se contabiliza su
+cierre y se comprueba que los resultados no cambian y que el ejercicio
+siguiente, con solo el asiento de apertura, no declara nada.
+"""
+
+import pytest
+
+from core.cierre import preparar_cierres
+from core.columnar import ApuntesColumnares
+from core.contabilizador import LibroAsientos
+from core.referencias import IndiceReferencias
+from modelos_aeat.modelo_303 import Modelo303
+from modelos_aeat.modelo_347 import Modelo347
+from modelos_aeat.retenciones import MotorRetenciones
+
+
+ENTIDAD = {'id': 1, 'razon_social': 'COMUNIDAD DE PRUEBA'}
+EJERCICIO = 2026
+
+TERCEROS = {
+    1: {'nif': 'B11111111', 'nombre': 'CLIENTE'},
+    2: {'nif': 'B22222222', 'nombre': 'PROVEEDOR'},
+    3: {'nif': '11111111H', 'nombre': 'EMPLEADO'},
+    4: {'nif': '22222222J', 'nombre': 'ARRENDADOR'},
+}
+
+ASIENTOS = [
+    ('2026-10-05', 'Fra. emitida', [
+        {'cuenta': '4300', 'debe': 12100, 'haber': 0, 'tercero_id': 1},
+        {'cuenta': '700', 'debe': 0, 'haber': 10000, 'tipo_iva': 21},
+        {'cuenta': '477', 'debe': 0, 'haber': 2100, 'tipo_iva': 21},
+    ]),
+    ('2026-11-10', 'Fra. recibida', [
+        {'cuenta': '600', 'debe': 5000, 'haber': 0},
+        {'cuenta': '472', 'debe': 1050, 'haber': 0},
+        {'cuenta': '400', 'debe': 0, 'haber': 6050, 'tercero_id': 2},
+    ]),
+    ('2026-11-30', 'Nómina noviembre', [
+        {'cuenta': '640', 'debe': 2000, 'haber': 0},
+        {'cuenta': '4751', 'debe': 0, 'haber': 300, 'tercero_id': 3},
+        {'cuenta': '465', 'debe': 0, 'haber': 1700, 'tercero_id': 3},
+    ]),
+    ('2026-12-01', 'Alquiler diciembre', [
+        {'cuenta': '621', 'debe': 1000, 'haber': 0},
+        {'cuenta': '472', 'debe': 210, 'haber': 0},
+        {'cuenta': '4751', 'debe': 0, 'haber': 190, 'tercero_id': 4},
+        {'cuenta': '410', 'debe': 0, 'haber': 1020, 'tercero_id': 4},
+    ]),
+]
+
+
+@pytest.fixture
+def libro():
+    libro = LibroAsientos()
+    libro.apuntes = ApuntesColumnares()
+    libro.referencias = IndiceReferencias()
+    libro.modelo_303 = Modelo303(libro.apuntes)
+    libro.modelo_347 = Modelo347(libro.apuntes)
+    libro.retenciones = MotorRetenciones(libro.apuntes)
+    for observador in (libro.apuntes, libro.referencias, libro.modelo_303,
+                       libro.modelo_347, libro.retenciones):
+        libro.suscribir(observador)
+    libro.contabilizar_lote([
+        {'entidad_id': ENTIDAD['id'], 'fecha': fecha, 'concepto': concepto, 'apuntes': apuntes}
+        for fecha, concepto, apuntes in ASIENTOS
+    ])
+    return libro
+
+
+def _modelos(libro, ejercicio: int) -> dict:
+    entidad_id = ENTIDAD['id']
+    resultados = {
+        '347': libro.modelo_347.calcular(entidad_id, ejercicio, TERCEROS).declarados,
+        '190': libro.retenciones.calcular('190', entidad_id, ejercicio, '0A', TERCEROS),
+        '180': libro.retenciones.calcular('180', entidad_id, ejercicio, '0A', TERCEROS),
+    }
+    for periodo in ('1T', '2T', '3T', '4T', '0A'):
+        resultados[f"303/{periodo}"] = libro.modelo_303.calcular(entidad_id, ejercicio, periodo)
+    for periodo in ('1T', '4T'):
+        for modelo in ('111', '115'):
+            resultados[f"{modelo}/{periodo}"] = libro.retenciones.calcular(
+                modelo, entidad_id, ejercicio, periodo, TERCEROS)
+    return resultados
+
+
+def _cerrar(libro, ejercicio: int) -> None:
+    informe = preparar_cierres([ENTIDAD], libro.apuntes, libro.referencias, ejercicio,
+                               simulacion=False, max_procesos=1)
+    assert len(informe.asientos) == 3
+    libro.contabilizar_lote(informe.asientos)
+
+
+def test_modelos_iguales_antes_y_despues_del_cierre(libro):
+    antes = _modelos(libro, EJERCICIO)
+    assert antes['303/4T'].casillas['29'] == 126000
+    assert antes['303/4T'].casillas['71'] == 84000
+    assert [d.nif for d in antes['347']] == ['B11111111', 'B22222222']
+    assert antes['111/4T'].casillas['30'] == 30000
+    assert antes['115/4T'].casillas['05'] == 19000
+
+    _cerrar(libro, EJERCICIO)
+    assert _modelos(libro, EJERCICIO) == antes
+
+
+def test_apertura_no_se_declara_en_el_ejercicio_siguiente(libro):
+    vacios = _modelos(libro, EJERCICIO + 1)
+    _cerrar(libro, EJERCICIO)
+
+    despues = _modelos(libro, EJERCICIO + 1)
+    assert despues == vacios
+    assert despues['347'] == []
+    assert all(v == 0 for v in despues['303/1T'].casillas.values())
+    assert despues['111/1T'].perceptores == []
@@ -0,0 +1,71 @@
+"""
+Conciliación de un extracto y un pain.002 de la misma remesa
+"""
+
+from datetime import date
+from io import BytesIO
+
+from core.referencias import IndiceReferencias
+from pagos.conciliacion import (
+    COBRADO, DEVUELTO, PENDIENTE, Conciliacion, ConciliadorRecibos, IndiceRecibos,
+)
+
+
+RECIBO = {
+    'id': 1, 'entidad_id': 1, 'numero': 'R-0001', 'estado': PENDIENTE, 'importe': 120.0,
+    'fecha_vencimiento': '2026-03-05',
+    'tercero': {'id': 7, 'nombre': 'PROPIETARIO', 'iban': 'ES9121000418450200051332'},
+}
+
+
+def _norma43(fecha: date, centimos: int, concepto: str) -> bytes:
+    """Extracto Norma 43 de una cuenta con un abono"""
+    aammdd = fecha.strftime('%y%m%d')
+    lineas = [
+        '11' + '2100' + '0418' + '0200051332' + aammdd * 2,
+        '22' + ' ' * 4 + '0418' + aammdd * 2 + '03' + '000' + '2' + f"{centimos:014d}",
+        '2301' + concepto.ljust(38),
+        '33' + '2100' + '0418' + '0200051332' + f"{0:05d}{0:014d}{1:05d}{centimos:014d}",
+    ]
+    return '\r\n'.join(linea.ljust(80) for linea in lineas).encode('latin-1')
+
+
+def _pain002(end_to_end: str) -> bytes:
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<Document xmlns="urn:iso:std:iso:20022:tech:xsd:pain.002.001.03"><CstmrPmtStsRpt>
+  <GrpHdr><MsgId>INF-1</MsgId><CreDtTm>2026-03-10T09:00:00</CreDtTm></GrpHdr>
+  <OrgnlPmtInfAndSts><TxInfAndSts>
+    <OrgnlEndToEndId>{end_to_end}</OrgnlEndToEndId><TxSts>RJCT</TxSts>
+    <StsRsnInf><Rsn><Cd>AM04</Cd></Rsn></StsRsnInf>
+  </TxInfAndSts></OrgnlPmtInfAndSts>
+</CstmrPmtStsRpt></Document>""".encode('utf-8')
+
+
+def _conciliador(recibo: dict) -> ConciliadorRecibos:
+    indice = IndiceRecibos()
+    indice.recibos_guardados([recibo])
+    return ConciliadorRecibos(indice, IndiceReferencias())
+
+
+def test_cobrado_en_extracto_y_rechazado_en_pain002_es_devolucion():
+    recibo = dict(RECIBO)
+    conciliador = _conciliador(recibo)
+    conciliacion = Conciliacion()
+    conciliador.conciliar_extracto(BytesIO(_norma43(date(2026, 3, 5), 12000, 'REMESA E2E-R-0001')),
+                                   1, conciliacion)
+    assert conciliacion.estado(recibo) == COBRADO
+    conciliador.conciliar_devoluciones(BytesIO(_pain002('E2E-R-0001')), 1, conciliacion)
+
+    cuentas = [[a['cuenta'] for a in asiento['apuntes']] for asiento in conciliacion.asientos]
+    assert cuentas == [['572', '4300'], ['4309', '572']]
+    assert conciliacion.asientos[1]['apuntes'][0]['debe'] == 120.0
+    assert conciliacion.aplicar() == [recibo]
+    assert recibo['estado'] == DEVUELTO
+
+
+def test_rechazo_de_recibo_pendiente_sin_asiento():
+    recibo = dict(RECIBO)
+    conciliacion = _conciliador(recibo).conciliar_devoluciones(BytesIO(_pain002('E2E-R-0001')), 1)
+    assert conciliacion.asientos == []
+    conciliacion.aplicar()
+    assert recibo['estado'] == 'rechazado'
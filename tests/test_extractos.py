@@ -0,0 +1,128 @@
+"""
+Extractos Norma 43 y CAMT.053: lectura, totales, movimientos repetidos e
+importación sin duplicar asientos
+"""
+
+from datetime import date
+from io import BytesIO
+
+import pytest
+
+from core.contabilizador import LibroAsientos
+from core.referencias import IndiceReferencias
+from pagos.extractos import (
+    CAMT053, NORMA43, ClasificadorMovimientos, ResumenExtracto, importar_extracto,
+    leer_extracto, movimientos_referenciados,
+)
+
+
+CUENTA = ('2100', '0418', '0200051332')
+IBAN = 'ES9121000418450200051332'
+TERCEROS = [{'id': 7, 'nif': 'B11111111', 'nombre': 'CLIENTE SL', 'tipo': 'cliente', 'iban': None}]
+
+# (fecha, céntimos con signo, concepto común AEB, concepto)
+MOVIMIENTOS = [
+    (date(2026, 3, 2), 12000, '02', 'TRANSFERENCIA B11111111 FRA 12'),
+    (date(2026, 3, 2), -350, '17', 'COMISION MANTENIMIENTO'),
+    (date(2026, 3, 2), -350, '17', 'COMISION MANTENIMIENTO'),
+    (date(2026, 3, 3), -350, '17', 'COMISION MANTENIMIENTO'),
+]
+
+
+def _norma43(movimientos, totales=None) -> bytes:
+    """Extracto de una cuenta: 11, un 22 + 23 por movimiento y 33 con sus totales"""
+    lineas = ['11' + ''.join(CUENTA) + '260301' + '260331']
+    for fecha, importe, comun, concepto in movimientos:
+        aammdd = fecha.strftime('%y%m%d')
+        clave = '1' if importe < 0 else '2'
+        lineas.append('22' + ' ' * 4 + '0418' + aammdd * 2 + comun + '000' + clave
+                      + f"{abs(importe):014d}")
+        lineas.append('2301' + concepto.ljust(38))
+    cargos = [-m[1] for m in movimientos if m[1] < 0]
+    abonos = [m[1] for m in movimientos if m[1] > 0]
+    num_debe, total_debe, num_haber, total_haber = totales or (
+        len(cargos), sum(cargos), len(abonos), sum(abonos))
+    lineas.append('33' + ''.join(CUENTA)
+                  + f"{num_debe:05d}{total_debe:014d}{num_haber:05d}{total_haber:014d}")
+    return '\r\n'.join(linea.ljust(80) for linea in lineas).encode('latin-1')
+
+
+def _camt053(movimientos) -> bytes:
+    apuntes = ''.join(f"""
+    <Ntry>
+      <Amt Ccy="EUR">{abs(importe) // 100}.{abs(importe) % 100:02d}</Amt>
+      <CdtDbtInd>{'DBIT' if importe < 0 else 'CRDT'}</CdtDbtInd>
+      <BookgDt><Dt>{fecha.isoformat()}</Dt></BookgDt>
+      <ValDt><Dt>{fecha.isoformat()}</Dt></ValDt>
+      <BkTxCd><Prtry><Cd>{comun}</Cd></Prtry></BkTxCd>
+      <AddtlNtryInf>{concepto}</AddtlNtryInf>
+    </Ntry>""" for fecha, importe, comun, concepto in movimientos)
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<Document xmlns="urn:iso:std:iso:20022:tech:xsd:camt.053.001.02"><BkToCstmrStmt>
+  <GrpHdr><MsgId>EXT-1</MsgId><CreDtTm>2026-03-31T20:00:00</CreDtTm></GrpHdr>
+  <Stmt>
+    <Id>EXT-1-1</Id>
+    <Acct><Id><IBAN>{IBAN}</IBAN></Id></Acct>{apuntes}
+  </Stmt>
+</BkToCstmrStmt></Document>""".encode('utf-8')
+
+
+FORMATOS = {NORMA43: _norma43, CAMT053: _camt053}
+
+
+@pytest.mark.parametrize('formato', FORMATOS)
+def test_lectura(formato):
+    resumen = ResumenExtracto()
+    movimientos = list(leer_extracto(BytesIO(FORMATOS[formato](MOVIMIENTOS)), resumen))
+
+    assert [(m.fecha, m.importe, m.concepto_comun, m.concepto) for m in movimientos] == MOVIMIENTOS
+    assert resumen.formato == formato
+    assert resumen.cuentas == [IBAN if formato == CAMT053 else ''.join(CUENTA)]
+    assert (resumen.movimientos, resumen.abonos, resumen.cargos) == (4, 12000, 1050)
+    assert resumen.avisos == []
+
+
+def test_totales_del_registro_33():
+    resumen = ResumenExtracto()
+    list(leer_extracto(BytesIO(_norma43(MOVIMIENTOS, totales=(3, 1050, 1, 10000))), resumen))
+    assert len(resumen.avisos) == 1
+    assert resumen.avisos[0].startswith(f"Cuenta {''.join(CUENTA)}: los totales del registro 33")
+
+
+@pytest.mark.parametrize('formato', FORMATOS)
+def test_movimientos_repetidos_el_mismo_dia(formato):
+    referencias = [referencia for referencia, _ in
+                   movimientos_referenciados(BytesIO(FORMATOS[formato](MOVIMIENTOS)))]
+    assert len(set(referencias)) == 4
+    assert all(r.startswith('BANCO/') for r in referencias)
+    assert referencias[2] == referencias[1] + '-1'
+    # Otro día, el mismo movimiento no lleva sufijo
+    assert not referencias[3].endswith('-1')
+
+
+@pytest.mark.parametrize('formato', FORMATOS)
+def test_reimportar_no_duplica(formato):
+    libro, indice = LibroAsientos(), IndiceReferencias()
+    libro.suscribir(indice)
+    clasificador = ClasificadorMovimientos(TERCEROS)
+
+    def importar(movimientos):
+        return importar_extracto(BytesIO(FORMATOS[formato](movimientos)), 1, clasificador, indice,
+                                 contabilizar=libro.contabilizar_lote, tamano_lote=2)
+
+    primera = importar(MOVIMIENTOS)
+    assert (primera.contabilizados, primera.ya_importados) == (4, 0)
+    assert {cuenta: datos[1:] for cuenta, datos in primera.por_cuenta.items()} == {
+        '430': [1, 12000], '626': [3, -1050]}
+    cobro = libro.asientos_entidad(1)[0]
+    assert [(a['cuenta'], a.get('tercero_id')) for a in cobro['apuntes']] == \
+        [('572', None), ('430', 7)]
+
+    segunda = importar(MOVIMIENTOS)
+    assert (segunda.contabilizados, segunda.ya_importados) == (0, 4)
+
+    # El extracto del mes siguiente con un día solapado solo añade lo nuevo
+    nuevo = (date(2026, 3, 3), -350, '17', 'COMISION MANTENIMIENTO')
+    tercera = importar(MOVIMIENTOS[3:] + [nuevo])
+    assert (tercera.contabilizados, tercera.ya_importados) == (1, 1)
+    assert libro.num_asientos(1) == 5
@@ -0,0 +1,57 @@
+"""
+Importación de diarios históricos: validación de cuentas e importes
+"""
+
+from core.columnar import ApuntesColumnares
+from core.contabilizador import LibroAsientos
+from core.importacion import analizar_diario
+from core.plan_cuentas import compilar_plan
+
+
+PLAN = compilar_plan({'id': 1, 'tipo': 'pyme'}, [])
+
+CABECERA = "ASIEN;FECHA;SUBCTA;CONCEPTO;EURODEBE;EUROHABER\n"
+
+
+def _analizar(lineas: str):
+    return analizar_diario((CABECERA + lineas).encode('utf-8'), 'diario.csv', 1, PLAN, 2023)
+
+
+def test_subcuentas_de_10_digitos_se_rechazan_por_fila():
+    importacion = _analizar(
+        "1;15/03/2023;5720000000;Cobro;100,00;\n"
+        "1;15/03/2023;4300000001;Cobro;;100,00\n"
+        "2;16/03/2023;572000001;Cobro;50,00;\n"
+        "2;16/03/2023;430000001;Cobro;;50,00\n"
+    )
+    assert importacion.asientos_con_errores == 1
+    assert len(importacion.asientos) == 1
+    errores = importacion.errores.set_index('Fila')['Error']
+    assert errores[2].startswith("Cuenta '5720000000' demasiado larga")
+    assert errores[3].startswith("Cuenta '4300000001' demasiado larga")
+
+    # Lo que sí se admite se puede contabilizar sin desincronizar los almacenes
+    libro, apuntes = LibroAsientos(), ApuntesColumnares()
+    libro.suscribir(apuntes)
+    libro.contabilizar_lote(importacion.asientos)
+    assert len(apuntes.columnas(1)['cuenta']) == 2
+
+
+def test_punto_de_miles_sin_decimales():
+    importacion = _analizar(
+        "1;15/03/2023;572;Cobro;1.000;\n"
+        "1;15/03/2023;430;Cobro;;1.000\n"
+        "2;16/03/2023;572;Cobro;250,50;\n"
+        "2;16/03/2023;430;Cobro;;250,50\n"
+    )
+    assert importacion.asientos_con_errores == 0
+    assert [a['apuntes'][0]['debe'] for a in importacion.asientos] == [1000.0, 250.5]
+    assert importacion.debe == 125050
+
+
+def test_punto_decimal():
+    importacion = _analizar(
+        "1;15/03/2023;572;Cobro;1000.25;\n"
+        "1;15/03/2023;430;Cobro;;1000.25\n"
+    )
+    assert importacion.asientos[0]['apuntes'][0]['debe'] == 1000.25
@@ -0,0 +1,92 @@
+"""
+Modelo 347: las devoluciones de cobros y pagos no son operaciones con terceros,
+y las facturas rectificativas restan
+"""
+
+from core.columnar import ApuntesColumnares
+from core.contabilizador import LibroAsientos
+from modelos_aeat.modelo_347 import Modelo347
+
+
+TERCEROS = {
+    1: {'nif': 'B11111111', 'nombre': 'CLIENTE'},
+    2: {'nif': 'B22222222', 'nombre': 'PROVEEDOR'},
+}
+
+
+def _modelo(*asientos) -> Modelo347:
+    libro = LibroAsientos()
+    apuntes = ApuntesColumnares()
+    modelo = Modelo347(apuntes)
+    libro.suscribir(apuntes)
+    libro.suscribir(modelo)
+    libro.contabilizar_lote([
+        {'entidad_id': 1, 'fecha': fecha, 'concepto': 'Prueba', 'apuntes': apuntes}
+        for fecha, apuntes in asientos
+    ])
+    return modelo
+
+
+def _declarados(modelo: Modelo347) -> dict:
+    return {(d.nif, d.clave): d.importe
+            for d in modelo.calcular(1, 2026, TERCEROS, umbral=0).declarados}
+
+
+FACTURA_EMITIDA = ('2026-02-01', [
+    {'cuenta': '4300', 'debe': 5000, 'haber': 0, 'tercero_id': 1},
+    {'cuenta': '700', 'debe': 0, 'haber': 5000},
+])
+FACTURA_RECIBIDA = ('2026-02-01', [
+    {'cuenta': '600', 'debe': 4000, 'haber': 0},
+    {'cuenta': '400', 'debe': 0, 'haber': 4000, 'tercero_id': 2},
+])
+
+
+def test_devoluciones_no_cuentan():
+    modelo = _modelo(
+        FACTURA_EMITIDA,
+        FACTURA_RECIBIDA,
+        # Cobro del recibo y su devolución (conciliación)
+        ('2026-02-10', [{'cuenta': '572', 'debe': 5000, 'haber': 0},
+                        {'cuenta': '4300', 'debe': 0, 'haber': 5000, 'tercero_id': 1}]),
+        ('2026-02-15', [{'cuenta': '4309', 'debe': 5000, 'haber': 0, 'tercero_id': 1},
+                        {'cuenta': '572', 'debe': 0, 'haber': 5000}]),
+        # Reclasificación a dudoso cobro
+        ('2026-03-01', [{'cuenta': '4309', 'debe': 5000, 'haber': 0, 'tercero_id': 1},
+                        {'cuenta': '4300', 'debe': 0, 'haber': 5000, 'tercero_id': 1}]),
+        # Pago al proveedor y transferencia devuelta (importada del extracto)
+        ('2026-02-20', [{'cuenta': '400', 'debe': 4000, 'haber': 0, 'tercero_id': 2},
+                        {'cuenta': '572', 'debe': 0, 'haber': 4000}]),
+        ('2026-02-22', [{'cuenta': '572', 'debe': 4000, 'haber': 0},
+                        {'cuenta': '400', 'debe': 0, 'haber': 4000, 'tercero_id': 2}]),
+    )
+    assert _declarados(modelo) == {('B11111111', 'B'): 500000, ('B22222222', 'A'): 400000}
+
+
+def test_factura_al_contado_cuenta():
+    modelo = _modelo(
+        ('2026-05-01', [{'cuenta': '4300', 'debe': 3000, 'haber': 0, 'tercero_id': 1},
+                        {'cuenta': '700', 'debe': 0, 'haber': 3000},
+                        {'cuenta': '572', 'debe': 3000, 'haber': 0},
+                        {'cuenta': '4300', 'debe': 0, 'haber': 3000, 'tercero_id': 1}]),
+        ('2026-05-02', [{'cuenta': '600', 'debe': 2000, 'haber': 0},
+                        {'cuenta': '400', 'debe': 0, 'haber': 2000, 'tercero_id': 2},
+                        {'cuenta': '400', 'debe': 2000, 'haber': 0, 'tercero_id': 2},
+                        {'cuenta': '572', 'debe': 0, 'haber': 2000}]),
+    )
+    assert _declarados(modelo) == {('B11111111', 'B'): 300000, ('B22222222', 'A'): 200000}
+
+
+def test_rectificativas_restan_en_su_trimestre():
+    modelo = _modelo(
+        FACTURA_EMITIDA,
+        FACTURA_RECIBIDA,
+        # Abono al cliente y del proveedor, en el segundo trimestre
+        ('2026-04-10', [{'cuenta': '708', 'debe': 1000, 'haber': 0},
+                        {'cuenta': '4300', 'debe': 0, 'haber': 1000, 'tercero_id': 1}]),
+        ('2026-04-12', [{'cuenta': '400', 'debe': 500, 'haber': 0, 'tercero_id': 2},
+                        {'cuenta': '608', 'debe': 0, 'haber': 500}]),
+    )
+    assert _declarados(modelo) == {('B11111111', 'B'): 400000, ('B22222222', 'A'): 350000}
+    trimestres = {d.nif: d.trimestres for d in modelo.calcular(1, 2026, TERCEROS, umbral=0).declarados}
+    assert trimestres['B11111111'] == (500000, -100000, 0, 0)
@@ -0,0 +1,118 @@
+"""
+Persistencia compartida: escrituras rechazadas y asientos de otras sesiones
+"""
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from core.columnar import ApuntesColumnares
+from core.contabilizador import LibroAsientos
+from database.almacen import AlmacenContable, ErrorPersistencia, PersistenciaContable
+
+
+ENTIDAD = {'id': 1, 'nif': 'B12345678', 'razon_social': 'EMPRESA', 'tipo': 'sociedad_limitada',
+           'regimen_iva': 'general', 'plan_contable': 'pymes'}
+TERCERO = {'id': 1, 'nif': 'A11111111', 'nombre': 'PROPIETARIO', 'tipo': 'cliente', 'iban': None}
+
+
+@pytest.fixture
+def url(tmp_path):
+    url = f"sqlite:///{tmp_path / 'contafacil.db'}"
+    AlmacenContable(url).inicializar([ENTIDAD], [TERCERO])
+    return url
+
+
+def _sesion(url: str):
+    libro, apuntes = LibroAsientos(), ApuntesColumnares()
+    persistencia = PersistenciaContable(AlmacenContable(url), libro, [])
+    libro.suscribir(apuntes)
+    libro.suscribir(persistencia)
+    persistencia.cargar_entidad(1, {1: TERCERO})
+    return libro, apuntes, persistencia
+
+
+def _asiento(concepto: str) -> dict:
+    return {'entidad_id': 1, 'fecha': '2026-01-10', 'concepto': concepto, 'apuntes': [
+        {'cuenta': '572', 'debe': 10.0, 'haber': 0}, {'cuenta': '700', 'debe': 0, 'haber': 10.0}]}
+
+
+def _recibo(recibo_id: int, numero: str) -> dict:
+    return {'id': recibo_id, 'entidad_id': 1, 'numero': numero, 'tercero': TERCERO,
+            'importe': 10.0, 'concepto': 'Cuota', 'fecha_emision': '2026-01-01',
+            'fecha_vencimiento': '2026-01-10', 'estado': 'pendiente', 'metodo': 'domiciliacion'}
+
+
+def test_escritura_rechazada_se_descarta_una_vez(url, monkeypatch):
+    libro, apuntes, persistencia = _sesion(url)
+    guardado = libro.contabilizar(_asiento('Guardado'))
+    persistencia.confirmar()
+
+    def falla(*args, **kwargs):
+        raise OperationalError('INSERT', {}, Exception('conexión perdida'))
+
+    monkeypatch.setattr(persistencia.almacen, 'guardar_asientos', falla)
+    libro.contabilizar(_asiento('Nuevo'))
+    libro.modificar(guardado['id'], {'concepto': 'Modificado'})
+    with pytest.raises(ErrorPersistencia):
+        persistencia.confirmar()
+
+    # El libro vuelve a lo guardado y el siguiente rerun no falla otra vez
+    assert [a['concepto'] for a in libro.asientos_entidad(1)] == ['Guardado']
+    assert len(apuntes.columnas(1)['cuenta']) == 2
+    assert persistencia.confirmar() == 0
+
+
+def test_asientos_de_otra_sesion_se_cargan(url):
+    libro_a, _, persistencia_a = _sesion(url)
+    libro_b, _, persistencia_b = _sesion(url)
+
+    libro_a.contabilizar(_asiento('A1'))
+    persistencia_a.confirmar()
+    libro_b.contabilizar(_asiento('B1'))
+    persistencia_b.confirmar()
+    libro_a.contabilizar(_asiento('A2'))      # numera después de B1
+    persistencia_a.confirmar()
+
+    for libro, persistencia in ((libro_a, persistencia_a), (libro_b, persistencia_b)):
+        persistencia.cargar_entidad(1, {})
+        assert sorted((a['numero'], a['concepto']) for a in libro.asientos_entidad(1)) == \
+            [(1, 'A1'), (2, 'B1'), (3, 'A2')]
+
+    # Sin cambios en la base no se vuelve a cargar
+    cargados = libro_a.asientos_entidad(1)
+    persistencia_a.cargar_entidad(1, {})
+    assert libro_a.asientos_entidad(1)[0] is cargados[0]
+
+
+def test_emision_con_recibo_repetido_no_guarda_los_asientos(url):
+    libro, _, persistencia = _sesion(url)
+    libro.contabilizar(_asiento('Emisión enero'))
+    persistencia.confirmar([_recibo(persistencia.nuevo_id_recibo(), '2026-01/1')])
+
+    libro.contabilizar(_asiento('Emisión enero (otra vez)'))
+    with pytest.raises(ErrorPersistencia):
+        persistencia.confirmar([_recibo(persistencia.nuevo_id_recibo(), '2026-01/1')])
+
+    libro_b, _, persistencia_b = _sesion(url)
+    assert [a['concepto'] for a in libro_b.asientos_entidad(1)] == ['Emisión enero']
+    assert [r['numero'] for r in persistencia_b.recibos] == ['2026-01/1']
+    assert [a['concepto'] for a in libro.asientos_entidad(1)] == ['Emisión enero']
+
+
+def test_indice_unico_de_recibos_en_base_existente(tmp_path):
+    url = f"sqlite:///{tmp_path / 'antigua.db'}"
+    with create_engine(url).begin() as conn:
+        conn.execute(text(
+            'CREATE TABLE recibos (id BIGINT PRIMARY KEY, entidad_id INTEGER NOT NULL, '
+            'numero VARCHAR(40) NOT NULL, tercero_id INTEGER NOT NULL, importe BIGINT NOT NULL, '
+            'concepto VARCHAR(140) NOT NULL, fecha_emision DATE NOT NULL, '
+            'fecha_vencimiento DATE NOT NULL, estado VARCHAR(20) NOT NULL, '
+            'metodo VARCHAR(20) NOT NULL)'
+        ))
+    almacen = AlmacenContable(url)
+    almacen.inicializar([ENTIDAD], [TERCERO])
+    almacen.guardar_recibos([_recibo(1, '2026-01/1')])
+    with pytest.raises(IntegrityError):
+        almacen.guardar_recibos([_recibo(2, '2026-01/1')])
+    AlmacenContable(url)        # la segunda apertura no vuelve a crearlo
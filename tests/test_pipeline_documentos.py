@@ -0,0 +1,107 @@
+"""
+Procesamiento de documentos: reintentos con espera, progreso y duplicados
+"""
+
+import threading
+
+import pytest
+
+from core.contabilizador import LibroAsientos
+from core.ocr import pipeline
+from core.ocr.extractor import ErrorTransitorio, ExtractorSimulado
+from core.ocr.pipeline import ColaRevision, ProcesadorDocumentos, propuesta_asiento
+from core.referencias import IndiceReferencias
+
+
+class ExtractorInestable(ExtractorSimulado):
+    """Falla de forma transitoria las primeras veces de cada documento"""
+
+    def __init__(self, fallos: dict):
+        super().__init__()
+        self.fallos = dict(fallos)      # nombre -> fallos antes de responder (-1: siempre)
+        self.llamadas = []
+        self._cerrojo = threading.Lock()
+
+    def extraer(self, nombre, contenido):
+        with self._cerrojo:
+            self.llamadas.append(nombre)
+            pendientes = self.fallos.get(nombre, 0)
+            if pendientes:
+                self.fallos[nombre] = pendientes - 1
+                raise ErrorTransitorio("429 demasiadas peticiones")
+        if nombre.startswith('ilegible'):
+            raise ValueError("Documento ilegible")
+        return super().extraer(nombre, contenido)
+
+
+@pytest.fixture
+def esperas(monkeypatch):
+    """Esperas pedidas a time.sleep, sin dormir y sin dispersión aleatoria"""
+    esperas = []
+    monkeypatch.setattr(pipeline.time, 'sleep', esperas.append)
+    monkeypatch.setattr(pipeline.random, 'random', lambda: 0.5)
+    return esperas
+
+
+def test_reintentos_con_espera_exponencial(esperas):
+    extractor = ExtractorInestable({'fra-1.pdf': 2, 'fra-2.pdf': -1})
+    procesador = ProcesadorDocumentos(extractor, max_concurrencia=1, reintentos=3,
+                                      espera_inicial=0.5, espera_maxima=1.0)
+    recuperado, agotado, ilegible = procesador.procesar([
+        ('fra-1.pdf', b'uno'), ('fra-2.pdf', b'dos'), ('ilegible.pdf', b'tres'),
+    ])
+
+    assert (recuperado.estado, recuperado.intentos) == ('extraido', 3)
+    assert (agotado.estado, agotado.intentos) == ('error', 4)
+    assert agotado.error.startswith("Reintentos agotados")
+    # Los errores definitivos no se reintentan
+    assert (ilegible.estado, ilegible.intentos, ilegible.error) == ('error', 1, "Documento ilegible")
+    assert sorted(esperas) == [0.5, 0.5, 1.0, 1.0, 1.0]
+
+
+def test_progreso_desde_el_hilo_que_llama(esperas):
+    procesador = ProcesadorDocumentos(ExtractorInestable({'fra-3.pdf': 1}), max_concurrencia=3)
+    avisos = []
+    documentos = procesador.procesar(
+        [(f'fra-{i}.pdf', bytes([i])) for i in range(6)],
+        al_terminar=lambda doc, hechos, total: avisos.append(
+            (doc.id, hechos, total, threading.get_ident()))
+    )
+    assert [hechos for _, hechos, _, _ in avisos] == [1, 2, 3, 4, 5, 6]
+    assert {total for _, _, total, _ in avisos} == {6}
+    assert {hilo for _, _, _, hilo in avisos} == {threading.get_ident()}
+    assert sorted(doc_id for doc_id, _, _, _ in avisos) == [d.id for d in documentos]
+    assert [d.nombre for d in documentos] == [f'fra-{i}.pdf' for i in range(6)]
+
+
+def test_duplicados_se_extraen_una_vez_y_se_marcan(esperas):
+    libro = LibroAsientos()
+    referencias = IndiceReferencias()
+    libro.suscribir(referencias)
+    extractor = ExtractorInestable({})
+    procesador = ProcesadorDocumentos(extractor)
+
+    contabilizada, = procesador.procesar([('fra-9.pdf', b'contabilizada')])
+    libro.contabilizar(propuesta_asiento(contabilizada.datos, 1, lambda nif: None))
+
+    documentos = procesador.procesar([
+        ('fra-1.pdf', b'original'),
+        ('copia.pdf', b'original'),         # mismo fichero con otro nombre
+        ('fra-1.pdf', b'reescaneada'),      # misma factura, otro fichero
+        ('fra-9.pdf', b'otra vez'),         # ya contabilizada
+    ])
+    assert extractor.llamadas.count('copia.pdf') == 0
+    assert documentos[1].estado == 'extraido' and documentos[1].desde_cache
+
+    cola = ColaRevision(referencias)
+    for documento in documentos:
+        cola.anadir(documento, propuesta_asiento(documento.datos, 1, lambda nif: None))
+    motivos = [cola.propuestas[d.id]['duplicado'] for d in documentos]
+    assert motivos[0] is None
+    assert motivos[1] == "Mismo fichero que fra-1.pdf"
+    assert motivos[2] == "Misma factura que fra-1.pdf"
+    assert motivos[3].startswith("Factura ya contabilizada en el asiento nº 1")
+
+    asientos, omitidos = cola.aprobar([d.id for d in documentos])
+    assert len(asientos) == 1
+    assert omitidos == ['copia.pdf', 'fra-1.pdf', 'fra-9.pdf']
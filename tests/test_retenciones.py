@@ -0,0 +1,75 @@
+"""
+Retenciones: una nómina de varios empleados declara a cada uno por separado
+"""
+
+from core.columnar import ApuntesColumnares
+from core.contabilizador import LibroAsientos
+from modelos_aeat.retenciones import MotorRetenciones
+
+
+TERCEROS = {
+    1: {'nif': '11111111H', 'nombre': 'EMPLEADA'},
+    2: {'nif': '22222222J', 'nombre': 'EMPLEADO'},
+    3: {'nif': '33333333P', 'nombre': 'ARRENDADOR'},
+}
+
+
+def _motor(*asientos) -> MotorRetenciones:
+    libro = LibroAsientos()
+    apuntes = ApuntesColumnares()
+    motor = MotorRetenciones(apuntes)
+    libro.suscribir(apuntes)
+    libro.suscribir(motor)
+    libro.contabilizar_lote([
+        {'entidad_id': 1, 'fecha': fecha, 'concepto': 'Prueba', 'apuntes': apuntes}
+        for fecha, apuntes in asientos
+    ])
+    return motor
+
+
+def _perceptores(motor: MotorRetenciones, modelo: str, periodo: str) -> dict:
+    return {(p.nif, p.categoria): (p.base, p.retencion)
+            for p in motor.calcular(modelo, 1, 2026, periodo, TERCEROS).perceptores}
+
+
+def test_nomina_de_varios_empleados():
+    motor = _motor(
+        # Un solo 640 para la nómina de dos empleados
+        ('2026-01-31', [{'cuenta': '640', 'debe': 3000, 'haber': 0},
+                        {'cuenta': '4751', 'debe': 0, 'haber': 200, 'tercero_id': 1},
+                        {'cuenta': '465', 'debe': 0, 'haber': 1800, 'tercero_id': 1},
+                        {'cuenta': '4751', 'debe': 0, 'haber': 50, 'tercero_id': 2},
+                        {'cuenta': '465', 'debe': 0, 'haber': 950, 'tercero_id': 2}]),
+        # Nómina con el gasto por empleado
+        ('2026-02-28', [{'cuenta': '640', 'debe': 2000, 'haber': 0, 'tercero_id': 1},
+                        {'cuenta': '640', 'debe': 1000, 'haber': 0, 'tercero_id': 2},
+                        {'cuenta': '4751', 'debe': 0, 'haber': 200, 'tercero_id': 1},
+                        {'cuenta': '465', 'debe': 0, 'haber': 1800, 'tercero_id': 1},
+                        {'cuenta': '465', 'debe': 0, 'haber': 1000, 'tercero_id': 2}]),
+        # Alquiler: el 621 no lleva tercero
+        ('2026-03-01', [{'cuenta': '621', 'debe': 1000, 'haber': 0},
+                        {'cuenta': '472', 'debe': 210, 'haber': 0},
+                        {'cuenta': '4751', 'debe': 0, 'haber': 190, 'tercero_id': 3},
+                        {'cuenta': '410', 'debe': 0, 'haber': 1020, 'tercero_id': 3}]),
+    )
+    assert _perceptores(motor, '111', '1T') == {
+        ('11111111H', 'trabajo'): (400000, 40000),
+        ('22222222J', 'trabajo'): (200000, 5000),
+    }
+    assert _perceptores(motor, '115', '1T') == {('33333333P', 'arrendamientos'): (100000, 19000)}
+    liquidacion = motor.calcular('111', 1, 2026, '1T', TERCEROS)
+    assert liquidacion.casillas['01'] == 2
+    assert liquidacion.casillas['03'] == 45000
+
+
+def test_reparto_con_redondeo():
+    motor = _motor(
+        ('2026-04-30', [{'cuenta': '640', 'debe': 100.00, 'haber': 0},
+                        {'cuenta': '4751', 'debe': 0, 'haber': 10.00, 'tercero_id': 1},
+                        {'cuenta': '465', 'debe': 0, 'haber': 23.33, 'tercero_id': 1},
+                        {'cuenta': '4751', 'debe': 0, 'haber': 10.00, 'tercero_id': 2},
+                        {'cuenta': '465', 'debe': 0, 'haber': 56.67, 'tercero_id': 2}]),
+    )
+    perceptores = _perceptores(motor, '111', '2T')
+    assert perceptores == {('11111111H', 'trabajo'): (3333, 1000),
+                           ('22222222J', 'trabajo'): (6667, 1000)}